@@ -11,4 +11,5 @@ def endpoints(request: Request):
         'rpc': request.app.url_for('sanic-redis-rpc.handle_rpc'),
         'status': request.app.url_for('sanic-redis-rpc.status'),
         'inspections': request.app.url_for('sanic-redis-rpc.inspect'),
+        'search': request.app.url_for('sanic-redis-rpc.federated_search'),
     })
@@ -1,18 +1,42 @@
 import os
+import tempfile
 import typing as t
 from collections import OrderedDict
 from operator import itemgetter
 from pprint import pformat
+from time import time
 
 import click
 from natsort import natsorted
 from sanic import Sanic
 from sanic.config import Config
 
-from sanic_redis_rpc.utils import parse_redis_dsn
+from sanic_redis_rpc.key_manager.stores import RESULT_STORES
+from sanic_redis_rpc.rpc.deadlines import DEFAULT_TIMEOUTS
+from sanic_redis_rpc.utils import coerce_str_to_bool, parse_redis_dsn
 
 DEFAULT_REDIS_CONNECTION_STRING = 'redis://localhost:6379'
 ENV_REDIS_PREFIX = 'REDIS_'
+# every REDIS_* variable is a pool, so application settings use their own prefix
+ENV_EXPORT_DIR = 'SANIC_REDIS_RPC_EXPORT_DIR'
+DEFAULT_EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'sanic-redis-rpc')
+ENV_RESULT_STORE = 'SANIC_REDIS_RPC_RESULT_STORE'
+DEFAULT_RESULT_STORE = 'redis'
+ENV_RESULTS_DIR = 'SANIC_REDIS_RPC_RESULTS_DIR'
+DEFAULT_RESULTS_DIR = os.path.join(tempfile.gettempdir(), 'sanic-redis-rpc-results')
+# a file with `REDIS_*=<dsn>` lines replacing env variables, it's re-read when pools are reloaded
+ENV_POOLS_FILE = 'SANIC_REDIS_RPC_POOLS_FILE'
+# the pools admin API is disabled unless a token is set
+ENV_ADMIN_TOKEN = 'SANIC_REDIS_RPC_ADMIN_TOKEN'
+# RPC clients are told apart by their addresses unless a proxy in front of the app is trusted to set this header,
+# clients are told by the header or by a bearer token then
+ENV_CLIENT_HEADER = 'SANIC_REDIS_RPC_CLIENT_HEADER'
+DEFAULT_CLIENT_HEADER = 'X-Client-Id'
+ENV_TRUST_CLIENT_HEADER = 'SANIC_REDIS_RPC_TRUST_CLIENT_HEADER'
+# `<client>=<weight>,...`, the default weight is 1
+ENV_CLIENT_WEIGHTS = 'SANIC_REDIS_RPC_CLIENT_WEIGHTS'
+# `<lane>=<seconds>,...` overriding default timeouts of `interactive`, `slow` and `blocking` calls, `0` is no limit
+ENV_TIMEOUTS = 'SANIC_REDIS_RPC_TIMEOUTS'
 
 
 def read_redis_config_from_env(env: t.Dict[str, str]) -> t.Dict[str, t.Dict[str, t.Any]]:
@@ -38,6 +62,53 @@ def read_redis_config_from_env(env: t.Dict[str, str]) -> t.Dict[str, t.Dict[str,
     return res
 
 
+def read_env_file(path: str) -> t.Dict[str, str]:
+    """
+    Reads ``NAME=value`` lines, blank lines and lines starting with ``#`` are skipped.
+    """
+    res = OrderedDict()
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name, sep, value = line.partition('=')
+            if not sep:
+                raise ValueError(f'Line `{line}` of `{path}` is not `NAME=value`')
+            res[name.strip()] = value.strip()
+    return res
+
+
+def read_redis_config(env: t.Dict[str, str]) -> t.Dict[str, t.Dict[str, t.Any]]:
+    """
+    Pools are read from a file named by ``SANIC_REDIS_RPC_POOLS_FILE`` if it's set, from ``env`` otherwise.
+    """
+    pools_file = env.get(ENV_POOLS_FILE, None)
+    pools_env = read_env_file(pools_file) if pools_file else env
+    pools_env.setdefault(ENV_REDIS_PREFIX + '0', DEFAULT_REDIS_CONNECTION_STRING)
+    return read_redis_config_from_env(pools_env)
+
+
+def parse_client_weights(value: str) -> t.Dict[str, float]:
+    res = {}
+    for item in filter(None, (item.strip() for item in value.split(','))):
+        client, sep, weight = item.rpartition('=')
+        if not sep or not client or float(weight) <= 0:
+            raise ValueError(f'`{item}` of `{ENV_CLIENT_WEIGHTS}` is not `<client>=<positive weight>`')
+        res[client.strip()] = float(weight)
+    return res
+
+
+def parse_timeouts(value: str) -> t.Dict[str, float]:
+    res = dict(DEFAULT_TIMEOUTS)
+    for item in filter(None, (item.strip() for item in value.split(','))):
+        lane, sep, timeout = item.partition('=')
+        if not sep or lane.strip() not in DEFAULT_TIMEOUTS or float(timeout) < 0:
+            raise ValueError(f'`{item}` of `{ENV_TIMEOUTS}` is not `<{"|".join(DEFAULT_TIMEOUTS)}>=<seconds>`')
+        res[lane.strip()] = float(timeout)
+    return res
+
+
 def display_config(config: Config):
     for k, v in config.redis_connections_options.items():
         click.echo(click.style(
@@ -52,9 +123,21 @@ def display_config(config: Config):
 
 def configure(app: Sanic, env: t.Optional[t.Dict[str, str]] = None, verbose: bool = True) -> Sanic:
     env = env or os.environ
-    env.setdefault(ENV_REDIS_PREFIX + '0', DEFAULT_REDIS_CONNECTION_STRING)
 
-    app.config.redis_connections_options = read_redis_config_from_env(env)
+    app.config.redis_connections_options = read_redis_config(env)
+    app.config.pools_file = env.get(ENV_POOLS_FILE, None)
+    app.config.admin_token = env.get(ENV_ADMIN_TOKEN, None)
+    app.config.client_header = env.get(ENV_CLIENT_HEADER, DEFAULT_CLIENT_HEADER)
+    app.config.trust_client_header = coerce_str_to_bool(env.get(ENV_TRUST_CLIENT_HEADER, False), strict=True)
+    app.config.client_weights = parse_client_weights(env.get(ENV_CLIENT_WEIGHTS, ''))
+    app.config.timeouts = parse_timeouts(env.get(ENV_TIMEOUTS, ''))
+    # workers are forked after the app is configured, pool changes published later are applied on their startup
+    app.config.configured_at = time()
+    app.config.export_dir = env.get(ENV_EXPORT_DIR, DEFAULT_EXPORT_DIR)
+    app.config.result_store = env.get(ENV_RESULT_STORE, DEFAULT_RESULT_STORE)
+    app.config.results_dir = env.get(ENV_RESULTS_DIR, DEFAULT_RESULTS_DIR)
+    if app.config.result_store not in RESULT_STORES:
+        raise ValueError(f'`{ENV_RESULT_STORE}` must be one of {RESULT_STORES}, got `{app.config.result_store}`')
 
     verbose and display_config(app.config)
     return app
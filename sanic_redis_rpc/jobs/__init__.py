@@ -0,0 +1,9 @@
+from .base import Job, JobRunner
+from .bigkeys import BigKeysJob, TopN
+from .bulk import BulkKeysJob
+from .diff import KeyspaceDiffJob
+from .exceptions import *
+from .files import ExportJob, ImportJob
+from .migrate import MigrationJob
+from .namespaces import NamespaceJob, NamespaceTree
+from .request_adapter import JobRequestAdapter
@@ -0,0 +1,202 @@
+import asyncio
+import typing as t
+from datetime import datetime
+from time import monotonic
+from uuid import uuid4
+
+import aioredis
+from ujson import dumps as json_dumps, loads as json_loads
+
+from sanic_redis_rpc.jobs.exceptions import JobNotFoundError, JobCancelledError, JobFinishedError
+
+
+def mk_job_key(job_id: str, service_key_prefix: str = 'sanic-redis-rpc') -> str:
+    return ':'.join([service_key_prefix, 'jobs', job_id])
+
+
+class Job:
+    """
+    A long-running background task. Its state lives in a service redis hash,
+    so any worker can report progress of a job or request its cancellation.
+
+    Subclasses implement ``run`` and call ``report_progress`` after every chunk of work:
+    it persists progress and raises ``JobCancelledError`` once a cancellation is requested.
+    """
+    KIND = 'job'
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+
+    INT_FIELDS = ['processed', 'total', 'cancel_requested']
+    JSON_FIELDS = ['options', 'result']
+
+    # requests a cancellation unless a job has finished, returns a job status
+    LUA_REQUEST_CANCEL_SCRIPT = '''
+        local status = redis.call("HGET", KEYS[1], "status")
+        if not status then
+            return false
+        end
+        if status == "pending" or status == "running" then
+            redis.call("HSET", KEYS[1], "cancel_requested", 1)
+        end
+        return status
+    '''
+
+    def __init__(
+            self, service_redis: aioredis.Redis,
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            job_id: t.Optional[str] = None,
+            ttl_seconds: int = 60 * 60,
+            service_key_prefix: str = 'sanic-redis-rpc'):
+        self.service_redis = service_redis
+        self.options = options or {}
+        self.id = job_id or uuid4().hex
+        self.ttl_seconds = ttl_seconds
+        self.service_key_prefix = service_key_prefix
+        self.key = mk_job_key(self.id, service_key_prefix)
+
+        self.processed = 0
+        self.total = -1
+        self.result: t.Dict[str, t.Any] = {}
+        self._started = None
+
+    async def run(self):
+        raise NotImplementedError()
+
+    async def create(self) -> t.Dict[str, t.Any]:
+        bundle = {
+            'id': self.id,
+            'kind': self.KIND,
+            'status': self.STATUS_PENDING,
+            'processed': 0,
+            'total': -1,
+            'cancel_requested': 0,
+            'timestamp': datetime.now().isoformat(),
+            'options': json_dumps(self.options),
+            'result': json_dumps({}),
+        }
+        await self._save(bundle)
+        return await self.get_info(self.service_redis, self.id, self.service_key_prefix)
+
+    async def execute(self):
+        self._started = monotonic()
+        await self._save({'status': self.STATUS_RUNNING, 'started_at': datetime.now().isoformat()})
+        try:
+            await self.run()
+        except JobCancelledError:
+            await self._finish(self.STATUS_CANCELLED)
+        except asyncio.CancelledError:
+            await asyncio.shield(self._finish(self.STATUS_CANCELLED))
+            raise
+        except Exception as e:
+            await self._finish(self.STATUS_FAILED, error=repr(e))
+        else:
+            await self._finish(self.STATUS_DONE)
+
+    async def report_progress(self, processed: int, total: t.Optional[int] = None, **result):
+        self.processed = processed
+        if total is not None:
+            self.total = total
+        self.result.update(result)
+
+        elapsed = monotonic() - self._started if self._started else 0
+        pipe = self.service_redis.pipeline()
+        pipe.hmset_dict(self.key, {
+            'processed': self.processed,
+            'total': self.total,
+            'result': json_dumps(self.result),
+            'elapsed': round(elapsed, 3),
+            'throughput': round(self.processed / elapsed, 3) if elapsed else 0,
+        })
+        pipe.expire(self.key, self.ttl_seconds)
+        pipe.hget(self.key, 'cancel_requested')
+        *__, cancel_requested = await pipe.execute()
+
+        if cancel_requested and int(cancel_requested):
+            raise JobCancelledError(self.id)
+
+    async def _finish(self, status: str, error: str = ''):
+        await self._flush_progress()
+        bundle = {'status': status, 'finished_at': datetime.now().isoformat()}
+        if error:
+            bundle['error'] = error
+        await self._save(bundle)
+
+    async def _flush_progress(self):
+        try:
+            await self.report_progress(self.processed)
+        except JobCancelledError:
+            pass
+
+    async def _save(self, bundle: t.Dict[str, t.Any]):
+        pipe = self.service_redis.pipeline()
+        pipe.hmset_dict(self.key, bundle)
+        pipe.expire(self.key, self.ttl_seconds)
+        await pipe.execute()
+
+    @classmethod
+    async def get_info(
+            cls, service_redis: aioredis.Redis, job_id: str,
+            service_key_prefix: str = 'sanic-redis-rpc') -> t.Dict[str, t.Any]:
+        bundle = await service_redis.hgetall(mk_job_key(job_id, service_key_prefix), encoding='utf8')
+        if not bundle:
+            raise JobNotFoundError(job_id)
+
+        for k in cls.INT_FIELDS:
+            bundle[k] = int(bundle[k])
+        for k in cls.JSON_FIELDS:
+            bundle[k] = json_loads(bundle[k])
+        for k in ['elapsed', 'throughput']:
+            if k in bundle:
+                bundle[k] = float(bundle[k])
+        return bundle
+
+    @classmethod
+    async def request_cancel(
+            cls, service_redis: aioredis.Redis, job_id: str,
+            service_key_prefix: str = 'sanic-redis-rpc') -> t.Dict[str, t.Any]:
+        """
+        :raises JobFinishedError: if a job is done, failed or cancelled already
+        """
+        status = await service_redis.eval(
+            cls.LUA_REQUEST_CANCEL_SCRIPT, keys=[mk_job_key(job_id, service_key_prefix)])
+        if status is None:
+            raise JobNotFoundError(job_id)
+        if status.decode() not in [cls.STATUS_PENDING, cls.STATUS_RUNNING]:
+            raise JobFinishedError(job_id, status.decode())
+        return await cls.get_info(service_redis, job_id, service_key_prefix)
+
+
+class JobRunner:
+    """
+    Keeps track of jobs running in the current worker.
+    """
+
+    def __init__(self):
+        self._tasks: t.Dict[str, asyncio.Task] = {}
+
+    @property
+    def running(self) -> t.List[str]:
+        return list(self._tasks.keys())
+
+    async def start(self, job: Job) -> t.Dict[str, t.Any]:
+        info = await job.create()
+        task = asyncio.ensure_future(job.execute())
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _task: self._tasks.pop(job.id, None))
+        return info
+
+    async def wait(self, job_id: str):
+        task = self._tasks.get(job_id, None)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
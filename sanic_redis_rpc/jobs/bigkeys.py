@@ -0,0 +1,194 @@
+import base64
+import binascii
+import heapq
+import typing as t
+from time import monotonic
+
+import aioredis
+
+from sanic_redis_rpc.jobs.base import Job
+from sanic_redis_rpc.jobs.exceptions import JobNotFoundError, WrongJobOptionError
+from sanic_redis_rpc.jobs.throttle import Throttle
+from sanic_redis_rpc.rpc.utils import decode_bytes
+
+
+class TopN:
+    """
+    Keeps ``n`` items with the largest weights in a bounded min-heap.
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+        self._heap: t.List[t.Tuple[int, bytes, str]] = []
+
+    def push(self, weight: int, key: bytes, key_type: str):
+        item = (weight, key, key_type)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heappushpop(self._heap, item)
+
+    def as_list(self) -> t.List[t.Dict[str, t.Any]]:
+        """
+        :return: items with keys decoded as utf8, keys that are not valid utf8 are base64 encoded and marked ``binary``
+        """
+        items = []
+        for weight, key, key_type in sorted(self._heap, reverse=True):
+            item = {'key': decode_bytes(key), 'type': key_type, 'memory': weight}
+            if item['key'].encode() != key:
+                item['binary'] = True
+            items.append(item)
+        return items
+
+    @classmethod
+    def from_list(cls, n: int, items: t.List[t.Dict[str, t.Any]]) -> 'TopN':
+        top = cls(n)
+        for item in items:
+            key = base64.standard_b64decode(item['key']) if item.get('binary') else item['key'].encode()
+            top.push(item['memory'], key, item['type'])
+        return top
+
+
+class BigKeysJob(Job):
+    """
+    Finds the biggest keys of a redis with a throttled ``SCAN`` and pipelined ``TYPE`` and ``MEMORY USAGE``.
+    Keeps top-N keys overall and per type, and totals per type.
+
+    Partial results are published every ``publish_interval`` seconds along with the ``SCAN`` cursor
+    they correspond to, so a cancelled or failed job can be resumed with the ``resume`` option
+    (an identifier of the job to continue). A resumed job must have the same ``RESUME_OPTIONS``.
+    """
+    KIND = 'bigkeys'
+    # options results depend on, with their defaults
+    RESUME_OPTIONS = {'redis_name': None, 'pattern': '*', 'top': 20, 'samples': 5}
+
+    def __init__(
+            self, service_redis: aioredis.Redis, redis: aioredis.Redis,
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            **kwargs):
+        super().__init__(service_redis, options, **kwargs)
+        self.redis = redis
+        self.validate_options(self.options)
+
+        self.top_n = int(self.options.get('top', 20))
+        self.cursor = b'0'
+        self.top = TopN(self.top_n)
+        self.top_by_type: t.Dict[str, TopN] = {}
+        self.totals: t.Dict[str, t.Dict[str, int]] = {}
+        self._restored = False
+
+    @classmethod
+    def validate_options(cls, options: t.Dict[str, t.Any]):
+        if not int(options.get('top', 20)) > 0:
+            raise WrongJobOptionError('top', 'must be a positive integer')
+        if not int(options.get('samples', 5)) >= 0:
+            raise WrongJobOptionError('samples', 'must be a non-negative integer')
+        if not int(options.get('scan_count', 1000)) > 0:
+            raise WrongJobOptionError('scan_count', 'must be a positive integer')
+
+    def _get_state(self) -> t.Dict[str, t.Any]:
+        return {
+            'cursor': self.cursor.decode(),
+            'scanned': self.processed,
+            'top': self.top.as_list(),
+            'top_by_type': {key_type: top.as_list() for key_type, top in self.top_by_type.items()},
+            'totals': self.totals,
+        }
+
+    async def restore(self):
+        """
+        Loads the state of a job given with the ``resume`` option.
+
+        :raises WrongJobOptionError: if the job is gone, is not resumable or was started with other options
+        """
+        job_id = self.options['resume']
+        try:
+            info = await self.get_info(self.service_redis, job_id, self.service_key_prefix)
+        except JobNotFoundError:
+            raise WrongJobOptionError('resume', f'job {job_id} is not found or has expired')
+        if info['kind'] != self.KIND:
+            raise WrongJobOptionError('resume', f'job {job_id} is not a {self.KIND} job')
+        for name, default in self.RESUME_OPTIONS.items():
+            if info['options'].get(name, default) != self.options.get(name, default):
+                raise WrongJobOptionError('resume', f'job {job_id} was started with another `{name}`')
+
+        state = info['result']
+        if not state.get('cursor') or state['cursor'] == '0':
+            raise WrongJobOptionError('resume', f'job {job_id} has nothing left to scan')
+
+        try:
+            self.processed = int(state['scanned'])
+            self.cursor = str(int(state['cursor'])).encode()
+            self.top = TopN.from_list(self.top_n, state['top'])
+            self.top_by_type = {
+                key_type: TopN.from_list(self.top_n, items) for key_type, items in state['top_by_type'].items()
+            }
+            self.totals = state['totals']
+        except (KeyError, TypeError, ValueError, binascii.Error):
+            raise WrongJobOptionError('resume', f'job {job_id} has a broken state')
+        self._restored = True
+
+    async def run(self):
+        if self.options.get('resume') and not self._restored:
+            await self.restore()
+
+        throttle = Throttle(
+            ops_per_second=float(self.options.get('ops_per_second', 0)),
+            target_latency=float(self.options.get('target_latency_ms', 0)) / 1000,
+        )
+        scan_count = int(self.options.get('scan_count', 1000))
+        publish_interval = float(self.options.get('publish_interval', 1))
+        total = await self.redis.dbsize()
+
+        published = monotonic()
+        try:
+            while True:
+                await throttle.acquire(scan_count)
+                started = monotonic()
+                cursor, keys = await self.redis.scan(
+                    self.cursor, match=self.options.get('pattern', '*'), count=scan_count
+                )
+                if keys:
+                    self._add(keys, await self._measure(keys))
+                throttle.feedback(scan_count + 2 * len(keys), monotonic() - started)
+
+                self.cursor, self.processed = str(cursor).encode(), self.processed + len(keys)
+                if not cursor:
+                    break
+
+                state = {}
+                if monotonic() - published >= publish_interval:
+                    state, published = self._get_state(), monotonic()
+                await self.report_progress(self.processed, max(total, self.processed), **state)
+        finally:
+            # the cursor must never get ahead of published top lists
+            self.result.update(self._get_state())
+
+    async def _measure(self, keys: t.List[bytes]) -> t.List[t.Tuple[t.Optional[str], t.Optional[int]]]:
+        samples = int(self.options.get('samples', 5))
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.type(key)
+            pipe.memory_usage(key, samples=samples)
+        results = [
+            None if isinstance(result, Exception) else result
+            for result in await pipe.execute(return_exceptions=True)
+        ]
+        return [
+            (key_type.decode() if key_type else None, memory)
+            for key_type, memory in zip(results[::2], results[1::2])
+        ]
+
+    def _add(self, keys: t.List[bytes], measures: t.List[t.Tuple[t.Optional[str], t.Optional[int]]]):
+        for key, (key_type, memory) in zip(keys, measures):
+            if key_type is None or key_type == 'none' or memory is None:
+                continue  # the key has expired in between
+
+            self.top.push(memory, key, key_type)
+            if key_type not in self.top_by_type:
+                self.top_by_type[key_type] = TopN(self.top_n)
+            self.top_by_type[key_type].push(memory, key, key_type)
+
+            totals = self.totals.setdefault(key_type, {'count': 0, 'memory': 0})
+            totals['count'] += 1
+            totals['memory'] += memory
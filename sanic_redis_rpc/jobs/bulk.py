@@ -0,0 +1,112 @@
+import typing as t
+from collections import OrderedDict
+from time import monotonic
+
+import aioredis
+
+from sanic_redis_rpc.jobs.base import Job
+from sanic_redis_rpc.jobs.exceptions import WrongJobOptionError
+from sanic_redis_rpc.jobs.throttle import Throttle
+from sanic_redis_rpc.key_manager.manager import KeyManager
+
+
+class BulkKeysJob(Job):
+    """
+    Applies an action to every key found with a search, chunk by chunk:
+
+        - ``unlink``: a single ``UNLINK`` per chunk
+        - ``expire``: ``EXPIRE key ttl_seconds`` per key
+        - ``persist``: ``PERSIST key`` per key
+        - ``rename``: ``RENAMENX key prefix+key`` per key, existing targets are never overwritten
+
+    Commands of a chunk are pipelined; chunks are paced with a ``Throttle``.
+    """
+    KIND = 'bulk'
+    ACTIONS = ('unlink', 'expire', 'persist', 'rename')
+
+    def __init__(
+            self, service_redis: aioredis.Redis,
+            get_redis: t.Callable[[str], t.Awaitable[aioredis.Redis]],
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            **kwargs):
+        """
+        :param get_redis: a coroutine function returning a redis by its pool name
+        """
+        super().__init__(service_redis, options, **kwargs)
+        self.get_redis = get_redis
+        self.validate_options(self.options)
+
+    @classmethod
+    def validate_options(cls, options: t.Dict[str, t.Any]):
+        if not options.get('search_id'):
+            raise WrongJobOptionError('search_id', 'it is required')
+        if options.get('action') not in cls.ACTIONS:
+            raise WrongJobOptionError('action', f'must be one of {", ".join(cls.ACTIONS)}')
+        if options['action'] == 'expire' and not int(options.get('ttl_seconds') or 0) > 0:
+            raise WrongJobOptionError('ttl_seconds', 'must be a positive integer')
+        if options['action'] == 'rename' and not options.get('prefix'):
+            raise WrongJobOptionError('prefix', 'it is required')
+        if not int(options.get('chunk_size', 1)) > 0:
+            raise WrongJobOptionError('chunk_size', 'must be a positive integer')
+
+    async def run(self):
+        search_id = self.options['search_id']
+        key_manager = KeyManager(None, self.service_redis)
+        info = await key_manager.get_search_info(search_id)
+        if info.get('snapshot'):
+            raise WrongJobOptionError('search_id', 'keys of a snapshot search can not be changed')
+        if info['redis_name']:
+            key_manager.redis = await self.get_redis(info['redis_name'])
+
+        throttle = Throttle(
+            ops_per_second=float(self.options.get('ops_per_second', 0)),
+            target_latency=float(self.options.get('target_latency_ms', 0)) / 1000,
+        )
+        chunk_size = int(self.options.get('chunk_size', 500))
+        total = max(info['count'], 0)
+        affected = errors = processed = 0
+
+        await self.report_progress(0, total, affected=0, errors=0, **throttle.as_dict())
+        async for chunk in key_manager.iter_results(info, chunk_size=chunk_size):
+            by_pool = OrderedDict()
+            for redis_name, key in chunk:
+                by_pool.setdefault(redis_name, []).append(key)
+
+            await throttle.acquire(len(chunk))
+            started = monotonic()
+            for redis_name, keys in by_pool.items():
+                _affected, _errors = await self._apply(await self.get_redis(redis_name), keys)
+                affected += _affected
+                errors += _errors
+            throttle.feedback(len(chunk), monotonic() - started)
+
+            processed += len(chunk)
+            await key_manager.refresh_ttl(search_id, info['ttl_seconds'])
+            await self.report_progress(
+                processed, max(total, processed), affected=affected, errors=errors, **throttle.as_dict()
+            )
+
+    async def _apply(self, redis: aioredis.Redis, keys: t.List[bytes]) -> t.Tuple[int, int]:
+        """
+        :return: the number of affected keys and the number of failed commands
+        """
+        action = self.options['action']
+        pipe = redis.pipeline()
+        if action == 'unlink':
+            pipe.unlink(*keys)
+        elif action == 'expire':
+            ttl_seconds = int(self.options['ttl_seconds'])
+            for key in keys:
+                pipe.expire(key, ttl_seconds)
+        elif action == 'persist':
+            for key in keys:
+                pipe.persist(key)
+        else:
+            prefix = self.options['prefix'].encode()
+            for key in keys:
+                pipe.renamenx(key, prefix + key)
+
+        results = await pipe.execute(return_exceptions=True)
+        errors = sum(1 for result in results if isinstance(result, Exception))
+        affected = sum(int(result) for result in results if not isinstance(result, Exception))
+        return affected, errors
@@ -0,0 +1,245 @@
+import typing as t
+from time import monotonic
+from uuid import uuid4
+
+import aioredis
+
+from sanic_redis_rpc.jobs.base import Job, mk_job_key
+from sanic_redis_rpc.jobs.exceptions import WrongJobOptionError
+from sanic_redis_rpc.jobs.throttle import Throttle
+from sanic_redis_rpc.key_manager.manager import KeyManager, tag_key
+from sanic_redis_rpc.key_manager.stores import ResultStore
+
+ONLY_IN_A, ONLY_IN_B, DIFFERENT, SAME = 'only_in_a', 'only_in_b', 'different', 'same'
+
+
+class KeyspaceDiffJob(Job):
+    """
+    Compares keys and values of two redis pools.
+
+    Keys of both pools are scanned into lexicographically sorted sets in service redis, so the worker
+    never holds a whole keyspace. Sorted streams are then merge-joined page by page with ``ZRANGEBYLEX``.
+    Values of keys present in both pools are compared by SHA1 digests of their ``DUMP`` payloads,
+    computed server-side (RDB version and checksum are stripped). Equal values stored with different
+    encodings (e.g. ``listpack`` vs ``hashtable``) are reported as different.
+
+    Differences are stored as a search bound to both pools with three child searches
+    (``only_in_a``, ``only_in_b``, ``different``), so they can be paged like any other search.
+    """
+    KIND = 'diff'
+    KINDS = (ONLY_IN_A, ONLY_IN_B, DIFFERENT)
+
+    LUA_DIGESTS_SCRIPT = '''
+        local res = {}
+        for i, key in ipairs(KEYS) do
+            local dump = redis.call("DUMP", key)
+            if dump then
+                res[i] = redis.sha1hex(string.sub(dump, 1, -11))
+            else
+                res[i] = ""
+            end
+        end
+        return res
+    '''
+
+    def __init__(
+            self, service_redis: aioredis.Redis,
+            get_redis: t.Callable[[str], t.Awaitable[aioredis.Redis]],
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            result_store: t.Optional[ResultStore] = None,
+            **kwargs):
+        """
+        :param get_redis: a coroutine function returning a redis by its pool name
+        :param result_store: a store differences are written to (service redis lists by default)
+        """
+        super().__init__(service_redis, options, **kwargs)
+        self.get_redis = get_redis
+        self.validate_options(self.options)
+
+        self.chunk_size = int(self.options.get('chunk_size', 500))
+        self.key_manager = KeyManager(
+            None, service_redis,
+            scan_count=int(self.options.get('scan_count', 1000)),
+            service_key_prefix=self.service_key_prefix,
+            result_store=result_store,
+        )
+        self.throttle = Throttle(
+            ops_per_second=float(self.options.get('ops_per_second', 0)),
+            target_latency=float(self.options.get('target_latency_ms', 0)) / 1000,
+        )
+        self.counts = {kind: 0 for kind in self.KINDS + (SAME,)}
+
+    @classmethod
+    def validate_options(cls, options: t.Dict[str, t.Any]):
+        for name in ['redis_a', 'redis_b']:
+            if not options.get(name):
+                raise WrongJobOptionError(name, 'it is required')
+        for name in ['chunk_size', 'scan_count']:
+            if name in options and not int(options[name]) > 0:
+                raise WrongJobOptionError(name, 'must be a positive integer')
+
+    def _mk_keys_key(self, side: str) -> str:
+        return ':'.join([mk_job_key(self.id, self.service_key_prefix), 'keys', side])
+
+    async def run(self):
+        redis_a = await self.get_redis(self.options['redis_a'])
+        redis_b = await self.get_redis(self.options['redis_b'])
+        keys_a, keys_b = self._mk_keys_key('a'), self._mk_keys_key('b')
+
+        try:
+            total = await redis_a.dbsize() + await redis_b.dbsize()
+            scanned = await self._collect(redis_a, keys_a, 0, total)
+            scanned = await self._collect(redis_b, keys_b, scanned, total)
+
+            search_id = uuid4().hex
+            bundles = self._mk_search_bundles(search_id)
+            await self.report_progress(0, scanned, phase='compare', search_id=search_id)
+            await self._compare(redis_a, redis_b, keys_a, keys_b, bundles, scanned)
+            await self._save_searches(bundles)
+        finally:
+            await self.service_redis.delete(keys_a, keys_b)
+
+    async def _collect(self, redis: aioredis.Redis, keys_key: str, scanned: int, total: int) -> int:
+        """
+        Scans keys of a pool into a sorted set.
+        """
+        self.key_manager.redis = redis
+        async for keys in self.key_manager.iter_scan(self.options.get('pattern', '*')):
+            await self.throttle.acquire(self.key_manager.scan_count)
+            if keys:
+                pipe = self.service_redis.pipeline()
+                pipe.zadd(keys_key, 0, keys[0], *[item for key in keys[1:] for item in (0, key)])
+                pipe.expire(keys_key, self.ttl_seconds)
+                await pipe.execute()
+
+            scanned += len(keys)
+            await self.report_progress(scanned, max(scanned, total), phase='scan')
+        return scanned
+
+    async def _iter_sorted(self, keys_key: str) -> t.AsyncIterator[bytes]:
+        last = None
+        while True:
+            if last is None:
+                keys = await self.service_redis.zrangebylex(keys_key, offset=0, count=self.chunk_size)
+            else:
+                keys = await self.service_redis.zrangebylex(
+                    keys_key, min=last, include_min=False, offset=0, count=self.chunk_size)
+            for key in keys:
+                yield key
+            if len(keys) < self.chunk_size:
+                return
+            last = keys[-1]
+
+    async def _merge_join(self, keys_a: str, keys_b: str) -> t.AsyncIterator[t.Tuple[str, bytes]]:
+        """
+        :return: an async iterator over sorted ``(kind, key)`` pairs, kind of keys present in both pools is ``None``
+        """
+        iter_a, iter_b = self._iter_sorted(keys_a), self._iter_sorted(keys_b)
+
+        async def _next(iterator):
+            try:
+                return await iterator.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        key_a, key_b = await _next(iter_a), await _next(iter_b)
+        while key_a is not None or key_b is not None:
+            if key_b is None or (key_a is not None and key_a < key_b):
+                yield ONLY_IN_A, key_a
+                key_a = await _next(iter_a)
+            elif key_a is None or key_b < key_a:
+                yield ONLY_IN_B, key_b
+                key_b = await _next(iter_b)
+            else:
+                yield None, key_a
+                key_a, key_b = await _next(iter_a), await _next(iter_b)
+
+    async def _compare(
+            self, redis_a: aioredis.Redis, redis_b: aioredis.Redis, keys_a: str, keys_b: str,
+            bundles: t.Dict[str, t.Dict[str, t.Any]], total: int):
+        window, processed = [], 0
+        async for kind, key in self._merge_join(keys_a, keys_b):
+            window.append([kind, key])
+            if len(window) >= self.chunk_size:
+                processed += await self._flush(redis_a, redis_b, window, bundles)
+                await self.report_progress(processed, total, **self.counts)
+                window = []
+        processed += await self._flush(redis_a, redis_b, window, bundles)
+        await self.report_progress(processed, max(processed, total), **self.counts)
+
+    async def _flush(
+            self, redis_a: aioredis.Redis, redis_b: aioredis.Redis, window: t.List[t.List[t.Any]],
+            bundles: t.Dict[str, t.Dict[str, t.Any]]) -> int:
+        """
+        Compares values of keys present in both pools and appends differences of the window to search results.
+
+        :return: the number of keys in the window, a key present in both pools is counted twice
+        """
+        if not window:
+            return 0
+
+        common = [item for item in window if item[0] is None]
+        if common and self.options.get('compare_values', True):
+            keys = [key for __, key in common]
+            await self.throttle.acquire(2 * len(keys))
+            started = monotonic()
+            digests_a = await redis_a.eval(self.LUA_DIGESTS_SCRIPT, keys=keys)
+            digests_b = await redis_b.eval(self.LUA_DIGESTS_SCRIPT, keys=keys)
+            self.throttle.feedback(2 * len(keys), monotonic() - started)
+            for item, digest_a, digest_b in zip(common, digests_a, digests_b):
+                item[0] = SAME if digest_a == digest_b else DIFFERENT
+        else:
+            for item in common:
+                item[0] = SAME
+
+        lengths = {kind: self.counts[kind] for kind in self.KINDS}
+        lengths[''] = sum(lengths.values())
+        results = {kind: [] for kind in self.KINDS}
+        parent_results = []
+        for kind, key in window:
+            self.counts[kind] += 1
+            if kind == SAME:
+                continue
+            results[kind].append(key)
+            parent_results.append(tag_key(1 if kind == ONLY_IN_B else 0, key))
+
+        pipe = self.service_redis.pipeline()
+        for kind, keys in [('', parent_results)] + [(kind, results[kind]) for kind in self.KINDS]:
+            if keys:
+                await self.key_manager.result_store.append(
+                    pipe, bundles[kind]['results_key'], keys, lengths[kind], bundles[kind]['ttl_seconds']
+                )
+        await self.key_manager.result_store.execute(pipe)
+
+        return len(window) + len(common)
+
+    def _mk_search_bundles(self, search_id: str) -> t.Dict[str, t.Dict[str, t.Any]]:
+        """
+        :return: search bundles by diff kind, the parent search is stored with an empty kind
+        """
+        pattern = self.options.get('pattern', '*')
+        ttl_seconds = int(self.options.get('search_ttl_seconds', 60 * 60))
+        mk_bundle = self.key_manager.mk_search_bundle
+
+        bundles = {'': mk_bundle(search_id, pattern, True, ttl_seconds, '')}
+        bundles[''].update({
+            'cursor': -1,
+            'pools': ','.join([self.options['redis_a'], self.options['redis_b']]),
+            'children': ','.join(f'{search_id}-{i}' for i in range(len(self.KINDS))),
+        })
+        for i, kind in enumerate(self.KINDS):
+            redis_name = self.options['redis_b' if kind == ONLY_IN_B else 'redis_a']
+            bundles[kind] = mk_bundle(f'{search_id}-{i}', pattern, True, ttl_seconds, redis_name)
+            bundles[kind].update({'cursor': -1, 'parent': search_id, 'diff': kind})
+        return bundles
+
+    async def _save_searches(self, bundles: t.Dict[str, t.Dict[str, t.Any]]):
+        bundles[''].update({'count': sum(self.counts[kind] for kind in self.KINDS)})
+        for kind in self.KINDS:
+            bundles[kind]['count'] = self.counts[kind]
+
+        transaction = self.service_redis.multi_exec()
+        for bundle in bundles.values():
+            # results are already appended
+            self.key_manager.save_search_bundle(transaction, bundle)
+        await transaction.execute()
@@ -0,0 +1,26 @@
+from sanic.exceptions import SanicException, InvalidUsage
+
+
+class JobNotFoundError(SanicException):
+    MESSAGE = 'Job identifier `{job_id}` is not present in service redis'
+
+    def __init__(self, job_id: str):
+        super().__init__(self.MESSAGE.format(job_id=job_id), status_code=404)
+
+
+class JobFinishedError(SanicException):
+    MESSAGE = 'Job `{job_id}` is already {status}'
+
+    def __init__(self, job_id: str, status: str):
+        super().__init__(self.MESSAGE.format(job_id=job_id, status=status), status_code=409)
+
+
+class WrongJobOptionError(InvalidUsage):
+    MESSAGE = 'Job option `{name}` is not valid: {reason}'
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(self.MESSAGE.format(name=name, reason=reason))
+
+
+class JobCancelledError(Exception):
+    pass
@@ -0,0 +1,308 @@
+import asyncio
+import gzip
+import mmap
+import os
+import struct
+import typing as t
+import zlib
+from itertools import islice
+from time import monotonic, time
+
+import aioredis
+
+from sanic_redis_rpc.jobs.base import Job
+from sanic_redis_rpc.jobs.exceptions import WrongJobOptionError
+from sanic_redis_rpc.jobs.throttle import Throttle
+from sanic_redis_rpc.key_manager.manager import KeyManager
+
+DUMP_FILE_MAGIC = b'SRRDUMP1'
+DUMP_FILE_EXTENSION = '.rdump'
+
+# key length, absolute expiration time in milliseconds (0 means no expire), payload length
+RECORD_HEADER = struct.Struct('>IqI')
+
+
+def get_dump_file_path(export_dir: str, file_name: str) -> str:
+    """
+    :return: a path of a dump file inside ``export_dir``, file names are not allowed to point outside of it
+    """
+    if not file_name or file_name != os.path.basename(file_name) or file_name.startswith('.'):
+        raise WrongJobOptionError('file_name', 'must be a plain file name')
+    return os.path.join(export_dir, file_name)
+
+
+class DumpFileWriter:
+    """
+    Writes length-prefixed ``DUMP`` payloads with expiration times.
+    Records are buffered in memory and written (and compressed) in blocks in an executor.
+    """
+
+    def __init__(self, path: str, compress: bool = False, block_size: int = 4 * 1024 * 1024, loop=None):
+        self.path = path
+        self.compress = compress
+        self.block_size = block_size
+        self.loop = loop or asyncio.get_event_loop()
+        self.bytes_written = 0
+        self._buffer = bytearray(DUMP_FILE_MAGIC)
+        self._file = None
+
+    async def open(self):
+        def _open():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            raw = open(self.path, 'wb')
+            return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if self.compress else raw
+
+        self._file = await self.loop.run_in_executor(None, _open)
+
+    async def write(self, key: bytes, expire_at: int, dump: bytes):
+        self._buffer += RECORD_HEADER.pack(len(key), expire_at, len(dump))
+        self._buffer += key
+        self._buffer += dump
+        if len(self._buffer) >= self.block_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        block, self._buffer = bytes(self._buffer), bytearray()
+        self.bytes_written += len(block)
+        await self.loop.run_in_executor(None, self._file.write, block)
+
+    async def close(self):
+        await self.flush()
+
+        def _close():
+            raw = self._file.fileobj if self.compress else self._file
+            self._file.close()
+            raw.close()
+
+        await self.loop.run_in_executor(None, _close)
+
+    async def discard(self):
+        """
+        Drops buffered records and closes the file without flushing them, e.g. once a write has failed.
+        Errors of closing are ignored: the file is removed anyway.
+        """
+        self._buffer = bytearray()
+        if self._file is None:
+            return
+
+        def _close():
+            for file in [self._file, self._file.fileobj] if self.compress else [self._file]:
+                try:
+                    file.close()
+                except (OSError, zlib.error):
+                    pass
+
+        await self.loop.run_in_executor(None, _close)
+
+
+class DumpFileReader:
+    """
+    Reads records written with ``DumpFileWriter`` from a memory-mapped file.
+    Compressed files are detected by the gzip magic and decompressed block by block.
+    """
+
+    def __init__(self, path: str, block_size: int = 4 * 1024 * 1024, loop=None):
+        self.path = path
+        self.block_size = block_size
+        self.loop = loop or asyncio.get_event_loop()
+        self.size = os.path.getsize(path)
+
+    async def iter_windows(self, window_size: int) -> t.AsyncIterator[t.List[t.Tuple[bytes, int, bytes]]]:
+        """
+        Reads and parses records in an executor, ``window_size`` records at a time.
+        """
+        records = self.iter_records()
+        try:
+            while True:
+                window = await self.loop.run_in_executor(None, lambda: list(islice(records, window_size)))
+                if not window:
+                    return
+                yield window
+        finally:
+            await self.loop.run_in_executor(None, records.close)
+
+    def iter_records(self) -> t.Iterator[t.Tuple[bytes, int, bytes]]:
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:2] == b'\x1f\x8b':
+                yield from self._iter_buffer(self._iter_decompressed(mm))
+            else:
+                yield from self._iter_buffer(iter([mm]))
+
+    def _iter_decompressed(self, mm: mmap.mmap) -> t.Iterator[bytes]:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for offset in range(0, len(mm), self.block_size):
+            yield decompressor.decompress(mm[offset:offset + self.block_size])
+        yield decompressor.flush()
+
+    @staticmethod
+    def _iter_buffer(blocks: t.Iterator[t.Any]) -> t.Iterator[t.Tuple[bytes, int, bytes]]:
+        buffer, position, magic_checked = b'', 0, False
+        for block in blocks:
+            if isinstance(block, mmap.mmap):
+                buffer = block  # uncompressed records are sliced right from the mapping
+            else:
+                buffer = bytes(buffer[position:]) + block
+            position = 0
+
+            if not magic_checked and len(buffer) >= len(DUMP_FILE_MAGIC):
+                if bytes(buffer[:len(DUMP_FILE_MAGIC)]) != DUMP_FILE_MAGIC:
+                    raise ValueError('Not a dump file')
+                position, magic_checked = len(DUMP_FILE_MAGIC), True
+
+            while len(buffer) - position >= RECORD_HEADER.size:
+                key_length, expire_at, dump_length = RECORD_HEADER.unpack_from(buffer, position)
+                end = position + RECORD_HEADER.size + key_length + dump_length
+                if end > len(buffer):
+                    break
+                key_start = position + RECORD_HEADER.size
+                yield (
+                    bytes(buffer[key_start:key_start + key_length]),
+                    expire_at,
+                    bytes(buffer[key_start + key_length:end]),
+                )
+                position = end
+
+        if not magic_checked or len(buffer) != position:
+            raise ValueError('Dump file is truncated')
+
+
+class ExportJob(Job):
+    """
+    Streams keys matching ``pattern`` into a dump file: ``DUMP`` and ``PTTL`` are pipelined for every ``SCAN`` batch.
+    The file is written as ``<file_name>.part`` and renamed once the export is complete.
+    An existing file is never replaced unless ``overwrite`` is set.
+    """
+    KIND = 'export'
+
+    def __init__(
+            self, service_redis: aioredis.Redis, redis: aioredis.Redis, export_dir: str,
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            **kwargs):
+        super().__init__(service_redis, options, **kwargs)
+        self.redis = redis
+        if not self.options.get('file_name'):
+            self.options['file_name'] = f'{self.options.get("redis_name", "redis")}-{self.id}{DUMP_FILE_EXTENSION}' + (
+                '.gz' if self.options.get('compress') else '')
+        self.path = get_dump_file_path(export_dir, self.options['file_name'])
+        if os.path.exists(self.path + '.part'):
+            raise WrongJobOptionError('file_name', f'file {self.options["file_name"]} is being exported')
+        if os.path.exists(self.path) and not self.options.get('overwrite'):
+            raise WrongJobOptionError(
+                'file_name', f'file {self.options["file_name"]} exists, set `overwrite` to replace it')
+
+    async def run(self):
+        throttle = Throttle(
+            ops_per_second=float(self.options.get('ops_per_second', 0)),
+            target_latency=float(self.options.get('target_latency_ms', 0)) / 1000,
+        )
+        key_manager = KeyManager(self.redis, self.service_redis, scan_count=int(self.options.get('scan_count', 1000)))
+        writer = DumpFileWriter(self.path + '.part', compress=bool(self.options.get('compress')))
+        total = await self.redis.dbsize()
+        processed = exported = 0
+
+        await writer.open()
+        try:
+            async for keys in key_manager.iter_scan(self.options.get('pattern', '*')):
+                if not keys:
+                    continue
+
+                await throttle.acquire(2 * len(keys))
+                started = monotonic()
+                pipe = self.redis.pipeline()
+                for key in keys:
+                    pipe.dump(key)
+                    pipe.pttl(key)
+                results = await pipe.execute()
+                throttle.feedback(2 * len(keys), monotonic() - started)
+
+                now = int(time() * 1000)
+                for key, dump, pttl in zip(keys, results[::2], results[1::2]):
+                    # PTTL 0 is a key about to expire, it would be exported as persistent
+                    if dump is None or pttl == -2 or pttl == 0:
+                        continue  # the key has expired in between
+                    await writer.write(key, now + pttl if pttl > 0 else 0, dump)
+                    exported += 1
+
+                processed += len(keys)
+                await self.report_progress(
+                    processed, max(total, processed), exported=exported, bytes=writer.bytes_written,
+                    file_name=self.options['file_name'], **throttle.as_dict()
+                )
+        except BaseException:
+            try:
+                await writer.discard()
+            finally:
+                os.remove(writer.path)
+            raise
+        await writer.close()
+
+        if os.path.exists(self.path) and not self.options.get('overwrite'):
+            os.remove(writer.path)
+            raise WrongJobOptionError('file_name', f'file {self.options["file_name"]} has been created meanwhile')
+        os.replace(self.path + '.part', self.path)
+        await self.report_progress(
+            processed, processed, exported=exported, bytes=writer.bytes_written, file_size=os.path.getsize(self.path)
+        )
+
+
+class ImportJob(Job):
+    """
+    Restores a dump file into a redis with pipelined ``RESTORE`` windows.
+    Keys expired since the export are skipped, existing keys are skipped unless ``replace`` is set.
+    """
+    KIND = 'import'
+
+    def __init__(
+            self, service_redis: aioredis.Redis, redis: aioredis.Redis, export_dir: str,
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            **kwargs):
+        super().__init__(service_redis, options, **kwargs)
+        self.redis = redis
+        self.path = get_dump_file_path(export_dir, self.options.get('file_name', ''))
+        if not os.path.isfile(self.path):
+            raise WrongJobOptionError('file_name', f'file {self.options["file_name"]} does not exist')
+        if not int(self.options.get('window_size', 500)) > 0:
+            raise WrongJobOptionError('window_size', 'must be a positive integer')
+
+    async def run(self):
+        throttle = Throttle(
+            ops_per_second=float(self.options.get('ops_per_second', 0)),
+            target_latency=float(self.options.get('target_latency_ms', 0)) / 1000,
+        )
+        window_size = int(self.options.get('window_size', 500))
+        reader = DumpFileReader(self.path)
+        counters = {'restored': 0, 'skipped': 0, 'expired': 0, 'errors': 0}
+
+        processed = 0
+        async for window in reader.iter_windows(window_size):
+            processed += await self._restore(window, throttle, counters)
+            await self.report_progress(processed, **counters, **throttle.as_dict())
+        await self.report_progress(processed, processed, file_size=reader.size, **counters)
+
+    async def _restore(
+            self, window: t.List[t.Tuple[bytes, int, bytes]], throttle: Throttle, counters: t.Dict[str, int]) -> int:
+        now = int(time() * 1000)
+        pipe = self.redis.pipeline()
+        queued = 0
+        for key, expire_at, dump in window:
+            if expire_at and expire_at <= now:
+                counters['expired'] += 1
+                continue
+            pipe.restore(key, expire_at - now if expire_at else 0, dump, replace=bool(self.options.get('replace')))
+            queued += 1
+
+        if queued:
+            await throttle.acquire(queued)
+            started = monotonic()
+            results = await pipe.execute(return_exceptions=True)
+            throttle.feedback(queued, monotonic() - started)
+            for result in results:
+                if not isinstance(result, Exception):
+                    counters['restored'] += 1
+                elif str(result).startswith('BUSYKEY'):
+                    counters['skipped'] += 1
+                else:
+                    counters['errors'] += 1
+        return len(window)
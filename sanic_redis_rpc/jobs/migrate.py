@@ -0,0 +1,200 @@
+import asyncio
+import typing as t
+from time import monotonic
+
+import aioredis
+from aioredis import ReplyError
+
+from sanic_redis_rpc.jobs.base import Job
+from sanic_redis_rpc.jobs.diff import KeyspaceDiffJob
+from sanic_redis_rpc.jobs.exceptions import WrongJobOptionError
+from sanic_redis_rpc.jobs.throttle import Throttle
+from sanic_redis_rpc.key_manager.manager import KeyManager, chunks
+
+
+class MigrationJob(Job):
+    """
+    Copies keys from a source pool to a target pool with ``DUMP``/``PTTL`` and ``RESTORE ... REPLACE``.
+
+    Keys come either from a ``SCAN`` of the source with ``pattern`` or from stored results of a search (``search_id``).
+    They are processed in windows of ``window_size`` keys, ``in_flight`` windows at a time.
+
+    Options:
+        - ``dry_run``: only count keys that would be copied
+        - ``skip_existing``: never overwrite keys existing in the target
+        - ``delete_source``: unlink source keys once their target copies are verified by ``DUMP`` digests
+    """
+    KIND = 'migrate'
+
+    LUA_UNLINK_IF_DIGEST_SCRIPT = '''
+        local deleted = 0
+        for i, key in ipairs(KEYS) do
+            local dump = redis.call("DUMP", key)
+            if dump and redis.sha1hex(string.sub(dump, 1, -11)) == ARGV[i] then
+                deleted = deleted + redis.call("UNLINK", key)
+            end
+        end
+        return deleted
+    '''
+
+    COUNTERS = ('copied', 'skipped', 'missing', 'errors', 'deleted', 'bytes')
+
+    def __init__(
+            self, service_redis: aioredis.Redis,
+            get_redis: t.Callable[[str], t.Awaitable[aioredis.Redis]],
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            **kwargs):
+        """
+        :param get_redis: a coroutine function returning a redis by its pool name
+        """
+        super().__init__(service_redis, options, **kwargs)
+        self.get_redis = get_redis
+        self.validate_options(self.options)
+
+        self.window_size = int(self.options.get('window_size', 100))
+        self.throttle = Throttle(
+            ops_per_second=float(self.options.get('ops_per_second', 0)),
+            target_latency=float(self.options.get('target_latency_ms', 0)) / 1000,
+        )
+        self.counters = {name: 0 for name in self.COUNTERS}
+
+    @classmethod
+    def validate_options(cls, options: t.Dict[str, t.Any]):
+        for name in ['source', 'target']:
+            if not options.get(name):
+                raise WrongJobOptionError(name, 'it is required')
+        if options['source'] == options['target']:
+            raise WrongJobOptionError('target', 'must differ from the source')
+        if options.get('search_id') and options.get('pattern'):
+            raise WrongJobOptionError('search_id', 'either a pattern or a search identifier is allowed')
+        for name in ['window_size', 'in_flight', 'scan_count']:
+            if name in options and not int(options[name]) > 0:
+                raise WrongJobOptionError(name, 'must be a positive integer')
+        if options.get('dry_run') and options.get('delete_source'):
+            raise WrongJobOptionError('delete_source', 'not allowed with a dry run')
+
+    async def _iter_windows(self, source: aioredis.Redis) -> t.AsyncIterator[t.Tuple[t.List[bytes], int]]:
+        """
+        :return: an async iterator over windows of source keys and an estimated total
+        """
+        key_manager = KeyManager(source, self.service_redis, scan_count=int(self.options.get('scan_count', 1000)))
+
+        if self.options.get('search_id'):
+            info = await key_manager.get_search_info(self.options['search_id'])
+            # keys of a search are only meaningful in pools it has been made on
+            search_pools = info.get('pools', None) or [info['redis_name']]
+            if self.options['source'] not in search_pools:
+                raise WrongJobOptionError(
+                    'search_id', f'the search has been made on {", ".join(map(str, search_pools))}, not on the source'
+                )
+            async for chunk in key_manager.iter_results(info, chunk_size=self.window_size):
+                yield [key for redis_name, key in chunk if redis_name == self.options['source']], info['count']
+            return
+
+        total, window = await source.dbsize(), []
+        async for keys in key_manager.iter_scan(self.options.get('pattern') or '*'):
+            window.extend(keys)
+            while len(window) >= self.window_size:
+                yield window[:self.window_size], total
+                window = window[self.window_size:]
+        if window:
+            yield window, total
+
+    async def run(self):
+        source = await self.get_redis(self.options['source'])
+        target = await self.get_redis(self.options['target'])
+        in_flight = int(self.options.get('in_flight', 4))
+
+        pending, processed, total = set(), 0, 0
+        try:
+            async for window, total in self._iter_windows(source):
+                if not window:
+                    continue
+
+                await self.throttle.acquire(len(window))
+                pending.add(asyncio.ensure_future(self._migrate(source, target, window)))
+                if len(pending) >= in_flight:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    processed = await self._collect(done, processed, total)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                processed = await self._collect(done, processed, total)
+        except BaseException:
+            # e.g. a cancellation is requested: don't leave windows running
+            for task in pending:
+                task.cancel()
+            raise
+
+    async def _collect(self, done: t.Set[asyncio.Future], processed: int, total: int) -> int:
+        """
+        Reports progress of finished windows.
+
+        :return: the number of processed keys
+        """
+        processed += sum(task.result() for task in done)
+        await self.report_progress(
+            processed, max(total, processed),
+            dry_run=bool(self.options.get('dry_run')), **self.counters, **self.throttle.as_dict()
+        )
+        return processed
+
+    async def _migrate(self, source: aioredis.Redis, target: aioredis.Redis, keys: t.List[bytes]) -> int:
+        started = monotonic()
+
+        pipe = source.pipeline()
+        for key in keys:
+            pipe.dump(key)
+            pipe.pttl(key)
+        results = await pipe.execute()
+
+        dumps = []
+        for key, dump, pttl in zip(keys, results[::2], results[1::2]):
+            # PTTL 0 is a key about to expire, RESTORE would take 0 for "no TTL" and make it persistent
+            if dump is None or pttl == -2 or pttl == 0:
+                self.counters['missing'] += 1
+                continue
+            dumps.append((key, dump, max(pttl, 0)))
+            self.counters['bytes'] += len(dump)
+
+        if self.options.get('dry_run'):
+            await self._dry_run(target, dumps)
+        elif dumps:
+            await self._restore(source, target, dumps)
+
+        self.throttle.feedback(3 * len(keys), monotonic() - started)
+        return len(keys)
+
+    async def _dry_run(self, target: aioredis.Redis, dumps: t.List[t.Tuple[bytes, bytes, int]]):
+        existing = [0] * len(dumps)
+        if self.options.get('skip_existing') and dumps:
+            pipe = target.pipeline()
+            for key, __, __ in dumps:
+                pipe.exists(key)
+            existing = await pipe.execute()
+        self.counters['skipped'] += sum(existing)
+        self.counters['copied'] += len(dumps) - sum(existing)
+
+    async def _restore(self, source: aioredis.Redis, target: aioredis.Redis, dumps: t.List[t.Tuple[bytes, bytes, int]]):
+        replace = not self.options.get('skip_existing')
+        pipe = target.pipeline()
+        for key, dump, pttl in dumps:
+            pipe.restore(key, pttl, dump, replace=replace)
+        results = await pipe.execute(return_exceptions=True)
+
+        copied = []
+        for (key, __, __), result in zip(dumps, results):
+            if not isinstance(result, Exception):
+                copied.append(key)
+            elif isinstance(result, ReplyError) and str(result).startswith('BUSYKEY'):
+                self.counters['skipped'] += 1
+            else:
+                self.counters['errors'] += 1
+        self.counters['copied'] += len(copied)
+
+        if self.options.get('delete_source') and copied:
+            for keys in chunks(copied, self.window_size):
+                digests = await target.eval(KeyspaceDiffJob.LUA_DIGESTS_SCRIPT, keys=keys)
+                # awaited first: windows run concurrently and `+= await` would lose their updates
+                deleted = await source.eval(self.LUA_UNLINK_IF_DIGEST_SCRIPT, keys=keys, args=digests)
+                self.counters['deleted'] += deleted
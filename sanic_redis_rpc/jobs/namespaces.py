@@ -0,0 +1,266 @@
+import asyncio
+import re
+import typing as t
+from collections import Counter
+from itertools import compress
+from time import monotonic
+
+import aioredis
+from ujson import dumps as json_dumps, loads as json_loads
+
+from sanic_redis_rpc.jobs.base import Job, mk_job_key
+from sanic_redis_rpc.jobs.exceptions import WrongJobOptionError
+from sanic_redis_rpc.jobs.throttle import Throttle
+from sanic_redis_rpc.key_manager.exceptions import PageNotFoundError
+
+
+def mk_tree_key(job_id: str, service_key_prefix: str = 'sanic-redis-rpc') -> str:
+    return mk_job_key(job_id, service_key_prefix) + ':tree'
+
+
+class _Node:
+    __slots__ = ['count', 'keys', 'other', 'sampled', 'memory', 'types', 'children']
+
+    def __init__(self):
+        self.count = 0  # keys under this prefix
+        self.keys = 0  # keys equal to this prefix
+        self.other = 0  # keys of pruned children
+        self.sampled = 0
+        self.memory = 0
+        self.types = Counter()
+        self.children: t.Dict[str, '_Node'] = {}
+
+
+class NamespaceTree:
+    """
+    A prefix trie over key segments. A segment ends with a delimiter, so paths are actual key prefixes:
+    ``user:1_session`` is split into ``user:``, ``1_``, ``session`` with delimiters ``:_``.
+
+    Every node counts keys under its prefix. Sampled keys also contribute their types and memory usage.
+    The number of nodes is capped with ``max_nodes``: once exceeded, the rarest branches are folded
+    into ``other`` counters of their parents. Pruned branches may grow back if they turn out to be frequent.
+    """
+
+    def __init__(self, delimiters: str = ':', max_depth: int = 8, max_nodes: int = 10000):
+        self.delimiters = delimiters
+        self.max_depth = max(1, max_depth)
+        self.max_nodes = max(1, max_nodes)
+        self.root = _Node()
+        self.num_nodes = 1
+        self.prune_threshold = 0
+        self._splitter = re.compile('[^%s]*[%s]|[^%s]+$' % ((re.escape(delimiters),) * 3))
+
+    def split(self, key: str) -> t.List[str]:
+        segments = self._splitter.findall(key)
+        if len(segments) > self.max_depth:
+            segments[self.max_depth - 1:] = [''.join(segments[self.max_depth - 1:])]
+        return segments
+
+    def add(self, key: str, key_type: t.Optional[str] = None, memory: t.Optional[int] = None):
+        node = self._add(self.root, key_type, memory)
+        for segment in self.split(key):
+            child = node.children.get(segment, None)
+            if child is None:
+                child = node.children[segment] = _Node()
+                self.num_nodes += 1
+            node = self._add(child, key_type, memory)
+        node.keys += 1
+
+        if self.num_nodes > self.max_nodes:
+            self.prune()
+
+    @staticmethod
+    def _add(node: _Node, key_type: t.Optional[str], memory: t.Optional[int]) -> _Node:
+        node.count += 1
+        if key_type is not None:
+            node.sampled += 1
+            node.types[key_type] += 1
+            node.memory += memory or 0
+        return node
+
+    def prune(self):
+        """
+        Folds branches with the lowest counts into their parents until at most 3/4 of ``max_nodes`` are left.
+        """
+        self.prune_threshold = 0
+        while self.num_nodes > max(1, self.max_nodes * 3 // 4):
+            self.prune_threshold = max(1, self.prune_threshold * 2)
+            self._prune(self.root)
+
+    def _prune(self, node: _Node):
+        for segment, child in list(node.children.items()):
+            if child.count <= self.prune_threshold:
+                node.other += child.count
+                self.num_nodes -= self._size(child)
+                del node.children[segment]
+            else:
+                self._prune(child)
+
+    def _size(self, node: _Node) -> int:
+        return 1 + sum(self._size(child) for child in node.children.values())
+
+    def iter_records(self) -> t.Iterator[t.Tuple[str, t.Dict[str, t.Any]]]:
+        """
+        :return: an iterator over ``(path, node bundle)`` pairs, the root path is an empty string
+        """
+        stack = [('', self.root)]
+        while stack:
+            path, node = stack.pop()
+            yield path, self._mk_record(path, node)
+            stack.extend((path + segment, child) for segment, child in node.children.items())
+
+    def get_node(self, path: str = '', limit: int = 100) -> t.Dict[str, t.Any]:
+        """
+        :return: a node bundle with its ``limit`` largest children expanded (see ``NamespaceJob.get_node``)
+        """
+        node = self.root
+        for segment in self.split(path):
+            node = node.children.get(segment, None)
+            if node is None:
+                raise PageNotFoundError(f'Namespace tree has no node `{path}`')
+
+        bundle = self._mk_record(path, node)
+        segments = bundle['children'][:max(0, limit)]
+        bundle['num_children'] = len(bundle['children'])
+        bundle['children'] = []
+        for segment in segments:
+            child = self._mk_record(path + segment, node.children[segment])
+            child['num_children'] = len(child.pop('children'))
+            bundle['children'].append(child)
+        return bundle
+
+    @staticmethod
+    def _mk_record(path: str, node: _Node) -> t.Dict[str, t.Any]:
+        return {
+            'path': path,
+            'count': node.count,
+            'keys': node.keys,
+            'other': node.other,
+            'sampled': node.sampled,
+            'types': dict(node.types),
+            'memory': node.memory,
+            'estimated_memory': int(node.memory * node.count / node.sampled) if node.sampled else None,
+            'children': sorted(node.children, key=lambda segment: -node.children[segment].count),
+        }
+
+
+class NamespaceJob(Job):
+    """
+    Builds a ``NamespaceTree`` with a throttled ``SCAN`` and stores its nodes in a service redis hash,
+    so nodes can be expanded lazily. The tree built so far is stored every ``publish_interval`` seconds
+    and once the job stops for any reason, ``tree_processed`` tells how many keys it counts.
+    Every ``1 / sample_rate``-th key is sampled with ``TYPE`` and ``MEMORY USAGE``.
+    """
+    KIND = 'namespaces'
+
+    def __init__(
+            self, service_redis: aioredis.Redis, redis: aioredis.Redis,
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            **kwargs):
+        super().__init__(service_redis, options, **kwargs)
+        self.redis = redis
+        self.validate_options(self.options)
+
+    @classmethod
+    def validate_options(cls, options: t.Dict[str, t.Any]):
+        if not options.get('delimiters'):
+            raise WrongJobOptionError('delimiters', 'at least one delimiter is required')
+        if not 0 <= float(options.get('sample_rate', 0)) <= 1:
+            raise WrongJobOptionError('sample_rate', 'must be between 0 and 1')
+        for name in ['max_depth', 'max_nodes', 'scan_count']:
+            if name in options and not int(options[name]) > 0:
+                raise WrongJobOptionError(name, 'must be a positive integer')
+
+    async def run(self):
+        tree = NamespaceTree(
+            delimiters=self.options['delimiters'],
+            max_depth=int(self.options.get('max_depth', 8)),
+            max_nodes=int(self.options.get('max_nodes', 10000)),
+        )
+        throttle = Throttle(
+            ops_per_second=float(self.options.get('ops_per_second', 0)),
+            target_latency=float(self.options.get('target_latency_ms', 0)) / 1000,
+        )
+        sample_rate = float(self.options.get('sample_rate', 0))
+        sample_every = int(round(1 / sample_rate)) if sample_rate else 0
+        scan_count = int(self.options.get('scan_count', 1000))
+        publish_interval = float(self.options.get('publish_interval', 5))
+        total = await self.redis.dbsize()
+
+        processed, cur, published = 0, b'0', monotonic()
+        try:
+            while cur:
+                await throttle.acquire(scan_count)
+                started = monotonic()
+                cur, keys = await self.redis.scan(cur, match=self.options.get('pattern', '*'), count=scan_count)
+
+                samples = [sample_every and (processed + i) % sample_every == 0 for i in range(len(keys))]
+                sampled_keys = list(compress(keys, samples))
+                types_and_memory = await self._sample(sampled_keys) if sampled_keys else iter([])
+                throttle.feedback(scan_count + 2 * len(sampled_keys), monotonic() - started)
+
+                for key, sampled in zip(keys, samples):
+                    key_type, memory = next(types_and_memory) if sampled else (None, None)
+                    tree.add(key.decode('utf8', errors='backslashreplace'), key_type, memory)
+
+                processed += len(keys)
+                if cur and monotonic() - published >= publish_interval:
+                    await self._save_tree(tree)
+                    self.result['tree_processed'], published = processed, monotonic()
+                await self.report_progress(
+                    processed, max(total, processed), nodes=tree.num_nodes, prune_threshold=tree.prune_threshold
+                )
+        finally:
+            # progress made so far is kept if the job is cancelled or fails
+            await asyncio.shield(self._save_tree(tree))
+            self.result['tree_processed'] = processed
+
+    async def _sample(self, keys: t.List[bytes]) -> t.Iterator[t.Tuple[t.Optional[str], t.Optional[int]]]:
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.type(key)
+            pipe.memory_usage(key)
+        results = [
+            None if isinstance(result, Exception) else result
+            for result in await pipe.execute(return_exceptions=True)
+        ]
+        return ((key_type.decode() if key_type else None, memory) for key_type, memory in zip(results[::2], results[1::2]))
+
+    async def _save_tree(self, tree: NamespaceTree, batch_size: int = 1000):
+        tree_key = mk_tree_key(self.id, self.service_key_prefix)
+        records = {}
+        # a tree is replaced at once, readers never see a half-saved one
+        pipe = self.service_redis.multi_exec()
+        pipe.delete(tree_key)
+        for path, bundle in tree.iter_records():
+            records[path] = json_dumps(bundle)
+            if len(records) >= batch_size:
+                pipe.hmset_dict(tree_key, records)
+                records = {}
+        if records:
+            pipe.hmset_dict(tree_key, records)
+        pipe.expire(tree_key, self.ttl_seconds)
+        await pipe.execute()
+
+    @classmethod
+    async def get_node(
+            cls, service_redis: aioredis.Redis, job_id: str, path: str = '', limit: int = 100,
+            service_key_prefix: str = 'sanic-redis-rpc') -> t.Dict[str, t.Any]:
+        """
+        :return: a node bundle with its ``limit`` largest children expanded
+        """
+        tree_key = mk_tree_key(job_id, service_key_prefix)
+        raw = await service_redis.hget(tree_key, path, encoding='utf8')
+        if raw is None:
+            raise PageNotFoundError(f'Namespace tree of job {job_id} has no node `{path}`')
+
+        node = json_loads(raw)
+        segments = node['children'][:max(0, limit)]
+        node['num_children'] = len(node['children'])
+        node['children'] = []
+        if segments:
+            children = await service_redis.hmget(tree_key, *[path + segment for segment in segments], encoding='utf8')
+            for child in map(json_loads, children):
+                child['num_children'] = len(child.pop('children'))
+                node['children'].append(child)
+        return node
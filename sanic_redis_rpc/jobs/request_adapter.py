@@ -0,0 +1,242 @@
+import typing as t
+
+from sanic.exceptions import InvalidUsage
+from sanic.request import Request
+
+from sanic_redis_rpc.key_manager.exceptions import RedisPoolNotFoundError
+from sanic_redis_rpc.key_manager.manager import KeyManager
+from sanic_redis_rpc.key_manager.stores import mk_result_store
+from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper
+from .base import Job, JobRunner
+from .exceptions import WrongJobOptionError
+from .bigkeys import BigKeysJob
+from .bulk import BulkKeysJob
+from .diff import KeyspaceDiffJob
+from .files import ExportJob, ImportJob
+from .migrate import MigrationJob
+from .namespaces import NamespaceJob
+
+
+class JobRequestAdapter:
+    # noinspection PyProtectedMember
+    def __init__(self, request: Request):
+        self.request: Request = request
+        self.pools_wrapper: RedisPoolsShareWrapper = request.app._pools_wrapper
+        self.job_runner: JobRunner = request.app._job_runner
+        self.options = self.parse_request()
+
+    def parse_request(self) -> t.Dict[str, t.Any]:
+        data = self.request.json or {}
+        if not isinstance(data, dict):
+            raise WrongJobOptionError('body', 'must be a json object')
+        return {
+            'action': data.get('action', None),
+            'ttl_seconds': self._parse(data, 'ttl_seconds', int, None),
+            'prefix': data.get('prefix', None),
+            'chunk_size': self._parse(data, 'chunk_size', int, 500),
+            'ops_per_second': self._parse(data, 'ops_per_second', float, 0),
+            'target_latency_ms': self._parse(data, 'target_latency_ms', float, 0),
+            'job_ttl_seconds': self._parse(data, 'job_ttl_seconds', int, 60 * 60),
+            'pattern': data.get('pattern', '*'),
+            'delimiters': data.get('delimiters', ':'),
+            'max_depth': self._parse(data, 'max_depth', int, 8),
+            'max_nodes': self._parse(data, 'max_nodes', int, 10000),
+            'sample_rate': self._parse(data, 'sample_rate', float, 0),
+            'scan_count': self._parse(data, 'scan_count', int, 1000),
+            'top': self._parse(data, 'top', int, 20),
+            'samples': self._parse(data, 'samples', int, 5),
+            'publish_interval': self._parse(data, 'publish_interval', float, 1),
+            'resume': data.get('resume', None),
+            'redis_a': data.get('redis_a', None),
+            'redis_b': data.get('redis_b', None),
+            'compare_values': bool(data.get('compare_values', True)),
+            'search_ttl_seconds': self._parse(data, 'search_ttl_seconds', int, 60 * 60),
+            'source': data.get('source', None),
+            'target': data.get('target', None),
+            'search_id': data.get('search_id', None),
+            'window_size': self._parse(data, 'window_size', int, 100),
+            'in_flight': self._parse(data, 'in_flight', int, 4),
+            'dry_run': bool(data.get('dry_run', False)),
+            'skip_existing': bool(data.get('skip_existing', False)),
+            'delete_source': bool(data.get('delete_source', False)),
+            'file_name': data.get('file_name', None),
+            'compress': bool(data.get('compress', False)),
+            'replace': bool(data.get('replace', False)),
+            'overwrite': bool(data.get('overwrite', False)),
+            'path': self.request.args.get('path', ''),
+            'limit': self._parse(self.request.args, 'limit', int, 100),
+        }
+
+    @staticmethod
+    def _parse(data: t.Mapping[str, t.Any], name: str, cast: t.Callable[[t.Any], t.Any], default: t.Any) -> t.Any:
+        """
+        :raises WrongJobOptionError: if an option given can't be cast
+        """
+        value = data.get(name, default)
+        if value is None and default is None:
+            return None
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            raise WrongJobOptionError(name, f'must be {"an integer" if cast is int else "a number"}')
+
+    def _get_urls(
+            self, job_id: str, kind: t.Optional[str] = None,
+            result: t.Optional[t.Dict[str, t.Any]] = None) -> t.Dict[str, str]:
+        urls = {
+            'get_job_info': self.request.app.url_for('sanic-redis-rpc.get_job_info', job_id=job_id),
+            'cancel_job': self.request.app.url_for('sanic-redis-rpc.cancel_job', job_id=job_id),
+        }
+        if kind == NamespaceJob.KIND:
+            urls['get_namespace_node'] = self.request.app.url_for(
+                'sanic-redis-rpc.get_namespace_node', job_id=job_id)
+        if result and result.get('search_id'):
+            urls['get_search_info'] = self.request.app.url_for(
+                'sanic-redis-rpc.get_search_info', search_id=result['search_id'])
+        return urls
+
+    def _get_job_options(self, *names: str, **extra) -> t.Dict[str, t.Any]:
+        return dict({name: self.options[name] for name in names}, **extra)
+
+    async def _start(self, job: Job) -> t.Dict[str, t.Any]:
+        info = await self.job_runner.start(job)
+        info['endpoints'] = self._get_urls(job.id, job.KIND)
+        return info
+
+    async def start_bulk(self, search_id: str) -> t.Dict[str, t.Any]:
+        service_redis = await self.pools_wrapper.get_service_redis()
+        info = await KeyManager(None, service_redis).get_search_info(search_id)
+        if info.get('snapshot'):
+            raise InvalidUsage(f'Search {search_id} is a snapshot search, its keys can not be changed')
+
+        return await self._start(BulkKeysJob(
+            service_redis,
+            self.pools_wrapper.get_redis,
+            self._get_job_options(
+                'action', 'ttl_seconds', 'prefix', 'chunk_size', 'ops_per_second', 'target_latency_ms',
+                search_id=search_id
+            ),
+            ttl_seconds=self.options['job_ttl_seconds'],
+        ))
+
+    async def start_namespaces(self, redis_name: str) -> t.Dict[str, t.Any]:
+        if redis_name not in self.pools_wrapper.pool_names:
+            raise RedisPoolNotFoundError(redis_name)
+
+        return await self._start(NamespaceJob(
+            await self.pools_wrapper.get_service_redis(),
+            await self.pools_wrapper.get_redis(redis_name),
+            self._get_job_options(
+                'pattern', 'delimiters', 'max_depth', 'max_nodes', 'sample_rate', 'scan_count', 'publish_interval',
+                'ops_per_second', 'target_latency_ms',
+                redis_name=redis_name
+            ),
+            ttl_seconds=self.options['job_ttl_seconds'],
+        ))
+
+    async def start_bigkeys(self, redis_name: str) -> t.Dict[str, t.Any]:
+        if redis_name not in self.pools_wrapper.pool_names:
+            raise RedisPoolNotFoundError(redis_name)
+
+        job = BigKeysJob(
+            await self.pools_wrapper.get_service_redis(),
+            await self.pools_wrapper.get_redis(redis_name),
+            self._get_job_options(
+                'pattern', 'top', 'samples', 'scan_count', 'publish_interval', 'resume',
+                'ops_per_second', 'target_latency_ms',
+                redis_name=redis_name
+            ),
+            ttl_seconds=self.options['job_ttl_seconds'],
+        )
+        if job.options['resume']:
+            await job.restore()  # a job to resume is checked before this one starts
+        return await self._start(job)
+
+    async def start_diff(self) -> t.Dict[str, t.Any]:
+        for redis_name in [self.options['redis_a'], self.options['redis_b']]:
+            if redis_name and redis_name not in self.pools_wrapper.pool_names:
+                raise RedisPoolNotFoundError(redis_name)
+
+        service_redis = await self.pools_wrapper.get_service_redis()
+        return await self._start(KeyspaceDiffJob(
+            service_redis,
+            self.pools_wrapper.get_redis,
+            self._get_job_options(
+                'redis_a', 'redis_b', 'pattern', 'compare_values', 'chunk_size', 'scan_count', 'search_ttl_seconds',
+                'ops_per_second', 'target_latency_ms',
+            ),
+            ttl_seconds=self.options['job_ttl_seconds'],
+            result_store=mk_result_store(
+                service_redis,
+                self.request.app.config.result_store,
+                results_dir=self.request.app.config.results_dir,
+            ),
+        ))
+
+    async def start_migration(self) -> t.Dict[str, t.Any]:
+        for redis_name in [self.options['source'], self.options['target']]:
+            if redis_name and redis_name not in self.pools_wrapper.pool_names:
+                raise RedisPoolNotFoundError(redis_name)
+
+        data = self.request.json or {}
+        return await self._start(MigrationJob(
+            await self.pools_wrapper.get_service_redis(),
+            self.pools_wrapper.get_redis,
+            self._get_job_options(
+                'source', 'target', 'search_id', 'window_size', 'in_flight', 'scan_count',
+                'dry_run', 'skip_existing', 'delete_source', 'ops_per_second', 'target_latency_ms',
+                pattern=data.get('pattern', None),  # a search identifier is used if there's no pattern
+            ),
+            ttl_seconds=self.options['job_ttl_seconds'],
+        ))
+
+    async def start_export(self, redis_name: str) -> t.Dict[str, t.Any]:
+        if redis_name not in self.pools_wrapper.pool_names:
+            raise RedisPoolNotFoundError(redis_name)
+
+        return await self._start(ExportJob(
+            await self.pools_wrapper.get_service_redis(),
+            await self.pools_wrapper.get_redis(redis_name),
+            self.request.app.config.export_dir,
+            self._get_job_options(
+                'pattern', 'file_name', 'compress', 'overwrite', 'scan_count', 'ops_per_second', 'target_latency_ms',
+                redis_name=redis_name
+            ),
+            ttl_seconds=self.options['job_ttl_seconds'],
+        ))
+
+    async def start_import(self, redis_name: str) -> t.Dict[str, t.Any]:
+        if redis_name not in self.pools_wrapper.pool_names:
+            raise RedisPoolNotFoundError(redis_name)
+
+        return await self._start(ImportJob(
+            await self.pools_wrapper.get_service_redis(),
+            await self.pools_wrapper.get_redis(redis_name),
+            self.request.app.config.export_dir,
+            self._get_job_options(
+                'file_name', 'replace', 'window_size', 'ops_per_second', 'target_latency_ms',
+                redis_name=redis_name
+            ),
+            ttl_seconds=self.options['job_ttl_seconds'],
+        ))
+
+    async def get_info(self, job_id: str) -> t.Dict[str, t.Any]:
+        info = await Job.get_info(await self.pools_wrapper.get_service_redis(), job_id)
+        info['endpoints'] = self._get_urls(job_id, info['kind'], info['result'])
+        return info
+
+    async def cancel(self, job_id: str) -> t.Dict[str, t.Any]:
+        info = await Job.request_cancel(await self.pools_wrapper.get_service_redis(), job_id)
+        info['endpoints'] = self._get_urls(job_id, info['kind'])
+        return info
+
+    async def get_namespace_node(self, job_id: str) -> t.Dict[str, t.Any]:
+        service_redis = await self.pools_wrapper.get_service_redis()
+        node = await NamespaceJob.get_node(service_redis, job_id, self.options['path'], self.options['limit'])
+        node['endpoints'] = {
+            'children': [
+                self.request.app.url_for('sanic-redis-rpc.get_namespace_node', job_id=job_id, path=child['path'])
+                for child in node['children']
+            ]
+        }
+        return node
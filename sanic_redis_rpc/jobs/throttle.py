@@ -0,0 +1,70 @@
+import asyncio
+import typing as t
+from time import monotonic
+
+
+class Throttle:
+    """
+    Paces operations issued against a redis.
+
+    The rate is limited with ``ops_per_second`` (``0`` means unlimited).
+    If ``target_latency`` (seconds) is set, the rate adapts to observed latencies:
+    it is halved every time a chunk of operations takes longer than the target
+    and grows back additively while latencies stay below it.
+    """
+
+    DECREASE_FACTOR = 0.5
+    INCREASE_STEP = 0.1
+
+    def __init__(self, ops_per_second: float = 0, target_latency: float = 0, min_ops_per_second: float = 1):
+        self.max_rate = ops_per_second or None
+        self.rate: t.Optional[float] = self.max_rate
+        self.target_latency = target_latency
+        self.min_rate = min_ops_per_second
+        self.last_latency = 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self, ops: int = 1):
+        """
+        Waits until ``ops`` operations may be issued.
+        """
+        if not self.rate:
+            return
+
+        now = monotonic()
+        delay = self._next_slot - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._next_slot = max(now, self._next_slot) + ops / self.rate
+
+    def feedback(self, ops: int, latency: float):
+        """
+        :param ops: the number of operations issued
+        :param latency: the time it took to execute them, seconds
+        """
+        self.last_latency = latency
+        if not self.target_latency or not ops:
+            return
+
+        if latency > self.target_latency:
+            observed_rate = ops / latency if latency else self.min_rate
+            self.rate = max(self.min_rate, min(self.rate or observed_rate, observed_rate) * self.DECREASE_FACTOR)
+            return
+
+        if self.rate is None:
+            return
+
+        # grow back to the configured limit, or become unlimited if there's none
+        step = (self.max_rate or self.rate) * self.INCREASE_STEP
+        self.rate += step
+        if self.max_rate and self.rate >= self.max_rate:
+            self.rate = self.max_rate
+        elif not self.max_rate and self.rate >= ops / max(latency, 1e-6):
+            self.rate = None
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            'rate': self.rate or 0,
+            'max_rate': self.max_rate or 0,
+            'last_latency': round(self.last_latency, 6),
+        }
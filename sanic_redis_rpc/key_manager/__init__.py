@@ -1,3 +1,4 @@
 from .manager import KeyManager
 from .exceptions import *
+from .live_index import LiveKeyIndex
 from .request_adapter import KeyManagerRequestAdapter
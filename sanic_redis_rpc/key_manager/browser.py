@@ -0,0 +1,194 @@
+import re
+import typing as t
+
+import aioredis
+
+from sanic_redis_rpc.key_manager.exceptions import WrongCursorError
+from sanic_redis_rpc.key_manager.values import (
+    KeyValuesLoader, decode_nested, format_scan_cursor, parse_offset, parse_scan_cursor
+)
+
+STREAM_ID_RE = re.compile(r'^\d+(-\d+)?$')
+
+
+def next_stream_id(entry_id: str) -> str:
+    """
+    Returns the smallest stream entry id greater than ``entry_id`` (works with redis < 6.2 lacking ``(`` ranges).
+
+    :raises ValueError: if ``entry_id`` is not a stream entry id
+    """
+    if not STREAM_ID_RE.match(entry_id):
+        raise ValueError(f'`{entry_id}` is not a stream entry id')
+    ms, __, seq = entry_id.partition('-')
+    return f'{ms}-{int(seq or 0) + 1}'
+
+
+class CollectionBrowser:
+    """
+    Browses a single key incrementally with stateless cursors:
+
+        - hash, set: ``HSCAN``/``SSCAN`` cursor plus a number of elements to skip from its batch
+        - zset, list: rank/index offset used in ``ZRANGE WITHSCORES``/``LRANGE`` windows
+        - string: byte offset used in ``GETRANGE`` windows
+        - stream: the last seen entry id
+
+    Every call stops as soon as the element budget (``max_elements``) or the byte budget (``max_bytes``)
+    is exhausted, so it never loads the whole collection. At least one element is always returned.
+    """
+
+    def __init__(
+            self, redis: aioredis.Redis,
+            max_elements: int = 1000,
+            max_bytes: int = 1024 * 1024,
+            scan_count: int = 500):
+        self.redis = redis
+        self.max_elements = max(1, max_elements)
+        self.max_bytes = max(1, max_bytes)
+        self.scan_count = max(1, scan_count)
+
+        self.next_cursor = None
+        self._elements_left = self.max_elements
+        self._bytes_left = self.max_bytes
+
+    async def browse(
+            self, key: str, cursor: t.Optional[str] = None
+    ) -> t.Tuple[t.Dict[str, t.Any], t.AsyncIterator[t.List[t.Any]]]:
+        """
+        :return: a bundle describing the key and an async iterator over batches of its elements;
+            ``next_cursor`` is populated after the iterator is exhausted (``None`` if there's nothing left)
+        """
+        raw = await self.redis.eval(KeyValuesLoader.LUA_TYPES_AND_LENGTHS_SCRIPT, keys=[key])
+        key_type, length = raw[0].decode(), raw[1]
+        bundle = {'key': key, 'type': key_type, 'length': length, 'cursor': cursor}
+
+        iterate = getattr(self, f'_iter_{key_type}', None)
+        if iterate is None:
+            return bundle, self._iter_nothing()
+
+        try:
+            return bundle, iterate(key, cursor)
+        except ValueError:
+            raise WrongCursorError(cursor, key_type)
+
+    def _consume(self, elements: t.List[t.Any]) -> int:
+        """
+        :return: the number of ``elements`` fitting into the budget left
+        """
+        taken = 0
+        for element in elements:
+            if self._elements_left <= 0 or (self._bytes_left <= 0 and taken):
+                break
+            self._elements_left -= 1
+            self._bytes_left -= self._size(element)
+            taken += 1
+        return taken
+
+    @property
+    def _exhausted(self) -> bool:
+        return self._elements_left <= 0 or self._bytes_left <= 0
+
+    @staticmethod
+    def _size(element: t.Any) -> int:
+        if isinstance(element, (list, tuple)):
+            return sum(CollectionBrowser._size(item) for item in element)
+        if isinstance(element, dict):
+            return sum(CollectionBrowser._size(item) for item in element.items())
+        if isinstance(element, bytes):
+            return len(element)
+        return len(str(element))
+
+    async def _iter_nothing(self):
+        return
+        yield
+
+    async def _iter_scan(self, command: t.Callable, key: str, cursor: t.Optional[str]):
+        scan_cursor, skip = parse_scan_cursor(cursor)
+        while True:
+            count = min(self.scan_count, self._elements_left)
+            next_scan_cursor, elements = await command(key, scan_cursor, count=count)
+            elements = elements[skip:]
+            taken = self._consume(elements)
+            if taken:
+                yield decode_nested(elements[:taken])
+
+            if taken < len(elements):
+                self.next_cursor = format_scan_cursor(scan_cursor, skip + taken)
+                return
+
+            scan_cursor, skip = next_scan_cursor, 0
+            if not scan_cursor:
+                self.next_cursor = None
+                return
+
+            if self._exhausted:
+                self.next_cursor = format_scan_cursor(scan_cursor)
+                return
+
+    def _iter_hash(self, key: str, cursor: t.Optional[str]):
+        parse_scan_cursor(cursor)
+        return self._iter_scan(self.redis.hscan, key, cursor)
+
+    def _iter_set(self, key: str, cursor: t.Optional[str]):
+        parse_scan_cursor(cursor)
+        return self._iter_scan(self.redis.sscan, key, cursor)
+
+    async def _iter_window(self, command: t.Callable, key: str, offset: int):
+        while True:
+            window = min(self.scan_count, self._elements_left)
+            elements = await command(key, offset, offset + window - 1)
+            taken = self._consume(elements)
+            if taken:
+                yield decode_nested(elements[:taken])
+            offset += taken
+
+            if len(elements) < window and taken == len(elements):
+                self.next_cursor = None
+                return
+
+            if self._exhausted or taken < len(elements):
+                self.next_cursor = offset
+                return
+
+    def _iter_zset(self, key: str, cursor: t.Optional[str]):
+        return self._iter_window(
+            lambda _key, start, stop: self.redis.zrange(_key, start, stop, withscores=True),
+            key, parse_offset(cursor)
+        )
+
+    def _iter_list(self, key: str, cursor: t.Optional[str]):
+        return self._iter_window(self.redis.lrange, key, parse_offset(cursor))
+
+    def _iter_string(self, key: str, cursor: t.Optional[str]):
+        offset = parse_offset(cursor)
+
+        async def _iter():
+            window = self.max_bytes
+            chunk = await self.redis.getrange(key, offset, offset + window - 1)
+            if chunk:
+                yield [decode_nested(chunk)]
+            self.next_cursor = offset + window if len(chunk) == window else None
+
+        return _iter()
+
+    def _iter_stream(self, key: str, cursor: t.Optional[str]):
+        start = next_stream_id(cursor) if cursor else '-'
+
+        async def _iter():
+            nonlocal start
+            while True:
+                window = min(self.scan_count, self._elements_left)
+                entries = await self.redis.xrange(key, start, '+', count=window)
+                taken = self._consume(entries)
+                if taken:
+                    yield decode_nested(entries[:taken])
+
+                if len(entries) < window and taken == len(entries):
+                    self.next_cursor = None
+                    return
+
+                start = next_stream_id(entries[taken - 1][0].decode())
+                if self._exhausted or taken < len(entries):
+                    self.next_cursor = entries[taken - 1][0].decode()
+                    return
+
+        return _iter()
@@ -24,3 +24,38 @@ class WrongNumberError(InvalidUsage):
 
 class PageNotFoundError(NotFound):
     pass
+
+
+class WrongPatternError(InvalidUsage):
+    MESSAGE = 'Pattern `{pattern}` is not valid: {reason}'
+
+    def __init__(self, pattern, reason):
+        super().__init__(self.MESSAGE.format(pattern=pattern, reason=reason))
+
+
+class RedisPoolNotFoundError(NotFound):
+    MESSAGE = 'Pool with name `{redis_name}` does not exist'
+
+    def __init__(self, redis_name: str):
+        super().__init__(self.MESSAGE.format(redis_name=redis_name))
+
+
+class WrongMetadataFieldError(InvalidUsage):
+    MESSAGE = 'Metadata field `{field}` is not supported, choose from {choices}'
+
+    def __init__(self, field, choices):
+        super().__init__(self.MESSAGE.format(field=field, choices=', '.join(choices)))
+
+
+class WrongCursorError(InvalidUsage):
+    MESSAGE = 'Cursor `{cursor}` is not valid for a key of type `{key_type}`'
+
+    def __init__(self, cursor, key_type: str):
+        super().__init__(self.MESSAGE.format(cursor=cursor, key_type=key_type))
+
+
+class WrongSamplingMethodError(InvalidUsage):
+    MESSAGE = 'Sampling method `{method}` is not supported, choose from {choices}'
+
+    def __init__(self, method, choices):
+        super().__init__(self.MESSAGE.format(method=method, choices=', '.join(choices)))
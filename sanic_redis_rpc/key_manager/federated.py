@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+import typing as t
+from itertools import repeat
+from uuid import uuid4
+
+import aioredis
+from sortedcontainers import SortedSet
+
+from sanic_redis_rpc.key_manager.live_index import LiveKeyIndex
+from sanic_redis_rpc.key_manager.manager import KeyManager, tag_key
+from sanic_redis_rpc.key_manager.stores import ResultStore
+
+
+class FederatedKeyManager(KeyManager):
+    """
+    Searches keys across several redis pools. Per-pool sorted results are merged into a single
+    globally sorted result where every key is tagged with the name of the pool it belongs to.
+    Pages of federated searches are served by a regular ``KeyManager.get_page``.
+    """
+
+    def __init__(
+            self, redis_map: t.Dict[str, aioredis.Redis], service_redis: aioredis.Redis,
+            scan_count: int = 5000,
+            concurrency: int = 8,
+            scan_semaphores: t.Optional[t.Dict[str, asyncio.Semaphore]] = None,
+            service_key_prefix: str = 'sanic-redis-rpc',
+            key_indexes: t.Optional[t.Dict[str, LiveKeyIndex]] = None,
+            result_store: t.Optional[ResultStore] = None):
+        super().__init__(
+            None, service_redis,
+            scan_count=scan_count, service_key_prefix=service_key_prefix, result_store=result_store
+        )
+        self.redis_map = redis_map
+        self.concurrency = max(1, concurrency)
+        self.scan_semaphores = scan_semaphores or {}
+        self.key_indexes = key_indexes or {}
+
+    async def search(
+            self,
+            pattern: str = '*',
+            sort_keys: bool = True,
+            ttl_seconds: int = 5 * 60,
+            redis_name: str = '') -> t.Dict[str, t.Union[str, t.Any]]:
+
+        if not sort_keys:
+            raise ValueError('Federated search results are always sorted')
+
+        redis_names = list(self.redis_map.keys())
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _scan_pool(_redis_name: str) -> SortedSet:
+            async with semaphore, self.scan_semaphores.get(_redis_name) or _NullContext():
+                key_manager = KeyManager(
+                    self.redis_map[_redis_name], self.service_redis,
+                    scan_count=self.scan_count,
+                    key_index=self.key_indexes.get(_redis_name, None)
+                )
+                return await key_manager.get_sorted_keys(pattern)
+
+        per_pool_keys = await asyncio.gather(*[_scan_pool(_redis_name) for _redis_name in redis_names])
+
+        search_id = uuid4().hex
+        search_bundle = self.mk_search_bundle(search_id, pattern, True, ttl_seconds, '')
+        search_bundle['pools'] = ','.join(redis_names)
+
+        merged = heapq.merge(*[
+            zip(keys, repeat(i))
+            for i, keys in enumerate(per_pool_keys)
+        ])
+        results = [tag_key(i, key) for key, i in merged]
+        search_bundle.update({'cursor': -1, 'count': len(results)})
+
+        transaction = self.service_redis.multi_exec()
+        self.save_search(transaction, search_bundle, results)
+        await self.result_store.execute(transaction)
+
+        search_bundle['pools'] = redis_names
+        search_bundle['counts'] = {
+            _redis_name: len(keys)
+            for _redis_name, keys in zip(redis_names, per_pool_keys)
+        }
+        return search_bundle
+
+
+class _NullContext:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc_info):
+        return False
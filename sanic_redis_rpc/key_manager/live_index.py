@@ -0,0 +1,266 @@
+import asyncio
+import typing as t
+from time import monotonic
+
+import aioredis
+from sortedcontainers import SortedSet
+
+from sanic_redis_rpc.key_manager.patterns import KeyPattern
+
+# an estimated cost of a key in the index besides the key itself: a bytes object, a hash table slot and a list slot
+KEY_OVERHEAD = 100
+
+# keyspace event classes needed to see every created and deleted key: generic, all types, expired and evicted
+REQUIRED_EVENT_CLASSES = 'g$lshzxet'
+
+REMOVE_EVENTS = frozenset([b'del', b'expired', b'evicted', b'rename_from', b'move_from'])
+# fired before a key is actually written (redis 7)
+IGNORED_EVENTS = frozenset([b'new'])
+
+
+class LiveKeyIndex:
+    """
+    An in-memory sorted set of keys of a redis db kept current from ``__keyevent@<db>__:*`` notifications.
+
+    A dedicated connection subscribes to notifications before the index is bootstrapped with ``SCAN``,
+    events received meanwhile are buffered and replayed once the scan is over. Lost notifications
+    (a dropped subscription, ``FLUSHDB``, disabled notifications) are detected by comparing ``DBSIZE``
+    with the size of the index every ``verify_interval`` seconds and fixed with a resync.
+
+    Keyevent notifications are not enabled by the index unless ``configure_notifications`` is set,
+    the index stays ``disabled`` until they are (checked every ``verify_interval`` seconds).
+
+    While the index is not ``ready`` (or its estimated size exceeds ``max_memory``),
+    ``get_keys`` returns ``None`` and searches fall back to ``SCAN``.
+    """
+    STATE_STOPPED = 'stopped'
+    STATE_BOOTSTRAPPING = 'bootstrapping'
+    STATE_READY = 'ready'
+    STATE_STALE = 'stale'
+    STATE_OVERFLOW = 'overflow'
+    STATE_DISABLED = 'disabled'
+
+    def __init__(
+            self, redis: aioredis.Redis,
+            create_subscriber: t.Callable[[], t.Awaitable[aioredis.Redis]],
+            db: int = 0,
+            max_memory: int = 64 * 1024 * 1024,
+            scan_count: int = 1000,
+            verify_interval: float = 60,
+            verify_tolerance: float = 0.01,
+            retry_interval: float = 1,
+            configure_notifications: bool = False):
+        """
+        :param redis: a redis to scan
+        :param create_subscriber: a coroutine function returning a new connection to the same db for pub/sub
+        :param verify_tolerance: a share of keys the index may differ from ``DBSIZE`` by (at least 10 keys)
+        :param configure_notifications: enable missing keyspace event classes with ``CONFIG SET``,
+            it changes the config of the whole server
+        """
+        self.redis = redis
+        self.create_subscriber = create_subscriber
+        self.db = db
+        self.max_memory = max_memory
+        self.scan_count = scan_count
+        self.verify_interval = verify_interval
+        self.verify_tolerance = verify_tolerance
+        self.retry_interval = retry_interval
+        self.configure_notifications = configure_notifications
+
+        self.state = self.STATE_STOPPED
+        self.memory = 0
+        self.counters = {'hits': 0, 'misses': 0, 'events': 0, 'syncs': 0, 'overflows': 0}
+        self.last_error: t.Optional[str] = None
+        self.synced_at: t.Optional[float] = None
+
+        self._keys = SortedSet()
+        self._buffer: t.Optional[t.List[t.Tuple[bytes, bytes]]] = None
+        self._overflow_keys = 0
+        self._task: t.Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == self.STATE_READY
+
+    def start(self) -> 'LiveKeyIndex':
+        if self._task is None:
+            self.state = self.STATE_BOOTSTRAPPING
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+        self._reset(self.STATE_STOPPED)
+
+    def get_keys(self, key_pattern: KeyPattern) -> t.Optional[t.List[bytes]]:
+        """
+        :return: sorted keys matching ``key_pattern``, only the range of its literal prefix is visited;
+            ``None`` if the index is not ready
+        """
+        if not self.ready:
+            self.counters['misses'] += 1
+            return None
+
+        self.counters['hits'] += 1
+        prefix = key_pattern.prefix.encode('utf8')
+        res = []
+        for key in self._keys.irange(minimum=prefix):
+            if not key.startswith(prefix):
+                break
+            if key_pattern.match(key):
+                res.append(key)
+        return res
+
+    def get_stats(self) -> t.Dict[str, t.Any]:
+        return dict(
+            self.counters,
+            state=self.state,
+            db=self.db,
+            keys=len(self._keys),
+            memory=self.memory,
+            max_memory=self.max_memory,
+            last_error=self.last_error,
+            synced_seconds_ago=round(monotonic() - self.synced_at, 3) if self.synced_at else None,
+        )
+
+    def _reset(self, state: str):
+        self.state = state
+        self._keys = SortedSet()
+        self._buffer = None
+        self.memory = 0
+
+    async def _run(self):
+        while True:
+            try:
+                if self.state != self.STATE_OVERFLOW or await self._may_fit():
+                    await self._sync()
+            except (aioredis.RedisError, OSError, asyncio.TimeoutError) as e:
+                self.last_error = repr(e)
+            if self.state not in [self.STATE_OVERFLOW, self.STATE_DISABLED]:
+                self._reset(self.STATE_STALE)
+            await asyncio.sleep(self.retry_interval if self.state == self.STATE_STALE else self.verify_interval)
+
+    async def _may_fit(self) -> bool:
+        """
+        An overflown index is retried once the db shrinks by a quarter.
+        """
+        return await self.redis.dbsize() <= self._overflow_keys * 3 // 4
+
+    async def _ensure_notifications(self) -> bool:
+        """
+        :return: ``False`` if keyevent notifications are not enabled and may not be enabled
+        """
+        try:
+            config = await self.redis.config_get('notify-keyspace-events')
+            flags = set(config.get('notify-keyspace-events', ''))
+            if 'E' in flags and ('A' in flags or set(REQUIRED_EVENT_CLASSES) <= flags):
+                return True
+            if not self.configure_notifications:
+                self.last_error = 'Keyevent notifications of all classes (`EA`) must be enabled'
+                return False
+            await self.redis.config_set('notify-keyspace-events', ''.join(sorted(flags | {'E', 'A'})))
+            return True
+        except aioredis.ReplyError as e:  # e.g. CONFIG is disabled on managed redis
+            self.last_error = f'Keyevent notifications can not be checked: {e}'
+            return False
+
+    async def _sync(self):
+        """
+        Subscribes to notifications, bootstraps the index and keeps it current until notifications are lost.
+        """
+        if not await self._ensure_notifications():
+            self._reset(self.STATE_DISABLED)
+            return
+
+        subscriber = await self.create_subscriber()
+        reader = None
+        try:
+            channel, = await subscriber.psubscribe(f'__keyevent@{self.db}__:*')
+
+            self._reset(self.STATE_BOOTSTRAPPING)
+            self._buffer = []
+            reader = asyncio.ensure_future(self._read(channel))
+            if not await self._bootstrap():
+                return
+
+            while True:
+                done, __ = await asyncio.wait([reader], timeout=self.verify_interval)
+                if done or not self.ready or not await self._verify():
+                    return
+        finally:
+            if reader is not None:
+                reader.cancel()
+            subscriber.close()
+            await subscriber.wait_closed()
+
+    async def _bootstrap(self) -> bool:
+        """
+        :return: ``False`` if the index has overflown
+        """
+        cur = b'0'
+        while cur:
+            cur, keys = await self.redis.scan(cur, count=self.scan_count)
+            for key in keys:
+                if not self._add(key):
+                    return False
+
+        buffer, self._buffer = self._buffer, None
+        for event, key in buffer:
+            if not self._apply(event, key):
+                return False
+
+        self.state = self.STATE_READY
+        self.counters['syncs'] += 1
+        self.synced_at = monotonic()
+        return True
+
+    async def _verify(self) -> bool:
+        """
+        :return: ``False`` if the index differs from ``DBSIZE`` too much
+        """
+        dbsize = await self.redis.dbsize()
+        if abs(dbsize - len(self._keys)) <= max(10, int(dbsize * self.verify_tolerance)):
+            self.synced_at = monotonic()
+            return True
+        self.last_error = f'Index has {len(self._keys)} keys while DBSIZE is {dbsize}'
+        return False
+
+    async def _read(self, channel: aioredis.Channel):
+        while await channel.wait_message():
+            channel_name, key = await channel.get()
+            event = channel_name.rsplit(b':', 1)[-1]
+            self.counters['events'] += 1
+            if self._buffer is not None:
+                self._buffer.append((event, key))
+            elif self.state == self.STATE_READY and not self._apply(event, key):
+                return
+
+    def _apply(self, event: bytes, key: bytes) -> bool:
+        if event in IGNORED_EVENTS:
+            return True
+        if event in REMOVE_EVENTS:
+            if key in self._keys:
+                self._keys.remove(key)
+                self.memory -= len(key) + KEY_OVERHEAD
+            return True
+        return self._add(key)
+
+    def _add(self, key: bytes) -> bool:
+        """
+        :return: ``False`` if the index has overflown
+        """
+        if key in self._keys:
+            return True
+
+        self._keys.add(key)
+        self.memory += len(key) + KEY_OVERHEAD
+        if self.memory > self.max_memory:
+            self._overflow_keys = len(self._keys)
+            self.counters['overflows'] += 1
+            self.last_error = f'Index exceeded {self.max_memory} bytes'
+            self._reset(self.STATE_OVERFLOW)
+            return False
+        return True
@@ -8,6 +8,10 @@ from sortedcontainers import SortedSet
 
 from sanic_redis_rpc.key_manager.exceptions import SearchIdNotFoundError, WrongPageSizeError, WrongNumberError, \
     PageNotFoundError
+from sanic_redis_rpc.key_manager.live_index import LiveKeyIndex
+from sanic_redis_rpc.key_manager.metadata import KeyMetadataLoader
+from sanic_redis_rpc.key_manager.patterns import KeyPattern, get_scan_match
+from sanic_redis_rpc.key_manager.stores import ResultStore, RedisListResultStore, get_result_store
 
 
 def chunks(l, n):
@@ -15,6 +19,21 @@ def chunks(l, n):
     return (l[i:i + n] for i in range(0, len(l), n))
 
 
+def tag_key(pool_index: int, key: bytes) -> bytes:
+    """
+    Prefixes ``key`` with an index of the pool it was found in (federated searches).
+    """
+    return b'%d:%s' % (pool_index, key)
+
+
+def untag_keys(tagged_keys: t.List[str], redis_names: t.List[str]) -> t.List[t.Dict[str, str]]:
+    res = []
+    for tagged_key in tagged_keys:
+        pool_index, key = tagged_key.split(':', 1)
+        res.append({'redis_name': redis_names[int(pool_index)], 'key': key})
+    return res
+
+
 class KeyManager:
     LUA_COUNT_MATCHES_SCRIPT = '''
         local cursor = "0"
@@ -36,12 +55,21 @@ class KeyManager:
     def __init__(
             self, redis: aioredis.Redis, service_redis: aioredis.Redis,
             scan_count: int = 5000,
-            service_key_prefix: str = 'sanic-redis-rpc'):
+            service_key_prefix: str = 'sanic-redis-rpc',
+            key_index: t.Optional[LiveKeyIndex] = None,
+            result_store: t.Optional[ResultStore] = None):
+        """
+        :param key_index: a live index of ``redis`` keys, sorted searches use it instead of ``SCAN`` when it's ready
+        :param result_store: a store results of new searches are written to (service redis lists by default),
+            existing searches are read from the store they were written to
+        """
         self.redis = redis
         self.service_redis = service_redis
         self.cursor = 0
         self.scan_count = scan_count
         self.service_key_prefix = service_key_prefix
+        self.key_index = key_index
+        self.result_store = result_store or RedisListResultStore(service_redis, scan_count=scan_count)
 
     async def search(
             self,
@@ -54,40 +82,85 @@ class KeyManager:
             raise ValueError('With sort_keys == False you must specify the redis_name')
 
         search_id = uuid4().hex
-        search_key = self._mk_search_key(search_id)
-        results_key = self._mk_results_key(search_id)
-        search_bundle = {
-            'id': search_id,
-            'cursor': 0,
-            'sorted': int(sort_keys),
-            'pattern': pattern,
-            'ttl_seconds': ttl_seconds,
-            'results_key': results_key,
-            'timestamp': datetime.now().isoformat(),
-            'count': -1,
-            'redis_name': redis_name,
-        }
+        search_bundle = self.mk_search_bundle(search_id, pattern, sort_keys, ttl_seconds, redis_name)
 
         if sort_keys:
-            results = await self._get_sorted_keys(pattern)
+            results = await self.get_sorted_keys(pattern)
             search_bundle.update({'cursor': -1, 'count': len(results)})
         else:
             results = []
             search_bundle.update({'count': await self._get_match_count(pattern)})
 
         transaction = self.service_redis.multi_exec()
-        transaction.hmset_dict(search_key, search_bundle)
-        transaction.expire(search_key, ttl_seconds)
+        self.save_search(transaction, search_bundle, results)
+        await self.result_store.execute(transaction)
 
-        for chunk in chunks(results, self.scan_count):
-            transaction.rpush(results_key, *chunk)
+        return search_bundle
 
-        transaction.expire(results_key, ttl_seconds)
-        await transaction.execute()
+    async def search_many(
+            self,
+            patterns: t.Sequence[str] = (),
+            regexes: t.Sequence[str] = (),
+            ttl_seconds: int = 5 * 60,
+            redis_name: str = '') -> t.Dict[str, t.Union[str, t.Any]]:
+        """
+        Searches keys matching any of glob-style ``patterns`` or regular expressions ``regexes``
+        with a single ``SCAN`` pass. Keys are classified locally into sorted per-pattern searches
+        available as ``searches`` in the resulting bundle. The parent search holds a union of all matches.
+
+        :param patterns: a list of redis glob-style patterns
+        :param regexes: a list of regular expressions (matched with ``re.search``)
+        :param ttl_seconds: ttl of the search and all its per-pattern searches
+        :param redis_name: redis pool name
+        :return: a search bundle
+        """
+        key_patterns = [KeyPattern(pattern) for pattern in patterns]
+        key_patterns += [KeyPattern(regex, regex=True) for regex in regexes]
+        if not key_patterns:
+            raise ValueError('At least one pattern or regular expression must be specified')
+
+        match = get_scan_match(key_patterns)
+        containers = [SortedSet() for _ in key_patterns]
+        union = SortedSet()
+
+        async for keys in self._iter_keys(match):
+            for key in keys:
+                matched = False
+                for key_pattern, container in zip(key_patterns, containers):
+                    if key_pattern.match(key):
+                        container.add(key)
+                        matched = True
+                if matched:
+                    union.add(key)
+
+        search_id = uuid4().hex
+        search_bundle = self.mk_search_bundle(search_id, match, True, ttl_seconds, redis_name)
+        search_bundle.update({'cursor': -1, 'count': len(union)})
 
+        searches = []
+        for i, (key_pattern, container) in enumerate(zip(key_patterns, containers)):
+            child_bundle = self.mk_search_bundle(
+                f'{search_id}-{i}', key_pattern.pattern, True, ttl_seconds, redis_name)
+            child_bundle.update({
+                'cursor': -1, 'count': len(container), 'regex': int(key_pattern.regex), 'parent': search_id
+            })
+            searches.append((child_bundle, container))
+
+        search_bundle['children'] = ','.join(child_bundle['id'] for child_bundle, __ in searches)
+
+        transaction = self.service_redis.multi_exec()
+        self.save_search(transaction, search_bundle, union)
+        for child_bundle, container in searches:
+            self.save_search(transaction, child_bundle, container)
+        await self.result_store.execute(transaction)
+
+        search_bundle['children'] = search_bundle['children'].split(',')
+        search_bundle['searches'] = [child_bundle for child_bundle, __ in searches]
         return search_bundle
 
-    async def get_page(self, search_id: str, page_number: int, per_page: int = 1000) -> t.List[str]:
+    async def get_page(
+            self, search_id: str, page_number: int, per_page: int = 1000
+    ) -> t.List[t.Union[str, t.Dict[str, str]]]:
         page_number, per_page = int(page_number), int(per_page)
         if not (per_page > 0):
             raise WrongPageSizeError(per_page)
@@ -100,6 +173,7 @@ class KeyManager:
         )
 
         results_key, count, cursor, pattern = info['results_key'], info['count'], info['cursor'], info['pattern']
+        result_store = get_result_store(self.service_redis, info)
 
         if count <= 0:
             return []
@@ -115,18 +189,33 @@ class KeyManager:
             finish = count - 1
 
         if info['sorted'] == 0:
-            await self._load_more(search_id, pattern, cursor, finish + 1)
+            await self._load_more(
+                search_id, pattern, cursor, finish + 1, result_store=result_store, ttl_seconds=info['ttl_seconds']
+            )
 
-        keys = await self.service_redis.lrange(results_key, start, finish, encoding='utf8')
+        keys = [key.decode('utf8') for key in await result_store.get_range(results_key, start, finish)]
+        if 'pools' in info:
+            return untag_keys(keys, info['pools'])
         return keys
 
     async def refresh_ttl(self, search_id: str, ttl_seconds: int = 5 * 60):
         search_key = self._mk_search_key(search_id)
-        results_key = self._mk_results_key(search_id)
+        fields = ['children', 'store', 'chunk_size', 'results_key']
+        info = dict(zip(fields, await self.service_redis.hmget(search_key, *fields, encoding='utf8')))
+        result_store = get_result_store(self.service_redis, info)
+        children = info['children']
+
         pipe = self.service_redis.pipeline()
-        pipe.expire(search_key, ttl_seconds)
-        pipe.expire(results_key, ttl_seconds)
-        return await pipe.execute()
+        results_expired = []
+        for _search_id in [search_id] + (children.split(',') if children else []):
+            pipe.expire(self._mk_search_key(_search_id), ttl_seconds)
+            results_key = result_store.mk_results_key(self.service_key_prefix, _search_id)
+            results_expired.append(result_store.expire(pipe, results_key, ttl_seconds))
+            pipe.expire(self.mk_metadata_key(_search_id), ttl_seconds)
+        expired = await pipe.execute()
+
+        # report only the state of the requested search itself
+        return [expired[0], expired[1] if results_expired[0] is None else results_expired[0]]
 
     async def get_search_info(self, search_id: str) -> t.Dict[str, t.Any]:
         search_key = self._mk_search_key(search_id)
@@ -137,60 +226,177 @@ class KeyManager:
         for k in ['sorted', 'ttl_seconds', 'count', 'cursor']:
             info_bundle[k] = int(info_bundle[k])
 
+        if 'regex' in info_bundle:
+            info_bundle['regex'] = int(info_bundle['regex'])
+        for k in ['children', 'pools']:
+            if k in info_bundle:
+                info_bundle[k] = info_bundle[k].split(',')
+
         return info_bundle
 
-    async def _load_more(self, search_id: str, pattern: str, cursor: int, finish: int):
+    async def iter_results(
+            self, info: t.Dict[str, t.Any], chunk_size: int = 1000
+    ) -> t.AsyncIterator[t.List[t.Tuple[str, bytes]]]:
+        """
+        Walks stored results of a search in chunks. Unsorted searches are loaded up to the end first.
+
+        :param info: a search info bundle
+        :param chunk_size: the number of keys in a chunk
+        :return: an async iterator over chunks of ``(redis_name, key)`` pairs, keys are raw bytes
+        """
+        results_key, result_store = info['results_key'], get_result_store(self.service_redis, info)
+        if not info['sorted']:
+            await self._load_more(
+                info['id'], info['pattern'], info['cursor'], info['count'],
+                result_store=result_store, ttl_seconds=info['ttl_seconds']
+            )
+
+        redis_names = info.get('pools', None)
+        start = 0
+        while True:
+            keys = await result_store.get_range(results_key, start, start + chunk_size - 1)
+            if not keys:
+                return
+            start += len(keys)
+
+            if redis_names:
+                chunk = []
+                for tagged_key in keys:
+                    pool_index, key = tagged_key.split(b':', 1)
+                    chunk.append((redis_names[int(pool_index)], key))
+                yield chunk
+            else:
+                yield [(info['redis_name'], key) for key in keys]
+
+    def get_metadata_loader(
+            self, search_id: str, ttl_seconds: int = 5 * 60,
+            redis: t.Optional[aioredis.Redis] = None) -> KeyMetadataLoader:
+        """
+        :param search_id: search identifier metadata is cached for
+        :param ttl_seconds: ttl of the metadata cache
+        :param redis: a redis to load metadata from (searched redis by default)
+        """
+        return KeyMetadataLoader(
+            redis or self.redis, self.service_redis, self.mk_metadata_key(search_id), ttl_seconds=ttl_seconds
+        )
+
+    async def get_sorted_keys(self, match: str = '*') -> SortedSet:
+        """
+        :return: keys matching ``match``, taken from the live key index if it's ready
+        """
+        container = SortedSet()
+        async for keys in self._iter_keys(match):
+            container.update(keys)
+        return container
+
+    async def iter_scan(self, match: str = '*') -> t.AsyncIterator[t.List[bytes]]:
+        """
+        :return: an async iterator over batches of keys ``SCAN`` returns, a batch may be empty
+        """
+        cur = b'0'
+        while cur:
+            cur, keys = await self.redis.scan(cur, match=match, count=self.scan_count)
+            yield keys
+
+    def mk_search_bundle(
+            self, search_id: str, pattern: str, sort_keys: bool,
+            ttl_seconds: int, redis_name: str) -> t.Dict[str, t.Any]:
+        return {
+            'id': search_id,
+            'cursor': 0,
+            'sorted': int(sort_keys),
+            'pattern': pattern,
+            'ttl_seconds': ttl_seconds,
+            'results_key': self._mk_results_key(search_id),
+            'timestamp': datetime.now().isoformat(),
+            'count': -1,
+            'redis_name': redis_name,
+            **self.result_store.as_dict(),
+        }
+
+    def save_search(self, transaction, search_bundle: t.Dict[str, t.Any], results: t.Sequence[bytes]):
+        """
+        Adds commands saving a search bundle and its results to ``transaction``,
+        it's executed with ``result_store.execute``.
+        """
+        self.save_search_bundle(transaction, search_bundle)
+        self.result_store.save(transaction, search_bundle['results_key'], results, search_bundle['ttl_seconds'])
+
+    def save_search_bundle(self, transaction, search_bundle: t.Dict[str, t.Any]):
+        """
+        Saves a search bundle only, results stored already are left as they are.
+        """
+        search_key = self._mk_search_key(search_bundle['id'])
+        transaction.hmset_dict(search_key, search_bundle)
+        transaction.expire(search_key, search_bundle['ttl_seconds'])
+
+    def mk_metadata_key(self, search_id: str) -> str:
+        return ':'.join([self.service_key_prefix, search_id, 'metadata'])
+
+    async def _load_more(
+            self, search_id: str, pattern: str, cursor: int, finish: int,
+            result_store: t.Optional[ResultStore] = None, ttl_seconds: t.Optional[int] = None):
         """
         :param search_id: search identifier
         :param pattern: original search pattern
         :param cursor: current cursor
         :param finish: corrected finish (it must not be gte total)
+        :param result_store: a store of the search results (``result_store`` of the manager by default)
+        :param ttl_seconds: ttl of the search (it's read from the search bundle by default)
         :return:
         """
-        results_key = self._mk_results_key(search_id)
+        result_store = result_store or self.result_store
+        results_key = result_store.mk_results_key(self.service_key_prefix, search_id)
         search_key = self._mk_search_key(search_id)
-        llen = await self.service_redis.llen(results_key)
-        if llen and cursor == 0:
+        length = await result_store.get_length(results_key)
+        if length and cursor == 0:
             return None  # cannot load more since we've reached the end before
 
-        keys_to_load = finish - llen
+        keys_to_load = finish - length
         if keys_to_load <= 0:
             return None  # no need to load
 
         keys_left = keys_to_load
+        loaded = []
 
         cur = f'{cursor}'
-        transaction = self.service_redis.multi_exec()
         while cur:
             cur, keys = await self.redis.scan(cur, match=pattern, count=self.scan_count)
             if not keys:
                 continue
 
-            transaction.rpush(results_key, *keys)
+            loaded.extend(keys)
             keys_left -= len(keys)
 
             if keys_left <= 0:
                 break
 
+        if ttl_seconds is None:
+            ttl_seconds = int(await self.service_redis.hget(search_key, 'ttl_seconds') or 5 * 60)
+        transaction = self.service_redis.multi_exec()
+        await result_store.append(transaction, results_key, loaded, length, ttl_seconds)
         transaction.hset(search_key, 'cursor', cur)
-        return await transaction.execute()
+        return await result_store.execute(transaction)
 
     async def _get_match_count(self, pattern: str = '*') -> int:
         pattern = pattern.replace('"', r'\"')
         script = self.LUA_COUNT_MATCHES_SCRIPT.format(pattern=pattern, scan_count=self.scan_count)
         return int(await self.redis.eval(script))
 
-    async def _get_sorted_keys(self, match: str = '*'):
-        container = SortedSet()
-        cur = b'0'
-        while cur:
-            cur, keys = await self.redis.scan(cur, match=match, count=self.scan_count)
-            for key in keys:
-                container.add(key)
-        return container
+    async def _iter_keys(self, match: str = '*') -> t.AsyncIterator[t.List[bytes]]:
+        """
+        Takes keys matching ``match`` from the live key index if it's ready, ``SCAN``s them otherwise.
+        """
+        keys = self.key_index.get_keys(KeyPattern(match)) if self.key_index else None
+        if keys is not None:
+            yield keys
+            return
+
+        async for keys in self.iter_scan(match):
+            yield keys
 
     def _mk_search_key(self, search_id: str) -> str:
         return ':'.join([self.service_key_prefix, search_id])
 
     def _mk_results_key(self, search_id: str) -> str:
-        return ':'.join([self.service_key_prefix, search_id, 'results'])
+        return self.result_store.mk_results_key(self.service_key_prefix, search_id)
@@ -0,0 +1,124 @@
+import typing as t
+from math import ceil
+from time import time
+
+import aioredis
+from ujson import dumps as json_dumps, loads as json_loads
+
+from sanic_redis_rpc.key_manager.exceptions import WrongMetadataFieldError
+
+METADATA_FIELDS = ('type', 'ttl', 'encoding', 'memory')
+
+
+def parse_metadata_fields(raw: t.Optional[str]) -> t.List[str]:
+    """
+    Parses an ``enrich`` query argument, e.g. ``type,ttl``. ``all`` (or an empty flag) enables every field.
+    """
+    if raw is None:
+        return []
+
+    if raw.strip().lower() in ['', '1', 'true', 'all']:
+        return list(METADATA_FIELDS)
+
+    fields = [field.strip().lower() for field in raw.split(',') if field.strip()]
+    for field in fields:
+        if field not in METADATA_FIELDS:
+            raise WrongMetadataFieldError(field, METADATA_FIELDS)
+    return fields
+
+
+class KeyMetadataLoader:
+    """
+    Loads ``TYPE``, ``PTTL``, ``OBJECT ENCODING`` and ``MEMORY USAGE`` for a page of keys in a single pipeline.
+    Loaded metadata is cached in a service redis hash living as long as the search itself.
+    TTL is cached as an absolute expiration time, so it stays accurate while the cache is alive.
+    """
+
+    def __init__(
+            self, redis: aioredis.Redis, service_redis: aioredis.Redis, cache_key: str,
+            ttl_seconds: int = 5 * 60,
+            memory_samples: int = 5):
+        self.redis = redis
+        self.service_redis = service_redis
+        self.cache_key = cache_key
+        self.ttl_seconds = ttl_seconds
+        self.memory_samples = memory_samples
+
+    async def load(
+            self, keys: t.List[str], fields: t.Sequence[str] = METADATA_FIELDS,
+            cache_prefix: str = '') -> t.List[t.Dict[str, t.Any]]:
+        if not keys:
+            return []
+
+        cache_fields = [cache_prefix + key for key in keys]
+        cached = await self.service_redis.hmget(self.cache_key, *cache_fields, encoding='utf8')
+        metadata = [json_loads(bundle) if bundle else {} for bundle in cached]
+
+        queued = [
+            (i, field)
+            for i in range(len(keys)) for field in fields
+            if self._cache_name(field) not in metadata[i]
+        ]
+
+        # fully cached pages (e.g. snapshot searches) never touch redis
+        if queued:
+            pipe = self.redis.pipeline()
+            for i, field in queued:
+                getattr(self, f'_queue_{field}')(pipe, keys[i])
+
+            updated = {}
+            for (i, field), value in zip(queued, await pipe.execute(return_exceptions=True)):
+                if isinstance(value, Exception):
+                    value = None
+                metadata[i][self._cache_name(field)] = getattr(self, f'_convert_{field}')(value)
+                updated[cache_fields[i]] = json_dumps(metadata[i])
+
+            cache_pipe = self.service_redis.pipeline()
+            cache_pipe.hmset_dict(self.cache_key, updated)
+            cache_pipe.expire(self.cache_key, self.ttl_seconds)
+            await cache_pipe.execute()
+
+        return [self._present(bundle, fields) for bundle in metadata]
+
+    @staticmethod
+    def _cache_name(field: str) -> str:
+        return 'expire_at' if field == 'ttl' else field
+
+    def _present(self, bundle: t.Dict[str, t.Any], fields: t.Sequence[str]) -> t.Dict[str, t.Any]:
+        res = {field: bundle[self._cache_name(field)] for field in fields}
+        if 'ttl' in res and res['ttl'] >= 0:
+            res['ttl'] = max(0, int(ceil(res['ttl'] / 1000 - time())))
+        return res
+
+    def _queue_type(self, pipe, key: str):
+        pipe.type(key)
+
+    def _queue_ttl(self, pipe, key: str):
+        pipe.pttl(key)
+
+    def _queue_encoding(self, pipe, key: str):
+        pipe.object_encoding(key)
+
+    def _queue_memory(self, pipe, key: str):
+        pipe.memory_usage(key, samples=self.memory_samples)
+
+    @staticmethod
+    def _convert_type(value: t.Optional[bytes]) -> t.Optional[str]:
+        return value.decode() if value else None
+
+    @staticmethod
+    def _convert_ttl(value: t.Optional[int]) -> int:
+        """
+        :return: an absolute expiration time in milliseconds or ``-1`` (no expire) and ``-2`` (no key)
+        """
+        if value is None or value < 0:
+            return -2 if value is None else value
+        return int(time() * 1000) + value
+
+    @staticmethod
+    def _convert_encoding(value: t.Optional[str]) -> t.Optional[str]:
+        return value
+
+    @staticmethod
+    def _convert_memory(value: t.Optional[int]) -> t.Optional[int]:
+        return value
@@ -0,0 +1,154 @@
+import re
+import typing as t
+from os.path import commonprefix
+
+from sanic_redis_rpc.key_manager.exceptions import WrongPatternError
+
+GLOB_SPECIAL_CHARS = '*?[]\\'
+REGEX_SPECIAL_CHARS = '.^$*+?{}[]\\|()'
+REGEX_QUANTIFIERS = '*?{'
+
+
+def escape_glob(value: str) -> str:
+    return ''.join('\\' + ch if ch in GLOB_SPECIAL_CHARS else ch for ch in value)
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Translates a redis glob-style pattern into a regular expression.
+    Unlike ``fnmatch.translate`` it follows redis ``stringmatchlen`` semantics:
+    ``\\`` escapes the next char and ``[^...]`` negates a character class.
+
+    :param pattern: redis glob-style pattern, e.g. ``user:[0-9]*``
+    :return: a regular expression matching the whole key
+    """
+    res, i, n = [], 0, len(pattern)
+    while i < n:
+        ch = pattern[i]
+        i += 1
+        if ch == '*':
+            res.append('.*')
+        elif ch == '?':
+            res.append('.')
+        elif ch == '\\' and i < n:
+            res.append(re.escape(pattern[i]))
+            i += 1
+        elif ch == '[':
+            end = _find_char_class_end(pattern, i)
+            if end == -1:
+                res.append(re.escape(ch))
+                continue
+            res.append(_translate_char_class(pattern[i:end]))
+            i = end + 1
+        else:
+            res.append(re.escape(ch))
+    return ''.join(res)
+
+
+def _find_char_class_end(pattern: str, start: int) -> int:
+    i = start
+    while i < len(pattern):
+        if pattern[i] == '\\':
+            i += 2
+            continue
+        if pattern[i] == ']':
+            return i
+        i += 1
+    return -1
+
+
+def _translate_char_class(body: str) -> str:
+    negate = body.startswith('^')
+    body = body[1:] if negate else body
+    items, i, n = [], 0, len(body)
+    while i < n:
+        ch = body[i]
+        if ch == '\\' and i + 1 < n:
+            ch = body[i + 1]
+            i += 1
+        if i + 2 < n and body[i + 1] == '-':
+            start, stop = sorted([ch, body[i + 2]])
+            items.append(f'{re.escape(start)}-{re.escape(stop)}')
+            i += 3
+            continue
+        items.append(re.escape(ch))
+        i += 1
+
+    if not items:
+        return '.' if negate else '(?!)'
+    return '[%s%s]' % ('^' if negate else '', ''.join(items))
+
+
+def glob_literal_prefix(pattern: str) -> str:
+    prefix, i = [], 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\' and i + 1 < len(pattern):
+            prefix.append(pattern[i + 1])
+            i += 2
+            continue
+        if ch in '*?[':
+            break
+        prefix.append(ch)
+        i += 1
+    return ''.join(prefix)
+
+
+def regex_literal_prefix(pattern: str) -> str:
+    """
+    Extracts a literal prefix every match of an anchored regular expression must start with.
+    Returns an empty string if the pattern is not anchored or contains alternations.
+    """
+    if not pattern.startswith('^') or '|' in pattern:
+        return ''
+
+    prefix, i = [], 1
+    while i < len(pattern):
+        ch = pattern[i]
+        step = 1
+        if ch == '\\':
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                break
+            ch, step = pattern[i + 1], 2
+        elif ch in REGEX_SPECIAL_CHARS:
+            break
+
+        if pattern[i + step:i + step + 1] and pattern[i + step] in REGEX_QUANTIFIERS:
+            break
+
+        prefix.append(ch)
+        if pattern[i + step:i + step + 1] == '+':
+            break
+        i += step
+    return ''.join(prefix)
+
+
+class KeyPattern:
+    def __init__(self, pattern: str, regex: bool = False):
+        if not isinstance(pattern, str) or not pattern:
+            raise WrongPatternError(pattern, 'a non-empty string expected')
+
+        self.pattern = pattern
+        self.regex = regex
+
+        expression = pattern if regex else glob_to_regex(pattern)
+        try:
+            self._compiled = re.compile(expression.encode('utf8'), re.DOTALL)
+        except re.error as e:
+            raise WrongPatternError(pattern, str(e))
+
+        self._match = self._compiled.search if regex else self._compiled.fullmatch
+        self.prefix = regex_literal_prefix(pattern) if regex else glob_literal_prefix(pattern)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(pattern="{self.pattern}" regex={self.regex})'
+
+    def match(self, key: bytes) -> bool:
+        return self._match(key) is not None
+
+
+def get_scan_match(key_patterns: t.List[KeyPattern]) -> str:
+    """
+    Computes a single ``SCAN MATCH`` pattern covering all given patterns.
+    """
+    return escape_glob(commonprefix([key_pattern.prefix for key_pattern in key_patterns])) + '*'
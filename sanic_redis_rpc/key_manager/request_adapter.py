@@ -1,11 +1,21 @@
 import typing as t
 from asyncio import gather
+from collections import OrderedDict
 from math import ceil
 
 import aioredis
+from sanic.exceptions import InvalidUsage
 from sanic.request import Request
 from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper
-from .manager import KeyManager
+from .browser import CollectionBrowser
+from .exceptions import WrongPatternError, RedisPoolNotFoundError
+from .federated import FederatedKeyManager
+from .live_index import LiveKeyIndex
+from .manager import KeyManager, chunks
+from .metadata import parse_metadata_fields
+from .stores import ResultStore, mk_result_store
+from .stats import KeyspaceSampler
+from .values import KeyValuesLoader
 
 
 class KeyManagerRequestAdapter:
@@ -13,6 +23,7 @@ class KeyManagerRequestAdapter:
     def __init__(self, request: Request, redis_name: t.Optional[str] = None):
         self.request: Request = request
         self.pools_wrapper: RedisPoolsShareWrapper = request.app._pools_wrapper
+        self.key_indexes: t.Dict[str, LiveKeyIndex] = request.app._key_indexes
         self.redis_name = redis_name
         self.options = self.parse_request()
 
@@ -31,9 +42,15 @@ class KeyManagerRequestAdapter:
         self.service_redis: aioredis.Redis = await self.pools_wrapper.get_service_redis()
         self.key_manager = KeyManager(
             self.redis, self.service_redis,
-            scan_count=self.options['scan_count']
+            scan_count=self.options['scan_count'],
+            key_index=self.key_indexes.get(self.redis_name, None),
+            result_store=self._mk_result_store(),
         )
 
+    def _mk_result_store(self) -> ResultStore:
+        config = self.request.app.config
+        return mk_result_store(self.service_redis, config.result_store, results_dir=config.results_dir)
+
     async def _init_redis(self, redis_name: str):
         # since we know nothing about sort_keys flag at the moment get_page called
         # we need a way to post-init an actual redis stored by name in search info bundle
@@ -45,6 +62,8 @@ class KeyManagerRequestAdapter:
             'get_page': self.request.app.url_for('sanic-redis-rpc.get_page', page_number=1, search_id=search_id),
             'refresh_ttl': self.request.app.url_for('sanic-redis-rpc.refresh_ttl', search_id=search_id),
             'get_search_info': self.request.app.url_for('sanic-redis-rpc.get_search_info', search_id=search_id),
+            'get_page_values': self.request.app.url_for(
+                'sanic-redis-rpc.get_page_values', page_number=1, search_id=search_id),
         }
 
     def parse_request(self) -> t.Dict[str, t.Any]:
@@ -52,14 +71,31 @@ class KeyManagerRequestAdapter:
         return {
             'scan_count': int(data.get('scan_count', 5000)),
             'pattern': data.get('pattern', '*'),
+            'patterns': data.get('patterns', None) or [],
+            'regexes': data.get('regexes', None) or [],
             'sort_keys': bool(data.get('sort_keys', True)),
             'ttl_seconds': int(data.get('ttl_seconds', 5 * 60)),
             'per_page': int(self.request.args.get('per_page', 1000)),
+            'enrich': parse_metadata_fields(self.request.args.get('enrich', None)),
+            'max_elements': int(self.request.args.get('max_elements', 100)),
+            'max_bytes': int(self.request.args.get('max_bytes', 64 * 1024)),
+            'batch_size': int(self.request.args.get('batch_size', 100)),
+            'key': self.request.args.get('key', None),
+            'cursor': self.request.args.get('cursor', None),
+            'sample_size': int(self.request.args.get('sample_size', 1000)),
+            'method': self.request.args.get('method', 'randomkey'),
+            'refresh_interval': int(self.request.args.get('refresh_interval', 60)),
+            'refresh': self.request.args.get('refresh', '').lower() in ['1', 'true'],
+            'pools': data.get('pools', None) or [],
+            'concurrency': int(data.get('concurrency', 8)),
         }
 
     async def search(self):
         await self._init()
 
+        if self.options['patterns'] or self.options['regexes']:
+            return await self.search_many()
+
         info = await self.key_manager.search(
             self.options['pattern'],
             sort_keys=self.options['sort_keys'],
@@ -70,6 +106,57 @@ class KeyManagerRequestAdapter:
 
         return info
 
+    async def search_many(self):
+        await self._init()
+
+        for option_name in ['patterns', 'regexes']:
+            if not isinstance(self.options[option_name], list):
+                raise WrongPatternError(self.options[option_name], f'`{option_name}` must be a list')
+
+        info = await self.key_manager.search_many(
+            self.options['patterns'],
+            self.options['regexes'],
+            ttl_seconds=self.options['ttl_seconds'],
+            redis_name=self.redis_name
+        )
+        info['endpoints'] = self._get_urls(info['id'])
+        for child_info in info['searches']:
+            child_info['endpoints'] = self._get_urls(child_info['id'])
+
+        return info
+
+    async def federated_search(self):
+        await self._init()
+
+        redis_names = self.options['pools'] or self.pools_wrapper.pool_names
+        for redis_name in redis_names:
+            if redis_name not in self.pools_wrapper.pool_names:
+                raise RedisPoolNotFoundError(redis_name)
+
+        redis_map = {
+            redis_name: await self.pools_wrapper.get_redis(redis_name)
+            for redis_name in redis_names
+        }
+        federated_key_manager = FederatedKeyManager(
+            redis_map, self.service_redis,
+            scan_count=self.options['scan_count'],
+            concurrency=self.options['concurrency'],
+            scan_semaphores={
+                redis_name: self.pools_wrapper.get_scan_semaphore(redis_name)
+                for redis_name in redis_names
+            },
+            key_indexes=self.key_indexes,
+            result_store=self.key_manager.result_store,
+        )
+
+        info = await federated_key_manager.search(
+            self.options['pattern'],
+            ttl_seconds=self.options['ttl_seconds'],
+        )
+        info['endpoints'] = self._get_urls(info['id'])
+
+        return info
+
     async def refresh_ttl(self, search_id: str):
         await self._init()
 
@@ -79,13 +166,115 @@ class KeyManagerRequestAdapter:
         )
 
     async def get_page(self, search_id: str, page_number: int):
+        __, page = await self._get_page(search_id, page_number)
+        return page
+
+    async def get_page_values(
+            self, search_id: str, page_number: int
+    ) -> t.Tuple[t.Dict[str, t.Any], t.AsyncIterator[t.List[t.Dict[str, t.Any]]]]:
+        """
+        :return: a page bundle without results and an async iterator over batches of loaded values
+        """
+        info, page = await self._get_page(search_id, page_number)
+        if info.get('snapshot'):
+            raise InvalidUsage(f'Search {search_id} is a snapshot search, values are not available')
+        return page, self._iter_values(page.pop('results'), info['redis_name'])
+
+    async def _iter_values(self, results: t.List[t.Any], redis_name: str):
+        loaders = {}
+
+        async def _load(_redis_name: str, keys: t.List[str]):
+            if _redis_name not in loaders:
+                loaders[_redis_name] = KeyValuesLoader(
+                    await self.pools_wrapper.get_redis(_redis_name),
+                    max_elements=self.options['max_elements'],
+                    max_bytes=self.options['max_bytes'],
+                )
+            return await loaders[_redis_name].load(keys)
+
+        for batch in chunks(results, self.options['batch_size']):
+            by_pool = OrderedDict()
+            for i, item in enumerate(batch):
+                _redis_name = redis_name if isinstance(item, str) else item.get('redis_name', redis_name)
+                by_pool.setdefault(_redis_name, []).append(i)
+
+            loaded = await gather(*[
+                _load(_redis_name, [batch[i] if isinstance(batch[i], str) else batch[i]['key'] for i in indexes])
+                for _redis_name, indexes in by_pool.items()
+            ])
+
+            values = [None] * len(batch)
+            for (_redis_name, indexes), pool_values in zip(by_pool.items(), loaded):
+                for i, value in zip(indexes, pool_values):
+                    if isinstance(batch[i], dict):  # keep pool names and enriched metadata
+                        value.update(batch[i])
+                    if value['truncated']:
+                        value['next'] = self._get_browse_url(_redis_name, value['key'], value['cursor'])
+                    values[i] = value
+            yield values
+
+    async def browse(self) -> t.Tuple[t.Dict[str, t.Any], t.AsyncIterator[t.List[t.Any]], CollectionBrowser]:
+        """
+        :return: a key bundle, an async iterator over batches of elements and a browser
+            holding the next cursor once the iterator is exhausted
+        """
+        if not self.options['key']:
+            raise InvalidUsage('Query argument `key` is required')
+        if self.redis_name not in self.pools_wrapper.pool_names:
+            raise RedisPoolNotFoundError(self.redis_name)
+
+        browser = CollectionBrowser(
+            await self.pools_wrapper.get_redis(self.redis_name),
+            max_elements=self.options['max_elements'],
+            max_bytes=self.options['max_bytes'],
+            scan_count=self.options['scan_count'],
+        )
+        bundle, elements = await browser.browse(self.options['key'], self.options['cursor'])
+        return bundle, elements, browser
+
+    async def get_stats(self) -> t.Dict[str, t.Any]:
+        if self.redis_name not in self.pools_wrapper.pool_names:
+            raise RedisPoolNotFoundError(self.redis_name)
+
+        sampler = KeyspaceSampler(
+            await self.pools_wrapper.get_redis(self.redis_name),
+            await self.pools_wrapper.get_service_redis(),
+            self.redis_name,
+            sample_size=self.options['sample_size'],
+            batch_size=self.options['batch_size'],
+            method=self.options['method'],
+            refresh_interval=self.options['refresh_interval'],
+        )
+        return await sampler.get_stats(refresh=self.options['refresh'])
+
+    async def get_key_index_stats(self) -> t.Dict[str, t.Any]:
+        if self.redis_name not in self.pools_wrapper.pool_names:
+            raise RedisPoolNotFoundError(self.redis_name)
+
+        key_index = self.key_indexes.get(self.redis_name, None)
+        if key_index is None:
+            return {'redis_name': self.redis_name, 'enabled': False}
+        return dict(key_index.get_stats(), redis_name=self.redis_name, enabled=True)
+
+    def _get_browse_url(self, redis_name: str, key: str, cursor: t.Any) -> t.Optional[str]:
+        if cursor is None:
+            return None
+        return self.request.app.url_for(
+            'sanic-redis-rpc.browse_key',
+            redis_name=redis_name, key=key, cursor=cursor,
+            max_elements=self.options['max_elements'], max_bytes=self.options['max_bytes']
+        )
+
+    async def _get_page(self, search_id: str, page_number: int):
         await self._init()
 
         per_page = self.options['per_page']
         page_number = int(page_number)
 
         info = await self.key_manager.get_search_info(search_id)
-        await self._init_redis(info['redis_name'])
+        # federated searches are bound to several pools, snapshot searches are not bound to a live pool
+        if info['redis_name'] and not info.get('snapshot'):
+            await self._init_redis(info['redis_name'])
 
         results = await self.key_manager.get_page(
             search_id,
@@ -93,12 +282,15 @@ class KeyManagerRequestAdapter:
             per_page=per_page,
         )
 
+        if self.options['enrich']:
+            results = await self._enrich(search_id, info, results)
+
         count = info['count']
         num_pages = int(ceil(float(count) / per_page))
         next_page = page_number + 1 if page_number < num_pages else None
         prev_page = page_number - 1 if page_number > 1 else None
 
-        return {
+        return info, {
             'page_number': page_number,
             'next': self.request.app.url_for(
                 'sanic-redis-rpc.get_page',
@@ -115,6 +307,31 @@ class KeyManagerRequestAdapter:
             'results': results,
         }
 
+    async def _enrich(
+            self, search_id: str, info: t.Dict[str, t.Any], results: t.List[t.Any]
+    ) -> t.List[t.Dict[str, t.Any]]:
+        fields = self.options['enrich']
+
+        if 'pools' not in info:
+            loader = self.key_manager.get_metadata_loader(search_id, info['ttl_seconds'])
+            metadata = await loader.load(results, fields)
+            return [dict(bundle, key=key) for key, bundle in zip(results, metadata)]
+
+        # federated search: one pipeline per pool
+        by_pool = {}
+        for item in results:
+            by_pool.setdefault(item['redis_name'], []).append(item)
+
+        async def _enrich_pool(redis_name: str, items: t.List[t.Dict[str, str]]):
+            redis = await self.pools_wrapper.get_redis(redis_name)
+            loader = self.key_manager.get_metadata_loader(search_id, info['ttl_seconds'], redis=redis)
+            metadata = await loader.load([item['key'] for item in items], fields, cache_prefix=f'{redis_name}:')
+            for item, bundle in zip(items, metadata):
+                item.update(bundle)
+
+        await gather(*[_enrich_pool(redis_name, items) for redis_name, items in by_pool.items()])
+        return results
+
     async def get_search_info(self, search_id: str):
         await self._init()
 
@@ -0,0 +1,174 @@
+import typing as t
+from collections import Counter
+from datetime import datetime
+from math import sqrt
+
+import aioredis
+from ujson import dumps as json_dumps, loads as json_loads
+
+from sanic_redis_rpc.key_manager.exceptions import WrongSamplingMethodError
+
+# upper bounds (seconds) of TTL histogram buckets: 1s, 4s, 16s, ..., ~194 days
+TTL_BUCKETS = tuple(4 ** i for i in range(13))
+
+# horizons (seconds) of the expiry timeline
+EXPIRY_HORIZONS = (
+    ('1m', 60), ('10m', 10 * 60), ('1h', 60 * 60), ('6h', 6 * 60 * 60),
+    ('1d', 24 * 60 * 60), ('7d', 7 * 24 * 60 * 60), ('30d', 30 * 24 * 60 * 60),
+)
+
+
+def wilson_interval(hits: int, n: int, z: float = 1.96) -> t.Tuple[float, float]:
+    """
+    :return: a Wilson score confidence interval of a proportion (95% by default)
+    """
+    if not n:
+        return 0.0, 1.0
+    p = hits / n
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    margin = z * sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+class KeyspaceSampler:
+    """
+    Estimates type distribution, TTL histogram and expiry timeline of a redis from a sample of keys.
+
+    Keys are sampled either with ``RANDOMKEY`` (uniform, with replacement) or with a partial ``SCAN``
+    (cheaper, but biased towards the beginning of the hash table). ``TYPE`` and ``PTTL`` are pipelined
+    in batches. Every estimate has a 95% confidence interval.
+
+    Results are cached in service redis for ``refresh_interval`` seconds per pool and sampling options.
+    """
+    METHODS = ('randomkey', 'scan')
+
+    def __init__(
+            self, redis: aioredis.Redis, service_redis: aioredis.Redis, redis_name: str,
+            sample_size: int = 1000,
+            batch_size: int = 100,
+            method: str = 'randomkey',
+            refresh_interval: int = 60,
+            service_key_prefix: str = 'sanic-redis-rpc'):
+        if method not in self.METHODS:
+            raise WrongSamplingMethodError(method, self.METHODS)
+
+        self.redis = redis
+        self.service_redis = service_redis
+        self.redis_name = redis_name
+        self.sample_size = max(1, sample_size)
+        self.batch_size = max(1, batch_size)
+        self.method = method
+        self.refresh_interval = refresh_interval
+        self.service_key_prefix = service_key_prefix
+
+    def _mk_cache_key(self) -> str:
+        return ':'.join([self.service_key_prefix, 'stats', self.redis_name, self.method, str(self.sample_size)])
+
+    async def get_stats(self, refresh: bool = False) -> t.Dict[str, t.Any]:
+        cache_key = self._mk_cache_key()
+        if not refresh and self.refresh_interval > 0:
+            cached = await self.service_redis.get(cache_key, encoding='utf8')
+            if cached:
+                return dict(json_loads(cached), cached=True)
+
+        stats = await self.collect()
+        if self.refresh_interval > 0:
+            await self.service_redis.set(cache_key, json_dumps(stats), expire=self.refresh_interval)
+        return dict(stats, cached=False)
+
+    async def collect(self) -> t.Dict[str, t.Any]:
+        total = await self.redis.dbsize()
+        samples = []
+        async for keys in getattr(self, f'_sample_{self.method}')(total):
+            samples.extend(await self._measure(keys))
+
+        # keys might have expired after they were sampled
+        samples = [(key_type, pttl) for key_type, pttl in samples if key_type != 'none']
+        return {
+            'redis_name': self.redis_name,
+            'method': self.method,
+            'timestamp': datetime.now().isoformat(),
+            'total': total,
+            'sample_size': len(samples),
+            'types': self._estimate(Counter(key_type for key_type, __ in samples), len(samples), total),
+            'no_expiry': self._estimate_one(sum(1 for __, pttl in samples if pttl < 0), len(samples), total),
+            'ttl_histogram': self._ttl_histogram([pttl for __, pttl in samples], total),
+            'expiry_timeline': self._expiry_timeline([pttl for __, pttl in samples], total),
+        }
+
+    async def _sample_randomkey(self, total: int) -> t.AsyncIterator[t.List[bytes]]:
+        left = self.sample_size if total else 0
+        while left > 0:
+            pipe = self.redis.pipeline()
+            for __ in range(min(self.batch_size, left)):
+                pipe.randomkey()
+            keys = [key for key in await pipe.execute() if key is not None]
+            if not keys:
+                return
+            left -= len(keys)
+            yield keys
+
+    async def _sample_scan(self, total: int) -> t.AsyncIterator[t.List[bytes]]:
+        left, cur = self.sample_size, b'0'
+        while cur and left > 0:
+            cur, keys = await self.redis.scan(cur, count=self.batch_size)
+            keys = keys[:left]
+            left -= len(keys)
+            if keys:
+                yield keys
+
+    async def _measure(self, keys: t.List[bytes]) -> t.List[t.Tuple[str, int]]:
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.type(key)
+            pipe.pttl(key)
+        results = await pipe.execute()
+        return [(key_type.decode(), pttl) for key_type, pttl in zip(results[::2], results[1::2])]
+
+    @staticmethod
+    def _estimate_one(hits: int, n: int, total: int) -> t.Dict[str, t.Any]:
+        low, high = wilson_interval(hits, n)
+        share = hits / n if n else 0.0
+        return {
+            'count': hits,
+            'share': round(share, 6),
+            'low': round(low, 6),
+            'high': round(high, 6),
+            'estimated_keys': int(round(share * total)),
+        }
+
+    def _estimate(self, counter: Counter, n: int, total: int) -> t.Dict[str, t.Dict[str, t.Any]]:
+        return {name: self._estimate_one(hits, n, total) for name, hits in counter.most_common()}
+
+    def _ttl_histogram(self, pttls: t.List[int], total: int) -> t.List[t.Dict[str, t.Any]]:
+        counter = Counter()
+        for pttl in pttls:
+            if pttl < 0:
+                continue
+            for upper in TTL_BUCKETS:
+                if pttl <= upper * 1000:
+                    counter[upper] += 1
+                    break
+            else:
+                counter[None] += 1
+
+        histogram = []
+        lower = 0
+        for upper in TTL_BUCKETS + (None,):
+            if counter[upper]:
+                histogram.append(dict(
+                    self._estimate_one(counter[upper], len(pttls), total), gt=lower, le=upper
+                ))
+            lower = upper
+        return histogram
+
+    def _expiry_timeline(self, pttls: t.List[int], total: int) -> t.List[t.Dict[str, t.Any]]:
+        """
+        :return: cumulative estimates of keys expiring within every horizon
+        """
+        return [
+            dict(self._estimate_one(sum(1 for pttl in pttls if 0 <= pttl <= seconds * 1000), len(pttls), total),
+                 horizon=name, seconds=seconds)
+            for name, seconds in EXPIRY_HORIZONS
+        ]
@@ -0,0 +1,335 @@
+import asyncio
+import mmap
+import os
+import struct
+import typing as t
+import weakref
+import zlib
+from time import time
+
+import aioredis
+
+# a length prefix of a key inside a chunk
+KEY_HEADER = struct.Struct('>I')
+# an end offset of a key inside a keys file
+OFFSET = struct.Struct('>Q')
+
+
+class ResultStore:
+    """
+    A storage of search results: an ordered list of keys addressed by ``results_key`` of a search bundle.
+    Search bundles always live in the service redis, ``as_dict()`` is saved into every bundle,
+    so a search can be read back by any worker with ``get_result_store``.
+    """
+    NAME = None
+
+    def __init__(self, service_redis: aioredis.Redis):
+        self.service_redis = service_redis
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return {'store': self.NAME}
+
+    def mk_results_key(self, service_key_prefix: str, search_id: str) -> str:
+        return ':'.join([service_key_prefix, search_id, 'results'])
+
+    def save(self, transaction, results_key: str, keys: t.Sequence[bytes], ttl_seconds: int):
+        """
+        Writes results of a new search, redis commands are queued into ``transaction``.
+        """
+        raise NotImplementedError()
+
+    async def append(self, transaction, results_key: str, keys: t.Sequence[bytes], length: int, ttl_seconds: int):
+        """
+        Appends ``keys`` to ``length`` results already stored, redis commands are queued into ``transaction``.
+        """
+        raise NotImplementedError()
+
+    async def execute(self, transaction) -> t.List[t.Any]:
+        """
+        Executes ``transaction`` results have been saved or appended with.
+        Stores writing outside of redis do it only once the transaction is committed.
+        """
+        return await transaction.execute()
+
+    async def get_length(self, results_key: str) -> int:
+        raise NotImplementedError()
+
+    async def get_range(self, results_key: str, start: int, finish: int) -> t.List[bytes]:
+        """
+        :return: keys from ``start`` to ``finish`` (inclusive, like ``LRANGE``)
+        """
+        raise NotImplementedError()
+
+    def expire(self, pipe, results_key: str, ttl_seconds: int) -> t.Optional[bool]:
+        """
+        :return: ``None`` if a command is queued into ``pipe``, the result if ttl is updated right away
+        """
+        pipe.expire(results_key, ttl_seconds)
+        return None
+
+
+class RedisListResultStore(ResultStore):
+    """
+    Results are a list in the service redis, ``scan_count`` keys per ``RPUSH``.
+    """
+    NAME = 'redis'
+
+    def __init__(self, service_redis: aioredis.Redis, scan_count: int = 5000):
+        super().__init__(service_redis)
+        self.scan_count = max(1, scan_count)
+
+    def save(self, transaction, results_key: str, keys: t.Sequence[bytes], ttl_seconds: int):
+        for i in range(0, len(keys), self.scan_count):
+            transaction.rpush(results_key, *keys[i:i + self.scan_count])
+        transaction.expire(results_key, ttl_seconds)
+
+    async def append(self, transaction, results_key: str, keys: t.Sequence[bytes], length: int, ttl_seconds: int):
+        self.save(transaction, results_key, keys, ttl_seconds)
+
+    async def get_length(self, results_key: str) -> int:
+        return await self.service_redis.llen(results_key)
+
+    async def get_range(self, results_key: str, start: int, finish: int) -> t.List[bytes]:
+        return await self.service_redis.lrange(results_key, start, finish)
+
+
+class ChunkedResultStore(ResultStore):
+    """
+    Results are split into chunks of ``chunk_size`` keys, every chunk is a zlib-compressed value
+    of a hash in the service redis. A page is read with a single ``HMGET`` of the chunks it spans,
+    the number of keys is kept in the ``length`` field.
+    """
+    NAME = 'chunked'
+    LENGTH_FIELD = 'length'
+
+    def __init__(self, service_redis: aioredis.Redis, chunk_size: int = 1000, compress_level: int = 1):
+        super().__init__(service_redis)
+        self.chunk_size = max(1, chunk_size)
+        self.compress_level = compress_level
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return dict(super().as_dict(), chunk_size=self.chunk_size)
+
+    def _pack(self, keys: t.Sequence[bytes]) -> bytes:
+        return zlib.compress(b''.join(KEY_HEADER.pack(len(key)) + key for key in keys), self.compress_level)
+
+    @staticmethod
+    def _unpack(chunk: bytes) -> t.List[bytes]:
+        data, keys, position = zlib.decompress(chunk), [], 0
+        while position < len(data):
+            key_length, = KEY_HEADER.unpack_from(data, position)
+            position += KEY_HEADER.size
+            keys.append(data[position:position + key_length])
+            position += key_length
+        return keys
+
+    def _write(self, transaction, results_key: str, keys: t.Sequence[bytes], first_chunk: int, length: int,
+               ttl_seconds: int):
+        chunks = {
+            first_chunk + i // self.chunk_size: self._pack(keys[i:i + self.chunk_size])
+            for i in range(0, len(keys), self.chunk_size)
+        }
+        transaction.hmset_dict(results_key, chunks, **{self.LENGTH_FIELD: length})
+        transaction.expire(results_key, ttl_seconds)
+
+    def save(self, transaction, results_key: str, keys: t.Sequence[bytes], ttl_seconds: int):
+        self._write(transaction, results_key, keys, 0, len(keys), ttl_seconds)
+
+    async def append(self, transaction, results_key: str, keys: t.Sequence[bytes], length: int, ttl_seconds: int):
+        if not keys:
+            return
+
+        # a partially filled last chunk is rewritten together with the new keys
+        tail_chunk, tail_size = divmod(length, self.chunk_size)
+        if tail_size:
+            tail = self._unpack(await self.service_redis.hget(results_key, tail_chunk))
+            keys = tail[:tail_size] + list(keys)
+        self._write(transaction, results_key, keys, tail_chunk, length - tail_size + len(keys), ttl_seconds)
+
+    async def get_length(self, results_key: str) -> int:
+        return int(await self.service_redis.hget(results_key, self.LENGTH_FIELD) or 0)
+
+    async def get_range(self, results_key: str, start: int, finish: int) -> t.List[bytes]:
+        length = await self.get_length(results_key)
+        finish = min(finish, length - 1)
+        if start > finish:
+            return []
+
+        first_chunk, last_chunk = start // self.chunk_size, finish // self.chunk_size
+        chunks = await self.service_redis.hmget(results_key, *range(first_chunk, last_chunk + 1))
+
+        keys = []
+        for chunk in chunks:
+            keys.extend(self._unpack(chunk) if chunk else [])
+        offset = first_chunk * self.chunk_size
+        return keys[start - offset:finish - offset + 1]
+
+
+class FileResultStore(ResultStore):
+    """
+    Results are local files in ``directory`` for single node deployments: ``<search_id>.keys`` holds keys
+    one after another and ``<search_id>.offsets`` their end offsets, so a page takes a single seek into offsets
+    and a slice of the memory-mapped keys.
+    Keys are written before their offsets, so readers in other workers never see a partially written key.
+    Files are written (in an executor) only once a transaction of the search is committed, see ``execute``.
+
+    A modification time of an offsets file is its expiration time. Expired files are removed
+    by a writer at most once per ``cleanup_interval`` seconds.
+    """
+    NAME = 'file'
+    KEYS_EXTENSION = '.keys'
+    OFFSETS_EXTENSION = '.offsets'
+
+    _cleaned_at: t.Dict[str, float] = {}
+
+    def __init__(self, service_redis: aioredis.Redis, directory: str, cleanup_interval: float = 60):
+        super().__init__(service_redis)
+        self.directory = directory
+        self.cleanup_interval = cleanup_interval
+        # writes waiting for their transactions to be committed
+        self._pending: t.MutableMapping[t.Any, t.List[t.Callable[[], t.Any]]] = weakref.WeakKeyDictionary()
+
+    def mk_results_key(self, service_key_prefix: str, search_id: str) -> str:
+        return os.path.join(self.directory, search_id)
+
+    def save(self, transaction, results_key: str, keys: t.Sequence[bytes], ttl_seconds: int):
+        self._pending.setdefault(transaction, []).extend([
+            self.cleanup,
+            lambda: self._write(results_key, keys, 0, ttl_seconds),
+        ])
+
+    async def append(self, transaction, results_key: str, keys: t.Sequence[bytes], length: int, ttl_seconds: int):
+        offset = 0
+        if length:
+            packed = await self._run_in_executor(self._read_offsets, results_key, length - 1, length)
+            offset, = OFFSET.unpack(packed)
+        self._pending.setdefault(transaction, []).append(lambda: self._write(results_key, keys, offset, ttl_seconds))
+
+    async def execute(self, transaction) -> t.List[t.Any]:
+        writes = self._pending.pop(transaction, [])
+        res = await transaction.execute()
+        for write in writes:
+            await self._run_in_executor(write)
+        return res
+
+    @staticmethod
+    async def _run_in_executor(func: t.Callable, *args) -> t.Any:
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+    def _write(self, results_key: str, keys: t.Sequence[bytes], offset: int, ttl_seconds: int):
+        os.makedirs(self.directory, exist_ok=True)
+        offsets = []
+        for key in keys:
+            offset += len(key)
+            offsets.append(OFFSET.pack(offset))
+
+        with open(results_key + self.KEYS_EXTENSION, 'ab') as f:
+            f.write(b''.join(keys))
+        with open(results_key + self.OFFSETS_EXTENSION, 'ab') as f:
+            f.write(b''.join(offsets))
+        self._set_expire_at(results_key, ttl_seconds)
+
+    def _set_expire_at(self, results_key: str, ttl_seconds: int) -> bool:
+        now = time()
+        try:
+            os.utime(results_key + self.OFFSETS_EXTENSION, (now, now + ttl_seconds))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _read_offsets(self, results_key: str, start: int, finish: int) -> bytes:
+        """
+        :return: packed offsets of keys from ``start`` to ``finish`` (exclusive)
+        """
+        with open(results_key + self.OFFSETS_EXTENSION, 'rb') as f:
+            f.seek(start * OFFSET.size)
+            return f.read((finish - start) * OFFSET.size)
+
+    async def get_length(self, results_key: str) -> int:
+        try:
+            return os.path.getsize(results_key + self.OFFSETS_EXTENSION) // OFFSET.size
+        except FileNotFoundError:
+            return 0
+
+    async def get_range(self, results_key: str, start: int, finish: int) -> t.List[bytes]:
+        finish = min(finish, await self.get_length(results_key) - 1)
+        if start > finish:
+            return []
+        return await self._run_in_executor(self._read_range, results_key, start, finish)
+
+    def _read_range(self, results_key: str, start: int, finish: int) -> t.List[bytes]:
+
+        # the end offset of the key preceding `start` is where `start` begins
+        packed = self._read_offsets(results_key, max(start - 1, 0), finish + 1)
+        offsets = [offset for offset, in OFFSET.iter_unpack(packed)]
+        if start == 0:
+            offsets.insert(0, 0)
+
+        if offsets[0] == offsets[-1]:
+            return [b''] * (len(offsets) - 1)  # empty keys only, an empty file can't be mapped
+        with open(results_key + self.KEYS_EXTENSION, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return [mm[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    def expire(self, pipe, results_key: str, ttl_seconds: int) -> t.Optional[bool]:
+        return self._set_expire_at(results_key, ttl_seconds)
+
+    def cleanup(self, force: bool = False) -> int:
+        """
+        :return: the number of removed searches
+        """
+        now = time()
+        if not force and now - self._cleaned_at.get(self.directory, 0) < self.cleanup_interval:
+            return 0
+        self._cleaned_at[self.directory] = now
+        if not os.path.isdir(self.directory):
+            return 0
+
+        removed = 0
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(self.OFFSETS_EXTENSION):
+                continue
+            results_key = os.path.join(self.directory, file_name[:-len(self.OFFSETS_EXTENSION)])
+            try:
+                if os.path.getmtime(results_key + self.OFFSETS_EXTENSION) > now:
+                    continue
+                os.remove(results_key + self.OFFSETS_EXTENSION)
+                os.remove(results_key + self.KEYS_EXTENSION)
+            except FileNotFoundError:
+                continue  # removed by another worker
+            removed += 1
+        return removed
+
+
+RESULT_STORES = (RedisListResultStore.NAME, ChunkedResultStore.NAME, FileResultStore.NAME)
+
+
+def mk_result_store(
+        service_redis: aioredis.Redis, name: str = RedisListResultStore.NAME,
+        results_dir: t.Optional[str] = None, **kwargs) -> ResultStore:
+    """
+    Creates a store new search results are written to.
+
+    :param name: one of ``RESULT_STORES``
+    :param results_dir: a directory of the ``file`` store
+    """
+    if name == ChunkedResultStore.NAME:
+        return ChunkedResultStore(service_redis, **kwargs)
+    if name == FileResultStore.NAME:
+        return FileResultStore(service_redis, results_dir, **kwargs)
+    if name == RedisListResultStore.NAME:
+        return RedisListResultStore(service_redis, **kwargs)
+    raise ValueError(f'Unknown result store `{name}`, expected one of {RESULT_STORES}')
+
+
+def get_result_store(service_redis: aioredis.Redis, info: t.Dict[str, t.Any]) -> ResultStore:
+    """
+    :param info: a search info bundle, searches saved before stores were introduced are redis lists
+    :return: a store results of the search are read from
+    """
+    name = info.get('store', None) or RedisListResultStore.NAME
+    if name == ChunkedResultStore.NAME:
+        return ChunkedResultStore(service_redis, chunk_size=int(info['chunk_size']))
+    if name == FileResultStore.NAME:
+        return FileResultStore(service_redis, os.path.dirname(info['results_key']))
+    return RedisListResultStore(service_redis)
@@ -0,0 +1,191 @@
+import typing as t
+
+import aioredis
+
+from sanic_redis_rpc.rpc.utils import decode_bytes
+
+
+def decode_nested(value: t.Any) -> t.Any:
+    if isinstance(value, dict):
+        return {decode_bytes(k): decode_nested(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [decode_nested(item) for item in value]
+    return decode_bytes(value)
+
+
+def format_scan_cursor(cursor: int, skip: int = 0) -> str:
+    """
+    ``HSCAN``/``SSCAN``/``ZSCAN`` may return more elements than requested (e.g. for small encodings),
+    so a continuation cursor is a scan cursor plus a number of elements to skip from its batch.
+    """
+    return f'{cursor}:{skip}'
+
+
+def parse_scan_cursor(raw: t.Union[str, int, None]) -> t.Tuple[int, int]:
+    """
+    :raises ValueError: if ``raw`` is not a pair of non-negative integers
+    """
+    if raw is None or raw == '':
+        return 0, 0
+    cursor, __, skip = str(raw).partition(':')
+    return parse_offset(cursor), parse_offset(skip)
+
+
+def parse_offset(raw: t.Union[str, int, None]) -> int:
+    """
+    :raises ValueError: if ``raw`` is not a non-negative integer
+    """
+    offset = int(raw or 0)
+    if offset < 0:
+        raise ValueError(f'Offset must not be negative, got {offset}')
+    return offset
+
+
+class KeyValuesLoader:
+    """
+    Loads values of a bunch of keys with two round trips per batch:
+    a Lua script gets types and lengths, then type-aware commands are pipelined.
+
+    Strings longer than ``max_bytes`` and collections longer than ``max_elements`` are truncated.
+    Truncated values are marked with ``truncated`` and a ``cursor`` to continue browsing from.
+    """
+
+    LUA_TYPES_AND_LENGTHS_SCRIPT = '''
+        local res = {}
+        for _, key in ipairs(KEYS) do
+            local key_type = redis.call("TYPE", key)["ok"]
+            local length = 0
+            if key_type == "string" then
+                length = redis.call("STRLEN", key)
+            elseif key_type == "hash" then
+                length = redis.call("HLEN", key)
+            elseif key_type == "set" then
+                length = redis.call("SCARD", key)
+            elseif key_type == "zset" then
+                length = redis.call("ZCARD", key)
+            elseif key_type == "list" then
+                length = redis.call("LLEN", key)
+            elseif key_type == "stream" then
+                length = redis.call("XLEN", key)
+            end
+            res[#res + 1] = key_type
+            res[#res + 1] = length
+        end
+        return res
+    '''
+
+    def __init__(
+            self, redis: aioredis.Redis,
+            max_elements: int = 100,
+            max_bytes: int = 64 * 1024):
+        self.redis = redis
+        self.max_elements = max(1, max_elements)
+        self.max_bytes = max(1, max_bytes)
+
+    async def load(self, keys: t.List[str]) -> t.List[t.Dict[str, t.Any]]:
+        if not keys:
+            return []
+
+        raw = await self.redis.eval(self.LUA_TYPES_AND_LENGTHS_SCRIPT, keys=list(keys))
+        items = [
+            {'key': key, 'type': key_type.decode(), 'length': length, 'truncated': False, 'cursor': None}
+            for key, key_type, length in zip(keys, raw[::2], raw[1::2])
+        ]
+
+        pipe = self.redis.pipeline()
+        queued, plain_strings = [], []
+        for item in items:
+            if item['type'] == 'string' and item['length'] <= self.max_bytes:
+                plain_strings.append(item)
+                continue
+
+            queue = getattr(self, f'_queue_{item["type"]}', None)
+            if queue is None:  # key is gone or its type is not supported
+                item['value'] = None
+                continue
+
+            queue(pipe, item)
+            queued.append(item)
+
+        if plain_strings:
+            pipe.mget(*[item['key'] for item in plain_strings])
+
+        results = await pipe.execute(return_exceptions=True)
+
+        if plain_strings:
+            for item, value in zip(plain_strings, results.pop()):
+                item['value'] = decode_bytes(value)
+
+        for item, result in zip(queued, results):
+            if isinstance(result, Exception):  # e.g. the key has changed its type in between
+                item.update({'value': None, 'error': str(result)})
+                continue
+            getattr(self, f'_convert_{item["type"]}')(item, result)
+
+        return items
+
+    def _truncate(self, item: t.Dict[str, t.Any], cursor: t.Union[int, str]):
+        item.update({'truncated': True, 'cursor': cursor})
+
+    def _queue_string(self, pipe, item: t.Dict[str, t.Any]):
+        pipe.getrange(item['key'], 0, self.max_bytes - 1)
+        self._truncate(item, self.max_bytes)
+
+    def _queue_hash(self, pipe, item: t.Dict[str, t.Any]):
+        if item['length'] <= self.max_elements:
+            pipe.hgetall(item['key'])
+        else:
+            pipe.hscan(item['key'], 0, count=self.max_elements)
+
+    def _queue_set(self, pipe, item: t.Dict[str, t.Any]):
+        if item['length'] <= self.max_elements:
+            pipe.smembers(item['key'])
+        else:
+            pipe.sscan(item['key'], 0, count=self.max_elements)
+
+    def _queue_zset(self, pipe, item: t.Dict[str, t.Any]):
+        pipe.zrange(item['key'], 0, self.max_elements - 1, withscores=True)
+        if item['length'] > self.max_elements:
+            self._truncate(item, self.max_elements)
+
+    def _queue_list(self, pipe, item: t.Dict[str, t.Any]):
+        pipe.lrange(item['key'], 0, self.max_elements - 1)
+        if item['length'] > self.max_elements:
+            self._truncate(item, self.max_elements)
+
+    def _queue_stream(self, pipe, item: t.Dict[str, t.Any]):
+        pipe.xrange(item['key'], count=self.max_elements)
+
+    def _convert_string(self, item: t.Dict[str, t.Any], result: bytes):
+        item['value'] = decode_bytes(result)
+
+    def _convert_hash(self, item: t.Dict[str, t.Any], result):
+        if isinstance(result, tuple):  # HSCAN
+            result = dict(self._convert_scan(item, result))
+        item['value'] = decode_nested(result)
+
+    def _convert_set(self, item: t.Dict[str, t.Any], result):
+        if isinstance(result, tuple):  # SSCAN
+            result = self._convert_scan(item, result)
+        item['value'] = decode_nested(result)
+
+    def _convert_scan(self, item: t.Dict[str, t.Any], result: t.Tuple[int, list]) -> list:
+        cursor, elements = result
+        if len(elements) > self.max_elements:
+            self._truncate(item, format_scan_cursor(0, self.max_elements))
+            return elements[:self.max_elements]
+
+        if cursor:
+            self._truncate(item, format_scan_cursor(cursor))
+        return elements
+
+    def _convert_zset(self, item: t.Dict[str, t.Any], result):
+        item['value'] = decode_nested(result)
+
+    def _convert_list(self, item: t.Dict[str, t.Any], result):
+        item['value'] = decode_nested(result)
+
+    def _convert_stream(self, item: t.Dict[str, t.Any], result):
+        item['value'] = decode_nested(result)
+        if item['length'] > self.max_elements and result:
+            self._truncate(item, item['value'][-1][0])
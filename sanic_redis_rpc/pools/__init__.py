@@ -0,0 +1,3 @@
+from .exceptions import *
+from .registry import PoolRegistry
+from .request_adapter import PoolsRequestAdapter, reload_pools
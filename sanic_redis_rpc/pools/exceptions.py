@@ -0,0 +1,15 @@
+from sanic.exceptions import Forbidden, InvalidUsage
+
+
+class AdminTokenError(Forbidden):
+    MESSAGE = 'A valid `X-Admin-Token` header is required, the admin API is enabled with `{env_variable}`'
+
+    def __init__(self, env_variable: str):
+        super().__init__(self.MESSAGE.format(env_variable=env_variable))
+
+
+class PoolsReloadError(InvalidUsage):
+    MESSAGE = 'Pools can not be reloaded: {reason}'
+
+    def __init__(self, reason: str):
+        super().__init__(self.MESSAGE.format(reason=reason))
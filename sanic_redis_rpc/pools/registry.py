@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import hmac
+import typing as t
+from collections import OrderedDict
+from time import time
+from uuid import uuid4
+
+import aioredis
+from sanic.log import logger
+from ujson import dumps as json_dumps, loads as json_loads
+
+from sanic_redis_rpc.rpc.exceptions import PoolConfigError
+from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper
+
+
+class PoolRegistry:
+    """
+    Keeps pools of every worker in sync. A change made by a worker (an admin API call or a reload)
+    is applied locally first, then it's saved into the service redis with a new version and published
+    to ``CHANNEL``, other workers apply published pools on receipt. A worker subscribes on startup and applies
+    the saved pools unless they have been published before the app was configured (by a previous deployment).
+    Versions only grow, so a change published concurrently with a newer one is ignored.
+
+    The service redis is writable through the RPC API, so messages are signed with ``secret`` (the admin token)
+    and unsigned or malformed ones are counted as ``rejected``. Pools are only synced with a ``secret``,
+    otherwise a change is applied to the worker making it.
+
+    The service redis is readable through the RPC API as well, so ``SECRET_OPTIONS`` are never published.
+    A worker takes them from ``read_secrets`` (pools of the pools file) or from its local config of a pool
+    with the same name, and checks them against digests signed by the publisher: pools with different
+    secrets are not applied, passwords are changed by editing the pools file and reloading.
+    """
+    CHANNEL = 'sanic-redis-rpc:pools'
+    CONFIG_KEY = 'sanic-redis-rpc:pools:config'
+    VERSION_KEY = 'sanic-redis-rpc:pools:version'
+    SECRET_OPTIONS = ('password',)
+
+    # a message published concurrently with a newer one is not saved, anything not parsed is overwritten
+    LUA_PUBLISH_SCRIPT = '''
+        local saved = redis.call("GET", KEYS[1])
+        local ok, version = pcall(function() return cjson.decode(cjson.decode(saved)["message"])["version"] end)
+        if not ok or type(version) ~= "number" or version < tonumber(ARGV[3]) then
+            redis.call("SET", KEYS[1], ARGV[1])
+        end
+        redis.call("PUBLISH", ARGV[2], ARGV[1])
+    '''
+
+    def __init__(
+            self, pools_wrapper: RedisPoolsShareWrapper,
+            configured_at: float = 0,
+            on_change: t.Optional[t.Callable[[t.Dict[str, t.Any]], t.Awaitable[None]]] = None,
+            retry_interval: float = 1,
+            secret: t.Optional[str] = None,
+            read_secrets: t.Optional[t.Callable[[], t.Dict[str, t.Dict[str, t.Any]]]] = None):
+        """
+        :param configured_at: a timestamp of the config pools of this worker are read from
+        :param on_change: a coroutine function called with changes made by ``apply_config`` of the wrapper
+        :param secret: a key messages are signed with, pools are not synced without it
+        :param read_secrets: returns pools to take ``SECRET_OPTIONS`` of received pools from
+        """
+        self.pools_wrapper = pools_wrapper
+        self.configured_at = configured_at
+        self.on_change = on_change
+        self.retry_interval = retry_interval
+        self.secret = secret
+        self.read_secrets = read_secrets
+
+        self.worker_id = uuid4().hex
+        self.version = 0
+        self.counters = {'published': 0, 'received': 0, 'applied': 0, 'errors': 0, 'rejected': 0}
+        self.last_error: t.Optional[str] = None
+        self._task: t.Optional[asyncio.Task] = None
+
+    def start(self) -> 'PoolRegistry':
+        if self._task is None and self.secret:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+
+    async def publish(self, redis_connections_options: t.Dict[str, t.Dict[str, t.Any]]) -> t.Dict[str, t.Any]:
+        """
+        Applies pools to this worker and publishes them to others.
+
+        :raises PoolConfigError: if pools can't be applied, nothing is published then
+        :return: changes made to this worker and the published ``version``, ``0`` if pools are not synced
+        """
+        changes = await self._apply(redis_connections_options)
+        if not self.secret:
+            return dict(changes, version=0)
+
+        pools = OrderedDict(
+            (name, {k: v for k, v in options.items() if k not in self.SECRET_OPTIONS})
+            for name, options in redis_connections_options.items()
+        )
+        service_redis = await self.pools_wrapper.get_service_redis()
+        version = await service_redis.incr(self.VERSION_KEY)
+        message = json_dumps({
+            'version': version, 'published_at': time(), 'origin': self.worker_id, 'pools': pools,
+            'secrets': {name: self._sign_secrets(name, options) for name, options in redis_connections_options.items()},
+        })
+        envelope = json_dumps({'message': message, 'signature': self._sign(message)})
+        await service_redis.eval(
+            self.LUA_PUBLISH_SCRIPT, keys=[self.CONFIG_KEY], args=[envelope, self.CHANNEL, version]
+        )
+        self.version = max(self.version, version)
+        self.counters['published'] += 1
+        return dict(changes, version=version)
+
+    async def _apply(self, redis_connections_options: t.Dict[str, t.Dict[str, t.Any]]) -> t.Dict[str, t.Any]:
+        changes = await self.pools_wrapper.apply_config(redis_connections_options)
+        if self.on_change is not None:
+            await self.on_change(changes)
+        self.counters['applied'] += 1
+        return changes
+
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+            except (aioredis.RedisError, OSError, asyncio.TimeoutError) as e:
+                self.last_error = repr(e)
+            await asyncio.sleep(self.retry_interval)
+
+    async def _listen(self):
+        # noinspection PyProtectedMember
+        subscriber = await self.pools_wrapper.create_redis(self.pools_wrapper._get_service_pool_name())
+        try:
+            channel, = await subscriber.subscribe(self.CHANNEL)
+            # pools published before the subscription
+            saved = await (await self.pools_wrapper.get_service_redis()).get(self.CONFIG_KEY)
+            if saved:
+                await self._receive(saved)
+            while await channel.wait_message():
+                self.counters['received'] += 1
+                await self._receive(await channel.get())
+        finally:
+            subscriber.close()
+            await subscriber.wait_closed()
+
+    def _sign(self, message: str) -> str:
+        return hmac.new(self.secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+    def _sign_secrets(self, name: str, options: t.Dict[str, t.Any]) -> str:
+        return self._sign(json_dumps([name] + [options.get(option, None) for option in self.SECRET_OPTIONS]))
+
+    def _parse(self, raw_message: bytes) -> t.Dict[str, t.Any]:
+        """
+        :raises ValueError: if a message is malformed or it's not signed with ``secret``
+        """
+        envelope = json_loads(raw_message)
+        if not isinstance(envelope, dict) or not isinstance(envelope.get('message', None), str) or \
+                not isinstance(envelope.get('signature', None), str):
+            raise ValueError('a message and its signature are required')
+        if not hmac.compare_digest(envelope['signature'], self._sign(envelope['message'])):
+            raise ValueError('the signature is not valid')
+
+        message = json_loads(envelope['message'])
+        if not isinstance(message, dict) or type(message.get('version', None)) is not int or \
+                not isinstance(message.get('published_at', None), (int, float)) or \
+                not isinstance(message.get('pools', None), dict) or not isinstance(message.get('secrets', None), dict):
+            raise ValueError('`version`, `published_at`, `pools` and `secrets` are required')
+        return message
+
+    async def _receive(self, raw_message: bytes):
+        try:
+            message = self._parse(raw_message)
+        except ValueError as e:
+            self.counters['rejected'] += 1
+            self.last_error = f'A message is rejected: {e}'
+            logger.warning('Pools message is rejected: %s', e)
+            return
+        if message['version'] <= self.version:
+            return  # already applied, e.g. published by this worker
+        self.version = message['version']
+        if message['published_at'] < self.configured_at:
+            return
+
+        try:
+            changes = await self._apply(self._merge_secrets(OrderedDict(message['pools']), message['secrets']))
+        except Exception as e:
+            self.counters['errors'] += 1
+            self.last_error = repr(e)
+            logger.warning('Pools of version %s can not be applied: %r', message['version'], e)
+            return
+        logger.info('Pools of version %s applied: %s', message['version'], changes)
+
+    def _merge_secrets(
+            self, redis_connections_options: t.Dict[str, t.Dict[str, t.Any]],
+            digests: t.Dict[str, str]) -> t.Dict[str, t.Dict[str, t.Any]]:
+        """
+        :raises PoolConfigError: if secrets of a pool differ from secrets of the publisher
+        """
+        # noinspection PyProtectedMember
+        local = self.read_secrets() if self.read_secrets is not None else self.pools_wrapper._redis_connections_options
+        for name, options in redis_connections_options.items():
+            for option in self.SECRET_OPTIONS:
+                if option in local.get(name, {}):
+                    options[option] = local[name][option]
+            if not hmac.compare_digest(str(digests.get(name, '')), self._sign_secrets(name, options)):
+                raise PoolConfigError(name, 'its secrets differ from secrets of the worker publishing it')
+        return redis_connections_options
+
+    def get_stats(self) -> t.Dict[str, t.Any]:
+        return dict(
+            self.counters,
+            worker_id=self.worker_id,
+            version=self.version,
+            last_error=self.last_error,
+            pools=self.pools_wrapper.pool_names,
+        )
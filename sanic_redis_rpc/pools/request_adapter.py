@@ -0,0 +1,105 @@
+import hmac
+import typing as t
+from collections import OrderedDict
+
+from sanic import Sanic
+from sanic.request import Request
+
+from sanic_redis_rpc.conf import ENV_ADMIN_TOKEN, ENV_POOLS_FILE, read_redis_config
+from sanic_redis_rpc.jobs.request_adapter import JobRequestAdapter
+from sanic_redis_rpc.key_manager.exceptions import RedisPoolNotFoundError
+from sanic_redis_rpc.rpc.exceptions import PoolConfigError
+from sanic_redis_rpc.utils import parse_redis_dsn
+from .exceptions import AdminTokenError, PoolsReloadError
+from .registry import PoolRegistry
+
+
+# noinspection PyProtectedMember
+async def reload_pools(app: Sanic) -> t.Dict[str, t.Any]:
+    """
+    Re-reads pools from the file named by ``SANIC_REDIS_RPC_POOLS_FILE`` and publishes them to all workers.
+    """
+    if not app.config.pools_file:
+        raise PoolsReloadError(f'`{ENV_POOLS_FILE}` is not set')
+    try:
+        redis_connections_options = read_redis_config({ENV_POOLS_FILE: app.config.pools_file})
+    except (OSError, ValueError, AssertionError) as e:
+        raise PoolsReloadError(str(e))
+    return await app._pool_registry.publish(redis_connections_options)
+
+
+class PoolsRequestAdapter(JobRequestAdapter):
+    ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+    # noinspection PyProtectedMember
+    def __init__(self, request: Request):
+        self.request = request
+        self._check_token()  # before a body is parsed: nothing is told to a client without a token
+        super().__init__(request)
+        self.registry: PoolRegistry = request.app._pool_registry
+        self.redis_connections_options: t.Dict[str, t.Dict[str, t.Any]] = request.app.config.redis_connections_options
+
+    def parse_request(self) -> t.Dict[str, t.Any]:
+        data = self.request.json or {}
+        return dict(
+            super().parse_request(),
+            dsn=data.get('dsn', None),
+        )
+
+    def _check_token(self):
+        admin_token = self.request.app.config.admin_token
+        token = self.request.headers.get(self.ADMIN_TOKEN_HEADER, '')
+        if not admin_token or not hmac.compare_digest(token.encode(), admin_token.encode()):
+            raise AdminTokenError(ENV_ADMIN_TOKEN)
+
+    def _copy_pools(self) -> t.Dict[str, t.Dict[str, t.Any]]:
+        return OrderedDict((name, dict(options)) for name, options in self.redis_connections_options.items())
+
+    def get_stats(self) -> t.Dict[str, t.Any]:
+        return self.registry.get_stats()
+
+    # noinspection PyProtectedMember
+    async def put(self, name: str) -> t.Dict[str, t.Any]:
+        """
+        Adds a pool or reconfigures an existing one from a ``dsn``, the ``name`` DSN argument is ignored.
+        Passwords are not published to other workers, so they are set in the pools file only:
+        a ``dsn`` may repeat the password of a pool or leave it out to keep it.
+        """
+        if not name or '.' in name:
+            raise PoolConfigError(name, 'a name must not be empty or contain dots')
+        dsn = self.options['dsn']
+        if not isinstance(dsn, str):
+            raise PoolConfigError(name, '`dsn` string is required')
+        try:
+            options = parse_redis_dsn(dsn)
+        except (ValueError, AssertionError) as e:
+            raise PoolConfigError(name, f'`dsn` is not valid: {e}')
+
+        pools = self._copy_pools()
+        previous = pools.get(name, None)
+        if previous is None and self.request.app._snapshot_registry.exists(self.request.app.config.export_dir, name):
+            raise PoolConfigError(name, 'a snapshot with this name exists')
+        for option in PoolRegistry.SECRET_OPTIONS:
+            current = (previous or {}).get(option, None)
+            if options.get(option, None) not in [None, current]:
+                raise PoolConfigError(name, f'`{option}` can only be changed in the pools file')
+            if current is not None:
+                options[option] = current
+        options.update({
+            'name': name,
+            'display_name': options['display_name'] or (previous or {}).get('display_name', f'Redis instance {name}'),
+            'id': previous['id'] if previous else max((pool['id'] for pool in pools.values()), default=-1) + 1,
+            'env_variable': (previous or {}).get('env_variable', None),
+        })
+        pools[name] = options
+        return await self.registry.publish(pools)
+
+    async def remove(self, name: str) -> t.Dict[str, t.Any]:
+        pools = self._copy_pools()
+        if name not in pools:
+            raise RedisPoolNotFoundError(name)
+        del pools[name]
+        return await self.registry.publish(pools)
+
+    async def reload(self) -> t.Dict[str, t.Any]:
+        return await reload_pools(self.request.app)
@@ -1,14 +1,22 @@
 import asyncio
-import base64
 import typing as t
 from collections import OrderedDict
+from functools import partial
 from itertools import chain
 
+import aioredis
 from sanic.request import Request
 
 from sanic_redis_rpc.rpc import exceptions
+from sanic_redis_rpc.rpc.admission import DEFAULT_CLIENT, identify_client
+from sanic_redis_rpc.rpc.deadlines import BLOCKING_TIMEOUT_MARGIN, DEFAULT_TIMEOUTS, TIMEOUT_FIELD, Deadline, \
+    get_blocking_timeout, get_request_timeout, parse_timeout_ms
 from sanic_redis_rpc.rpc.generic import RpcRequest, RpcRequestProcessor, RpcBatchRequest
-from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper, load_json
+from sanic_redis_rpc.rpc.health import is_connection_error
+from sanic_redis_rpc.rpc.lanes import LANE_BLOCKING, LANE_INTERACTIVE, LANE_PRIORITY, LaneScheduler, \
+    classify_command
+from sanic_redis_rpc.rpc.retries import is_idempotent
+from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper, load_json, decode_bytes
 
 
 class RedisRpcRequest(RpcRequest):
@@ -19,38 +27,80 @@ class RedisRpcRequest(RpcRequest):
                 id=self.id, data=self.params,
                 message='Pool name should be specified in `method`, e.g. `redis_0.get`'
             )
+        if TIMEOUT_FIELD in self._data:
+            try:
+                parse_timeout_ms(self._data[TIMEOUT_FIELD])
+            except (TypeError, ValueError):
+                raise exceptions.RpcInvalidRequestError(
+                    id=self.id, message=f'`{TIMEOUT_FIELD}` should be a positive number'
+                )
 
     @property
     def pool_name(self):
         return self.method_path[0]
 
+    @property
+    def timeout(self) -> t.Optional[float]:
+        """
+        :return: seconds set by the ``timeout_ms`` field
+        """
+        return parse_timeout_ms(self._data[TIMEOUT_FIELD]) if TIMEOUT_FIELD in self._data else None
+
+
+def get_deadline(
+        rpc_request: RedisRpcRequest,
+        timeout: t.Optional[float] = None,
+        timeouts: t.Optional[t.Dict[str, float]] = None) -> Deadline:
+    """
+    :param timeout: seconds all calls of a request may take
+    :param timeouts: default seconds of command lanes
+    :return: a deadline of a call, ``timeout_ms`` of the call goes first, then ``timeout``,
+        then a timeout of a blocking command itself, then the lane default
+    """
+    timeout = rpc_request.timeout or timeout
+    if timeout is None:
+        blocking_timeout = get_blocking_timeout(rpc_request.method_name, rpc_request.params)
+        if blocking_timeout:
+            return Deadline(blocking_timeout + BLOCKING_TIMEOUT_MARGIN)
+        # possibly slow commands get a longer timeout whether they are scheduled in the slow lane or not
+        lane = classify_command(rpc_request.method_name, rpc_request.params, slow=True)
+        timeout = (DEFAULT_TIMEOUTS if timeouts is None else timeouts).get(lane, None)
+    return Deadline(timeout)
+
 
 class RedisRpcRequestProcessor(RpcRequestProcessor):
     def _get_method_path(self, rpc_request: RpcRequest):
         # skip pool name
         return super()._get_method_path(rpc_request)[1:]
 
+    @classmethod
+    def apply_to(cls, rpc_request: RpcRequest, instance):
+        return cls(instance).apply(rpc_request)
+
     async def process(self, rpc_request: RpcRequest):
         result = self.apply(rpc_request)
         if asyncio.iscoroutine(result) or asyncio.isfuture(result):
             result = await result
 
-        if isinstance(result, bytes):
-            try:
-                result = result.decode('utf8')
-            except UnicodeDecodeError:
-                result = base64.standard_b64encode(result).decode()
-
         return {
             'id': rpc_request.id,
             'jsonrpc': rpc_request.jsonrpc,
-            'result': result,
+            'result': decode_bytes(result),
         }
 
 
 class RedisRpcBatchProcessor:
-    def __init__(self, pools_wrapper: RedisPoolsShareWrapper):
+    def __init__(
+            self, pools_wrapper: RedisPoolsShareWrapper,
+            client: str = DEFAULT_CLIENT,
+            weight: float = 1,
+            timeout: t.Optional[float] = None,
+            timeouts: t.Optional[t.Dict[str, float]] = None):
         self._pools_wrapper = pools_wrapper
+        self._client = client
+        self._weight = weight
+        self._timeout = timeout
+        self._timeouts = timeouts
 
     @staticmethod
     def _reorder_requests_by_pool_name(rpc_batch_request: RpcBatchRequest) -> t.Dict[str, t.List[RedisRpcRequest]]:
@@ -67,9 +117,16 @@ class RedisRpcBatchProcessor:
             message='Fail'):
         return [
             exception(id=rpc_request.id, message=message).as_dict()
-            for rpc_request in rpc_requests
+            for rpc_request in RedisRpcBatchProcessor._get_answered(rpc_requests)
         ]
 
+    @staticmethod
+    def _get_answered(rpc_requests: t.List[RedisRpcRequest]) -> t.List[RedisRpcRequest]:
+        """
+        :return: requests expecting a response, notifications are answered only if they are not valid
+        """
+        return [rpc_request for rpc_request in rpc_requests if rpc_request.error or not rpc_request.is_notify]
+
     @staticmethod
     def _validate_pool_tasks(rpc_requests: t.List[RedisRpcRequest]):
         multis, pipelines, failed = [], [], []
@@ -94,95 +151,305 @@ class RedisRpcBatchProcessor:
         return None
 
     async def process_pool_tasks(self, pool_name: str, rpc_requests: t.List[RedisRpcRequest]):
+        """
+        Calls of a pool are done by the latest of their deadlines, a call whose deadline has expired
+        before it's sent is not sent. Results of calls done by then are returned, the rest are timeout errors.
+        """
         declined = self._validate_pool_tasks(rpc_requests)
         if declined:
             return declined
 
+        deadlines = {
+            rpc_request: get_deadline(rpc_request, self._timeout, self._timeouts)
+            for rpc_request in rpc_requests if not rpc_request.error
+        }
+        deadline = Deadline.latest(deadlines.values())
         try:
-            redis = await self._pools_wrapper.get_redis(pool_name)
+            redis = await deadline.run(self._pools_wrapper.get_rpc_redis(pool_name))
         except KeyError:
             return self._decline_requests(
                 rpc_requests, exceptions.RpcMethodNotFoundError,
                 message=f'Pool with name `{pool_name}` does not exist'
             )
+        except (exceptions.PoolUnavailableError, exceptions.DeadlineExceededError) as e:
+            return [e.as_rpc_error(id=rpc_request.id).as_dict() for rpc_request in self._get_answered(rpc_requests)]
 
-        if rpc_requests[0].method_name == 'multi_exec':
-            instance = redis.multi_exec()
-            rpc_requests = rpc_requests[1:]
-        elif rpc_requests[0].method_name == 'pipeline':
-            instance = redis.pipeline()
+        transaction = rpc_requests[0].method_name == 'multi_exec'
+        if rpc_requests[0].method_name in ['multi_exec', 'pipeline']:
             rpc_requests = rpc_requests[1:]
-        else:
-            instance = redis.pipeline()
+        pending_requests = [rpc_request for rpc_request in rpc_requests if not rpc_request.error]
 
-        processor = RedisRpcRequestProcessor(instance)
-        pre_failed_requests = []
-        pending_requests = []
-        for rpc_request in rpc_requests:
-            if rpc_request.error:
-                pre_failed_requests.append(rpc_request.error.as_dict())
-                continue
-            pending_requests.append(rpc_request)
-            processor.apply(rpc_request)
+        responses = {}
+        try:
+            await deadline.run(self._process_pending_requests(
+                pool_name, redis, pending_requests, transaction, deadlines, responses
+            ))
+        except exceptions.DeadlineExceededError:
+            pass
+
+        return [rpc_request.error.as_dict() for rpc_request in rpc_requests if rpc_request.error] + [
+            responses.get(rpc_request, None) or exceptions.DeadlineExceededError(
+                deadlines[rpc_request].timeout or deadline.timeout
+            ).as_rpc_error(id=rpc_request.id).as_dict()
+            for rpc_request in self._get_answered(pending_requests)
+        ]
 
-        results = pre_failed_requests
+    async def _process_pending_requests(
+            self, pool_name: str, redis,
+            rpc_requests: t.List[RedisRpcRequest],
+            transaction: bool,
+            deadlines: t.Dict[RedisRpcRequest, Deadline],
+            responses: t.Dict[RedisRpcRequest, t.Dict[str, t.Any]]):
+        """
+        Commands of a pipeline are admitted in chunks of at most ``max_in_flight`` commands,
+        so other clients' calls get their turn between chunks. A transaction is admitted as a whole.
+        An admitted chunk takes a lane connection if it has to, like a single call: admission always goes first.
+        """
+        controller = self._pools_wrapper.get_admission_controller(pool_name)
+        scheduler = self._pools_wrapper.get_lane_scheduler(pool_name)
+        chunk_size = controller.max_in_flight if controller.limited and not transaction else len(rpc_requests)
+        for offset in range(0, len(rpc_requests), max(1, chunk_size)):
+            chunk = rpc_requests[offset:offset + chunk_size]
+            try:
+                async with controller.admit(self._client, len(chunk), self._weight):
+                    chunk = [rpc_request for rpc_request in chunk if not deadlines[rpc_request].expired]
+                    if transaction and len(chunk) != len(rpc_requests):
+                        # a transaction is not sent in part, all of its calls expire with the first one expired
+                        expired = next(deadlines[item] for item in rpc_requests if deadlines[item].expired)
+                        error = exceptions.DeadlineExceededError(expired.timeout)
+                        responses.update((item, error.as_rpc_error(id=item.id).as_dict()) for item in rpc_requests)
+                        return
+                    if not chunk:
+                        continue
+                    deadline = Deadline.latest(deadlines[item] for item in chunk)
+                    lane = self._get_batch_lane(scheduler, chunk) if scheduler is not None else LANE_INTERACTIVE
+                    if lane == LANE_INTERACTIVE:
+                        results = await self._execute_chunk(pool_name, redis, chunk, transaction, deadline)
+                    else:
+                        async with scheduler.connection(lane) as lane_redis:
+                            results = await self._execute_chunk(pool_name, lane_redis, chunk, transaction, deadline)
+                    responses.update(zip(chunk, results))
+            except (exceptions.AdmissionRejectedError, exceptions.LaneOverloadedError) as e:
+                responses.update(
+                    (rpc_request, e.as_rpc_error(id=rpc_request.id).as_dict()) for rpc_request in rpc_requests[offset:]
+                )
+                return
 
-        for request, response in zip(pending_requests, await instance.execute(return_exceptions=True)):
+    @staticmethod
+    def _get_batch_lane(scheduler: LaneScheduler, rpc_requests: t.List[RedisRpcRequest]) -> str:
+        """
+        :return: the lane of the slowest command, all commands of a chunk are sent together
+        """
+        lanes = [scheduler.classify(rpc_request.method_name, rpc_request.params) for rpc_request in rpc_requests]
+        return max(lanes, key=LANE_PRIORITY.__getitem__, default=LANE_INTERACTIVE)
+
+    async def _execute_chunk(
+            self, pool_name: str, redis,
+            rpc_requests: t.List[RedisRpcRequest],
+            transaction: bool,
+            deadline: Deadline):
+        """
+        A pipeline of idempotent commands is sent again if it fails with a connection error.
+        A transaction or a pipeline on a dedicated lane connection (closed on errors) is sent once.
+        """
+        def send():
+            instance = redis.multi_exec() if transaction else redis.pipeline()
+            processor = RedisRpcRequestProcessor(instance)
+            for rpc_request in rpc_requests:
+                processor.apply(rpc_request)
+            return instance.execute(return_exceptions=True)
+
+        retryable = not transaction and isinstance(redis.connection, aioredis.ConnectionsPool) and all(
+            is_idempotent(rpc_request.method_name, rpc_request.params) for rpc_request in rpc_requests
+        )
+        try:
+            if retryable:
+                responses = await self._pools_wrapper.get_retry_policy(pool_name).run(
+                    send, deadline,
+                    get_error=lambda items: next(filter(is_connection_error, items), None),
+                    on_retry=partial(self._pools_wrapper.report, pool_name),
+                    can_retry=partial(self._pools_wrapper.is_available, pool_name),
+                )
+            else:
+                responses = await send()
+        except asyncio.CancelledError:
+            raise  # an expired deadline or a gone client is not an outcome of the pool
+        except Exception as e:
+            self._pools_wrapper.report(pool_name, e)
+            raise
+        self._pools_wrapper.report(pool_name, next(filter(is_connection_error, responses), None))
+
+        results = []
+        for request, response in zip(rpc_requests, responses):
             if isinstance(response, Exception):
                 results.append(
                     exceptions.RpcError(id=request.id, message=repr(response)).as_dict()
                 )
                 continue
 
-            if isinstance(response, bytes):
-                try:
-                    response = response.decode(encoding='utf8')
-                except UnicodeDecodeError:
-                    response = base64.standard_b64encode(response).decode()
-
             results.append({
                 'id': request.id,
                 'jsonrpc': request.jsonrpc,
-                'result': response
+                'result': decode_bytes(response)
             })
 
         return results
 
+    async def queue_notifications(self, pool_name: str, rpc_requests: t.List[RedisRpcRequest]):
+        """
+        Puts valid notifications of a pool to its write-behind queue unless they are a part of a pipeline
+        or a transaction. Notifications of blocking commands are not queued: they would hold the queue.
+
+        :return: requests left
+        """
+        if rpc_requests[0].method_name in ['multi_exec', 'pipeline'] or not any(
+                rpc_request.is_notify for rpc_request in rpc_requests):
+            return rpc_requests
+        try:
+            queue = self._pools_wrapper.get_notification_queue(pool_name)
+        except KeyError:
+            return rpc_requests  # declined with other requests
+
+        rest = []
+        for rpc_request in rpc_requests:
+            if not rpc_request.is_notify or rpc_request.error or \
+                    classify_command(rpc_request.method_name, rpc_request.params) == LANE_BLOCKING:
+                rest.append(rpc_request)
+                continue
+            await queue.put(
+                partial(RedisRpcRequestProcessor.apply_to, rpc_request),
+                get_deadline(rpc_request, self._timeout, self._timeouts)
+            )
+        return rest
+
     async def process(self, rpc_batch_request: RpcBatchRequest):
+        """
+        :return: responses of calls, notifications are not answered
+        """
         reordered = self._reorder_requests_by_pool_name(rpc_batch_request)
-        tasks = [
-            self.process_pool_tasks(pool_name, rpc_requests)
-            for pool_name, rpc_requests in reordered.items()
-        ]
+        tasks = []
+        for pool_name, rpc_requests in reordered.items():
+            rpc_requests = await self.queue_notifications(pool_name, rpc_requests)
+            rpc_requests and tasks.append(self.process_pool_tasks(pool_name, rpc_requests))
         return list(chain.from_iterable(await asyncio.gather(*tasks)))
 
 
 class RedisRpc:
-    def __init__(self, pools_wrapper: RedisPoolsShareWrapper):
+    def __init__(
+            self, pools_wrapper: RedisPoolsShareWrapper,
+            client_header: t.Optional[str] = None,
+            client_weights: t.Optional[t.Dict[str, float]] = None,
+            timeouts: t.Optional[t.Dict[str, float]] = None):
+        """
+        :param client_header: a header naming a client for fair scheduling of calls, it must be set
+            by a trusted proxy, clients are told apart by their addresses without it
+        :param client_weights: shares of pools clients get when calls are queued, 1 by default
+        :param timeouts: default seconds calls of command lanes may take
+        """
         self._pools_wrapper = pools_wrapper
-
-    async def handle_single(self, request_data: t.Dict[str, t.Any]):
+        self.client_header = client_header
+        self.client_weights = client_weights or {}
+        self.timeouts = DEFAULT_TIMEOUTS if timeouts is None else timeouts
+
+    def get_weight(self, client: str) -> float:
+        return self.client_weights.get(client, 1)
+
+    async def handle_single(
+            self, request_data: t.Dict[str, t.Any],
+            client: str = DEFAULT_CLIENT,
+            timeout: t.Optional[float] = None):
+        """
+        :param timeout: seconds the call may take if it has no ``timeout_ms``
+        :return: ``None`` for a notification, it's queued unless it's a blocking command
+        """
         rpc_request = RedisRpcRequest(request_data)
+        deadline = get_deadline(rpc_request, timeout, self.timeouts)
+        if rpc_request.is_notify and classify_command(rpc_request.method_name, rpc_request.params) != LANE_BLOCKING:
+            return await self._queue_notification(rpc_request, deadline)
+        try:
+            result = await deadline.run(self._process(rpc_request, client, deadline))
+        except exceptions.DeadlineExceededError as e:
+            raise e.as_rpc_error(id=rpc_request.id)
+        return None if rpc_request.is_notify else result
 
+    async def _queue_notification(self, rpc_request: RedisRpcRequest, deadline: Deadline) -> None:
         try:
-            redis = await self._pools_wrapper.get_redis(rpc_request.pool_name)
+            queue = self._pools_wrapper.get_notification_queue(rpc_request.pool_name)
+        except KeyError:
+            raise exceptions.RpcMethodNotFoundError(
+                data=rpc_request.params, message=f'Pool with name `{rpc_request.pool_name}` does not exist'
+            )
+        await queue.put(partial(RedisRpcRequestProcessor.apply_to, rpc_request), deadline)
+
+    async def _process(self, rpc_request: RedisRpcRequest, client: str, deadline: Deadline):
+        try:
+            redis = await self._pools_wrapper.get_rpc_redis(rpc_request.pool_name)
         except KeyError:
             raise exceptions.RpcMethodNotFoundError(
                 id=rpc_request.id, data=rpc_request.params,
                 message=f'Pool with name `{rpc_request.pool_name}` does not exist'
             )
-        processor = RedisRpcRequestProcessor(redis)
-        return await processor.process(rpc_request)
+        except exceptions.PoolUnavailableError as e:
+            raise e.as_rpc_error(id=rpc_request.id)
+
+        scheduler = self._pools_wrapper.get_lane_scheduler(rpc_request.pool_name)
+        lane = scheduler.classify(rpc_request.method_name, rpc_request.params) if scheduler else LANE_INTERACTIVE
+        if lane == LANE_INTERACTIVE:
+            scheduler = None
+        controller = self._pools_wrapper.get_admission_controller(rpc_request.pool_name)
+
+        async def call():
+            if scheduler is None:
+                return await RedisRpcRequestProcessor(redis).process(rpc_request)
+            async with scheduler.connection(lane) as lane_redis:
+                return await RedisRpcRequestProcessor(lane_redis).process(rpc_request)
 
-    async def handle_batch(self, request_data: t.List[t.Dict[str, t.Any]]):
+        try:
+            async with controller.admit(client, 1, self.get_weight(client)):
+                if is_idempotent(rpc_request.method_name, rpc_request.params):
+                    result = await self._pools_wrapper.get_retry_policy(rpc_request.pool_name).run(
+                        call, deadline,
+                        on_retry=partial(self._pools_wrapper.report, rpc_request.pool_name),
+                        can_retry=partial(self._pools_wrapper.is_available, rpc_request.pool_name),
+                    )
+                else:
+                    result = await call()
+        except (exceptions.AdmissionRejectedError, exceptions.LaneOverloadedError) as e:
+            raise e.as_rpc_error(id=rpc_request.id)  # the call has not reached redis
+        except exceptions.RpcError:
+            raise  # the call has not reached redis
+        except asyncio.CancelledError:
+            raise  # an expired deadline or a gone client is not an outcome of the pool
+        except Exception as e:
+            self._pools_wrapper.report(rpc_request.pool_name, e)
+            raise
+        self._pools_wrapper.report(rpc_request.pool_name)
+        return result
+
+    async def handle_batch(
+            self, request_data: t.List[t.Dict[str, t.Any]],
+            client: str = DEFAULT_CLIENT,
+            timeout: t.Optional[float] = None):
+        """
+        :param timeout: seconds every call without ``timeout_ms`` may take
+        """
         batch_rpc_request = RpcBatchRequest(request_data, request_cls=RedisRpcRequest)
-        processor = RedisRpcBatchProcessor(self._pools_wrapper)
+        processor = RedisRpcBatchProcessor(
+            self._pools_wrapper, client, self.get_weight(client), timeout=timeout, timeouts=self.timeouts
+        )
         return await processor.process(batch_rpc_request)
 
     async def handle(self, request: Request):
+        """
+        A request is cancelled with all calls of it once its client disconnects.
+
+        :return: ``None`` or an empty list if there is nothing to answer (notifications only)
+        """
         data = load_json(request.body)
+        client = identify_client(request, self.client_header)
+        timeout = get_request_timeout(request)
 
         if isinstance(data, list):
-            return await self.handle_batch(data)
+            return await self.handle_batch(data, client, timeout)
         else:
-            return await self.handle_single(data)
+            return await self.handle_single(data, client, timeout)
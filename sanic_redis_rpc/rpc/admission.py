@@ -0,0 +1,220 @@
+import asyncio
+import heapq
+import typing as t
+from contextlib import asynccontextmanager
+from hashlib import sha1
+from time import monotonic
+
+from sanic.request import Request
+
+from sanic_redis_rpc.rpc import exceptions
+
+DEFAULT_CLIENT = 'anonymous'
+CLIENT_HEADER = 'X-Client-Id'
+
+
+def identify_client(request: Request, header: t.Optional[str] = None) -> str:
+    """
+    Clients choose their headers freely, so only an address of a client is used by default
+    (a forwarded one as far as Sanic trusts proxies).
+
+    :param header: a header set by a trusted proxy: a value of it or a hash of a bearer token (``token:<hash>``)
+        name a client then
+    :return: a name of a client
+    """
+    if header is not None:
+        client = request.headers.get(header, '').strip()
+        if client:
+            return client
+        authorization = request.headers.get('Authorization', '')
+        if authorization.lower().startswith('bearer '):
+            return 'token:' + sha1(authorization[7:].strip().encode()).hexdigest()[:16]
+    return request.remote_addr or request.ip or DEFAULT_CLIENT
+
+
+class ClientState:
+    def __init__(self):
+        self.in_flight = 0
+        self.queued = 0
+        self.finish_tag = 0.
+        self.counters = {'admitted': 0, 'rejected': 0}
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return dict(self.counters, in_flight=self.in_flight, queued=self.queued)
+
+
+class AdmissionController:
+    """
+    Limits the number of commands a pool runs at once to ``max_in_flight`` and shares it between clients
+    with weighted fair queueing: a call costs as many commands as it sends, calls of a client get
+    virtual finish tags growing by ``cost / weight`` and the call with the smallest tag runs next,
+    so a client sending huge batches can't hold back single calls of other clients.
+
+    At most ``max_queued`` commands wait for admission, a client may queue its weighted share of them
+    among clients having work in the pool. Excess calls are rejected right away with an estimate
+    of seconds the queue takes to drain. ``max_in_flight <= 0`` admits everything.
+    """
+
+    def __init__(self, pool_name: str, max_in_flight: int = 1000, max_queued: int = 10000):
+        self.pool_name = pool_name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max(0, max_queued)
+
+        self.in_flight = 0
+        self.queued = 0
+        self.virtual_time = 0.
+        self.counters = {'admitted': 0, 'rejected': 0, 'delayed': 0}
+        self.clients: t.Dict[str, ClientState] = {}
+
+        self._queue: t.List[t.Tuple[float, int, int, str, float, asyncio.Future]] = []
+        self._sequence = 0
+        self._weights: t.Dict[str, float] = {}
+        self._seconds_per_command = 0.001
+        self._wait_seconds = 0.
+        self._max_wait_seconds = 0.
+
+    @property
+    def limited(self) -> bool:
+        return self.max_in_flight > 0
+
+    def get_cost(self, commands: int) -> int:
+        """
+        :return: admission cost of ``commands``, a call costs no more than the whole pool
+        """
+        cost = max(1, commands)
+        return min(cost, self.max_in_flight) if self.limited else cost
+
+    @property
+    def retry_after(self) -> float:
+        """
+        :return: estimated seconds until commands queued now are admitted
+        """
+        if not self.limited:
+            return 0.
+        seconds = (self.queued + self.in_flight) * self._seconds_per_command / self.max_in_flight
+        return round(max(0.01, seconds), 3)
+
+    @asynccontextmanager
+    async def admit(self, client: str, commands: int = 1, weight: float = 1) -> t.AsyncIterator[None]:
+        """
+        :raises AdmissionRejectedError: if the queue (or the share of it the client may take) is full
+        """
+        cost = self.get_cost(commands)
+        await self._acquire(client, cost, max(weight, 0.01))
+        started = monotonic()
+        try:
+            yield
+        finally:
+            self._release(client, cost, monotonic() - started)
+
+    def _get_client(self, client: str) -> ClientState:
+        state = self.clients.get(client, None)
+        if state is None:
+            state = self.clients[client] = ClientState()
+        return state
+
+    def _tag(self, state: ClientState, cost: int, weight: float) -> t.Tuple[float, float]:
+        start_tag = max(self.virtual_time, state.finish_tag)
+        state.finish_tag = start_tag + cost / weight
+        return start_tag, state.finish_tag
+
+    async def _acquire(self, client: str, cost: int, weight: float):
+        state = self._get_client(client)
+        self._weights[client] = weight
+        if not self.limited or (not self._queue and self.in_flight + cost <= self.max_in_flight):
+            start_tag, _ = self._tag(state, cost, weight)
+            self.virtual_time = max(self.virtual_time, start_tag)
+            self._grant(state, cost)
+            return
+
+        if self.queued + cost > self.max_queued or state.queued + cost > self._get_queue_share(client):
+            state.counters['rejected'] += 1
+            self.counters['rejected'] += 1
+            self._forget_idle(client)
+            raise exceptions.AdmissionRejectedError(self.pool_name, client, self.retry_after)
+
+        start_tag, finish_tag = self._tag(state, cost, weight)
+        waiter = asyncio.get_event_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._queue, (finish_tag, self._sequence, cost, client, start_tag, waiter))
+        self.queued += cost
+        state.queued += cost
+        self.counters['delayed'] += 1
+        started = monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(client, cost, 0.)  # admitted right before the cancellation
+            else:
+                self._dequeue(waiter)
+            raise
+        self._wait_seconds += monotonic() - started
+        self._max_wait_seconds = max(self._max_wait_seconds, monotonic() - started)
+
+    def _get_queue_share(self, client: str) -> float:
+        active = [
+            name for name, state in self.clients.items()
+            if name == client or state.queued or state.in_flight
+        ]
+        weights = sum(self._weights.get(name, 1) for name in active)
+        return self.max_queued * self._weights.get(client, 1) / weights
+
+    def _grant(self, state: ClientState, cost: int):
+        self.in_flight += cost
+        state.in_flight += cost
+        state.counters['admitted'] += 1
+        self.counters['admitted'] += 1
+
+    def _dequeue(self, waiter: asyncio.Future):
+        for i, (_, _, cost, client, _, item) in enumerate(self._queue):
+            if item is waiter:
+                self._queue.pop(i)
+                heapq.heapify(self._queue)
+                self.queued -= cost
+                self.clients[client].queued -= cost
+                self._dispatch()
+                return
+
+    def _release(self, client: str, cost: int, seconds: float):
+        state = self.clients[client]
+        self.in_flight -= cost
+        state.in_flight -= cost
+        if seconds:
+            self._seconds_per_command = self._seconds_per_command * 0.9 + seconds / cost * 0.1
+        self._dispatch()
+        self._forget_idle(client)
+
+    def _dispatch(self):
+        while self._queue and self.in_flight + self._queue[0][2] <= self.max_in_flight:
+            _, _, cost, client, start_tag, waiter = heapq.heappop(self._queue)
+            state = self.clients[client]
+            self.queued -= cost
+            state.queued -= cost
+            if waiter.done():
+                continue  # cancelled
+            self.virtual_time = max(self.virtual_time, start_tag)
+            self._grant(state, cost)
+            waiter.set_result(None)
+
+    def _forget_idle(self, client: str):
+        # tags ahead of the virtual time keep a client from jumping the queue, they matter while calls are queued
+        state = self.clients.get(client, None)
+        if state is not None and not state.in_flight and not state.queued and (
+                not self._queue or state.finish_tag <= self.virtual_time):
+            del self.clients[client]
+            self._weights.pop(client, None)
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        delayed = self.counters['delayed']
+        return dict(
+            self.counters,
+            max_in_flight=self.max_in_flight,
+            max_queued=self.max_queued,
+            in_flight=self.in_flight,
+            queued=self.queued,
+            retry_after=self.retry_after,
+            wait_ms=round(self._wait_seconds / delayed * 1000, 3) if delayed else 0.,
+            max_wait_ms=round(self._max_wait_seconds * 1000, 3),
+            clients={name: state.as_dict() for name, state in self.clients.items()},
+        )
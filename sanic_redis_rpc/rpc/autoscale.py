@@ -0,0 +1,292 @@
+import asyncio
+import collections
+import math
+import typing as t
+from time import monotonic, time
+
+import aioredis
+
+
+class MeteredConnectionsPool(aioredis.ConnectionsPool):
+    """
+    A pool measuring how long callers wait for a connection, how many connections are in use
+    and how long commands take. Commands sent over a free connection are timed one by one,
+    a connection acquired for a pipeline or a transaction is timed from ``acquire`` to ``release``.
+    Measurements are accumulated until ``collect()`` is called.
+
+    The maximum size is ``target_maxsize`` limited by ``cap`` (a share of a connection budget),
+    the minimum size never exceeds the maximum.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.target_maxsize = self.maxsize
+        self.cap: t.Optional[int] = None
+        self._configured_minsize = self._minsize
+        self._peak_demand = 0
+        self._acquired_at: t.Dict[aioredis.RedisConnection, float] = {}
+        # connections dropped by a shrink with commands still pending
+        self._draining: t.Set[aioredis.RedisConnection] = set()
+        self._reset_metrics()
+
+    @property
+    def in_use(self) -> int:
+        return len(self._used) + self._acquiring
+
+    def _reset_metrics(self):
+        self._acquires = 0
+        self._wait_seconds = 0.
+        self._max_wait_seconds = 0.
+        self._commands = 0
+        self._command_seconds = 0.
+        self._peak_in_use = self.in_use
+        self._peak_waiting = self.waiting
+
+    def collect(self) -> t.Dict[str, t.Any]:
+        """
+        :return: metrics accumulated since the previous call
+        """
+        sample = {
+            'maxsize': self.maxsize,
+            'in_use': self.in_use,
+            'peak_in_use': max(self._peak_in_use, self.in_use),
+            'waiting': self.waiting,
+            'peak_waiting': max(self._peak_waiting, self.waiting),
+            'acquires': self._acquires,
+            'wait_ms': round(self._wait_seconds / self._acquires * 1000, 3) if self._acquires else 0.,
+            'max_wait_ms': round(self._max_wait_seconds * 1000, 3),
+            'commands': self._commands,
+            'latency_ms': round(self._command_seconds / self._commands * 1000, 3) if self._commands else 0.,
+        }
+        self._reset_metrics()
+        return sample
+
+    def pop_peak_demand(self) -> int:
+        """
+        :return: the peak of used connections and callers waiting for one since the previous call
+        """
+        demand, self._peak_demand = max(self._peak_demand, self.in_use + self.waiting), 0
+        return demand
+
+    def resize(self, maxsize: int) -> int:
+        """
+        Changes the maximum number of connections (not below the configured ``minsize``).
+
+        :return: the new ``target_maxsize``
+        """
+        self.target_maxsize = max(maxsize, self._configured_minsize, 1)
+        self._apply_maxsize()
+        return self.target_maxsize
+
+    def set_cap(self, cap: t.Optional[int]):
+        self.cap = cap
+        self._apply_maxsize()
+
+    def _apply_maxsize(self):
+        """
+        Extra free connections are dropped, idle ones are closed right away, ones with commands
+        still pending (free connections are shared by commands) are closed once they are answered.
+        Extra used connections are closed on release. Callers waiting for a connection are woken up.
+        """
+        maxsize = max(1, min(self.target_maxsize, self.cap or self.target_maxsize))
+        self._minsize = min(self._configured_minsize, maxsize)
+        if maxsize == self.maxsize:
+            return
+        # busy connections are kept first, so fewer of them have to drain
+        free = sorted(self._pool, key=lambda conn: not self._is_busy(conn))
+        self._pool = collections.deque(free[:maxsize], maxlen=maxsize)
+        for conn in free[maxsize:]:
+            if self._is_busy(conn):
+                self._drain(conn)
+            else:
+                conn.close()
+        asyncio.ensure_future(self._wakeup_all())
+
+    @staticmethod
+    def _is_busy(conn: aioredis.RedisConnection) -> bool:
+        return bool(conn._waiters) or conn.in_pubsub or conn.in_transaction
+
+    def _drain(self, conn: aioredis.RedisConnection):
+        """
+        Closes a connection dropped from the pool once its last pending command is answered.
+        """
+        self._draining.add(conn)
+
+        def _close(_=None):
+            if conn._waiters and not conn.closed:
+                conn._waiters[-1][0].add_done_callback(_close)
+                return
+            self._draining.discard(conn)
+            conn.close()
+
+        _close()
+
+    async def _wakeup_all(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def _do_close(self):
+        for conn in self._draining:
+            conn.close()
+        self._draining.clear()
+        await super()._do_close()
+
+    async def acquire(self, command=None, args=()):
+        started = monotonic()
+        self.waiting += 1
+        self._peak_waiting = max(self._peak_waiting, self.waiting)
+        self._peak_demand = max(self._peak_demand, self.in_use + self.waiting)
+        try:
+            conn = await super().acquire(command, args)
+        finally:
+            self.waiting -= 1
+
+        now = monotonic()
+        self._acquires += 1
+        self._wait_seconds += now - started
+        self._max_wait_seconds = max(self._max_wait_seconds, now - started)
+        self._peak_in_use = max(self._peak_in_use, self.in_use)
+        self._peak_demand = max(self._peak_demand, self.in_use + self.waiting)
+        self._acquired_at[conn] = now
+        return conn
+
+    def release(self, conn):
+        acquired_at = self._acquired_at.pop(conn, None)
+        if acquired_at is not None:
+            self._add_command(monotonic() - acquired_at)
+        super().release(conn)
+
+    def _check_result(self, fut, *data):
+        # a future is a command sent over a free connection, a coroutine waits for a connection first
+        if asyncio.isfuture(fut):
+            started = monotonic()
+            fut.add_done_callback(lambda _: self._add_command(monotonic() - started))
+        return fut
+
+    def _add_command(self, seconds: float):
+        self._commands += 1
+        self._command_seconds += seconds
+
+
+class PoolAutoscaler:
+    """
+    Grows and shrinks the maximum size of a pool between ``min_size`` and ``max_size``
+    from metrics the pool collects every ``interval`` seconds.
+
+    The pool grows by half (at least by a connection) once callers have queued for a connection
+    for more than ``grow_wait_ms`` on average, or when the peak of used connections reaches ``high_utilization``.
+    It shrinks by a quarter (at least by a connection, but not below the peak of used connections)
+    after ``shrink_after`` samples in a row with the peak under ``low_utilization``.
+    No changes are made for ``cooldown`` samples after a change.
+    Growth is held while the command latency is ``saturation_factor`` times higher than it was before
+    the last growth: more connections don't help a saturated redis.
+    """
+
+    def __init__(
+            self, pool: MeteredConnectionsPool,
+            min_size: int,
+            max_size: int,
+            interval: float = 1,
+            grow_wait_ms: float = 1,
+            high_utilization: float = 0.8,
+            low_utilization: float = 0.3,
+            shrink_after: int = 10,
+            cooldown: int = 3,
+            saturation_factor: float = 2,
+            history: int = 20):
+        self.pool = pool
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.interval = interval
+        self.grow_wait_ms = grow_wait_ms
+        self.high_utilization = high_utilization
+        self.low_utilization = low_utilization
+        self.shrink_after = shrink_after
+        self.cooldown = cooldown
+        self.saturation_factor = saturation_factor
+
+        self.counters = {'samples': 0, 'grows': 0, 'shrinks': 0, 'held': 0}
+        self.last_sample: t.Optional[t.Dict[str, t.Any]] = None
+        self.decisions: t.Deque[t.Dict[str, t.Any]] = collections.deque(maxlen=history)
+
+        self._idle_samples = 0
+        self._cooldown_samples = 0
+        self._latency_before_growth: t.Optional[float] = None
+        self._task: t.Optional[asyncio.Task] = None
+
+    def start(self) -> 'PoolAutoscaler':
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.pool.closed:
+                return
+            self.step(self.pool.collect())
+
+    def step(self, sample: t.Dict[str, t.Any]) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Resizes the pool if ``sample`` calls for it.
+
+        :return: a decision made, ``None`` if the size is kept
+        """
+        self.counters['samples'] += 1
+        self.last_sample = sample
+        size = self.pool.target_maxsize
+        utilization = sample['peak_in_use'] / self.pool.maxsize
+        queued = sample['peak_waiting'] > 0 and sample['wait_ms'] > self.grow_wait_ms
+
+        self._idle_samples = self._idle_samples + 1 if utilization < self.low_utilization else 0
+        if self._cooldown_samples:
+            self._cooldown_samples -= 1
+            return None
+
+        if (queued or utilization >= self.high_utilization) and size < self.max_size:
+            if self._is_saturated(sample):
+                self.counters['held'] += 1
+                return self._decide(size, size, 'saturated', sample)
+            self._latency_before_growth = sample['latency_ms']
+            self.counters['grows'] += 1
+            new_size = min(self.max_size, size + max(1, size // 2))
+            return self._decide(size, new_size, 'queued' if queued else 'utilization', sample)
+
+        if self._idle_samples >= self.shrink_after and size > self.min_size:
+            self._latency_before_growth = None
+            self.counters['shrinks'] += 1
+            new_size = max(self.min_size, sample['peak_in_use'], size - max(1, size // 4))
+            return self._decide(size, new_size, 'idle', sample)
+
+        return None
+
+    def _is_saturated(self, sample: t.Dict[str, t.Any]) -> bool:
+        baseline = self._latency_before_growth
+        return bool(baseline) and sample['latency_ms'] > baseline * self.saturation_factor
+
+    def _decide(self, size: int, new_size: int, reason: str, sample: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        if new_size != size:
+            new_size = self.pool.resize(new_size)
+            self._idle_samples = 0
+            self._cooldown_samples = self.cooldown
+        decision = {'at': time(), 'from': size, 'to': new_size, 'reason': reason, 'sample': sample}
+        self.decisions.append(decision)
+        return decision
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return dict(
+            self.counters,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            size=self.pool.target_maxsize,
+            utilization=math.floor(self.pool.in_use / self.pool.maxsize * 100) / 100,
+            last_sample=self.last_sample,
+            decisions=list(self.decisions),
+        )
@@ -0,0 +1,151 @@
+import asyncio
+import typing as t
+from uuid import uuid4
+
+import aioredis
+
+from sanic_redis_rpc.rpc.autoscale import MeteredConnectionsPool
+from sanic_redis_rpc.rpc.health import CONNECTION_ERRORS
+
+
+class ConnectionBudget:
+    """
+    Splits ``budget`` connections of a pool between workers of all processes sharing the service redis.
+
+    Every ``interval`` seconds a worker reports how many connections it wants (the peak of used connections
+    and callers waiting for one) and gets a lease, the maximum size of its pool is capped by the lease.
+    Leases are kept in a hash of the service redis and updated by a script, so their sum never exceeds
+    the budget (but every worker is granted ``min_grant`` connections at least):
+
+    - a worker wanting less than it holds gives the rest back;
+    - a worker wanting more borrows free capacity, e.g. given back by idle workers;
+    - a worker holding more than a fair share (``budget / workers``) returns to it while other workers are starved.
+
+    Leases of workers not seen for ``3 * interval`` seconds are freed. The first lease asks for the whole
+    ``maxsize`` of the pool, while the service redis can't be reached a worker holds no more than its fair share.
+    """
+    KEY_PREFIX = 'sanic-redis-rpc:budget'
+
+    # a lease is `<granted> <wanted> <seen_ms>`
+    LUA_LEASE_SCRIPT = '''
+        redis.replicate_commands()
+        local time = redis.call("TIME")
+        local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+        local worker, wanted, budget = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+        local ttl, min_grant = tonumber(ARGV[4]), tonumber(ARGV[5])
+
+        local leases = redis.call("HGETALL", KEYS[1])
+        local granted, workers, others, starved = 0, 1, 0, false
+        for i = 1, #leases, 2 do
+            local g, w, seen = string.match(leases[i + 1], "(%d+) (%d+) (%d+)")
+            g, w, seen = tonumber(g), tonumber(w), tonumber(seen)
+            if leases[i] == worker then
+                granted = g
+            elseif now - seen > ttl then
+                redis.call("HDEL", KEYS[1], leases[i])
+            else
+                workers = workers + 1
+                others = others + g
+                starved = starved or w > g
+            end
+        end
+
+        local fair = math.max(min_grant, math.floor(budget / workers))
+        local free = budget - others
+        local grant = math.min(wanted, free)
+        if starved and grant > fair then
+            grant = fair
+        end
+        grant = math.max(min_grant, grant)
+
+        redis.call("HSET", KEYS[1], worker, grant .. " " .. wanted .. " " .. now)
+        redis.call("PEXPIRE", KEYS[1], ttl * 10)
+        return {grant, workers, fair}
+    '''
+
+    def __init__(
+            self, pool: MeteredConnectionsPool,
+            get_service_redis: t.Callable[[], t.Awaitable[aioredis.Redis]],
+            pool_name: str,
+            budget: int,
+            interval: float = 1,
+            min_grant: int = 1):
+        """
+        :param get_service_redis: a coroutine function returning the service redis
+        """
+        self.pool = pool
+        self.get_service_redis = get_service_redis
+        self.key = ':'.join([self.KEY_PREFIX, pool_name])
+        self.budget = max(1, budget)
+        self.interval = interval
+        self.min_grant = max(1, min_grant)
+
+        self.worker_id = uuid4().hex
+        self.granted = self.min_grant
+        self.wanted: t.Optional[int] = None
+        self.workers = 1
+        self.fair_share = self.budget
+        self.counters = {'leases': 0, 'borrowed': 0, 'returned': 0, 'errors': 0}
+        self.last_error: t.Optional[str] = None
+        self._task: t.Optional[asyncio.Task] = None
+
+        self.pool.set_cap(self.granted)
+
+    def start(self) -> 'ConnectionBudget':
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+        try:
+            await (await self.get_service_redis()).hdel(self.key, self.worker_id)
+        except CONNECTION_ERRORS + (aioredis.RedisError,):
+            pass  # freed once it expires
+
+    async def _run(self):
+        while True:
+            try:
+                await self.lease(self.pool.target_maxsize if self.wanted is None else self.pool.pop_peak_demand())
+            except CONNECTION_ERRORS + (aioredis.RedisError,) as e:
+                self.counters['errors'] += 1
+                self.last_error = repr(e)
+                self._grant(min(self.granted, self.fair_share))
+            await asyncio.sleep(self.interval)
+
+    async def lease(self, wanted: int) -> int:
+        """
+        :return: the number of connections granted to this worker
+        """
+        self.wanted = max(self.min_grant, min(wanted, self.pool.target_maxsize))
+        service_redis = await self.get_service_redis()
+        granted, self.workers, self.fair_share = await service_redis.eval(
+            self.LUA_LEASE_SCRIPT, keys=[self.key], args=[
+                self.worker_id, self.wanted, self.budget, int(self.interval * 3000), self.min_grant
+            ]
+        )
+        self.counters['leases'] += 1
+        if granted > self.fair_share and granted > self.granted:
+            self.counters['borrowed'] += 1
+        elif self.granted > self.fair_share >= granted:
+            self.counters['returned'] += 1
+        return self._grant(granted)
+
+    def _grant(self, granted: int) -> int:
+        self.granted = granted
+        self.pool.set_cap(granted)
+        return granted
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return dict(
+            self.counters,
+            budget=self.budget,
+            granted=self.granted,
+            wanted=self.wanted,
+            workers=self.workers,
+            fair_share=self.fair_share,
+            last_error=self.last_error,
+        )
@@ -17,3 +17,19 @@ class CustomRedis(aioredis.Redis):
         """
 
         return self.execute(b'MEMORY', b'USAGE', key, b'SAMPLES', samples)
+
+    def restore(self, key: str, ttl: int, value: bytes, *, replace: bool = False):
+        """
+        Create a key associated with a value that is obtained by deserializing the provided serialized value
+        (obtained via DUMP).
+
+        If ttl is 0 the key is created without any expire, otherwise the specified expire time (in milliseconds)
+        is set. RESTORE fails with BUSYKEY error if the key already exists unless `replace` is set.
+        :param key: key
+        :param ttl: expire time in milliseconds, 0 means no expire
+        :param value: a serialized value
+        :param replace: replace an existing key
+        :return:
+        """
+        args = [b'REPLACE'] if replace else []
+        return self.execute(b'RESTORE', key, ttl, value, *args)
@@ -0,0 +1,131 @@
+import asyncio
+import typing as t
+from time import monotonic
+
+from sanic.request import Request
+
+from sanic_redis_rpc.rpc import exceptions
+from sanic_redis_rpc.rpc.lanes import LANE_BLOCKING, LANE_INTERACTIVE, LANE_SLOW
+
+# a timeout of all calls of a request, a `timeout_ms` field of a call takes precedence
+TIMEOUT_HEADER = 'X-Timeout-Ms'
+TIMEOUT_FIELD = 'timeout_ms'
+# seconds calls of a lane may take unless a client sets a timeout, `0` is no limit;
+# blocking commands with a timeout of their own are given that timeout instead
+DEFAULT_TIMEOUTS = {LANE_INTERACTIVE: 5., LANE_SLOW: 30., LANE_BLOCKING: 60.}
+# timeouts of blocking commands: position (`None` for keyword-only), name and seconds per unit
+BLOCKING_TIMEOUTS = {
+    'blpop': (None, 'timeout', 1), 'brpop': (None, 'timeout', 1), 'brpoplpush': (2, 'timeout', 1),
+    'bzpopmin': (None, 'timeout', 1), 'bzpopmax': (None, 'timeout', 1), 'wait': (1, 'timeout', 0.001),
+    'xread': (1, 'timeout', 0.001), 'xread_group': (3, 'timeout', 0.001),
+}
+# seconds a blocking command is given to reply after its own timeout
+BLOCKING_TIMEOUT_MARGIN = 1.
+
+
+def parse_timeout_ms(value: t.Any) -> float:
+    """
+    :return: seconds
+    :raises ValueError: if ``value`` is not a positive number of milliseconds
+    """
+    if isinstance(value, bool):
+        raise ValueError(value)
+    timeout = float(value) / 1000
+    if not timeout > 0:
+        raise ValueError(value)
+    return timeout
+
+
+def get_blocking_timeout(method_name: str, params: t.Union[list, dict, None] = None) -> t.Optional[float]:
+    """
+    :return: seconds a blocking command waits for by its own timeout, ``0`` is no limit,
+        ``None`` if the command doesn't block or its timeout is not a number
+    """
+    name = method_name.lower()
+    if name not in BLOCKING_TIMEOUTS:
+        return None
+    position, param_name, unit = BLOCKING_TIMEOUTS[name]
+    if isinstance(params, dict):
+        value = params.get(param_name, 0)
+    else:
+        value = params[position] if position is not None and len(params or []) > position else 0
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        return None  # `None` of stream reads is no blocking, anything else fails anyway
+    return value * unit
+
+
+def get_request_timeout(request: Request) -> t.Optional[float]:
+    """
+    :return: seconds set by the ``X-Timeout-Ms`` header
+    """
+    value = request.headers.get(TIMEOUT_HEADER, None)
+    if value is None:
+        return None
+    try:
+        return parse_timeout_ms(value)
+    except ValueError:
+        raise exceptions.RpcInvalidRequestError(message=f'`{TIMEOUT_HEADER}` should be a positive number')
+
+
+class Deadline:
+    """
+    A moment a call must be done by, ``None`` or ``0`` seconds is no deadline.
+    """
+
+    def __init__(self, timeout: t.Optional[float] = None):
+        self.timeout = timeout or None
+        self.expires_at = monotonic() + timeout if timeout else None
+
+    @classmethod
+    def latest(cls, deadlines: t.Iterable['Deadline']) -> 'Deadline':
+        res = None
+        for deadline in deadlines:
+            if deadline.expires_at is None:
+                return deadline
+            if res is None or deadline.expires_at > res.expires_at:
+                res = deadline
+        return res or cls()
+
+    @property
+    def remaining(self) -> t.Optional[float]:
+        return None if self.expires_at is None else self.expires_at - monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.remaining <= 0
+
+    async def run(self, awaitable: t.Awaitable) -> t.Any:
+        """
+        Awaits ``awaitable`` cancelling it once the deadline expires.
+
+        :raises DeadlineExceededError: if the deadline has expired
+        """
+        if self.expires_at is None:
+            return await awaitable
+        if self.expired:
+            asyncio.iscoroutine(awaitable) and awaitable.close()
+            raise exceptions.DeadlineExceededError(self.timeout)
+        try:
+            return await asyncio.wait_for(_wrap_timeout(awaitable), self.remaining)
+        except _InnerTimeoutError as e:
+            raise e.error  # a timeout of redis itself
+        except asyncio.TimeoutError:
+            # a timer may fire a bit before `expires_at`, the deadline has expired anyway
+            raise exceptions.DeadlineExceededError(self.timeout)
+
+
+class _InnerTimeoutError(Exception):
+    """
+    Carries a timeout of an awaitable itself through ``wait_for``, so it's not taken for an expired deadline.
+    """
+
+    def __init__(self, error: asyncio.TimeoutError):
+        super().__init__(error)
+        self.error = error
+
+
+async def _wrap_timeout(awaitable: t.Awaitable) -> t.Any:
+    try:
+        return await awaitable
+    except asyncio.TimeoutError as e:
+        raise _InnerTimeoutError(e)
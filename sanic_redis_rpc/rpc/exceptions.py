@@ -1,4 +1,4 @@
-from sanic.exceptions import SanicException
+from sanic.exceptions import SanicException, ServiceUnavailable, InvalidUsage
 
 JSON_RPC_VERSION = '2.0'
 
@@ -7,10 +7,10 @@ class RpcError(SanicException):
     MESSAGE = ''
     ERROR_CODE = -32000
 
-    def __init__(self, id=None, data=None, message=None, error_code=ERROR_CODE):
+    def __init__(self, id=None, data=None, message=None, error_code=None):
         super().__init__(message or self.MESSAGE, status_code=200)
         self.message = message or self.MESSAGE
-        self.error_code = error_code
+        self.error_code = error_code or self.ERROR_CODE
         self.data = data
         self.id = id
 
@@ -52,3 +52,82 @@ class RpcInvalidParamsError(RpcError):
 class RpcParseError(RpcError):
     ERROR_CODE = -32700
     MESSAGE = 'Invalid JSON was received'
+
+
+class RpcPoolUnavailableError(RpcError):
+    ERROR_CODE = -32001
+    MESSAGE = 'Pool is unavailable'
+
+
+class PoolUnavailableError(ServiceUnavailable):
+    MESSAGE = 'Pool `{pool_name}` is unavailable (circuit is {state}), retry in {retry_after}s'
+
+    def __init__(self, pool_name: str, state: str, retry_after: float):
+        super().__init__(self.MESSAGE.format(pool_name=pool_name, state=state, retry_after=retry_after))
+        self.pool_name = pool_name
+        self.state = state
+        self.retry_after = retry_after
+
+    def as_rpc_error(self, id=None) -> RpcPoolUnavailableError:
+        return RpcPoolUnavailableError(
+            id=id, message=str(self),
+            data={'pool': self.pool_name, 'state': self.state, 'retry_after': self.retry_after}
+        )
+
+
+class RpcOverloadedError(RpcError):
+    ERROR_CODE = -32002
+    MESSAGE = 'Server is overloaded'
+
+
+class LaneOverloadedError(ServiceUnavailable):
+    MESSAGE = 'Lane `{lane}` of pool `{pool_name}` is overloaded, {queued} calls are queued'
+
+    def __init__(self, pool_name: str, lane: str, queued: int):
+        super().__init__(self.MESSAGE.format(pool_name=pool_name, lane=lane, queued=queued))
+        self.pool_name = pool_name
+        self.lane = lane
+        self.queued = queued
+
+    def as_rpc_error(self, id=None) -> RpcOverloadedError:
+        return RpcOverloadedError(
+            id=id, message=str(self), data={'pool': self.pool_name, 'lane': self.lane, 'queued': self.queued}
+        )
+
+
+class AdmissionRejectedError(ServiceUnavailable):
+    MESSAGE = 'Pool `{pool_name}` is overloaded by calls of `{client}`, retry in {retry_after}s'
+
+    def __init__(self, pool_name: str, client: str, retry_after: float):
+        super().__init__(self.MESSAGE.format(pool_name=pool_name, client=client, retry_after=retry_after))
+        self.pool_name = pool_name
+        self.client = client
+        self.retry_after = retry_after
+
+    def as_rpc_error(self, id=None) -> RpcOverloadedError:
+        return RpcOverloadedError(
+            id=id, message=str(self), data={'pool': self.pool_name, 'retry_after': self.retry_after}
+        )
+
+
+class RpcDeadlineExceededError(RpcError):
+    ERROR_CODE = -32003
+    MESSAGE = 'Deadline exceeded'
+
+
+class DeadlineExceededError(ServiceUnavailable):
+    MESSAGE = 'The call has not been done in {timeout}s'
+
+    def __init__(self, timeout: float):
+        super().__init__(self.MESSAGE.format(timeout=round(timeout, 3)))
+        self.timeout = timeout
+
+    def as_rpc_error(self, id=None) -> RpcDeadlineExceededError:
+        return RpcDeadlineExceededError(id=id, message=str(self), data={'timeout_ms': round(self.timeout * 1000)})
+
+
+class PoolConfigError(InvalidUsage):
+    MESSAGE = 'Pool `{pool_name}` can not be configured: {reason}'
+
+    def __init__(self, pool_name: str, reason: str):
+        super().__init__(self.MESSAGE.format(pool_name=pool_name, reason=reason))
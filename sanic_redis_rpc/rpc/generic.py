@@ -63,7 +63,7 @@ class RpcRequest:
 
     @property
     def is_notify(self) -> bool:
-        return 'id' in self._data
+        return 'id' not in self._data
 
     @property
     def params(self):
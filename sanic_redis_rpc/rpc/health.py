@@ -0,0 +1,108 @@
+import asyncio
+import typing as t
+from collections import deque
+from time import monotonic
+
+import aioredis
+
+# errors meaning a pool can't be talked to, unlike replies with errors
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, aioredis.ConnectionClosedError, aioredis.PoolClosedError)
+
+
+def is_connection_error(e: BaseException) -> bool:
+    return isinstance(e, CONNECTION_ERRORS)
+
+
+class CircuitBreaker:
+    """
+    Health state of a pool fed with outcomes of calls and background ``PING``s.
+
+    A ``closed`` circuit opens after ``failure_threshold`` consecutive failures or once at least
+    ``error_rate`` of the last ``window`` calls (but no less than ``min_calls``) have failed.
+    An ``open`` circuit rejects calls for ``open_seconds``, then it's ``half_open``: a single trial call
+    (or a ``PING``) is let through at a time, its success closes the circuit and its failure opens it again.
+    A trial call whose outcome is never recorded frees its slot after ``open_seconds``.
+    """
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+
+    def __init__(
+            self,
+            failure_threshold: int = 5,
+            error_rate: float = 0.5,
+            window: int = 20,
+            min_calls: int = 10,
+            open_seconds: float = 5):
+        self.failure_threshold = max(1, failure_threshold)
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+
+        self.state = self.STATE_CLOSED
+        self.counters = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+        self.consecutive_failures = 0
+        self.last_error: t.Optional[str] = None
+
+        self._outcomes: t.Deque[bool] = deque(maxlen=max(1, window))
+        self._opened_at = 0.
+        self._trial_at: t.Optional[float] = None
+
+    @property
+    def retry_after(self) -> float:
+        """
+        :return: seconds until the circuit lets a trial call through
+        """
+        if self.state == self.STATE_CLOSED:
+            return 0.
+        started_at = self._opened_at if self.state == self.STATE_OPEN else (self._trial_at or 0.)
+        return round(max(0., started_at + self.open_seconds - monotonic()), 3)
+
+    def allow(self) -> bool:
+        now = monotonic()
+        if self.state == self.STATE_OPEN:
+            if now - self._opened_at < self.open_seconds:
+                self.counters['rejected'] += 1
+                return False
+            self.state, self._trial_at = self.STATE_HALF_OPEN, None
+
+        if self.state == self.STATE_HALF_OPEN:
+            if self._trial_at is not None and now - self._trial_at < self.open_seconds:
+                self.counters['rejected'] += 1
+                return False
+            self._trial_at = now
+        return True
+
+    def record(self, success: bool, error: t.Optional[BaseException] = None):
+        self._outcomes.append(success)
+        if success:
+            self.counters['successes'] += 1
+            self.consecutive_failures = 0
+            if self.state != self.STATE_CLOSED:
+                self.state = self.STATE_CLOSED
+                self._outcomes.clear()
+            return
+
+        self.counters['failures'] += 1
+        self.consecutive_failures += 1
+        self.last_error = repr(error) if error is not None else self.last_error
+        if self.state == self.STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold or (
+                len(self._outcomes) >= self.min_calls and
+                self._outcomes.count(False) >= self.error_rate * len(self._outcomes)):
+            self._open()
+
+    def _open(self):
+        if self.state != self.STATE_OPEN:
+            self.counters['opened'] += 1
+        self.state = self.STATE_OPEN
+        self._opened_at = monotonic()
+        self._trial_at = None
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return dict(
+            self.counters,
+            state=self.state,
+            consecutive_failures=self.consecutive_failures,
+            retry_after=self.retry_after,
+            last_error=self.last_error,
+        )
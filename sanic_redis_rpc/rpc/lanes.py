@@ -0,0 +1,236 @@
+import asyncio
+import collections
+import math
+import typing as t
+from contextlib import asynccontextmanager
+from time import monotonic
+
+import aioredis
+
+from sanic_redis_rpc.rpc import exceptions
+from sanic_redis_rpc.rpc.custom_redis import CustomRedis
+
+LANE_INTERACTIVE = 'interactive'
+LANE_SLOW = 'slow'
+LANE_BLOCKING = 'blocking'
+
+# a lane taking precedence when commands of different lanes are sent together
+LANE_PRIORITY = {LANE_INTERACTIVE: 0, LANE_SLOW: 1, LANE_BLOCKING: 2}
+
+BLOCKING_COMMANDS = frozenset([
+    'blpop', 'brpop', 'brpoplpush', 'bzpopmin', 'bzpopmax', 'wait',
+])
+# commands blocking unless their `timeout` is `None` (no `BLOCK` argument): position and name of `timeout`
+STREAM_READ_COMMANDS = {'xread': (1, 'timeout'), 'xread_group': (3, 'timeout')}
+# commands taking time proportional to the size of a key or a db
+SLOW_COMMANDS = frozenset([
+    'keys', 'smembers', 'hgetall', 'hkeys', 'hvals', 'sunion', 'sinter', 'sdiff', 'sunionstore', 'sinterstore',
+    'sdiffstore', 'zunionstore', 'zinterstore', 'sort', 'flushdb', 'flushall', 'save', 'debug_sleep',
+])
+# range commands are slow if a range is unbounded or too wide: (position, name, default) of start and stop
+RANGE_COMMANDS = {
+    'lrange': ((1, 'start', None), (2, 'stop', None)),
+    'zrange': ((1, 'start', 0), (2, 'stop', -1)),
+    'zrevrange': ((1, 'start', 0), (2, 'stop', -1)),
+}
+SLOW_RANGE = 1000
+
+
+def _get_param(params: t.Union[list, dict], position: int, name: str, default: t.Any) -> t.Any:
+    if isinstance(params, dict):
+        return params.get(name, default)
+    return params[position] if len(params) > position else default
+
+
+def classify_command(method_name: str, params: t.Union[list, dict, None] = None, slow: bool = False) -> str:
+    """
+    :param slow: tell ``slow`` commands from interactive ones, only blocking commands are told apart by default
+    :return: a lane of a command by its ``CustomRedis`` method name
+    """
+    name = method_name.lower()
+    if name in BLOCKING_COMMANDS:
+        return LANE_BLOCKING
+    if name in STREAM_READ_COMMANDS:
+        position, param_name = STREAM_READ_COMMANDS[name]
+        blocking = _get_param(params or [], position, param_name, 0) is not None
+        return LANE_BLOCKING if blocking else LANE_INTERACTIVE
+    if not slow:
+        return LANE_INTERACTIVE
+    if name in SLOW_COMMANDS:
+        return LANE_SLOW
+    if name in RANGE_COMMANDS:
+        (start_position, start_name, start_default), (stop_position, stop_name, stop_default) = RANGE_COMMANDS[name]
+        try:
+            start = int(_get_param(params or [], start_position, start_name, start_default))
+            stop = int(_get_param(params or [], stop_position, stop_name, stop_default))
+        except (TypeError, ValueError):
+            return LANE_INTERACTIVE  # fails anyway
+        if start < 0 or stop < 0 or stop - start >= SLOW_RANGE:
+            return LANE_SLOW
+    return LANE_INTERACTIVE
+
+
+class Lane:
+    def __init__(self, name: str, weight: int, max_in_use: int, max_queued: int):
+        self.name = name
+        self.weight = max(1, weight)
+        self.max_in_use = max(1, max_in_use)
+        self.max_queued = max_queued
+
+        self.in_use = 0
+        self.queue: t.Deque[asyncio.Future] = collections.deque()
+        self.counters = {'executed': 0, 'rejected': 0, 'peak_queued': 0}
+        self._wait_seconds = 0.
+        self._max_wait_seconds = 0.
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.queue) and self.in_use < self.max_in_use
+
+    def add_wait(self, seconds: float):
+        self.counters['executed'] += 1
+        self._wait_seconds += seconds
+        self._max_wait_seconds = max(self._max_wait_seconds, seconds)
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        executed = self.counters['executed']
+        return dict(
+            self.counters,
+            weight=self.weight,
+            max_in_use=self.max_in_use,
+            in_use=self.in_use,
+            queued=len(self.queue),
+            wait_ms=round(self._wait_seconds / executed * 1000, 3) if executed else 0.,
+            max_wait_ms=round(self._max_wait_seconds * 1000, 3),
+        )
+
+
+class LaneScheduler:
+    """
+    Runs commands holding a connection for long (``slow`` and ``blocking`` lanes) on ``size`` dedicated
+    connections of a pool, so they never take connections of interactive commands.
+
+    Every lane has its own queue of at most ``max_queued`` callers, a free connection goes to the ready lane
+    using the least of its ``weights`` share. A blocking command may hold a connection for good,
+    so blocking commands are limited to their weighted share of connections, the slow lane may use all of them.
+    Only blocking commands are scheduled unless ``slow_commands`` is set.
+    The dedicated pool is created on first use.
+    """
+    WEIGHTS = {LANE_SLOW: 1, LANE_BLOCKING: 1}
+
+    def __init__(
+            self, pool_name: str,
+            create_pool: t.Callable[[], t.Awaitable[aioredis.ConnectionsPool]],
+            size: int = 4,
+            max_queued: int = 100,
+            weights: t.Optional[t.Dict[str, int]] = None,
+            slow_commands: bool = False):
+        """
+        :param create_pool: a coroutine function creating a pool of ``size`` connections
+        :param slow_commands: run commands taking time proportional to the size of data in the ``slow`` lane
+        """
+        self.pool_name = pool_name
+        self.create_pool = create_pool
+        self.size = max(1, size)
+        self.slow_commands = slow_commands
+        weights = dict(self.WEIGHTS, **(weights or {}))
+        blocking_share = math.ceil(self.size * weights[LANE_BLOCKING] / sum(weights.values()))
+        self.lanes = {
+            LANE_SLOW: Lane(LANE_SLOW, weights[LANE_SLOW], self.size, max_queued),
+            LANE_BLOCKING: Lane(LANE_BLOCKING, weights[LANE_BLOCKING], blocking_share, max_queued),
+        }
+
+        self.in_use = 0
+        self.pool: t.Optional[aioredis.ConnectionsPool] = None
+        self._pool_lock: t.Optional[asyncio.Lock] = None
+
+    def classify(self, method_name: str, params: t.Union[list, dict, None] = None) -> str:
+        """
+        :return: a lane a command is run in, ``interactive`` commands are not run by the scheduler
+        """
+        return classify_command(method_name, params, slow=self.slow_commands)
+
+    async def _get_pool(self) -> aioredis.ConnectionsPool:
+        if self.pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self.pool is None:
+                    self.pool = await self.create_pool()
+        return self.pool
+
+    @asynccontextmanager
+    async def connection(self, lane_name: str) -> t.AsyncIterator[aioredis.Redis]:
+        """
+        :raises LaneOverloadedError: if the queue of the lane is full
+        """
+        await self._take_slot(self.lanes[lane_name])
+        try:
+            conn = await (await self._get_pool()).acquire()
+        except BaseException:
+            self._release_slot(self.lanes[lane_name])
+            raise
+        try:
+            yield CustomRedis(conn)
+        finally:
+            # a connection with a command left waiting for a reply (e.g. a cancelled `BLPOP`) is closed on release
+            self.pool.release(conn)
+            self._release_slot(self.lanes[lane_name])
+
+    async def _take_slot(self, lane: Lane):
+        started = monotonic()
+        if self.in_use < self.size and lane.in_use < lane.max_in_use and not lane.queue:
+            self._grant(lane)
+            lane.add_wait(0.)
+            return
+
+        if len(lane.queue) >= lane.max_queued:
+            lane.counters['rejected'] += 1
+            raise exceptions.LaneOverloadedError(self.pool_name, lane.name, len(lane.queue))
+
+        waiter = asyncio.get_event_loop().create_future()
+        lane.queue.append(waiter)
+        lane.counters['peak_queued'] = max(lane.counters['peak_queued'], len(lane.queue))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot(lane)  # granted right before the cancellation
+            elif waiter in lane.queue:
+                lane.queue.remove(waiter)
+            raise
+        lane.add_wait(monotonic() - started)
+
+    def _grant(self, lane: Lane):
+        self.in_use += 1
+        lane.in_use += 1
+
+    def _release_slot(self, lane: Lane):
+        self.in_use -= 1
+        lane.in_use -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_use < self.size:
+            ready = [lane for lane in self.lanes.values() if lane.ready]
+            if not ready:
+                return
+            lane = min(ready, key=lambda item: (item.in_use + 1) / item.weight)
+            waiter = lane.queue.popleft()
+            if waiter.done():
+                continue  # cancelled
+            self._grant(lane)
+            waiter.set_result(None)
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            'size': self.size,
+            'in_use': self.in_use,
+            'connected': self.pool is not None,
+            'lanes': {name: lane.as_dict() for name, lane in self.lanes.items()},
+        }
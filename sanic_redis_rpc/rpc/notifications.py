@@ -0,0 +1,186 @@
+import asyncio
+import collections
+import typing as t
+from time import monotonic
+
+import aioredis
+
+from sanic_redis_rpc.rpc import exceptions
+from sanic_redis_rpc.rpc.deadlines import Deadline
+from sanic_redis_rpc.rpc.health import is_connection_error
+
+OVERFLOW_DROP_NEW = 'drop_new'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_WAIT = 'wait'
+OVERFLOW_POLICIES = [OVERFLOW_DROP_NEW, OVERFLOW_DROP_OLDEST, OVERFLOW_WAIT]
+
+# a function adding a command to a pipeline
+Command = t.Callable[[aioredis.commands.Pipeline], t.Any]
+
+
+class NotificationQueue:
+    """
+    A write-behind queue of a pool: callers don't wait for commands queued, a background task sends them
+    in pipelines of up to ``batch_size`` commands. Commands queued while a pipeline is sent go with the next one.
+
+    At most ``max_queued`` commands are kept, once the queue is full the ``overflow`` policy either drops
+    a new command (``drop_new``), drops the oldest one (``drop_oldest``) or makes a caller ``wait``
+    for free space until its deadline. Nothing is sent while the circuit of the pool is open,
+    a failed pipeline is not sent again: it may have been partly done.
+    """
+
+    def __init__(
+            self, pool_name: str,
+            get_redis: t.Callable[[], t.Awaitable[aioredis.Redis]],
+            max_queued: int = 10000,
+            batch_size: int = 500,
+            overflow: str = OVERFLOW_DROP_NEW,
+            is_available: t.Optional[t.Callable[[], bool]] = None,
+            report: t.Optional[t.Callable[[t.Optional[BaseException]], t.Any]] = None,
+            retry_interval: float = 0.1):
+        """
+        :param get_redis: a coroutine function returning a redis of the pool
+        :param is_available: returns ``False`` while the pool can't be talked to
+        :param report: is called with an error of every pipeline sent, ``None`` if it has been sent
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'`overflow` must be one of {OVERFLOW_POLICIES}, got `{overflow}`')
+        self.pool_name = pool_name
+        self.get_redis = get_redis
+        self.max_queued = max(1, max_queued)
+        self.batch_size = max(1, batch_size)
+        self.overflow = overflow
+        self.is_available = is_available
+        self.report = report
+        self.retry_interval = retry_interval
+
+        self.counters = {
+            'queued': 0, 'dropped': 0, 'sent': 0, 'failed': 0, 'invalid': 0, 'flushes': 0, 'peak_queued': 0,
+        }
+        self.last_error: t.Optional[str] = None
+        self.last_flush_ms = 0.
+
+        self._queue: t.Deque[Command] = collections.deque()
+        self._ready: t.Optional[asyncio.Event] = None
+        self._not_full: t.Optional[asyncio.Event] = None
+        self._task: t.Optional[asyncio.Task] = None
+        self._closing = False
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def start(self) -> 'NotificationQueue':
+        if self._task is None:
+            self._ready, self._not_full = asyncio.Event(), asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def put(self, command: Command, deadline: t.Optional[Deadline] = None) -> bool:
+        """
+        :return: ``False`` if the command has been dropped
+        """
+        self.start()
+        if len(self._queue) >= self.max_queued:
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._queue.popleft()
+                self.counters['dropped'] += 1
+            elif self.overflow == OVERFLOW_WAIT:
+                try:
+                    await (deadline or Deadline()).run(self._wait_for_space())
+                except exceptions.DeadlineExceededError:
+                    self.counters['dropped'] += 1
+                    return False
+            else:
+                self.counters['dropped'] += 1
+                return False
+
+        self._queue.append(command)
+        self.counters['queued'] += 1
+        self.counters['peak_queued'] = max(self.counters['peak_queued'], len(self._queue))
+        self._ready.set()
+        return True
+
+    async def _wait_for_space(self):
+        while len(self._queue) >= self.max_queued:
+            self._not_full.clear()
+            await self._not_full.wait()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            if not self._queue or self._closing:
+                if self._closing:
+                    return  # commands left are sent by `close()`
+                self._ready.clear()
+                continue
+            if self.is_available is not None and not self.is_available():
+                await asyncio.sleep(self.retry_interval)
+                continue
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Sends up to ``batch_size`` queued commands.
+
+        :return: the number of commands sent
+        """
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        if self._not_full is not None:
+            self._not_full.set()
+        if not batch:
+            return 0
+
+        started = monotonic()
+        self.counters['flushes'] += 1
+        invalid = 0
+        try:
+            pipeline = (await self.get_redis()).pipeline()
+            for command in batch:
+                try:
+                    command(pipeline)
+                except exceptions.RpcError as e:
+                    invalid += 1
+                    self.last_error = repr(e)
+            responses = await pipeline.execute(return_exceptions=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.counters['invalid'] += invalid
+            self.counters['failed'] += len(batch) - invalid
+            self.last_error = repr(e)
+            self.report and self.report(e)
+            return 0
+        finally:
+            self.last_flush_ms = round((monotonic() - started) * 1000, 3)
+
+        errors = [response for response in responses if isinstance(response, Exception)]
+        self.counters['invalid'] += invalid
+        self.counters['sent'] += len(responses) - len(errors)
+        self.counters['failed'] += len(errors)
+        if errors:
+            self.last_error = repr(errors[-1])
+        self.report and self.report(next(filter(is_connection_error, errors), None))
+        return len(responses) - len(errors)
+
+    async def close(self):
+        """
+        Lets a pipeline being sent finish, sends commands left and stops.
+        """
+        self._closing = True
+        if self._task is not None:
+            self._ready.set()
+            await asyncio.wait([self._task])
+            self._task = None
+        while self._queue:
+            await self.flush()
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return dict(
+            self.counters,
+            size=len(self._queue),
+            max_queued=self.max_queued,
+            batch_size=self.batch_size,
+            overflow=self.overflow,
+            last_flush_ms=self.last_flush_ms,
+            last_error=self.last_error,
+        )
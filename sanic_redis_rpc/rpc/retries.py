@@ -0,0 +1,104 @@
+import asyncio
+import random
+import typing as t
+
+from sanic_redis_rpc.rpc.deadlines import Deadline
+from sanic_redis_rpc.rpc.health import CONNECTION_ERRORS
+
+# `CustomRedis` methods not changing data
+READ_ONLY_COMMANDS = frozenset([
+    'ping', 'echo', 'time', 'info', 'dbsize', 'lastsave', 'role', 'config_get', 'client_list', 'randomkey',
+    'exists', 'keys', 'scan', 'type', 'ttl', 'pttl', 'dump', 'object_encoding', 'object_idletime',
+    'object_refcount', 'memory_usage', 'debug_object',
+    'get', 'mget', 'getrange', 'getbit', 'bitcount', 'bitpos', 'strlen',
+    'hget', 'hmget', 'hgetall', 'hkeys', 'hvals', 'hlen', 'hexists', 'hstrlen', 'hscan',
+    'llen', 'lindex', 'lrange',
+    'scard', 'smembers', 'sismember', 'srandmember', 'sunion', 'sinter', 'sdiff', 'sscan',
+    'zcard', 'zcount', 'zlexcount', 'zrange', 'zrevrange', 'zrangebyscore', 'zrevrangebyscore', 'zrangebylex',
+    'zrevrangebylex', 'zrank', 'zrevrank', 'zscore', 'zscan',
+    'pfcount', 'geohash', 'geopos', 'geodist', 'xlen', 'xrange', 'xrevrange', 'xinfo_stream', 'xinfo_groups',
+])
+# writes leaving the same data and replying the same when repeated
+IDEMPOTENT_COMMANDS = READ_ONLY_COMMANDS | frozenset([
+    'set', 'setex', 'psetex', 'mset', 'hmset', 'hmset_dict', 'expire', 'pexpire', 'expireat', 'pexpireat',
+])
+
+
+def is_idempotent(method_name: str, params: t.Union[list, dict, None] = None) -> bool:
+    """
+    :return: ``True`` if a command of a ``CustomRedis`` method may be sent again
+    """
+    name = method_name.lower()
+    if name == 'set':
+        # `SET ... NX|XX` replies differently once the first call has been done, `exist` is keyword-only
+        return not (isinstance(params, dict) and params.get('exist', None))
+    return name in IDEMPOTENT_COMMANDS
+
+
+class RetryPolicy:
+    """
+    Repeats calls failed with connection-level errors up to ``retries`` times. Delays between attempts are
+    picked at random (full jitter) from ``0`` to ``backoff * 2 ** attempt`` seconds, no more than ``max_backoff``.
+    A call is not repeated if its deadline would expire before the delay ends.
+    """
+
+    def __init__(self, retries: int = 2, backoff: float = 0.05, max_backoff: float = 1):
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.counters = {'retries': 0, 'recovered': 0, 'exhausted': 0}
+        self.last_error: t.Optional[str] = None
+
+    def get_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def run(
+            self, call: t.Callable[[], t.Awaitable],
+            deadline: t.Optional[Deadline] = None,
+            get_error: t.Optional[t.Callable[[t.Any], t.Optional[BaseException]]] = None,
+            on_retry: t.Optional[t.Callable[[BaseException], t.Any]] = None,
+            can_retry: t.Optional[t.Callable[[], bool]] = None) -> t.Any:
+        """
+        :param call: a coroutine function making an attempt
+        :param get_error: returns a connection error of a result of an attempt, e.g. of a command in a pipeline
+        :param on_retry: is called with an error of every attempt being repeated
+        :param can_retry: stops repeating once it returns ``False``
+        :return: a result of the last attempt
+        :raises: an error of the last attempt
+        """
+        attempt = 0
+        while True:
+            try:
+                result, raised = await call(), False
+                error = get_error(result) if get_error else None
+            except CONNECTION_ERRORS as e:
+                result, raised, error = None, True, e
+
+            if error is None:
+                if attempt:
+                    self.counters['recovered'] += 1
+                return result
+
+            self.last_error = repr(error)
+            delay = self.get_delay(attempt)
+            remaining = deadline.remaining if deadline is not None else None
+            if attempt >= self.retries or (remaining is not None and remaining <= delay) or (
+                    can_retry is not None and not can_retry()):
+                if attempt:
+                    self.counters['exhausted'] += 1
+                if raised:
+                    raise error
+                return result
+
+            on_retry and on_retry(error)
+            attempt += 1
+            self.counters['retries'] += 1
+            await asyncio.sleep(delay)
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return dict(
+            self.counters,
+            retries_per_call=self.retries,
+            backoff=self.backoff,
+            last_error=self.last_error,
+        )
@@ -1,10 +1,22 @@
+import asyncio
+import base64
 import typing as t
+from collections import OrderedDict
+from functools import partial
+from time import monotonic
 from ujson import loads as json_loads
 
 import aioredis
 
 from sanic_redis_rpc.rpc import exceptions
+from sanic_redis_rpc.rpc.admission import AdmissionController
+from sanic_redis_rpc.rpc.autoscale import MeteredConnectionsPool, PoolAutoscaler
+from sanic_redis_rpc.rpc.budget import ConnectionBudget
 from sanic_redis_rpc.rpc.custom_redis import CustomRedis
+from sanic_redis_rpc.rpc.health import CircuitBreaker, is_connection_error
+from sanic_redis_rpc.rpc.lanes import LaneScheduler
+from sanic_redis_rpc.rpc.notifications import NotificationQueue
+from sanic_redis_rpc.rpc.retries import RetryPolicy
 
 
 def load_json(body):
@@ -21,6 +33,19 @@ def load_json(body):
         })
 
 
+def decode_bytes(value: t.Any) -> t.Any:
+    """
+    Decodes ``bytes`` as utf8 falling back to base64 for binary data. Other values are returned as is.
+    """
+    if not isinstance(value, bytes):
+        return value
+
+    try:
+        return value.decode('utf8')
+    except UnicodeDecodeError:
+        return base64.standard_b64encode(value).decode()
+
+
 JSON_RPC_VERSION = '2.0'
 
 
@@ -29,15 +54,59 @@ class RedisPoolsShareWrapper:
         'minsize', 'maxsize', 'ssl', 'parser', 'create_connection_timeout', 'db', 'password'
     ]
 
-    SAFE_STATUS_KEYS = ['id', 'db', 'env_variable', 'name', 'display_name', 'poolsize', 'address']
+    SAFE_STATUS_KEYS = ['id', 'db', 'env_variable', 'name', 'display_name', 'poolsize', 'address', 'lazy']
+    POOL_STATUS_KEYS = ['encoding', 'freesize', 'maxsize', 'minsize', 'closed', 'size', 'in_use', 'waiting']
 
     def __init__(self, redis_connections_options: t.Dict[str, t.Dict[str, t.Any]], loop=None):
         self._redis_connections_options = redis_connections_options
         self._pool_map: t.Dict[str, aioredis.ConnectionsPool] = {}
         self._redis_map: t.Dict[str, aioredis.Redis] = {}
+        self._scan_semaphores: t.Dict[str, asyncio.Semaphore] = {}
         self._loop = loop
 
+        # pools being created, concurrent callers share a single attempt
+        self._pool_futures: t.Dict[str, asyncio.Future] = {}
+        self._init_seconds: t.Dict[str, float] = {}
+        self._init_errors: t.Dict[str, str] = {}
+        self._circuit_breakers: t.Dict[str, CircuitBreaker] = {}
+        self._health_tasks: t.Dict[str, asyncio.Task] = {}
+        self._health_checks_started = False
+        self._drain_tasks: t.Set[asyncio.Task] = set()
+        self._config_lock: t.Optional[asyncio.Lock] = None
+        self._autoscalers: t.Dict[str, PoolAutoscaler] = {}
+        self._budgets: t.Dict[str, ConnectionBudget] = {}
+        self._lane_schedulers: t.Dict[str, LaneScheduler] = {}
+        self._admission_controllers: t.Dict[str, AdmissionController] = {}
+        self._retry_policies: t.Dict[str, RetryPolicy] = {}
+        self._notification_queues: t.Dict[str, NotificationQueue] = {}
+
+    @property
+    def pool_names(self) -> t.List[str]:
+        return list(self._redis_connections_options.keys())
+
     async def get_redis(self, pool_name: str) -> aioredis.Redis:
+        """
+        :raises PoolUnavailableError: if the circuit of the pool is open, a trial call of a half-open circuit
+            is left to RPC calls (see ``get_rpc_redis``)
+        """
+        if not self.is_available(pool_name):
+            circuit_breaker = self.get_circuit_breaker(pool_name)
+            raise exceptions.PoolUnavailableError(pool_name, circuit_breaker.state, circuit_breaker.retry_after)
+        # failures to create a pool are recorded by `_init_pool`
+        return await self._get_redis(pool_name)
+
+    async def get_rpc_redis(self, pool_name: str) -> aioredis.Redis:
+        """
+        Lets an RPC call through the circuit of a pool, the caller must ``report`` its outcome.
+
+        :raises PoolUnavailableError: if the circuit of the pool rejects calls
+        """
+        circuit_breaker = self.get_circuit_breaker(pool_name)
+        if not circuit_breaker.allow():
+            raise exceptions.PoolUnavailableError(pool_name, circuit_breaker.state, circuit_breaker.retry_after)
+        return await self._get_redis(pool_name)
+
+    async def _get_redis(self, pool_name: str) -> aioredis.Redis:
         redis: aioredis.Redis = self._redis_map.get(pool_name, None)
         if redis is not None:
             return redis
@@ -45,50 +114,445 @@ class RedisPoolsShareWrapper:
         self._redis_map[pool_name] = CustomRedis(pool)
         return self._redis_map[pool_name]
 
+    def get_circuit_breaker(self, pool_name: str) -> CircuitBreaker:
+        circuit_breaker = self._circuit_breakers.get(pool_name, None)
+        if circuit_breaker is None:
+            options = self._redis_connections_options[pool_name]
+            circuit_breaker = self._circuit_breakers[pool_name] = CircuitBreaker(
+                failure_threshold=options.get('circuit_failures', 5),
+                open_seconds=options.get('circuit_open_seconds', 5),
+            )
+        return circuit_breaker
+
+    def get_lane_scheduler(self, pool_name: str) -> t.Optional[LaneScheduler]:
+        """
+        :return: a scheduler of blocking (and slow with the ``lane_slow`` DSN flag) commands of a pool,
+            ``None`` unless ``lane_connections`` is set: all commands share the pool then
+        """
+        scheduler = self._lane_schedulers.get(pool_name, None)
+        if scheduler is None:
+            options = self._redis_connections_options[pool_name]
+            size = options.get('lane_connections', 0)
+            if size <= 0:
+                return None
+            scheduler = self._lane_schedulers[pool_name] = LaneScheduler(
+                pool_name,
+                partial(self._create_pool, pool_name, minsize=0, maxsize=size),
+                size=size,
+                max_queued=options.get('lane_queue', 100),
+                slow_commands=options.get('lane_slow', False),
+            )
+        return scheduler
+
+    def get_admission_controller(self, pool_name: str) -> AdmissionController:
+        """
+        :return: a controller limiting commands of a pool run at once (``max_in_flight`` DSN option)
+        """
+        controller = self._admission_controllers.get(pool_name, None)
+        if controller is None:
+            options = self._redis_connections_options[pool_name]
+            controller = self._admission_controllers[pool_name] = AdmissionController(
+                pool_name,
+                max_in_flight=options.get('max_in_flight', 1000),
+                max_queued=options.get('admission_queue', 10000),
+            )
+        return controller
+
+    def get_retry_policy(self, pool_name: str) -> RetryPolicy:
+        """
+        :return: a policy repeating idempotent calls of a pool (``retries`` and ``retry_backoff`` DSN options)
+        """
+        policy = self._retry_policies.get(pool_name, None)
+        if policy is None:
+            options = self._redis_connections_options[pool_name]
+            policy = self._retry_policies[pool_name] = RetryPolicy(
+                retries=options.get('retries', 2),
+                backoff=options.get('retry_backoff', 0.05),
+            )
+        return policy
+
+    def get_notification_queue(self, pool_name: str) -> NotificationQueue:
+        """
+        :return: a write-behind queue of notifications of a pool
+            (``notify_queue``, ``notify_batch`` and ``notify_overflow`` DSN options)
+        """
+        queue = self._notification_queues.get(pool_name, None)
+        if queue is None:
+            options = self._redis_connections_options[pool_name]
+            queue = self._notification_queues[pool_name] = NotificationQueue(
+                pool_name,
+                partial(self._get_redis, pool_name),
+                max_queued=options.get('notify_queue', 10000),
+                batch_size=options.get('notify_batch', 500),
+                overflow=options.get('notify_overflow', 'drop_new'),
+                is_available=partial(self.is_available, pool_name),
+                report=partial(self.report, pool_name),
+            )
+        return queue
+
+    def is_available(self, pool_name: str) -> bool:
+        """
+        :return: ``False`` while the circuit of a pool is open, unlike ``allow()`` it does not take a trial call
+        """
+        circuit_breaker = self.get_circuit_breaker(pool_name)
+        return circuit_breaker.state != CircuitBreaker.STATE_OPEN or not circuit_breaker.retry_after
+
+    def report(self, pool_name: str, error: t.Optional[BaseException] = None):
+        """
+        Feeds an outcome of a call to the circuit breaker of a pool, only connection-level errors are failures.
+        """
+        self.get_circuit_breaker(pool_name).record(not is_connection_error(error), error)
+
+    def start_health_checks(self):
+        """
+        Pings every pool each ``health_check_interval`` seconds (``0`` disables checks of a pool).
+        """
+        self._health_checks_started = True
+        for pool_name in self._redis_connections_options:
+            self._start_health_check(pool_name)
+
+    def _start_health_check(self, pool_name: str):
+        if self._redis_connections_options[pool_name].get('health_check_interval', 5) > 0:
+            self._health_tasks[pool_name] = asyncio.ensure_future(self._check_health(pool_name))
+
+    async def _check_health(self, pool_name: str):
+        options = self._redis_connections_options[pool_name]
+        while True:
+            await asyncio.sleep(options.get('health_check_interval', 5))
+            # lazy pools are not connected to until they are used
+            if pool_name not in self._pool_map and options.get('lazy', False):
+                continue
+            await self.ping(pool_name)
+
+    async def ping(self, pool_name: str) -> bool:
+        """
+        :return: ``True`` if the pool answered a ``PING`` within ``health_check_timeout``,
+            nothing is sent while its circuit rejects calls
+        """
+        circuit_breaker = self.get_circuit_breaker(pool_name)
+        if not circuit_breaker.allow():
+            return False
+
+        timeout = self._redis_connections_options[pool_name].get('health_check_timeout', 1)
+        try:
+            redis = await self._get_redis(pool_name)
+        except Exception:
+            return False  # recorded by `_init_pool`
+
+        try:
+            await asyncio.wait_for(redis.ping(), timeout)
+        except Exception as e:
+            circuit_breaker.record(False, e)
+            return False
+        circuit_breaker.record(True)
+        return True
+
     async def get_service_redis(self) -> aioredis.Redis:
         pool_name = self._get_service_pool_name()
         return await self.get_redis(pool_name)
 
+    def get_scan_semaphore(self, pool_name: str) -> asyncio.Semaphore:
+        """
+        Limits the number of concurrent keyspace scans issued against a pool (``max_scans`` DSN option).
+        """
+        semaphore = self._scan_semaphores.get(pool_name, None)
+        if semaphore is None:
+            max_scans = self._redis_connections_options[pool_name].get('max_scans', 2)
+            semaphore = self._scan_semaphores[pool_name] = asyncio.Semaphore(max(1, max_scans))
+        return semaphore
+
+    async def create_redis(self, pool_name: str) -> aioredis.Redis:
+        """
+        Creates a dedicated connection outside of the pool (e.g. for pub/sub), the caller must close it.
+        """
+        options = self._redis_connections_options[pool_name]
+        return await aioredis.create_redis(
+            options['address'],
+            db=options['db'],
+            password=options.get('password', None),
+            ssl=options.get('ssl', None),
+            timeout=options.get('create_connection_timeout', None),
+            loop=self._loop
+        )
+
     async def get_status(self) -> t.List[t.Dict[str, t.Any]]:
+        """
+        Lazy pools and pools failed to initialize are not connected to, they are reported with ``initialized: false``.
+        """
         res = []
         for pool_name, opts in self._redis_connections_options.items():
-            pool = await self._get_pool(pool_name)
+            pool = self._pool_map.get(pool_name, None)
             bundle = {k: v for k, v in opts.items() if k in self.SAFE_STATUS_KEYS}
+            bundle.update({attr: getattr(pool, attr, None) for attr in self.POOL_STATUS_KEYS})
             bundle.update({
-                attr: getattr(pool, attr)
-                for attr in ['encoding', 'freesize', 'maxsize', 'minsize', 'closed', 'size']
+                'initialized': pool is not None,
+                'init_seconds': self._init_seconds.get(pool_name, None),
+                'init_error': self._init_errors.get(pool_name, None),
+                'circuit': self.get_circuit_breaker(pool_name).as_dict(),
+                'autoscaler': self._autoscalers[pool_name].as_dict() if pool_name in self._autoscalers else None,
+                'budget': self._budgets[pool_name].as_dict() if pool_name in self._budgets else None,
+                'lanes': self._lane_schedulers[pool_name].as_dict() if pool_name in self._lane_schedulers else None,
+                'admission': (
+                    self._admission_controllers[pool_name].as_dict()
+                    if pool_name in self._admission_controllers else None
+                ),
+                'retries': self._retry_policies[pool_name].as_dict() if pool_name in self._retry_policies else None,
+                'notifications': (
+                    self._notification_queues[pool_name].as_dict()
+                    if pool_name in self._notification_queues else None
+                ),
             })
             res.append(bundle)
         return res
 
     async def close(self):
+        for task in self._health_tasks.values():
+            task.cancel()
+        if self._health_tasks:
+            await asyncio.wait(self._health_tasks.values())
+        self._health_tasks = {}
+        if self._drain_tasks:
+            await asyncio.wait(self._drain_tasks)
+
+        for autoscaler in self._autoscalers.values():
+            await autoscaler.stop()
+        for budget in self._budgets.values():
+            await budget.stop()
+        for scheduler in self._lane_schedulers.values():
+            await scheduler.close()
+        for queue in self._notification_queues.values():
+            await queue.close()
+
         for pool in self._pool_map.values():
             pool.close()
             await pool.wait_closed()
 
-    async def _initialize_pools(self):
-        for pool_name in self._redis_connections_options.keys():
-            await self._get_pool(pool_name)
+    async def apply_config(self, redis_connections_options: t.Dict[str, t.Dict[str, t.Any]]) -> t.Dict[str, t.Any]:
+        """
+        Adds, removes and reconfigures pools to match ``redis_connections_options`` without a restart.
+        New requests get new pools right away while removed and replaced pools are drained in background:
+        requests already holding them are served until the pool is idle or ``drain_timeout`` is over.
+        Changes are applied one at a time, applying the same options twice changes nothing.
+
+        :raises PoolConfigError: if the service pool is removed or another pool becomes the service one
+        :return: names of ``added``, ``removed`` and ``reconfigured`` pools and ``init`` results of new pools
+        """
+        if self._config_lock is None:
+            self._config_lock = asyncio.Lock()
+
+        async with self._config_lock:
+            current = self._redis_connections_options
+            service_pool_name = self._get_service_pool_name()
+            if service_pool_name not in redis_connections_options:
+                raise exceptions.PoolConfigError(service_pool_name, 'the service pool can not be removed')
+            if self._get_service_pool_name(redis_connections_options) != service_pool_name:
+                raise exceptions.PoolConfigError(service_pool_name, 'the service pool can not be changed')
+
+            changes = {
+                'added': [name for name in redis_connections_options if name not in current],
+                'removed': [name for name in current if name not in redis_connections_options],
+                'reconfigured': [
+                    name for name, options in redis_connections_options.items()
+                    if name in current and self._get_pool_settings(current[name]) != self._get_pool_settings(options)
+                ],
+            }
+            for pool_name in changes['removed'] + changes['reconfigured']:
+                await self._detach_pool(pool_name)
+
+            updated = OrderedDict()
+            for pool_name, options in redis_connections_options.items():
+                if pool_name in current and pool_name not in changes['reconfigured']:
+                    # options of an unchanged pool are updated in place, pools being created keep them
+                    updated[pool_name] = current[pool_name]
+                    updated[pool_name].update(options)
+                else:
+                    updated[pool_name] = dict(options)
+            # the same object is shared with the app config
+            current.clear()
+            current.update(updated)
+
+            pool_names = [
+                pool_name for pool_name in changes['added'] + changes['reconfigured']
+                if not current[pool_name].get('lazy', False)
+            ]
+            results = await asyncio.gather(*map(self._get_pool, pool_names), return_exceptions=True)
+            changes['init'] = {
+                pool_name: {'init_error': repr(result)} if isinstance(result, Exception) else
+                {'init_seconds': self._init_seconds[pool_name]}
+                for pool_name, result in zip(pool_names, results)
+            }
+            if self._health_checks_started:
+                for pool_name in changes['added'] + changes['reconfigured']:
+                    self._start_health_check(pool_name)
+            return changes
+
+    @staticmethod
+    def _get_pool_settings(options: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        """
+        :return: options a pool depends on, the position of a pool in the config is not one of them
+        """
+        return {k: v for k, v in options.items() if k not in ['id', 'env_variable']}
+
+    async def _detach_pool(self, pool_name: str):
+        """
+        Forgets a pool and everything created for it, the pool itself is drained in background.
+        """
+        task = self._health_tasks.pop(pool_name, None)
+        if task is not None:
+            task.cancel()
+        autoscaler = self._autoscalers.pop(pool_name, None)
+        if autoscaler is not None:
+            await autoscaler.stop()
+        budget = self._budgets.pop(pool_name, None)
+        if budget is not None:
+            await budget.stop()
+
+        self._admission_controllers.pop(pool_name, None)
+        self._retry_policies.pop(pool_name, None)
+        queue = self._notification_queues.pop(pool_name, None)
+        if queue is not None:
+            # the pool is drained after notifications left are sent
+            await queue.close()
+        scheduler = self._lane_schedulers.pop(pool_name, None)
+        if scheduler is not None and scheduler.pool is not None:
+            self._start_drain(scheduler.pool, self._redis_connections_options[pool_name].get('drain_timeout', 30))
+
+        for state in [self._redis_map, self._scan_semaphores, self._circuit_breakers,
+                      self._init_seconds, self._init_errors, self._pool_futures]:
+            state.pop(pool_name, None)
+
+        pool = self._pool_map.pop(pool_name, None)
+        if pool is not None:
+            self._start_drain(pool, self._redis_connections_options[pool_name].get('drain_timeout', 30))
+
+    def _start_drain(self, pool: aioredis.ConnectionsPool, timeout: float):
+        task = asyncio.ensure_future(self._drain(pool, timeout))
+        self._drain_tasks.add(task)
+        task.add_done_callback(self._drain_tasks.discard)
+
+    @staticmethod
+    async def _drain(pool: aioredis.ConnectionsPool, timeout: float, poll_interval: float = 0.05):
+        """
+        Closes a pool once no connection is used and no command is waiting for a reply, or after ``timeout``.
+        """
+        deadline = monotonic() + timeout
+        # noinspection PyProtectedMember
+        while monotonic() < deadline and (
+                pool._used or pool._acquiring or any(conn._waiters for conn in pool._pool)):
+            await asyncio.sleep(poll_interval)
+        pool.close()
+        await pool.wait_closed()
+
+    async def _initialize_pools(self) -> t.Dict[str, t.Any]:
+        """
+        Creates all pools except ``lazy`` ones concurrently, every pool is filled up to ``minsize`` connections
+        (authenticated and with ``db`` selected) within its ``init_timeout``. A pool failed to initialize
+        is created again on its first use, only a failure of the service pool is raised.
+
+        :return: ``{'init_seconds': ...}`` or ``{'init_error': ...}`` by pool name
+        """
+        pool_names = [
+            pool_name for pool_name, options in self._redis_connections_options.items()
+            if not options.get('lazy', False)
+        ]
+        results = await asyncio.gather(*map(self._get_pool, pool_names), return_exceptions=True)
+
+        service_pool_name = self._get_service_pool_name()
+        for pool_name, result in zip(pool_names, results):
+            if isinstance(result, Exception) and pool_name == service_pool_name:
+                raise result
+
+        return {
+            pool_name: {'init_error': self._init_errors[pool_name]} if isinstance(result, Exception) else
+            {'init_seconds': self._init_seconds[pool_name]}
+            for pool_name, result in zip(pool_names, results)
+        }
 
     async def _get_pool(self, name: str) -> aioredis.ConnectionsPool:
         pool = self._pool_map.get(name, None)
-        if pool is None:
-            self._pool_map[name] = await self._create_pool(name)
-        return self._pool_map[name]
+        if pool is not None:
+            return pool
+
+        future = self._pool_futures.get(name, None)
+        if future is None:
+            future = self._pool_futures[name] = asyncio.ensure_future(self._init_pool(name))
+            # a failed attempt is forgotten, so the next caller tries again
+            future.add_done_callback(lambda f: self._pool_futures.get(name, None) is f and self._pool_futures.pop(name))
+        # a cancelled caller must not cancel the attempt shared with others
+        return await asyncio.shield(future)
 
-    async def _create_pool(self, pool_name: str) -> aioredis.ConnectionsPool:
+    async def _init_pool(self, name: str) -> aioredis.ConnectionsPool:
+        started = monotonic()
+        options = self._redis_connections_options[name]
+        timeout = options.get('init_timeout', None)
+        try:
+            pool = await asyncio.wait_for(self._create_pool(name), timeout)
+        except Exception as e:
+            if self._redis_connections_options.get(name, None) is options:
+                self._init_errors[name] = repr(e)
+                self.get_circuit_breaker(name).record(False, e)
+            raise
+
+        if self._redis_connections_options.get(name, None) is not options:
+            # the pool has been removed or reconfigured meanwhile, the caller is served and the pool is dropped
+            self._start_drain(pool, options.get('drain_timeout', 30))
+            return pool
+
+        self._init_errors.pop(name, None)
+        self._init_seconds[name] = round(monotonic() - started, 3)
+        self._pool_map[name] = pool
+        self._start_autoscaler(name, pool)
+        self._start_budget(name, pool)
+        return pool
+
+    def _start_autoscaler(self, name: str, pool: MeteredConnectionsPool):
+        """
+        An ``autoscale`` pool starts with ``minsize`` connections at most and grows up to ``maxsize``.
+        """
+        options = self._redis_connections_options[name]
+        if not options.get('autoscale', False):
+            return
+        self._autoscalers[name] = PoolAutoscaler(
+            pool,
+            min_size=options.get('minsize', 1),
+            max_size=options.get('maxsize', 10),
+            interval=options.get('autoscale_interval', 1),
+        ).start()
+
+    def _start_budget(self, name: str, pool: MeteredConnectionsPool):
+        """
+        A pool with a ``budget`` shares it with the same pool of other workers.
+        """
+        options = self._redis_connections_options[name]
+        if options.get('budget', 0) <= 0:
+            return
+        self._budgets[name] = ConnectionBudget(
+            pool,
+            # leases are not calls made by clients, so they bypass the circuit breaker
+            lambda: self._get_redis(self._get_service_pool_name()),
+            name,
+            options['budget'],
+            interval=options.get('budget_interval', 1),
+        ).start()
+
+    async def _create_pool(self, pool_name: str, **overrides) -> aioredis.ConnectionsPool:
         pool_options = self._redis_connections_options[pool_name].copy()
         address = pool_options.pop('address')
         opts = {k: v for k, v in pool_options.items() if k in self.ALLOWED_POOL_ARGS}
+        if pool_options.get('autoscale', False):
+            opts['maxsize'] = max(opts.get('minsize', 1), 1)
+        opts.update(overrides)
         return await aioredis.create_pool(
             address,
             **opts,
+            pool_cls=MeteredConnectionsPool,
             loop=self._loop
         )
 
-    def _get_service_pool_name(self):
-        for pool_name, opts in self._redis_connections_options.items():
+    def _get_service_pool_name(self, redis_connections_options: t.Optional[t.Dict[str, t.Dict[str, t.Any]]] = None):
+        redis_connections_options = redis_connections_options or self._redis_connections_options
+        for pool_name, opts in redis_connections_options.items():
             if opts['service']:
                 return pool_name
 
-        return list(self._redis_connections_options.keys())[0]
+        return list(redis_connections_options.keys())[0]
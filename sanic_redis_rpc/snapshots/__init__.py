@@ -0,0 +1,5 @@
+from .exceptions import *
+from .index import SnapshotIndex, SnapshotIndexBuilder, SnapshotRegistry
+from .job import SnapshotIndexJob
+from .rdb import RdbParser
+from .request_adapter import SnapshotRequestAdapter
@@ -0,0 +1,16 @@
+from sanic.exceptions import NotFound
+
+
+class RdbParseError(Exception):
+    pass
+
+
+class SnapshotBuildCancelledError(Exception):
+    pass
+
+
+class SnapshotNotFoundError(NotFound):
+    MESSAGE = 'Snapshot with name `{name}` does not exist'
+
+    def __init__(self, name: str):
+        super().__init__(self.MESSAGE.format(name=name))
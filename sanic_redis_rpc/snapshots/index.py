@@ -0,0 +1,327 @@
+import heapq
+import mmap
+import os
+import struct
+import typing as t
+from bisect import bisect_right
+from datetime import datetime
+from os.path import commonprefix
+from threading import Lock
+
+from ujson import dumps as json_dumps, loads as json_loads
+
+from sanic_redis_rpc.jobs.bigkeys import TopN
+from sanic_redis_rpc.jobs.namespaces import NamespaceTree
+from sanic_redis_rpc.key_manager.patterns import KeyPattern
+from sanic_redis_rpc.rpc.utils import decode_bytes
+from sanic_redis_rpc.snapshots.exceptions import SnapshotBuildCancelledError, SnapshotNotFoundError
+from sanic_redis_rpc.snapshots.rdb import RdbParser
+
+SNAPSHOT_FILE_MAGIC = b'SRRSNAP1'
+SNAPSHOT_FILE_EXTENSION = '.snapshot'
+
+TYPES = ('string', 'list', 'set', 'zset', 'hash', 'stream', 'module')
+
+# key length, type, absolute expiration time in milliseconds (0 means no expire), serialized size, elements
+RECORD_HEADER = struct.Struct('>IBqQq')
+# sparse index entry: key length, record offset
+SPARSE_HEADER = struct.Struct('>IQ')
+# end of records, offset of the sparse index, number of records, magic
+TRAILER = struct.Struct('>QQQ8s')
+
+
+class SnapshotRecord(t.NamedTuple):
+    key: bytes
+    type: str
+    expire_at: int
+    size: int
+    elements: int
+
+    def as_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            'key': decode_bytes(self.key),
+            'type': self.type,
+            'expire_at': self.expire_at or None,
+            'size': self.size,
+            'elements': self.elements,
+        }
+
+
+def _pack_record(record: SnapshotRecord) -> bytes:
+    return RECORD_HEADER.pack(
+        len(record.key), TYPES.index(record.type), record.expire_at, record.size, record.elements
+    ) + record.key
+
+
+def _iter_records(buffer: t.Any, start: int, end: int) -> t.Iterator[t.Tuple[int, SnapshotRecord]]:
+    """
+    :return: an iterator over ``(offset, record)`` pairs of records packed between ``start`` and ``end``
+    """
+    position = start
+    while position < end:
+        key_length, type_index, expire_at, size, elements = RECORD_HEADER.unpack_from(buffer, position)
+        key_start = position + RECORD_HEADER.size
+        yield position, SnapshotRecord(
+            bytes(buffer[key_start:key_start + key_length]), TYPES[type_index], expire_at, size, elements
+        )
+        position = key_start + key_length
+
+
+def _iter_run(path: str) -> t.Iterator[SnapshotRecord]:
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for __, record in _iter_records(mm, 0, len(mm)):
+                yield record
+
+
+class SnapshotIndexBuilder:
+    """
+    Builds a key index of an RDB file: records sorted by key with their types, serialized sizes and expiration times.
+
+    Keys are sorted externally: runs of ``run_size`` records are sorted in memory and spilled to temporary files,
+    which are merged into the index. Every ``sparse_every``-th record offset is stored in a sparse index
+    at the end of the file, so a reader only keeps those keys in memory.
+
+    ``build`` is blocking and meant to be run in an executor: ``processed`` and ``phase`` may be polled
+    from another thread, and setting ``cancelled`` stops the build.
+    """
+
+    def __init__(self, rdb_path: str, path: str, db: int = 0, run_size: int = 100000, sparse_every: int = 128):
+        self.rdb_path = rdb_path
+        self.path = path
+        self.db = db
+        self.run_size = max(1, run_size)
+        self.sparse_every = max(1, sparse_every)
+
+        self.phase = 'parse'
+        self.processed = 0
+        self.cancelled = False
+
+    def _check_cancelled(self):
+        if self.cancelled:
+            raise SnapshotBuildCancelledError(self.path)
+
+    def build(self) -> t.Dict[str, t.Any]:
+        """
+        :return: a snapshot info bundle
+        """
+        info = {
+            'source': os.path.basename(self.rdb_path),
+            'source_size': os.path.getsize(self.rdb_path),
+            'db': self.db,
+            'timestamp': datetime.now().isoformat(),
+            'keys': 0,
+            'volatile': 0,
+            'types': {},
+        }
+        runs = []
+        try:
+            batch = []
+            for entry in RdbParser(self.rdb_path, db=self.db).iter_entries():
+                batch.append(SnapshotRecord(entry.key, entry.type, entry.expire_at, entry.size, entry.elements))
+                totals = info['types'].setdefault(entry.type, {'count': 0, 'size': 0})
+                totals['count'] += 1
+                totals['size'] += entry.size
+                info['volatile'] += 1 if entry.expire_at else 0
+
+                self.processed += 1
+                if len(batch) >= self.run_size:
+                    self._check_cancelled()
+                    runs.append(self._write_run(batch, len(runs)))
+                    batch = []
+            runs.append(self._write_run(batch, len(runs)))
+
+            self.phase = 'merge'
+            info['keys'] = self._merge(runs, info)
+        finally:
+            for run in runs:
+                os.remove(run)
+        return info
+
+    def _write_run(self, batch: t.List[SnapshotRecord], number: int) -> str:
+        batch.sort()
+        path = f'{self.path}.run{number}'
+        with open(path, 'wb') as f:
+            f.write(b''.join(map(_pack_record, batch)))
+        return path
+
+    def _merge(self, runs: t.List[str], info: t.Dict[str, t.Any]) -> int:
+        sparse, count = [], 0
+        part_path = self.path + '.part'
+        try:
+            with open(part_path, 'wb') as f:
+                f.write(SNAPSHOT_FILE_MAGIC)
+                offset = len(SNAPSHOT_FILE_MAGIC)
+                for record in heapq.merge(*map(_iter_run, runs)):
+                    if count % self.sparse_every == 0:
+                        self._check_cancelled()
+                        sparse.append(SPARSE_HEADER.pack(len(record.key), offset) + record.key)
+                    packed = _pack_record(record)
+                    f.write(packed)
+                    offset += len(packed)
+                    count += 1
+
+                records_end = offset
+                f.write(json_dumps(dict(info, keys=count)).encode())
+                sparse_offset = f.tell()
+                f.write(b''.join(sparse))
+                f.write(TRAILER.pack(records_end, sparse_offset, count, SNAPSHOT_FILE_MAGIC))
+        except BaseException:
+            os.remove(part_path)
+            raise
+
+        os.replace(part_path, self.path)
+        return count
+
+
+class SnapshotIndex:
+    """
+    A read-only view of an index built with ``SnapshotIndexBuilder``. The file is memory-mapped,
+    lookups bisect the in-memory sparse index and scan at most ``sparse_every`` records.
+    Methods are blocking, so long scans (namespaces, biggest keys) should be run in an executor.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._bigkeys: t.Dict[int, t.Dict[str, t.Any]] = {}
+
+        if len(self._mm) < len(SNAPSHOT_FILE_MAGIC) + TRAILER.size or self._mm[:len(SNAPSHOT_FILE_MAGIC)] != \
+                SNAPSHOT_FILE_MAGIC:
+            self.close()
+            raise ValueError(f'Not a snapshot file: {path}')
+
+        self.records_end, sparse_offset, self.count, magic = TRAILER.unpack_from(self._mm, len(self._mm) - TRAILER.size)
+        if magic != SNAPSHOT_FILE_MAGIC:
+            self.close()
+            raise ValueError(f'Snapshot file is truncated: {path}')
+
+        self.info = json_loads(self._mm[self.records_end:sparse_offset].decode())
+        self._sparse_keys, self._sparse_offsets = [], []
+        position, end = sparse_offset, len(self._mm) - TRAILER.size
+        while position < end:
+            key_length, offset = SPARSE_HEADER.unpack_from(self._mm, position)
+            position += SPARSE_HEADER.size
+            self._sparse_keys.append(bytes(self._mm[position:position + key_length]))
+            self._sparse_offsets.append(offset)
+            position += key_length
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def iter_records(self, start: bytes = b'') -> t.Iterator[SnapshotRecord]:
+        """
+        :return: an iterator over records with keys greater than or equal to ``start``
+        """
+        i = bisect_right(self._sparse_keys, start) - 1
+        offset = self._sparse_offsets[i] if i >= 0 else len(SNAPSHOT_FILE_MAGIC)
+        for __, record in _iter_records(self._mm, offset, self.records_end):
+            if record.key >= start:
+                yield record
+
+    def iter_prefix(self, prefix: bytes) -> t.Iterator[SnapshotRecord]:
+        for record in self.iter_records(prefix):
+            if not record.key.startswith(prefix):
+                return
+            yield record
+
+    def search(self, key_patterns: t.List[KeyPattern]) -> t.List[SnapshotRecord]:
+        """
+        :return: sorted records of keys matching any of ``key_patterns``,
+            only the range of their common literal prefix is scanned
+        """
+        prefix = commonprefix([key_pattern.prefix for key_pattern in key_patterns]).encode('utf8')
+        return [
+            record for record in self.iter_prefix(prefix)
+            if any(key_pattern.match(record.key) for key_pattern in key_patterns)
+        ]
+
+    def get(self, key: bytes) -> t.Optional[SnapshotRecord]:
+        for record in self.iter_records(key):
+            return record if record.key == key else None
+        return None
+
+    def get_namespace_node(
+            self, path: str = '', delimiters: str = ':', max_depth: int = 8, max_nodes: int = 10000,
+            limit: int = 100) -> t.Dict[str, t.Any]:
+        """
+        Builds a ``NamespaceTree`` of keys under ``path``, every key contributes its type and serialized size.
+
+        :return: a node bundle with its ``limit`` largest children expanded
+        """
+        tree = NamespaceTree(delimiters=delimiters, max_depth=max_depth, max_nodes=max_nodes)
+        for record in self.iter_prefix(path.encode('utf8')):
+            tree.add(record.key.decode('utf8', errors='backslashreplace'), record.type, record.size)
+        return tree.get_node(path, limit)
+
+    def get_bigkeys(self, top: int = 20) -> t.Dict[str, t.Any]:
+        """
+        :return: ``top`` biggest keys overall and per type by serialized size, and totals per type
+        """
+        if top not in self._bigkeys:
+            top_n, top_by_type = TopN(top), {}
+            for record in self.iter_records():
+                top_n.push(record.size, record.key, record.type)
+                if record.type not in top_by_type:
+                    top_by_type[record.type] = TopN(top)
+                top_by_type[record.type].push(record.size, record.key, record.type)
+
+            self._bigkeys[top] = {
+                'top': top_n.as_list(),
+                'top_by_type': {key_type: items.as_list() for key_type, items in top_by_type.items()},
+                'totals': {
+                    key_type: {'count': totals['count'], 'memory': totals['size']}
+                    for key_type, totals in self.info['types'].items()
+                },
+            }
+        return self._bigkeys[top]
+
+
+class SnapshotRegistry:
+    """
+    Snapshots are index files named ``<name>.snapshot`` in a directory, so every worker sees the same set.
+    Opened indexes are cached until their files change.
+    """
+
+    def __init__(self):
+        self._opened: t.Dict[str, t.Tuple[float, SnapshotIndex]] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def get_path(directory: str, name: str) -> str:
+        return os.path.join(directory, name + SNAPSHOT_FILE_EXTENSION)
+
+    def list(self, directory: str) -> t.List[str]:
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            file_name[:-len(SNAPSHOT_FILE_EXTENSION)] for file_name in os.listdir(directory)
+            if file_name.endswith(SNAPSHOT_FILE_EXTENSION) and not file_name.startswith('.')
+        )
+
+    def exists(self, directory: str, name: str) -> bool:
+        return bool(name) and name == os.path.basename(name) and os.path.isfile(self.get_path(directory, name))
+
+    def get(self, directory: str, name: str) -> SnapshotIndex:
+        if not self.exists(directory, name):
+            raise SnapshotNotFoundError(name)
+
+        path = self.get_path(directory, name)
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            opened_mtime, index = self._opened.get(path, (None, None))
+            if index is None or opened_mtime != mtime:
+                # a replaced index may still be read in an executor, it's unmapped once garbage collected
+                index = SnapshotIndex(path)
+                self._opened[path] = mtime, index
+            return index
+
+    def close(self):
+        with self._lock:
+            for __, index in self._opened.values():
+                index.close()
+            self._opened.clear()
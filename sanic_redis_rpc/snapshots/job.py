@@ -0,0 +1,67 @@
+import asyncio
+import os
+import re
+import typing as t
+
+import aioredis
+
+from sanic_redis_rpc.jobs.base import Job
+from sanic_redis_rpc.jobs.exceptions import WrongJobOptionError
+from sanic_redis_rpc.jobs.files import get_dump_file_path
+from sanic_redis_rpc.snapshots.index import SnapshotIndexBuilder, SnapshotRegistry
+
+SNAPSHOT_NAME_RE = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]*$')
+
+
+class SnapshotIndexJob(Job):
+    """
+    Indexes an RDB file from the export directory with ``SnapshotIndexBuilder`` in an executor,
+    so the live redis is never touched. The index is registered as a read-only snapshot named ``name``.
+    """
+    KIND = 'snapshot'
+
+    def __init__(
+            self, service_redis: aioredis.Redis, export_dir: str,
+            options: t.Optional[t.Dict[str, t.Any]] = None,
+            progress_interval: float = 0.5,
+            **kwargs):
+        super().__init__(service_redis, options, **kwargs)
+        self.rdb_path = get_dump_file_path(export_dir, self.options.get('file_name', ''))
+        if not os.path.isfile(self.rdb_path):
+            raise WrongJobOptionError('file_name', f'file {self.options["file_name"]} does not exist')
+
+        if not self.options.get('name'):
+            self.options['name'] = os.path.splitext(self.options['file_name'])[0]
+        self.validate_options(self.options)
+
+        self.path = SnapshotRegistry.get_path(export_dir, self.options['name'])
+        self.progress_interval = progress_interval
+
+    @classmethod
+    def validate_options(cls, options: t.Dict[str, t.Any]):
+        if not SNAPSHOT_NAME_RE.match(options['name']):
+            raise WrongJobOptionError('name', 'only letters, digits, `_`, `-` and `.` are allowed')
+        if not int(options.get('db', 0)) >= 0:
+            raise WrongJobOptionError('db', 'must be a non-negative integer')
+        if 'run_size' in options and not int(options['run_size']) > 0:
+            raise WrongJobOptionError('run_size', 'must be a positive integer')
+
+    async def run(self):
+        builder = SnapshotIndexBuilder(
+            self.rdb_path, self.path,
+            db=int(self.options.get('db', 0)),
+            run_size=int(self.options.get('run_size', 100000)),
+        )
+        future = asyncio.get_event_loop().run_in_executor(None, builder.build)
+        try:
+            while not future.done():
+                await asyncio.wait([future], timeout=self.progress_interval)
+                await self.report_progress(builder.processed, phase=builder.phase, name=self.options['name'])
+        except BaseException:
+            # let the builder remove its temporary files
+            builder.cancelled = True
+            await asyncio.wait([future])
+            raise
+
+        info = future.result()
+        await self.report_progress(info['keys'], info['keys'], phase='done', **info)
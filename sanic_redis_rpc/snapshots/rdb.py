@@ -0,0 +1,332 @@
+import mmap
+import struct
+import typing as t
+
+from sanic_redis_rpc.snapshots.exceptions import RdbParseError
+
+RDB_MAX_VERSION = 11
+
+OPCODE_FUNCTION2 = 0xF5
+OPCODE_FUNCTION = 0xF6
+OPCODE_FREQ = 0xF7
+OPCODE_IDLE = 0xF8
+OPCODE_MODULE_AUX = 0xF9
+OPCODE_AUX = 0xFA
+OPCODE_RESIZEDB = 0xFB
+OPCODE_EXPIRETIME_MS = 0xFC
+OPCODE_EXPIRETIME = 0xFD
+OPCODE_SELECTDB = 0xFE
+OPCODE_EOF = 0xFF
+
+TYPE_NAMES = {
+    0: 'string',
+    1: 'list', 2: 'set', 3: 'zset', 4: 'hash', 5: 'zset',
+    6: 'module', 7: 'module',
+    9: 'hash', 10: 'list', 11: 'set', 12: 'zset', 13: 'hash', 14: 'list',
+    15: 'stream', 16: 'hash', 17: 'zset', 18: 'list', 19: 'stream', 20: 'set', 21: 'stream',
+}
+
+STREAM_LISTPACKS, STREAM_LISTPACKS_2, STREAM_LISTPACKS_3 = 15, 19, 21
+
+
+class RdbEntry(t.NamedTuple):
+    db: int
+    key: bytes
+    type: str
+    expire_at: int  # milliseconds, 0 means no expire
+    size: int  # serialized size of the value
+    elements: int  # bytes for strings, elements for collections (at least, for huge ziplists/listpacks)
+
+
+def lzf_decompress(data: bytes, expected_length: int) -> bytes:
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        ctrl = data[i]
+        i += 1
+        if ctrl < 32:  # literal run
+            out += data[i:i + ctrl + 1]
+            i += ctrl + 1
+            continue
+
+        length = ctrl >> 5
+        if length == 7:
+            length += data[i]
+            i += 1
+        ref = len(out) - ((ctrl & 0x1F) << 8) - data[i] - 1
+        i += 1
+        if ref < 0:
+            raise RdbParseError('Invalid LZF back reference')
+        for __ in range(length + 2):  # references may overlap with the output being written
+            out.append(out[ref])
+            ref += 1
+
+    if len(out) != expected_length:
+        raise RdbParseError('LZF decompressed length mismatch')
+    return bytes(out)
+
+
+class RdbParser:
+    """
+    A streaming parser of RDB files (versions up to 11). The file is memory-mapped, values are skipped over
+    and only their serialized size and number of elements are reported. Module values are not supported.
+    """
+
+    def __init__(self, path: str, db: t.Optional[int] = None):
+        """
+        :param path: a path to an RDB file
+        :param db: report keys of this db only
+        """
+        self.path = path
+        self.db = db
+        self.position = 0
+        self.size = 0
+        self._mm: t.Optional[mmap.mmap] = None
+
+    def iter_entries(self) -> t.Iterator[RdbEntry]:
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            self._mm, self.size, self.position = mm, len(mm), 0
+            try:
+                yield from self._iter_entries()
+            except (IndexError, struct.error):
+                raise RdbParseError(f'Unexpected end of file at {self.position}')
+            finally:
+                self._mm = None
+
+    def _iter_entries(self) -> t.Iterator[RdbEntry]:
+        magic = self._read(9)
+        if magic[:5] != b'REDIS' or not magic[5:].isdigit():
+            raise RdbParseError('Not an RDB file')
+        version = int(magic[5:])
+        if version > RDB_MAX_VERSION:
+            raise RdbParseError(f'RDB version {version} is not supported')
+
+        db, expire_at = 0, 0
+        while True:
+            opcode = self._read_byte()
+            if opcode == OPCODE_EOF:
+                return
+            elif opcode == OPCODE_SELECTDB:
+                db = self._read_length()
+            elif opcode == OPCODE_EXPIRETIME:
+                expire_at = struct.unpack('<I', self._read(4))[0] * 1000
+            elif opcode == OPCODE_EXPIRETIME_MS:
+                expire_at = struct.unpack('<Q', self._read(8))[0]
+            elif opcode == OPCODE_RESIZEDB:
+                self._read_length()
+                self._read_length()
+            elif opcode == OPCODE_AUX:
+                self._skip_string()
+                self._skip_string()
+            elif opcode == OPCODE_IDLE:
+                self._read_length()
+            elif opcode == OPCODE_FREQ:
+                self._read(1)
+            elif opcode == OPCODE_FUNCTION2:
+                self._skip_string()
+            elif opcode in (OPCODE_FUNCTION, OPCODE_MODULE_AUX):
+                raise RdbParseError(f'Opcode {opcode} is not supported')
+            elif opcode in TYPE_NAMES:
+                key = self._read_string()
+                start = self.position
+                elements = getattr(self, f'_skip_type_{opcode}')()
+                if self.db is None or self.db == db:
+                    yield RdbEntry(db, key, TYPE_NAMES[opcode], expire_at, self.position - start, elements)
+                expire_at = 0
+            else:
+                raise RdbParseError(f'Unknown opcode {opcode} at {self.position - 1}')
+
+    def _read(self, n: int) -> bytes:
+        if self.position + n > self.size:
+            raise RdbParseError(f'Unexpected end of file at {self.position}')
+        data = self._mm[self.position:self.position + n]
+        self.position += n
+        return data
+
+    def _read_byte(self) -> int:
+        byte = self._mm[self.position]
+        self.position += 1
+        return byte
+
+    def _read_length_with_encoding(self) -> t.Tuple[int, bool]:
+        byte = self._read_byte()
+        kind = byte >> 6
+        if kind == 0:
+            return byte & 0x3F, False
+        if kind == 1:
+            return ((byte & 0x3F) << 8) | self._read_byte(), False
+        if kind == 3:
+            return byte & 0x3F, True
+        if byte == 0x80:
+            return struct.unpack('>I', self._read(4))[0], False
+        if byte == 0x81:
+            return struct.unpack('>Q', self._read(8))[0], False
+        raise RdbParseError(f'Unknown length encoding {byte} at {self.position - 1}')
+
+    def _read_length(self) -> int:
+        length, encoded = self._read_length_with_encoding()
+        if encoded:
+            raise RdbParseError(f'Unexpected string encoding at {self.position - 1}')
+        return length
+
+    def _read_string(self) -> bytes:
+        length, encoded = self._read_length_with_encoding()
+        if not encoded:
+            return self._read(length)
+        return self._read_string_tail(length)
+
+    def _read_string_tail(self, length: int) -> bytes:
+        """
+        Reads an encoded string, ``length`` is its encoding.
+        """
+        if length == 0:
+            return str(struct.unpack('<b', self._read(1))[0]).encode()
+        if length == 1:
+            return str(struct.unpack('<h', self._read(2))[0]).encode()
+        if length == 2:
+            return str(struct.unpack('<i', self._read(4))[0]).encode()
+        if length == 3:
+            compressed_length, length = self._read_length(), self._read_length()
+            return lzf_decompress(self._read(compressed_length), length)
+        raise RdbParseError(f'Unknown string encoding {length} at {self.position - 1}')
+
+    def _skip_string(self) -> int:
+        """
+        :return: the length of a skipped string
+        """
+        length, encoded = self._read_length_with_encoding()
+        if not encoded:
+            self.position += length
+            return length
+        if length == 3:
+            compressed_length, length = self._read_length(), self._read_length()
+            self.position += compressed_length
+            return length
+        return len(self._read_string_tail(length))
+
+    def _skip_strings(self, n: int):
+        for __ in range(n):
+            self._skip_string()
+
+    def _skip_double(self):
+        length = self._read_byte()
+        if length < 253:  # 253-255 are NaN and infinities
+            self.position += length
+
+    # plain encodings
+
+    def _skip_type_0(self) -> int:
+        return self._skip_string()
+
+    def _skip_type_1(self) -> int:
+        n = self._read_length()
+        self._skip_strings(n)
+        return n
+
+    _skip_type_2 = _skip_type_1
+
+    def _skip_type_3(self) -> int:
+        n = self._read_length()
+        for __ in range(n):
+            self._skip_string()
+            self._skip_double()
+        return n
+
+    def _skip_type_4(self) -> int:
+        n = self._read_length()
+        self._skip_strings(2 * n)
+        return n
+
+    def _skip_type_5(self) -> int:
+        n = self._read_length()
+        for __ in range(n):
+            self._skip_string()
+            self.position += 8
+        return n
+
+    def _skip_type_6(self) -> int:
+        raise RdbParseError('Module values are not supported')
+
+    _skip_type_7 = _skip_type_6
+
+    # compact encodings are stored as strings with a header holding the number of elements
+
+    def _skip_type_9(self) -> int:
+        zipmap = self._read_string()
+        return zipmap[0] if zipmap[0] < 254 else -1
+
+    @staticmethod
+    def _ziplist_length(blob: bytes) -> int:
+        return struct.unpack_from('<H', blob, 8)[0]
+
+    @staticmethod
+    def _listpack_length(blob: bytes) -> int:
+        return struct.unpack_from('<H', blob, 4)[0]
+
+    def _skip_type_10(self) -> int:
+        return self._ziplist_length(self._read_string())
+
+    def _skip_type_11(self) -> int:
+        return struct.unpack_from('<I', self._read_string(), 4)[0]
+
+    def _skip_type_12(self) -> int:
+        return self._ziplist_length(self._read_string()) // 2
+
+    _skip_type_13 = _skip_type_12
+
+    def _skip_type_14(self) -> int:
+        return sum(self._ziplist_length(self._read_string()) for __ in range(self._read_length()))
+
+    def _skip_type_16(self) -> int:
+        return self._listpack_length(self._read_string()) // 2
+
+    _skip_type_17 = _skip_type_16
+
+    def _skip_type_18(self) -> int:
+        elements = 0
+        for __ in range(self._read_length()):
+            container = self._read_length()
+            blob = self._read_string()
+            elements += 1 if container == 1 else self._listpack_length(blob)  # 1 is a plain node
+        return elements
+
+    def _skip_type_20(self) -> int:
+        return self._listpack_length(self._read_string())
+
+    def _skip_stream(self, version: int) -> int:
+        self._skip_strings(2 * self._read_length())  # master ids and listpacks
+        length = self._read_length()
+        self._read_length()  # last id
+        self._read_length()
+        if version >= STREAM_LISTPACKS_2:
+            for __ in range(5):  # first id, max deleted id, entries added
+                self._read_length()
+
+        for __ in range(self._read_length()):  # consumer groups
+            self._skip_string()
+            self._read_length()  # last id
+            self._read_length()
+            if version >= STREAM_LISTPACKS_2:
+                self._read_length()  # entries read
+
+            for __ in range(self._read_length()):  # global PEL: id, delivery time, delivery count
+                self.position += 16 + 8
+                self._read_length()
+
+            for __ in range(self._read_length()):  # consumers
+                self._skip_string()
+                self.position += 8  # seen time
+                if version >= STREAM_LISTPACKS_3:
+                    self.position += 8  # active time
+                pending = self._read_length()  # consumer PEL ids
+                self.position += 16 * pending
+        return length
+
+    def _skip_type_15(self) -> int:
+        return self._skip_stream(STREAM_LISTPACKS)
+
+    def _skip_type_19(self) -> int:
+        return self._skip_stream(STREAM_LISTPACKS_2)
+
+    def _skip_type_21(self) -> int:
+        return self._skip_stream(STREAM_LISTPACKS_3)
@@ -0,0 +1,169 @@
+import asyncio
+import typing as t
+from uuid import uuid4
+
+from sanic.request import Request
+from ujson import dumps as json_dumps
+
+from sanic_redis_rpc.jobs.exceptions import WrongJobOptionError
+from sanic_redis_rpc.jobs.request_adapter import JobRequestAdapter
+from sanic_redis_rpc.key_manager.exceptions import WrongPatternError
+from sanic_redis_rpc.key_manager.manager import KeyManager, chunks
+from sanic_redis_rpc.key_manager.patterns import KeyPattern, get_scan_match
+from sanic_redis_rpc.key_manager.stores import mk_result_store
+from .index import SnapshotIndex, SnapshotRegistry
+from .job import SnapshotIndexJob
+
+
+class SnapshotRequestAdapter(JobRequestAdapter):
+    # noinspection PyProtectedMember
+    def __init__(self, request: Request):
+        super().__init__(request)
+        self.registry: SnapshotRegistry = request.app._snapshot_registry
+        self.export_dir: str = request.app.config.export_dir
+
+    def parse_request(self) -> t.Dict[str, t.Any]:
+        data = self.request.json or {}
+        return dict(
+            super().parse_request(),
+            name=data.get('name', None),
+            db=self._parse(data, 'db', int, 0),
+            run_size=self._parse(data, 'run_size', int, 100000),
+            patterns=data.get('patterns', None) or [],
+            regexes=data.get('regexes', None) or [],
+            search_ttl_seconds=self._parse(data, 'ttl_seconds', int, 5 * 60),
+            top=self._parse(self.request.args, 'top', int, data.get('top', 20)),
+            delimiters=self.request.args.get('delimiters', ':'),
+            max_depth=self._parse(self.request.args, 'max_depth', int, 8),
+            max_nodes=self._parse(self.request.args, 'max_nodes', int, 10000),
+        )
+
+    def is_snapshot(self, name: str) -> bool:
+        return name not in self.pools_wrapper.pool_names and self.registry.exists(self.export_dir, name)
+
+    def _get_snapshot(self, name: str) -> SnapshotIndex:
+        return self.registry.get(self.export_dir, name)
+
+    def _get_snapshot_urls(self, name: str) -> t.Dict[str, str]:
+        return {
+            'search': self.request.app.url_for('sanic-redis-rpc.search', redis_name=name),
+            'get_snapshot_info': self.request.app.url_for('sanic-redis-rpc.get_snapshot_info', name=name),
+            'get_snapshot_namespaces': self.request.app.url_for('sanic-redis-rpc.get_snapshot_namespaces', name=name),
+            'get_snapshot_bigkeys': self.request.app.url_for('sanic-redis-rpc.get_snapshot_bigkeys', name=name),
+        }
+
+    async def start_index(self) -> t.Dict[str, t.Any]:
+        if self.options['name'] in self.pools_wrapper.pool_names:
+            raise WrongJobOptionError('name', 'a pool with this name already exists')
+
+        return await self._start(SnapshotIndexJob(
+            await self.pools_wrapper.get_service_redis(),
+            self.export_dir,
+            self._get_job_options('file_name', 'name', 'db', 'run_size'),
+            ttl_seconds=self.options['job_ttl_seconds'],
+        ))
+
+    def get_statuses(self) -> t.List[t.Dict[str, t.Any]]:
+        """
+        :return: status bundles of snapshots, listed next to live pools
+        """
+        statuses = []
+        for name in self.registry.list(self.export_dir):
+            if name in self.pools_wrapper.pool_names:
+                continue  # live pools win
+            statuses.append({
+                'name': name,
+                'display_name': f'Snapshot {name}',
+                'snapshot': True,
+                'read_only': True,
+                'search_url': self.request.app.url_for('sanic-redis-rpc.search', redis_name=name),
+                'info_url': self.request.app.url_for('sanic-redis-rpc.get_snapshot_info', name=name),
+            })
+        return statuses
+
+    async def get_info(self, name: str) -> t.Dict[str, t.Any]:
+        snapshot = self._get_snapshot(name)
+        return dict(snapshot.info, name=name, read_only=True, endpoints=self._get_snapshot_urls(name))
+
+    async def get_namespace_node(self, name: str) -> t.Dict[str, t.Any]:
+        snapshot = self._get_snapshot(name)
+        node = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: snapshot.get_namespace_node(
+                self.options['path'],
+                delimiters=self.options['delimiters'],
+                max_depth=self.options['max_depth'],
+                max_nodes=self.options['max_nodes'],
+                limit=self.options['limit'],
+            )
+        )
+        node['endpoints'] = {
+            'children': [
+                self.request.app.url_for(
+                    'sanic-redis-rpc.get_snapshot_namespaces',
+                    name=name, path=child['path'], delimiters=self.options['delimiters']
+                )
+                for child in node['children']
+            ]
+        }
+        return node
+
+    async def get_bigkeys(self, name: str) -> t.Dict[str, t.Any]:
+        if not self.options['top'] > 0:
+            raise WrongJobOptionError('top', 'must be a positive integer')
+
+        snapshot = self._get_snapshot(name)
+        result = await asyncio.get_event_loop().run_in_executor(None, snapshot.get_bigkeys, self.options['top'])
+        return dict(result, name=name, size='serialized')
+
+    async def search(self, name: str) -> t.Dict[str, t.Any]:
+        """
+        Stores keys of a snapshot matching a pattern (or any of ``patterns`` and ``regexes``) as a sorted search,
+        so it's paged like any other search. Metadata cache of the search is filled from the snapshot,
+        sizes are reported as ``memory``.
+        """
+        data = self.request.json or {}
+        for option_name in ['patterns', 'regexes']:
+            if not isinstance(self.options[option_name], list):
+                raise WrongPatternError(self.options[option_name], f'`{option_name}` must be a list')
+
+        key_patterns = [KeyPattern(pattern) for pattern in self.options['patterns']]
+        key_patterns += [KeyPattern(regex, regex=True) for regex in self.options['regexes']]
+        if not key_patterns:
+            key_patterns = [KeyPattern(data.get('pattern', '*'))]
+
+        snapshot = self._get_snapshot(name)
+        records = await asyncio.get_event_loop().run_in_executor(None, snapshot.search, key_patterns)
+
+        service_redis = await self.pools_wrapper.get_service_redis()
+        key_manager = KeyManager(None, service_redis, result_store=mk_result_store(
+            service_redis, self.request.app.config.result_store, results_dir=self.request.app.config.results_dir
+        ))
+        ttl_seconds = self.options['search_ttl_seconds']
+        pattern = key_patterns[0].pattern if len(key_patterns) == 1 else get_scan_match(key_patterns)
+
+        search_id = uuid4().hex
+        bundle = key_manager.mk_search_bundle(search_id, pattern, True, ttl_seconds, name)
+        bundle.update({'cursor': -1, 'count': len(records), 'snapshot': 1})
+
+        metadata_key = key_manager.mk_metadata_key(search_id)
+        transaction = service_redis.multi_exec()
+        key_manager.save_search(transaction, bundle, [record.key for record in records])
+        for chunk in chunks(records, key_manager.scan_count):
+            transaction.hmset_dict(metadata_key, {
+                record.key: json_dumps({
+                    'type': record.type,
+                    'expire_at': record.expire_at or -1,
+                    'encoding': None,
+                    'memory': record.size,
+                })
+                for record in chunk
+            })
+        transaction.expire(metadata_key, ttl_seconds)
+        await key_manager.result_store.execute(transaction)
+
+        bundle['endpoints'] = {
+            'get_page': self.request.app.url_for('sanic-redis-rpc.get_page', page_number=1, search_id=search_id),
+            'refresh_ttl': self.request.app.url_for('sanic-redis-rpc.refresh_ttl', search_id=search_id),
+            'get_search_info': self.request.app.url_for('sanic-redis-rpc.get_search_info', search_id=search_id),
+        }
+        return bundle
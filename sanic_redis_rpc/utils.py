@@ -62,6 +62,31 @@ def parse_redis_dsn(raw_str: str = 'redis://localhost:6379') -> t.Dict[str, t.An
         'name': parsed.args.get('name', ''),
         'display_name': parsed.args.get('display_name', ''),
         'service': coerce_str_to_bool(parsed.args.get('service', False)),
+        'max_scans': int(parsed.args.get('max_scans', 2)),
+        'drain_timeout': float(parsed.args.get('drain_timeout', 30)),
+        'autoscale': coerce_str_to_bool(parsed.args.get('autoscale', False)),
+        'autoscale_interval': float(parsed.args.get('autoscale_interval', 1)),
+        'lane_connections': int(parsed.args.get('lane_connections', 0)),
+        'lane_queue': int(parsed.args.get('lane_queue', 100)),
+        'lane_slow': coerce_str_to_bool(parsed.args.get('lane_slow', False)),
+        'max_in_flight': int(parsed.args.get('max_in_flight', 1000)),
+        'admission_queue': int(parsed.args.get('admission_queue', 10000)),
+        'retries': int(parsed.args.get('retries', 2)),
+        'retry_backoff': float(parsed.args.get('retry_backoff', 0.05)),
+        'notify_queue': int(parsed.args.get('notify_queue', 10000)),
+        'notify_batch': int(parsed.args.get('notify_batch', 500)),
+        'notify_overflow': parsed.args.get('notify_overflow', 'drop_new'),
+        'budget': int(parsed.args.get('budget', 0)),
+        'budget_interval': float(parsed.args.get('budget_interval', 1)),
+        'lazy': coerce_str_to_bool(parsed.args.get('lazy', False)),
+        'init_timeout': float(parsed.args.get('init_timeout', 10)),
+        'health_check_interval': float(parsed.args.get('health_check_interval', 5)),
+        'health_check_timeout': float(parsed.args.get('health_check_timeout', 1)),
+        'circuit_failures': int(parsed.args.get('circuit_failures', 5)),
+        'circuit_open_seconds': float(parsed.args.get('circuit_open_seconds', 5)),
+        'key_index': coerce_str_to_bool(parsed.args.get('key_index', False)),
+        'key_index_max_memory': int(parsed.args.get('key_index_max_memory', 64 * 1024 * 1024)),
+        'key_index_configure': coerce_str_to_bool(parsed.args.get('key_index_configure', False)),
     })
 
     return opts
@@ -1,18 +1,32 @@
+import asyncio
+import signal
+import typing as t
+from functools import partial
+
 import aioredis
 from sanic import Blueprint
 from sanic import Sanic
 from sanic.request import Request
-from sanic.response import json
+from sanic.log import logger
+from sanic.response import empty, json, stream
+from ujson import dumps as json_dumps
 
+from sanic_redis_rpc.conf import ENV_POOLS_FILE, read_redis_config
 from sanic_redis_rpc.rpc import exceptions
 from sanic_redis_rpc.redis_rpc import RedisRpc
 from sanic_redis_rpc.rpc.custom_redis import CustomRedis
 from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper
 from sanic_redis_rpc.signature_serializer import SignatureSerializer
-from sanic_redis_rpc.key_manager import KeyManagerRequestAdapter
+from sanic_redis_rpc.key_manager import KeyManagerRequestAdapter, LiveKeyIndex
+from sanic_redis_rpc.jobs import JobRequestAdapter, JobRunner
+from sanic_redis_rpc.snapshots import SnapshotRegistry, SnapshotRequestAdapter
+from sanic_redis_rpc.pools import PoolRegistry, PoolsRequestAdapter, reload_pools
 
 sanic_redis_rpc_bp = bp = Blueprint('sanic-redis-rpc')
 
+# routes of the pools admin API, see `PoolsRequestAdapter`
+ADMIN_URL_PREFIX = '/admin'
+
 
 # @bp.exception(Exception)
 # async def process_rpc_exceptions(request: Request, exception: Exception):
@@ -23,16 +37,115 @@ sanic_redis_rpc_bp = bp = Blueprint('sanic-redis-rpc')
 #     traceback.print_exc()
 
 
+def stream_json(
+        bundle: t.Dict[str, t.Any], list_name: str, batches: t.AsyncIterator[t.List[t.Any]],
+        trailer: t.Optional[t.Callable[[], t.Dict[str, t.Any]]] = None):
+    """
+    Streams ``bundle`` as a json object with ``list_name`` list populated from ``batches``.
+    ``trailer`` is called when all batches are sent and its result is appended to the object.
+    """
+    async def streaming_fn(response):
+        await response.write(json_dumps(bundle)[:-1] + '%s"%s":[' % (',' if bundle else '', list_name))
+        first = True
+        async for batch in batches:
+            if not batch:
+                continue
+            await response.write(('' if first else ',') + json_dumps(batch)[1:-1])
+            first = False
+
+        trailer_bundle = trailer() if trailer else {}
+        await response.write(']' + (',' + json_dumps(trailer_bundle)[1:] if trailer_bundle else '}'))
+
+    return stream(streaming_fn, content_type='application/json')
+
+
 @bp.listener('before_server_start')
 async def before_server_start(app: Sanic, loop):
     app._pools_wrapper = RedisPoolsShareWrapper(app.config.redis_connections_options, loop)
-    await app._pools_wrapper._initialize_pools()
-    app._redis_rpc_handler = RedisRpc(app._pools_wrapper)
+    init_results = await app._pools_wrapper._initialize_pools()
+    for pool_name, result in init_results.items():
+        if 'init_error' in result:
+            logger.warning(
+                'Redis pool `%s` failed to initialize, retrying on first use: %s', pool_name, result['init_error']
+            )
+        else:
+            logger.info('Redis pool `%s` initialized in %ss', pool_name, result['init_seconds'])
+    app._pools_wrapper.start_health_checks()
+    app._redis_rpc_handler = RedisRpc(
+        app._pools_wrapper,
+        app.config.client_header if app.config.trust_client_header else None,
+        app.config.client_weights,
+        app.config.timeouts,
+    )
+    app._job_runner = JobRunner()
+    app._snapshot_registry = SnapshotRegistry()
+
+    # every worker keeps its own indexes of pools with the `key_index` DSN flag
+    app._key_indexes = {}
+    await start_key_indexes(app, init_results)
+
+    app._pool_registry = PoolRegistry(
+        app._pools_wrapper, app.config.configured_at, partial(on_pools_change, app),
+        secret=app.config.admin_token, read_secrets=partial(read_pools_secrets, app),
+    ).start()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(on_sighup(app)))
+    except (AttributeError, NotImplementedError, RuntimeError):
+        pass  # no SIGHUP on windows, no signal handlers outside of the main thread
+
+
+async def start_key_indexes(app: Sanic, init_results: t.Dict[str, t.Dict[str, t.Any]]):
+    for pool_name, options in app.config.redis_connections_options.items():
+        # indexes of lazy pools and pools failed to initialize are not started
+        if options.get('key_index') and 'init_seconds' in init_results.get(pool_name, {}):
+            app._key_indexes[pool_name] = LiveKeyIndex(
+                await app._pools_wrapper.get_redis(pool_name),
+                partial(app._pools_wrapper.create_redis, pool_name),
+                db=options['db'],
+                max_memory=options['key_index_max_memory'],
+                configure_notifications=options['key_index_configure'],
+            ).start()
+
+
+async def on_pools_change(app: Sanic, changes: t.Dict[str, t.Any]):
+    for pool_name in changes['removed'] + changes['reconfigured']:
+        key_index = app._key_indexes.pop(pool_name, None)
+        if key_index is not None:
+            await key_index.stop()
+    for pool_name, result in changes['init'].items():
+        if 'init_error' in result:
+            logger.warning('Redis pool `%s` failed to initialize: %s', pool_name, result['init_error'])
+    await start_key_indexes(app, changes['init'])
+
+
+def read_pools_secrets(app: Sanic) -> t.Dict[str, t.Dict[str, t.Any]]:
+    # every worker reads the pools file, so passwords of a reload are taken from it
+    if not app.config.pools_file:
+        return app.config.redis_connections_options
+    return read_redis_config({ENV_POOLS_FILE: app.config.pools_file})
+
+
+async def on_sighup(app: Sanic):
+    try:
+        changes = await reload_pools(app)
+    except Exception as e:
+        logger.warning('Pools are not reloaded: %s', e)
+        return
+    logger.info('Pools reloaded: %s', changes)
 
 
 @bp.listener('after_server_stop')
 async def after_server_stop(app: Sanic, loop):
+    try:
+        loop.remove_signal_handler(signal.SIGHUP)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        pass
+    await app._pool_registry.stop()
+    await app._job_runner.close()
+    for key_index in app._key_indexes.values():
+        await key_index.stop()
     await app._pools_wrapper.close()
+    app._snapshot_registry.close()
 
 
 @bp.route('/status', methods=['GET'])
@@ -46,8 +159,12 @@ async def status(request: Request):
             'sanic-redis-rpc.search',
             redis_name=status_bundle['name']
         )
+        status_bundle['stats_url'] = request.app.url_for(
+            'sanic-redis-rpc.get_stats',
+            redis_name=status_bundle['name']
+        )
 
-    return json(statuses)
+    return json(statuses + SnapshotRequestAdapter(request).get_statuses())
 
 
 @bp.route('/inspect', methods=['GET'])
@@ -62,11 +179,25 @@ async def search(request: Request, redis_name: str):
     if request.method == 'OPTIONS':
         return json({})
 
+    snapshot_adapter = SnapshotRequestAdapter(request)
+    if snapshot_adapter.is_snapshot(redis_name):
+        return json(await snapshot_adapter.search(redis_name))
+
     return json(
         await KeyManagerRequestAdapter(request, redis_name).search()
     )
 
 
+@bp.route('/keys/search', methods=['POST', 'OPTIONS'])
+async def federated_search(request: Request):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await KeyManagerRequestAdapter(request, None).federated_search()
+    )
+
+
 @bp.route('/keys/search/refresh-ttl/<search_id>', methods=['POST', 'OPTIONS'])
 async def refresh_ttl(request: Request, search_id: str):
     if request.method == 'OPTIONS':
@@ -87,6 +218,52 @@ async def get_page(request: Request, search_id: str, page_number: int):
     )
 
 
+@bp.route('/keys/search/<search_id>/page/<page_number>/values', methods=['GET', 'OPTIONS'])
+async def get_page_values(request: Request, search_id: str, page_number: int):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    page, batches = await KeyManagerRequestAdapter(request, None).get_page_values(search_id, page_number)
+    return stream_json(page, 'results', batches)
+
+
+@bp.route('/keys/browse/<redis_name>', methods=['GET', 'OPTIONS'])
+async def browse_key(request: Request, redis_name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    adapter = KeyManagerRequestAdapter(request, redis_name)
+    bundle, elements, browser = await adapter.browse()
+
+    def trailer():
+        return {
+            'next_cursor': browser.next_cursor,
+            'next': adapter._get_browse_url(redis_name, bundle['key'], browser.next_cursor),
+        }
+
+    return stream_json(bundle, 'elements', elements, trailer)
+
+
+@bp.route('/keys/stats/<redis_name>', methods=['GET', 'OPTIONS'])
+async def get_stats(request: Request, redis_name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await KeyManagerRequestAdapter(request, redis_name).get_stats()
+    )
+
+
+@bp.route('/keys/index/<redis_name>', methods=['GET', 'OPTIONS'])
+async def get_key_index_stats(request: Request, redis_name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await KeyManagerRequestAdapter(request, redis_name).get_key_index_stats()
+    )
+
+
 @bp.route('/keys/search/info/<search_id>', methods=['GET', 'OPTIONS'])
 async def get_search_info(request: Request, search_id: str):
     if request.method == 'OPTIONS':
@@ -97,6 +274,177 @@ async def get_search_info(request: Request, search_id: str):
     )
 
 
+@bp.route('/jobs/bulk/<search_id>', methods=['POST', 'OPTIONS'])
+async def start_bulk_job(request: Request, search_id: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).start_bulk(search_id)
+    )
+
+
+@bp.route('/jobs/namespaces/<redis_name>', methods=['POST', 'OPTIONS'])
+async def start_namespaces_job(request: Request, redis_name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).start_namespaces(redis_name)
+    )
+
+
+@bp.route('/jobs/bigkeys/<redis_name>', methods=['POST', 'OPTIONS'])
+async def start_bigkeys_job(request: Request, redis_name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).start_bigkeys(redis_name)
+    )
+
+
+@bp.route('/jobs/diff', methods=['POST', 'OPTIONS'])
+async def start_diff_job(request: Request):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).start_diff()
+    )
+
+
+@bp.route('/jobs/migrate', methods=['POST', 'OPTIONS'])
+async def start_migration_job(request: Request):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).start_migration()
+    )
+
+
+@bp.route('/jobs/export/<redis_name>', methods=['POST', 'OPTIONS'])
+async def start_export_job(request: Request, redis_name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).start_export(redis_name)
+    )
+
+
+@bp.route('/jobs/import/<redis_name>', methods=['POST', 'OPTIONS'])
+async def start_import_job(request: Request, redis_name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).start_import(redis_name)
+    )
+
+
+@bp.route('/jobs/snapshot', methods=['POST', 'OPTIONS'])
+async def start_snapshot_job(request: Request):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await SnapshotRequestAdapter(request).start_index()
+    )
+
+
+@bp.route('/snapshots/<name>', methods=['GET', 'OPTIONS'])
+async def get_snapshot_info(request: Request, name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await SnapshotRequestAdapter(request).get_info(name)
+    )
+
+
+@bp.route('/snapshots/<name>/namespaces', methods=['GET', 'OPTIONS'])
+async def get_snapshot_namespaces(request: Request, name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await SnapshotRequestAdapter(request).get_namespace_node(name)
+    )
+
+
+@bp.route('/snapshots/<name>/bigkeys', methods=['GET', 'OPTIONS'])
+async def get_snapshot_bigkeys(request: Request, name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await SnapshotRequestAdapter(request).get_bigkeys(name)
+    )
+
+
+@bp.route('/jobs/<job_id>/namespaces', methods=['GET', 'OPTIONS'])
+async def get_namespace_node(request: Request, job_id: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).get_namespace_node(job_id)
+    )
+
+
+@bp.route('/jobs/<job_id>', methods=['GET', 'OPTIONS'])
+async def get_job_info(request: Request, job_id: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).get_info(job_id)
+    )
+
+
+@bp.route('/jobs/<job_id>/cancel', methods=['POST', 'OPTIONS'])
+async def cancel_job(request: Request, job_id: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await JobRequestAdapter(request).cancel(job_id)
+    )
+
+
+@bp.route(ADMIN_URL_PREFIX + '/pools', methods=['GET', 'OPTIONS'])
+async def get_pools_registry(request: Request):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        PoolsRequestAdapter(request).get_stats()
+    )
+
+
+@bp.route(ADMIN_URL_PREFIX + '/pools/<name>', methods=['POST', 'DELETE', 'OPTIONS'])
+async def put_pool(request: Request, name: str):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    adapter = PoolsRequestAdapter(request)
+    if request.method == 'DELETE':
+        return json(await adapter.remove(name))
+    return json(await adapter.put(name))
+
+
+@bp.route(ADMIN_URL_PREFIX + '/reload', methods=['POST', 'OPTIONS'])
+async def reload_pools_config(request: Request):
+    if request.method == 'OPTIONS':
+        return json({})
+
+    return json(
+        await PoolsRequestAdapter(request).reload()
+    )
+
+
 @bp.route('/', methods=['POST', 'OPTIONS'])
 async def handle_rpc(request: Request):
     if request.method == 'OPTIONS':
@@ -106,8 +454,11 @@ async def handle_rpc(request: Request):
     # handle exceptions manually since sanic-cors does not apply cors headers to responses
     # handled with @bp.exception(Exception)
     try:
-        return json(await handler.handle(request))
+        result = await handler.handle(request)
+        return json(result) if result else empty()
     except exceptions.RpcError as e:
         return json(e.as_dict())
+    except asyncio.CancelledError:
+        raise  # the client has disconnected
     except Exception as e:
         return json(exceptions.RpcError(message=str(e)).as_dict())
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from sanic import Sanic
+
+from sanic_redis_rpc.redis_rpc import RedisRpc
+from sanic_redis_rpc.rpc import exceptions
+from sanic_redis_rpc.rpc.admission import CLIENT_HEADER, AdmissionController, identify_client
+from tests.utils import AttrObject, mk_pools_wrapper, mk_rpc_bundle
+
+
+def test__identify_client():
+    request = AttrObject(headers={CLIENT_HEADER: 'billing', 'Authorization': 'Bearer qwe'}, remote_addr='', ip='10.0.0.1')
+    assert identify_client(request) == '10.0.0.1', 'Headers chosen by a client are not trusted by default'
+    assert identify_client(request, CLIENT_HEADER) == 'billing'
+    request.headers = {'Authorization': 'Bearer qwe'}
+    assert identify_client(request, CLIENT_HEADER).startswith('token:')
+    assert identify_client(request, CLIENT_HEADER) != identify_client(
+        AttrObject(headers={'Authorization': 'Bearer asd'}), CLIENT_HEADER)
+    request.headers = {}
+    assert identify_client(request, CLIENT_HEADER) == '10.0.0.1'
+    request.remote_addr = '192.168.0.1'
+    assert identify_client(request) == '192.168.0.1', 'A forwarded address is preferred'
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class AdmissionControllerTest:
+    pytestmark = [pytest.mark.wrapper]
+
+    async def test__admit(self):
+        controller = AdmissionController('redis_1', max_in_flight=1, max_queued=4)
+        order = []
+        release = asyncio.Event()
+
+        async def call(client, name, weight=1):
+            async with controller.admit(client, weight=weight):
+                order.append(name)
+                await release.wait()
+
+        holder = asyncio.ensure_future(call('heavy', 'heavy:0'))
+        await asyncio.sleep(0)
+        calls = [asyncio.ensure_future(call('heavy', f'heavy:{i}')) for i in range(1, 3)]
+        await asyncio.sleep(0)
+        calls.append(asyncio.ensure_future(call('light', 'light:1')))
+        await asyncio.sleep(0)
+        assert controller.as_dict()['queued'] == 3
+
+        with pytest.raises(exceptions.AdmissionRejectedError) as e:
+            await call('heavy', 'heavy:3')
+        assert e.value.retry_after > 0
+        assert controller.clients['heavy'].counters['rejected'] == 1, 'A client may queue its share of the queue'
+
+        release.set()
+        await asyncio.gather(holder, *calls)
+        assert order == ['heavy:0', 'light:1', 'heavy:1', 'heavy:2'], 'A light client goes ahead of a heavy one'
+        stats = controller.as_dict()
+        assert (stats['in_flight'], stats['queued'], stats['admitted'], stats['rejected']) == (0, 0, 4, 1)
+        assert stats['clients'] == {}, 'Idle clients are forgotten'
+
+    async def test__weights(self):
+        controller = AdmissionController('redis_1', max_in_flight=2, max_queued=100)
+        order = []
+        release = asyncio.Event()
+
+        async def call(client, weight, commands=1):
+            async with controller.admit(client, commands, weight):
+                order.append(client)
+                await release.wait()
+                release.clear()
+
+        holder = asyncio.ensure_future(call('holder', 1, commands=10))
+        await asyncio.sleep(0)
+        assert controller.in_flight == 2, 'A call costs no more than the whole pool'
+        calls = [asyncio.ensure_future(call(client, weight)) for client, weight in [('a', 1), ('b', 3)] * 4]
+        await asyncio.sleep(0)
+        for _ in range(9):
+            release.set()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(holder, *calls)
+        assert order[1:5].count('b') == 3, 'A client gets its weighted share'
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class AdmissionRpcTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.handler]
+
+    async def test__handle(self, app: Sanic, loop):
+        pools_wrapper = mk_pools_wrapper(app, loop, max_in_flight=2, admission_queue=0)
+        rpc = RedisRpc(pools_wrapper)
+
+        res = await rpc.handle_batch([mk_rpc_bundle('redis_1.echo', [i]) for i in range(5)], 'batch')
+        assert [item['result'] for item in res] == [str(i) for i in range(5)], 'A batch is sent in chunks'
+        assert pools_wrapper.get_admission_controller('redis_1').counters['admitted'] == 3
+
+        blocked = [
+            asyncio.ensure_future(rpc.handle_single(mk_rpc_bundle('redis_1.blpop', [f'admission:{i}']), 'slow'))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0.05)
+        with pytest.raises(exceptions.RpcOverloadedError) as e:
+            await rpc.handle_single(mk_rpc_bundle('redis_1.echo', ['qwe']), 'fast')
+        assert e.value.error_code == -32002 and e.value.data['retry_after'] > 0
+        res = await rpc.handle_batch([mk_rpc_bundle('redis_1.echo', ['qwe']), mk_rpc_bundle('redis_0.echo', ['qwe'])])
+        assert res[0]['error']['code'] == -32002 and res[1]['result'] == 'qwe', 'Only the overloaded pool rejects'
+
+        status, = [bundle for bundle in await pools_wrapper.get_status() if bundle['name'] == 'redis_1']
+        assert status['admission']['clients']['slow']['in_flight'] == 2
+        assert status['admission']['rejected'] == 2
+
+        for task in blocked:
+            task.cancel()
+        await asyncio.wait(blocked)
+        await pools_wrapper.close()
+
+    async def test__admission_before_lane(self, app: Sanic, loop):
+        pools_wrapper = mk_pools_wrapper(app, loop, max_in_flight=1, lane_connections=1)
+        rpc = RedisRpc(pools_wrapper)
+        await (await pools_wrapper.get_redis('redis_1')).delete('admission:single', 'admission:batch')
+
+        single = asyncio.ensure_future(rpc.handle_single(mk_rpc_bundle('redis_1.blpop', ['admission:single'])))
+        await asyncio.sleep(0.05)
+        batch = asyncio.ensure_future(rpc.handle_batch([mk_rpc_bundle('redis_1.blpop', ['admission:batch'])]))
+        await asyncio.sleep(0.05)
+        scheduler = pools_wrapper.get_lane_scheduler('redis_1')
+        assert pools_wrapper.get_admission_controller('redis_1').queued == 1
+        assert scheduler.as_dict()['lanes']['blocking']['queued'] == 0, 'A batch waits for admission first'
+
+        redis = await pools_wrapper.get_redis('redis_1')
+        await redis.rpush('admission:single', 1)
+        await redis.rpush('admission:batch', 2)
+        assert (await asyncio.wait_for(single, 1))['result'] == [b'admission:single', b'1']
+        assert (await asyncio.wait_for(batch, 1))[0]['result'] == [b'admission:batch', b'2']
+        await pools_wrapper.close()
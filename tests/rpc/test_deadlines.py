@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from sanic import Sanic
+
+from sanic_redis_rpc.redis_rpc import RedisRpc, RedisRpcRequest, get_deadline
+from sanic_redis_rpc.rpc import deadlines, exceptions
+from sanic_redis_rpc.rpc.deadlines import Deadline, get_blocking_timeout, get_request_timeout
+from tests.utils import AttrObject, mk_pools_wrapper, mk_rpc_bundle
+
+
+# noinspection PyMethodMayBeStatic
+class DeadlineTest:
+    async def test__run(self):
+        assert await Deadline().run(asyncio.sleep(0.01, 'qwe')) == 'qwe'
+        with pytest.raises(exceptions.DeadlineExceededError) as e:
+            await Deadline(0.01).run(asyncio.sleep(1))
+        assert e.value.as_rpc_error(id=1).as_dict()['error']['data'] == {'timeout_ms': 10}
+
+        async def fail():
+            raise asyncio.TimeoutError()
+
+        with pytest.raises(asyncio.TimeoutError) as e:
+            await Deadline(1).run(fail())
+        assert not isinstance(e.value, exceptions.DeadlineExceededError), 'A timeout of redis itself is kept'
+
+        assert Deadline.latest([Deadline(1), Deadline(2)]).timeout == 2
+        assert Deadline.latest([Deadline(1), Deadline()]).expires_at is None
+        assert Deadline.latest([]).expires_at is None
+
+    async def test__early_timer(self, monkeypatch):
+        deadline = Deadline(0.01)
+        # the timer fires while the clock is still before `expires_at`
+        monkeypatch.setattr(deadlines, 'monotonic', lambda: deadline.expires_at - 0.01)
+        with pytest.raises(exceptions.DeadlineExceededError):
+            await deadline.run(asyncio.sleep(1))
+
+    def test__get_deadline(self):
+        bundle = mk_rpc_bundle('redis_0.get', ['qwe'])
+        assert get_deadline(RedisRpcRequest(bundle)).timeout == 5, 'A lane default is used'
+        assert get_deadline(RedisRpcRequest(bundle), 1).timeout == 1, 'A request timeout goes before a default'
+        assert get_deadline(RedisRpcRequest(dict(bundle, timeout_ms=500)), 1).timeout == 0.5
+        assert get_deadline(RedisRpcRequest(mk_rpc_bundle('redis_0.blpop', ['qwe'])), timeouts={}).timeout is None
+        blpop = mk_rpc_bundle('redis_0.blpop', {'key': 'qwe', 'timeout': 120})
+        assert get_deadline(RedisRpcRequest(blpop)).timeout == 121, 'A blocking command is given its own timeout'
+        assert get_deadline(RedisRpcRequest(blpop), 1).timeout == 1
+        assert get_deadline(RedisRpcRequest(mk_rpc_bundle('redis_0.blpop', ['qwe']))).timeout == 60
+
+        assert get_blocking_timeout('brpoplpush', ['qwe', 'asd', 10]) == 10
+        assert get_blocking_timeout('xread', [['qwe'], 2000]) == 2
+        assert get_blocking_timeout('xread', {'streams': ['qwe'], 'timeout': None}) is None
+        assert get_blocking_timeout('blpop', ['qwe', 'asd']) == 0, 'A timeout of `blpop` is keyword-only'
+        assert get_blocking_timeout('get', ['qwe']) is None
+
+        for timeout_ms in [0, -1, 'qwe', True]:
+            with pytest.raises(exceptions.RpcInvalidRequestError):
+                RedisRpcRequest(dict(bundle, timeout_ms=timeout_ms))
+
+        assert get_request_timeout(AttrObject(headers={'X-Timeout-Ms': '250'})) == 0.25
+        with pytest.raises(exceptions.RpcInvalidRequestError):
+            get_request_timeout(AttrObject(headers={'X-Timeout-Ms': 'qwe'}))
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class DeadlineRpcTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.handler]
+
+    async def test__handle_single(self, app: Sanic, loop):
+        pools_wrapper = mk_pools_wrapper(app, loop, lane_connections=4)
+        rpc = RedisRpc(pools_wrapper)
+        with pytest.raises(exceptions.RpcDeadlineExceededError) as e:
+            await rpc.handle_single(dict(mk_rpc_bundle('redis_1.blpop', ['deadline:empty']), timeout_ms=50))
+        assert e.value.error_code == -32003
+
+        status, = [bundle for bundle in await pools_wrapper.get_status() if bundle['name'] == 'redis_1']
+        assert status['lanes']['in_use'] == status['admission']['in_flight'] == 0, 'Expired calls free resources'
+        assert status['circuit']['failures'] == 0, 'An expired deadline is not a failure of a pool'
+
+        task = asyncio.ensure_future(rpc.handle_single(mk_rpc_bundle('redis_1.blpop', ['deadline:empty'])))
+        await asyncio.sleep(0.05)
+        task.cancel()  # the client has gone
+        await asyncio.wait([task])
+        assert pools_wrapper.get_lane_scheduler('redis_1').in_use == 0
+        await pools_wrapper.close()
+
+    async def test__handle_batch(self, app: Sanic, loop):
+        pools_wrapper = mk_pools_wrapper(app, loop, max_in_flight=1, lane_connections=4)
+        rpc = RedisRpc(pools_wrapper)
+        res = await rpc.handle_batch([
+            mk_rpc_bundle('redis_1.echo', ['qwe']),
+            mk_rpc_bundle('redis_1.echo', ['asd']),
+            mk_rpc_bundle('redis_1.blpop', ['deadline:empty']),
+            mk_rpc_bundle('redis_1.echo', ['zxc']),
+            mk_rpc_bundle('redis_0.echo', ['qwe']),
+        ], timeout=0.1)
+        assert [item.get('result', None) for item in res] == ['qwe', 'asd', None, None, 'qwe'], \
+            'Results of calls done by the deadline are returned'
+        assert [item['error']['code'] for item in res[2:4]] == [-32003, -32003]
+        assert pools_wrapper.get_admission_controller('redis_1').in_flight == 0
+        await pools_wrapper.close()
+
+    async def test__handle_transaction(self, app: Sanic, loop):
+        pools_wrapper = mk_pools_wrapper(app, loop, max_in_flight=1)
+        rpc = RedisRpc(pools_wrapper, timeouts={})
+        single = asyncio.ensure_future(
+            rpc.handle_single(dict(mk_rpc_bundle('redis_1.blpop', ['deadline:empty']), timeout_ms=100))
+        )
+        await asyncio.sleep(0.02)
+        res = await rpc.handle_batch([
+            mk_rpc_bundle('redis_1.multi_exec', []),
+            dict(mk_rpc_bundle('redis_1.echo', ['qwe']), timeout_ms=10),
+            mk_rpc_bundle('redis_1.echo', ['asd']),
+        ])
+        assert [item['error']['code'] for item in res] == [-32003, -32003], \
+            'Calls of a transaction expire together, whether they have a deadline or not'
+        assert res[1]['error']['data'] == {'timeout_ms': 10}
+        with pytest.raises(exceptions.RpcDeadlineExceededError):
+            await single
+        await pools_wrapper.close()
@@ -26,6 +26,13 @@ class RpcRequestTest:
         with pytest.raises(exceptions.RpcInvalidRequestError):
             RpcRequest([1])
 
+    def test__is_notify(self):
+        bundle = mk_rpc_bundle('qwe', [])
+        assert not RpcRequest(bundle).is_notify
+        assert not RpcRequest(dict(bundle, id=None)).is_notify, 'A null id is still an id'
+        del bundle['id']
+        assert RpcRequest(bundle).is_notify
+
 
 # noinspection PyMethodMayBeStatic,PyShadowingNames
 class RpcBatchRequestTest:
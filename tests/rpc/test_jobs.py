@@ -0,0 +1,762 @@
+import asyncio
+import os
+from contextlib import suppress
+from functools import partialmethod
+
+import aioredis
+import pytest
+from sanic import Sanic
+
+from sanic_redis_rpc.jobs import Job, JobRunner, BulkKeysJob, NamespaceJob, NamespaceTree, BigKeysJob, TopN, \
+    KeyspaceDiffJob, MigrationJob, ExportJob, ImportJob
+from sanic_redis_rpc.jobs.files import DumpFileReader, DumpFileWriter, get_dump_file_path
+from sanic_redis_rpc.jobs.exceptions import JobNotFoundError, JobFinishedError, WrongJobOptionError
+from sanic_redis_rpc.jobs.throttle import Throttle
+from sanic_redis_rpc.key_manager import KeyManager
+from sanic_redis_rpc.key_manager.exceptions import PageNotFoundError
+from sanic_redis_rpc.key_manager.stores import mk_result_store
+
+BULK_KEYS = ['bulk-test:%s' % i for i in range(20)]
+
+
+@pytest.fixture
+async def bulk_search(get_redis):
+    redis: aioredis.Redis = await get_redis('redis_0')
+    service_redis: aioredis.Redis = await get_redis('redis_1')
+    pipe = redis.pipeline()
+    pipe.delete(*BULK_KEYS, *['renamed:' + key for key in BULK_KEYS])
+    for key in BULK_KEYS:
+        pipe.set(key, key)
+    await pipe.execute()
+
+    info = await KeyManager(redis, service_redis).search('bulk-test:*', redis_name='redis_0')
+    return redis, service_redis, info
+
+
+# noinspection PyMethodMayBeStatic
+class ThrottleTest:
+    pytestmark = [pytest.mark.jobs]
+
+    async def test__acquire(self):
+        throttle = Throttle(ops_per_second=100)
+        started = asyncio.get_event_loop().time()
+        for __ in range(3):
+            await throttle.acquire(5)
+        # 10 operations are paced for 0.1 second, the first chunk is not delayed
+        assert asyncio.get_event_loop().time() - started >= 0.09
+
+        unlimited = Throttle()
+        await unlimited.acquire(10 ** 6)
+        assert unlimited.as_dict()['rate'] == 0
+
+    def test__feedback(self):
+        throttle = Throttle(ops_per_second=1000, target_latency=0.01)
+        throttle.feedback(100, 0.1)
+        assert throttle.rate == 500
+
+        throttle.feedback(100, 0.001)
+        assert throttle.rate == 600
+
+        for __ in range(10):
+            throttle.feedback(100, 0.001)
+        assert throttle.rate == 1000
+
+        adaptive = Throttle(target_latency=0.01)
+        adaptive.feedback(100, 0.1)
+        assert adaptive.rate == 500
+        assert Throttle(target_latency=1, min_ops_per_second=10).rate is None
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class BulkKeysJobTest:
+    pytestmark = [pytest.mark.jobs]
+
+    async def test__unlink(self, bulk_search, get_redis):
+        redis, service_redis, info = await bulk_search
+        job = BulkKeysJob(service_redis, get_redis, {
+            'search_id': info['id'], 'action': 'unlink', 'chunk_size': 7, 'ops_per_second': 10000
+        })
+        await job.create()
+        await job.execute()
+
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_DONE
+        assert job_info['processed'] == job_info['total'] == 20
+        assert job_info['result']['affected'] == 20
+        assert job_info['result']['errors'] == 0
+        assert await redis.exists(*BULK_KEYS) == 0
+
+    async def test__expire_persist_rename(self, bulk_search, get_redis):
+        redis, service_redis, info = await bulk_search
+
+        job = BulkKeysJob(service_redis, get_redis, {
+            'search_id': info['id'], 'action': 'expire', 'ttl_seconds': 100
+        })
+        await job.create()
+        await job.execute()
+        assert 0 < await redis.ttl(BULK_KEYS[0]) <= 100
+
+        job = BulkKeysJob(service_redis, get_redis, {'search_id': info['id'], 'action': 'persist'})
+        await job.create()
+        await job.execute()
+        assert await redis.ttl(BULK_KEYS[0]) == -1
+
+        job = BulkKeysJob(service_redis, get_redis, {
+            'search_id': info['id'], 'action': 'rename', 'prefix': 'renamed:'
+        })
+        await job.create()
+        await job.execute()
+        assert await redis.get('renamed:' + BULK_KEYS[0], encoding='utf8') == BULK_KEYS[0]
+        assert (await Job.get_info(service_redis, job.id))['result']['affected'] == 20
+        await redis.delete(*['renamed:' + key for key in BULK_KEYS])
+
+    async def test__cancel(self, bulk_search, get_redis):
+        redis, service_redis, info = await bulk_search
+        runner = JobRunner()
+        job = BulkKeysJob(service_redis, get_redis, {
+            'search_id': info['id'], 'action': 'persist', 'chunk_size': 1, 'ops_per_second': 20
+        })
+        await runner.start(job)
+        await asyncio.sleep(0.1)
+        await Job.request_cancel(service_redis, job.id)
+        await runner.wait(job.id)
+
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_CANCELLED
+        assert 0 < job_info['processed'] < 20
+        assert not runner.running
+        with pytest.raises(JobFinishedError):
+            await Job.request_cancel(service_redis, job.id)
+
+    async def test__exceptions(self, get_redis):
+        service_redis: aioredis.Redis = await get_redis('redis_1')
+        with pytest.raises(WrongJobOptionError):
+            BulkKeysJob(service_redis, get_redis, {'search_id': 'qwe', 'action': 'drop'})
+        with pytest.raises(WrongJobOptionError):
+            BulkKeysJob(service_redis, get_redis, {'search_id': 'qwe', 'action': 'expire'})
+        with pytest.raises(WrongJobOptionError):
+            BulkKeysJob(service_redis, get_redis, {'search_id': 'qwe', 'action': 'rename'})
+        with pytest.raises(JobNotFoundError):
+            await Job.get_info(service_redis, 'does-not-exist')
+
+        job = BulkKeysJob(service_redis, get_redis, {'search_id': 'does-not-exist', 'action': 'unlink'})
+        await job.create()
+        await job.execute()
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_FAILED
+        assert 'does-not-exist' in job_info['error']
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class NamespaceTreeTest:
+    pytestmark = [pytest.mark.jobs, pytest.mark.namespaces]
+
+    def test__split(self):
+        tree = NamespaceTree(delimiters=':_-', max_depth=3)
+        assert tree.split('user:1_session') == ['user:', '1_', 'session']
+        assert tree.split('a:b:c:d:') == ['a:', 'b:', 'c:d:']
+        assert tree.split('plain') == ['plain']
+        assert tree.split(':') == [':']
+
+    def test__add_and_prune(self):
+        tree = NamespaceTree(max_nodes=20)
+        for i in range(10):
+            tree.add('user:%s' % i, 'hash', 100)
+        tree.add('session:1', 'string', 10)
+        tree.add('session:2')
+        tree.add('session')
+
+        records = dict(tree.iter_records())
+        assert records['']['count'] == 13
+        assert records['session:']['count'] == 2
+        assert records['session:']['types'] == {'string': 1}
+        assert records['session:']['estimated_memory'] == 20
+        assert records['session']['keys'] == 1
+        assert records['']['children'][0] == 'user:'
+        assert tree.num_nodes == len(records)
+
+        # user:* leaves outnumber 3/4 of max_nodes and get folded into `user:`
+        for i in range(10, 20):
+            tree.add('user:%s' % i)
+        records = dict(tree.iter_records())
+        assert tree.num_nodes == len(records) <= 15
+        assert records['user:']['count'] == 20
+        assert records['user:']['other'] + sum(
+            records['user:' + segment]['count'] for segment in records['user:']['children']) == 20
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class NamespaceJobTest:
+    pytestmark = [pytest.mark.jobs, pytest.mark.namespaces]
+
+    async def test__run(self, bulk_search):
+        redis, service_redis, info = await bulk_search
+        job = NamespaceJob(service_redis, redis, {
+            'pattern': 'bulk-test:*', 'delimiters': ':', 'sample_rate': 0.5, 'scan_count': 7
+        })
+        await job.create()
+        await job.execute()
+
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_DONE
+        assert job_info['processed'] == 20
+
+        root = await NamespaceJob.get_node(service_redis, job.id, limit=10)
+        assert root['count'] == 20
+        assert root['num_children'] == 1
+        assert root['children'][0]['path'] == 'bulk-test:'
+        assert root['children'][0]['num_children'] == 20
+
+        node = await NamespaceJob.get_node(service_redis, job.id, 'bulk-test:', limit=5)
+        assert len(node['children']) == 5
+        assert node['types'] == {'string': 10}
+        assert node['estimated_memory'] > 0
+
+        with pytest.raises(PageNotFoundError):
+            await NamespaceJob.get_node(service_redis, job.id, 'nothing:')
+        with pytest.raises(WrongJobOptionError):
+            NamespaceJob(service_redis, redis, {'delimiters': ''})
+
+    async def test__cancel(self, bulk_search):
+        redis, service_redis, info = await bulk_search
+        runner = JobRunner()
+        job = NamespaceJob(service_redis, redis, {
+            'pattern': 'bulk-test:*', 'delimiters': ':', 'scan_count': 10, 'ops_per_second': 200, 'publish_interval': 0
+        })
+        await runner.start(job)
+        root = {'count': 0}
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            with suppress(PageNotFoundError):
+                root = await NamespaceJob.get_node(service_redis, job.id)
+            if root['count']:
+                break
+        assert 0 < root['count'] < 20, 'A tree is stored while a job runs'
+
+        await Job.request_cancel(service_redis, job.id)
+        await runner.wait(job.id)
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_CANCELLED
+        root = await NamespaceJob.get_node(service_redis, job.id)
+        assert root['count'] == job_info['result']['tree_processed'] > 0, 'Progress is kept once a job is cancelled'
+
+
+@pytest.fixture
+async def big_keys(get_redis):
+    redis: aioredis.Redis = await get_redis('redis_0')
+    pipe = redis.pipeline()
+    pipe.delete(*['bigkeys-test:%s' % i for i in range(30)])
+    for i in range(20):
+        pipe.set('bigkeys-test:%s' % i, 'x' * 100 * (i + 1))
+    for i in range(20, 30):
+        pipe.rpush('bigkeys-test:%s' % i, *['x' * 100] * (i - 19))
+    await pipe.execute()
+    return redis
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class BigKeysJobTest:
+    pytestmark = [pytest.mark.jobs, pytest.mark.bigkeys]
+
+    def test__top_n(self):
+        top = TopN(3)
+        for i in [5, 1, 7, 3, 9, 2]:
+            top.push(i, b'key:%d' % i, 'string')
+        assert [item['memory'] for item in top.as_list()] == [9, 7, 5]
+        assert TopN.from_list(2, top.as_list()).as_list() == top.as_list()[:2]
+
+        top.push(10, b'\xff\xfe', 'string')
+        assert top.as_list()[0] == {'key': '//4=', 'type': 'string', 'memory': 10, 'binary': True}
+        assert sorted(TopN.from_list(3, top.as_list())._heap) == sorted(top._heap), 'Binary keys survive a resume'
+
+    async def test__run(self, big_keys, get_redis):
+        redis = await big_keys
+        service_redis: aioredis.Redis = await get_redis('redis_1')
+        job = BigKeysJob(service_redis, redis, {'pattern': 'bigkeys-test:*', 'top': 3, 'scan_count': 7})
+        await job.create()
+        await job.execute()
+
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_DONE
+        result = job_info['result']
+        assert result['cursor'] == '0'
+        assert result['scanned'] == 30
+        assert [item['key'] for item in result['top_by_type']['string']] == [
+            'bigkeys-test:19', 'bigkeys-test:18', 'bigkeys-test:17'
+        ]
+        assert result['top_by_type']['list'][0]['key'] == 'bigkeys-test:29'
+        assert len(result['top']) == 3
+        assert result['totals']['string']['count'] == 20
+        assert result['totals']['list']['count'] == 10
+
+    async def test__resume(self, big_keys, get_redis):
+        redis = await big_keys
+        service_redis: aioredis.Redis = await get_redis('redis_1')
+        runner = JobRunner()
+        job = BigKeysJob(service_redis, redis, {
+            'pattern': 'bigkeys-test:*', 'top': 3, 'scan_count': 1, 'ops_per_second': 50, 'publish_interval': 0
+        })
+        await runner.start(job)
+        await asyncio.sleep(0.1)
+        await Job.request_cancel(service_redis, job.id)
+        await runner.wait(job.id)
+
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_CANCELLED
+        assert job_info['result']['cursor'] != '0'
+
+        resumed = BigKeysJob(service_redis, redis, {'pattern': 'bigkeys-test:*', 'top': 3, 'resume': job.id})
+        await resumed.create()
+        await resumed.execute()
+
+        result = (await Job.get_info(service_redis, resumed.id))['result']
+        assert result['scanned'] == 30
+        assert result['totals']['string']['count'] + result['totals']['list']['count'] == 30
+        assert result['top_by_type']['string'][0]['key'] == 'bigkeys-test:19'
+
+        with pytest.raises(WrongJobOptionError):
+            BigKeysJob(service_redis, redis, {'top': 0})
+        for options in [
+            {'pattern': 'other:*', 'top': 3, 'resume': job.id},
+            {'pattern': 'bigkeys-test:*', 'resume': job.id},
+            {'pattern': 'bigkeys-test:*', 'top': 3, 'resume': resumed.id},
+            {'pattern': 'bigkeys-test:*', 'top': 3, 'resume': 'does-not-exist'},
+        ]:
+            with pytest.raises(WrongJobOptionError):
+                await BigKeysJob(service_redis, redis, options).restore()
+
+
+@pytest.fixture
+async def diff_keys(get_redis):
+    redis_a: aioredis.Redis = await get_redis('redis_0')
+    redis_b: aioredis.Redis = await get_redis('redis_1')
+    names = ['only_a', 'only_b', 'same', 'same_hash', 'changed', 'changed_type'] + ['bulk_%s' % i for i in range(5)]
+    for redis in [redis_a, redis_b]:
+        await redis.delete(*['diff-test:%s' % name for name in names])
+
+    for redis in [redis_a, redis_b]:
+        pipe = redis.pipeline()
+        pipe.set('diff-test:same', 'value')
+        pipe.hmset_dict('diff-test:same_hash', {'a': 1, 'b': 2})
+        for i in range(5):
+            pipe.set('diff-test:bulk_%s' % i, i)
+        await pipe.execute()
+
+    await redis_a.set('diff-test:only_a', 1)
+    await redis_b.set('diff-test:only_b', 1)
+    await redis_a.set('diff-test:changed', 1)
+    await redis_b.set('diff-test:changed', 2)
+    await redis_a.set('diff-test:changed_type', 1)
+    await redis_b.sadd('diff-test:changed_type', 1)
+    return redis_a, redis_b
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class KeyspaceDiffJobTest:
+    pytestmark = [pytest.mark.jobs, pytest.mark.diff]
+
+    async def test__run(self, diff_keys, get_redis):
+        redis_a, redis_b = await diff_keys
+        job = KeyspaceDiffJob(redis_b, get_redis, {
+            'redis_a': 'redis_0', 'redis_b': 'redis_1', 'pattern': 'diff-test:*', 'chunk_size': 2, 'scan_count': 3
+        })
+        await job.create()
+        await job.execute()
+
+        job_info = await Job.get_info(redis_b, job.id)
+        assert job_info['status'] == Job.STATUS_DONE
+        result = job_info['result']
+        assert result['only_in_a'] == 1
+        assert result['only_in_b'] == 1
+        assert result['different'] == 2
+        assert result['same'] == 7
+        assert job_info['processed'] == job_info['total'] == 20
+        assert not await redis_b.exists(job._mk_keys_key('a'), job._mk_keys_key('b'))
+
+        km = KeyManager(None, redis_b)
+        info = await km.get_search_info(result['search_id'])
+        assert info['count'] == 4
+        assert info['pools'] == ['redis_0', 'redis_1']
+        assert await km.get_page(result['search_id'], 1) == [
+            {'redis_name': 'redis_0', 'key': 'diff-test:changed'},
+            {'redis_name': 'redis_0', 'key': 'diff-test:changed_type'},
+            {'redis_name': 'redis_0', 'key': 'diff-test:only_a'},
+            {'redis_name': 'redis_1', 'key': 'diff-test:only_b'},
+        ]
+
+        only_b, different = info['children'][1], info['children'][2]
+        assert (await km.get_search_info(only_b))['redis_name'] == 'redis_1'
+        assert (await km.get_search_info(different))['diff'] == 'different'
+        assert await km.get_page(different, 1) == ['diff-test:changed', 'diff-test:changed_type']
+
+        job = KeyspaceDiffJob(redis_b, get_redis, {
+            'redis_a': 'redis_0', 'redis_b': 'redis_1', 'pattern': 'diff-test:*', 'compare_values': False
+        })
+        await job.create()
+        await job.execute()
+        result = (await Job.get_info(redis_b, job.id))['result']
+        assert result['different'] == 0
+        assert result['same'] == 9
+
+        with pytest.raises(WrongJobOptionError):
+            KeyspaceDiffJob(redis_b, get_redis, {'redis_a': 'redis_0'})
+
+    @pytest.mark.parametrize('store', ['chunked', 'file'])
+    async def test__result_stores(self, diff_keys, get_redis, store, tmpdir):
+        redis_a, redis_b = await diff_keys
+        result_store = mk_result_store(redis_b, store, results_dir=str(tmpdir.join('results')))
+        job = KeyspaceDiffJob(redis_b, get_redis, {
+            'redis_a': 'redis_0', 'redis_b': 'redis_1', 'pattern': 'diff-test:*', 'chunk_size': 2, 'scan_count': 3
+        }, result_store=result_store)
+        await job.create()
+        await job.execute()
+
+        result = (await Job.get_info(redis_b, job.id))['result']
+        km = KeyManager(None, redis_b)
+        info = await km.get_search_info(result['search_id'])
+        assert info['store'] == store
+        assert [item['key'] for item in await km.get_page(result['search_id'], 1)] == [
+            'diff-test:changed', 'diff-test:changed_type', 'diff-test:only_a', 'diff-test:only_b',
+        ], 'Saving search bundles keeps appended results'
+        only_a, only_b, different = info['children']
+        assert await km.get_page(only_b, 1) == ['diff-test:only_b']
+        assert await km.get_page(different, 1) == ['diff-test:changed', 'diff-test:changed_type']
+
+
+@pytest.fixture
+async def migrate_keys(get_redis):
+    source: aioredis.Redis = await get_redis('redis_0')
+    target: aioredis.Redis = await get_redis('redis_1')
+    keys = ['migrate-test:%s' % i for i in range(10)]
+    # keys of the export test are left behind if it fails
+    await source.delete(*keys, 'migrate-test:big', 'migrate-test:expiring')
+    await target.delete(*keys, 'migrate-test:big', 'migrate-test:expiring')
+
+    pipe = source.pipeline()
+    for i, key in enumerate(keys):
+        pipe.rpush(key, *range(i + 1))
+    pipe.expire(keys[0], 100)
+    await pipe.execute()
+    await target.set(keys[1], 'existing')
+    return source, target, keys
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class MigrationJobTest:
+    pytestmark = [pytest.mark.jobs, pytest.mark.migrate]
+
+    async def _run(self, service_redis, get_redis, **options) -> dict:
+        job = MigrationJob(service_redis, get_redis, dict({
+            'source': 'redis_0', 'target': 'redis_1', 'window_size': 3, 'in_flight': 2, 'scan_count': 4
+        }, **options))
+        await job.create()
+        await job.execute()
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_DONE, job_info.get('error')
+        return job_info['result']
+
+    async def test__migrate(self, migrate_keys, get_redis):
+        source, target, keys = await migrate_keys
+
+        result = await self._run(target, get_redis, pattern='migrate-test:*', dry_run=True, skip_existing=True)
+        assert (result['copied'], result['skipped'], result['dry_run']) == (9, 1, True)
+        assert await target.exists(*keys) == 1
+
+        result = await self._run(target, get_redis, pattern='migrate-test:*', skip_existing=True)
+        assert (result['copied'], result['skipped'], result['errors']) == (9, 1, 0)
+        assert result['bytes'] > 0
+        assert await target.get(keys[1], encoding='utf8') == 'existing'
+        assert await target.lrange(keys[5], 0, -1, encoding='utf8') == [str(i) for i in range(6)]
+        assert 0 < await target.ttl(keys[0]) <= 100
+        assert await target.ttl(keys[2]) == -1
+
+        info = await KeyManager(source, target).search('migrate-test:*', redis_name='redis_0')
+        result = await self._run(target, get_redis, search_id=info['id'], delete_source=True)
+        assert (result['copied'], result['deleted']) == (10, 10)
+        assert await source.exists(*keys) == 0
+        assert await target.lrange(keys[1], 0, -1, encoding='utf8') == ['0', '1']
+
+        info = await KeyManager(target, target).search('migrate-test:*', redis_name='redis_1')
+        job = MigrationJob(target, get_redis, {'source': 'redis_0', 'target': 'redis_1', 'search_id': info['id']})
+        await job.create()
+        await job.execute()
+        job_info = await Job.get_info(target, job.id)
+        assert job_info['status'] == Job.STATUS_FAILED, 'A search is only used with the pool it has been made on'
+        assert 'search_id' in job_info['error']
+
+    async def test__exceptions(self, get_redis):
+        service_redis: aioredis.Redis = await get_redis('redis_1')
+        for options in [
+            {'source': 'redis_0'},
+            {'source': 'redis_0', 'target': 'redis_0'},
+            {'source': 'redis_0', 'target': 'redis_1', 'pattern': '*', 'search_id': 'qwe'},
+            {'source': 'redis_0', 'target': 'redis_1', 'dry_run': True, 'delete_source': True},
+        ]:
+            with pytest.raises(WrongJobOptionError):
+                MigrationJob(service_redis, get_redis, options)
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class ExportImportJobTest:
+    pytestmark = [pytest.mark.jobs, pytest.mark.files]
+
+    async def test__export_import(self, migrate_keys, get_redis, tmpdir):
+        source, target, keys = await migrate_keys
+        await source.set('migrate-test:big', 'x' * 10000)
+        await source.set('migrate-test:expiring', 1)
+        await source.pexpire('migrate-test:expiring', 500)
+
+        for compress in [False, True]:
+            job = ExportJob(target, source, str(tmpdir), {
+                'pattern': 'migrate-test:*', 'compress': compress, 'scan_count': 3, 'redis_name': 'redis_0'
+            })
+            await job.create()
+            await job.execute()
+            job_info = await Job.get_info(target, job.id)
+            assert job_info['status'] == Job.STATUS_DONE, job_info.get('error')
+            assert job_info['result']['exported'] == 12
+            assert job_info['options']['file_name'].endswith('.rdump.gz' if compress else '.rdump')
+            assert not os.path.exists(job.path + '.part')
+
+            records = {key: (expire_at, dump) for key, expire_at, dump in DumpFileReader(job.path).iter_records()}
+            assert len(records) == 12
+            assert records[b'migrate-test:5'][1] == await source.dump('migrate-test:5')
+            assert records[b'migrate-test:5'][0] == 0
+            assert records[b'migrate-test:0'][0] > 0
+            if compress:
+                assert job_info['result']['file_size'] < job_info['result']['bytes']
+
+        options = {'pattern': 'migrate-test:*', 'file_name': job_info['options']['file_name']}
+        with pytest.raises(WrongJobOptionError):
+            ExportJob(target, source, str(tmpdir), options)
+        job = ExportJob(target, source, str(tmpdir), dict(options, overwrite=True, compress=True))
+        await job.create()
+        await job.execute()
+        assert (await Job.get_info(target, job.id))['status'] == Job.STATUS_DONE
+
+        await asyncio.sleep(0.5)
+        job = ImportJob(target, target, str(tmpdir), {'file_name': job_info['options']['file_name'], 'window_size': 5})
+        await job.create()
+        await job.execute()
+        result = (await Job.get_info(target, job.id))['result']
+        assert (result['restored'], result['skipped'], result['expired'], result['errors']) == (10, 1, 1, 0)
+        assert await target.get(keys[1], encoding='utf8') == 'existing'
+        assert await target.get('migrate-test:big', encoding='utf8') == 'x' * 10000
+        assert 0 < await target.ttl(keys[0]) <= 100
+        await source.delete('migrate-test:big')
+        await target.delete(*keys, 'migrate-test:big')
+
+    async def test__export_failure(self, migrate_keys, tmpdir, monkeypatch):
+        source, target, keys = await migrate_keys
+
+        async def flush(writer):
+            raise OSError('No space left on device')
+
+        monkeypatch.setattr(DumpFileWriter, 'flush', flush)
+        monkeypatch.setattr(DumpFileWriter, '__init__', partialmethod(DumpFileWriter.__init__, block_size=1))
+        options = {'pattern': 'migrate-test:*', 'file_name': 'failed.rdump', 'compress': True}
+        job = ExportJob(target, source, str(tmpdir), dict(options, scan_count=3))
+        await job.create()
+        await job.execute()
+        job_info = await Job.get_info(target, job.id)
+        assert job_info['status'] == Job.STATUS_FAILED and 'No space left' in job_info['error'], \
+            'A write error is not masked'
+        assert os.listdir(str(tmpdir)) == [], 'A partial file is removed'
+        ExportJob(target, source, str(tmpdir), options)
+
+    def test__dump_file_path(self, tmpdir):
+        assert get_dump_file_path('/tmp', 'qwe.rdump') == '/tmp/qwe.rdump'
+        for file_name in ['', '../qwe', '/etc/passwd', '.hidden', 'a/b']:
+            with pytest.raises(WrongJobOptionError):
+                get_dump_file_path('/tmp', file_name)
+
+        path = str(tmpdir.join('broken.rdump'))
+        with open(path, 'wb') as f:
+            f.write(b'SRRDUMP1' + b'\x00' * 10)
+        with pytest.raises(ValueError):
+            list(DumpFileReader(path).iter_records())
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class JobViewsTest:
+    pytestmark = [pytest.mark.jobs, pytest.mark.views]
+
+    async def test__bulk(self, app: Sanic, test_cli, bulk_search):
+        await bulk_search
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.search', redis_name='redis_0'),
+            json={'pattern': 'bulk-test:*'}
+        )
+        info = await resp.json()
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_bulk_job', search_id=info['id']),
+            json={'action': 'expire', 'ttl_seconds': 100, 'chunk_size': 5}
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['kind'] == 'bulk'
+        assert resp_json['options']['search_id'] == info['id']
+
+        await app._job_runner.wait(resp_json['id'])
+        resp = await test_cli.get(resp_json['endpoints']['get_job_info'])
+        resp_json = await resp.json()
+        assert resp_json['status'] == 'done'
+        assert resp_json['result']['affected'] == 20
+
+        resp = await test_cli.post(resp_json['endpoints']['cancel_job'])
+        assert resp.status == 409, 'A finished job can not be cancelled'
+        resp = await test_cli.get(resp_json['endpoints']['get_job_info'])
+        assert (await resp.json())['status'] == 'done'
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_bulk_job', search_id=info['id']),
+            json={'action': 'expire', 'ttl_seconds': 'qwe'}
+        )
+        assert resp.status == 400
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_bulk_job', search_id=info['id']),
+            json={'action': 'expire', 'ttl_seconds': 100, 'chunk_size': None}
+        )
+        assert resp.status == 400
+        resp = await test_cli.post(app.url_for('sanic-redis-rpc.start_bulk_job', search_id=info['id']), json=[1])
+        assert resp.status == 400
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_bulk_job', search_id=info['id']),
+            json={'action': 'rename'}
+        )
+        assert resp.status == 400
+
+        resp = await test_cli.get(app.url_for('sanic-redis-rpc.get_job_info', job_id='does-not-exist'))
+        assert resp.status == 404
+
+    async def test__namespaces(self, app: Sanic, test_cli, bulk_search):
+        await bulk_search
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_namespaces_job', redis_name='redis_0'),
+            json={'pattern': 'bulk-test:*', 'delimiters': ':'}
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['kind'] == 'namespaces'
+        await app._job_runner.wait(resp_json['id'])
+
+        resp = await test_cli.get(resp_json['endpoints']['get_namespace_node'])
+        resp_json = await resp.json()
+        assert resp_json['count'] == 20
+        assert len(resp_json['endpoints']['children']) == 1
+
+        resp = await test_cli.get(resp_json['endpoints']['children'][0] + '&limit=3')
+        resp_json = await resp.json()
+        assert resp_json['path'] == 'bulk-test:'
+        assert len(resp_json['children']) == 3
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_namespaces_job', redis_name='does-not-exist'), json={}
+        )
+        assert resp.status == 404
+
+    async def test__bigkeys(self, app: Sanic, test_cli, big_keys):
+        await big_keys
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_bigkeys_job', redis_name='redis_0'),
+            json={'pattern': 'bigkeys-test:*', 'top': 2}
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['kind'] == 'bigkeys'
+        await app._job_runner.wait(resp_json['id'])
+
+        resp = await test_cli.get(resp_json['endpoints']['get_job_info'])
+        resp_json = await resp.json()
+        assert resp_json['status'] == 'done'
+        assert [item['key'] for item in resp_json['result']['top_by_type']['string']] == [
+            'bigkeys-test:19', 'bigkeys-test:18'
+        ]
+
+        for resume in ['does-not-exist', resp_json['id']]:
+            resp = await test_cli.post(
+                app.url_for('sanic-redis-rpc.start_bigkeys_job', redis_name='redis_0'),
+                json={'pattern': 'bigkeys-test:*', 'top': 2, 'resume': resume}
+            )
+            assert resp.status == 400, 'A job to resume is checked before a job starts'
+
+    async def test__diff(self, app: Sanic, test_cli, diff_keys):
+        await diff_keys
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_diff_job'),
+            json={'redis_a': 'redis_0', 'redis_b': 'redis_1', 'pattern': 'diff-test:*'}
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['kind'] == 'diff'
+        await app._job_runner.wait(resp_json['id'])
+
+        resp = await test_cli.get(resp_json['endpoints']['get_job_info'])
+        resp_json = await resp.json()
+        assert resp_json['status'] == 'done'
+
+        resp = await test_cli.get(resp_json['endpoints']['get_search_info'])
+        resp_json = await resp.json()
+        assert resp_json['count'] == 4
+
+        resp = await test_cli.post(app.url_for('sanic-redis-rpc.start_diff_job'), json={'redis_a': 'redis_0'})
+        assert resp.status == 400
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_diff_job'), json={'redis_a': 'redis_0', 'redis_b': 'nothing'})
+        assert resp.status == 404
+
+    async def test__migrate(self, app: Sanic, test_cli, migrate_keys):
+        source, target, keys = await migrate_keys
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_migration_job'),
+            json={'source': 'redis_0', 'target': 'redis_1', 'pattern': 'migrate-test:*'}
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['kind'] == 'migrate'
+        await app._job_runner.wait(resp_json['id'])
+
+        resp = await test_cli.get(resp_json['endpoints']['get_job_info'])
+        resp_json = await resp.json()
+        assert resp_json['status'] == 'done'
+        assert resp_json['result']['copied'] == 10
+        assert await target.exists(*keys) == 10
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_migration_job'), json={'source': 'redis_0', 'target': 'nothing'})
+        assert resp.status == 404
+
+    async def test__export_import(self, app: Sanic, test_cli, migrate_keys, tmpdir):
+        source, target, keys = await migrate_keys
+        app.config.export_dir = str(tmpdir)
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_export_job', redis_name='redis_0'),
+            json={'pattern': 'migrate-test:*', 'file_name': 'migrate.rdump'}
+        )
+        assert resp.status == 200
+        await app._job_runner.wait((await resp.json())['id'])
+        assert os.path.isfile(str(tmpdir.join('migrate.rdump')))
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_export_job', redis_name='redis_0'),
+            json={'pattern': 'migrate-test:*', 'file_name': 'migrate.rdump'}
+        )
+        assert resp.status == 400, 'An existing file is not overwritten'
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_import_job', redis_name='redis_1'),
+            json={'file_name': 'migrate.rdump', 'replace': True}
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        await app._job_runner.wait(resp_json['id'])
+        resp = await test_cli.get(resp_json['endpoints']['get_job_info'])
+        assert (await resp.json())['result']['restored'] == 10
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_import_job', redis_name='redis_1'), json={'file_name': '../etc'})
+        assert resp.status == 400
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_import_job', redis_name='redis_1'), json={'file_name': 'nothing'})
+        assert resp.status == 400
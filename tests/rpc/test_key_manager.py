@@ -1,4 +1,7 @@
+import asyncio
+import os
 import random
+from functools import partial
 from itertools import permutations, chain
 
 import aioredis
@@ -6,6 +9,18 @@ import pytest
 
 from sanic_redis_rpc.key_manager.exceptions import WrongNumberError, WrongPageSizeError, PageNotFoundError, SearchIdNotFoundError
 from sanic_redis_rpc.key_manager import KeyManager
+from sanic_redis_rpc.key_manager.federated import FederatedKeyManager
+from sanic_redis_rpc.key_manager.browser import CollectionBrowser
+from sanic_redis_rpc.key_manager.exceptions import WrongCursorError
+from sanic_redis_rpc.key_manager.values import KeyValuesLoader
+from sanic_redis_rpc.key_manager.exceptions import WrongPatternError, WrongMetadataFieldError
+from sanic_redis_rpc.key_manager.metadata import parse_metadata_fields, METADATA_FIELDS
+from sanic_redis_rpc.key_manager.exceptions import WrongSamplingMethodError
+from sanic_redis_rpc.key_manager.stats import KeyspaceSampler, wilson_interval
+from sanic_redis_rpc.key_manager.patterns import KeyPattern, get_scan_match, regex_literal_prefix
+from sanic_redis_rpc.key_manager.live_index import LiveKeyIndex
+from sanic_redis_rpc.key_manager.stores import ResultStore, RedisListResultStore, ChunkedResultStore, \
+    FileResultStore, get_result_store, mk_result_store
 
 COMB_PARTS = sorted({
     'anonymous',
@@ -68,9 +83,9 @@ class KeyManagerTest:
     async def test__init(self, key_manager):
         assert await key_manager
 
-    async def test___get_sorted_keys(self, key_manager):
+    async def test__get_sorted_keys(self, key_manager):
         km = await key_manager
-        sorted_keys = await km._get_sorted_keys(KEYS_LOOKUP_PATTERN)
+        sorted_keys = await km.get_sorted_keys(KEYS_LOOKUP_PATTERN)
         assert len(sorted_keys) >= len(ALL_COMBINATIONS), \
             'Ensure count of keys retrieved from redis cannot be less than count of all combinations'
 
@@ -197,6 +212,98 @@ class KeyManagerTest:
         km = await key_manager
         assert await km._get_match_count(KEYS_LOOKUP_PATTERN) >= len(ALL_COMBINATIONS)
 
+    async def test__search_many(self, key_manager):
+        km: KeyManager = await key_manager
+        search = await km.search_many(
+            ['sanic-redis-rpc-test:bool:*', 'sanic-redis-rpc-test:[ab]ower:*'],
+            [r'^sanic-redis-rpc-test:chai:.*:cheat$'],
+            ttl_seconds=10, redis_name='redis_0'
+        )
+        assert search['pattern'] == 'sanic-redis-rpc-test:*', 'Ensure a common prefix is used for SCAN MATCH'
+        assert len(search['searches']) == 3
+        assert search['children'] == [child['id'] for child in search['searches']]
+
+        expected = [
+            [k for k in ALL_KEYS if k.startswith('sanic-redis-rpc-test:bool:')],
+            [k for k in ALL_KEYS if k.startswith('sanic-redis-rpc-test:bower:')],
+            [k for k in ALL_KEYS if k.startswith('sanic-redis-rpc-test:chai:') and k.endswith(':cheat')],
+        ]
+        for child, expected_keys in zip(search['searches'], expected):
+            assert child['count'] == len(expected_keys)
+            assert await km.get_page(child['id'], 1, 1000) == expected_keys
+
+        union = sorted(set(chain(*expected)))
+        assert search['count'] == len(union)
+        assert await km.get_page(search['id'], 1, 1000) == union, 'Parent search must hold a union of matches'
+
+        info = await km.get_search_info(search['searches'][2]['id'])
+        assert info['regex'] == 1
+        assert info['parent'] == search['id']
+
+        assert await km.refresh_ttl(search['id'], 20) == [True, True]
+        assert await km.service_redis.ttl(km._mk_results_key(search['children'][0])) >= 19, \
+            'Ensure per-pattern searches TTL updated with the parent'
+
+    async def test__search_many__exceptions(self, key_manager):
+        km: KeyManager = await key_manager
+
+        with pytest.raises(ValueError):
+            await km.search_many([], [])
+
+        with pytest.raises(WrongPatternError):
+            await km.search_many([], ['(unbalanced'])
+
+    async def test__federated_search(self, key_manager, get_redis):
+        km: KeyManager = await key_manager
+        redis1: aioredis.Redis = await get_redis('redis_1')
+        await redis1.set('sanic-redis-rpc-test:bool:federated', 1, expire=10)
+
+        fkm = FederatedKeyManager({'redis_0': km.redis, 'redis_1': redis1}, km.service_redis, concurrency=1)
+        search = await fkm.search('sanic-redis-rpc-test:bool:*', ttl_seconds=10)
+        assert search['pools'] == ['redis_0', 'redis_1']
+        assert search['counts']['redis_1'] >= 1
+
+        page = await fkm.get_page(search['id'], 1, 1000)
+        assert len(page) == search['count']
+        assert [(item['key'], item['redis_name']) for item in page] == sorted(
+            (item['key'], item['redis_name']) for item in page
+        ), 'Ensure results are globally sorted'
+        assert {'redis_name': 'redis_1', 'key': 'sanic-redis-rpc-test:bool:federated'} in page
+
+        info = await fkm.get_search_info(search['id'])
+        assert info['pools'] == ['redis_0', 'redis_1']
+
+    async def test__get_metadata_loader(self, key_manager):
+        km: KeyManager = await key_manager
+        await km.redis.set('metadata-test:persistent', 'value')
+        search = await km.search('sanic-redis-rpc-test:*', sort_keys=True, ttl_seconds=10)
+        keys = await km.get_page(search['id'], 1, 10)
+
+        loader = km.get_metadata_loader(search['id'], 10)
+        metadata = await loader.load(keys + ['metadata-test:persistent', 'does_not_exist'])
+        assert len(metadata) == 12
+        assert set(metadata[0].keys()) == set(METADATA_FIELDS)
+        assert metadata[0]['type'] == (await km.redis.type(keys[0])).decode()
+        assert 0 < metadata[0]['ttl'] <= 60
+        assert metadata[0]['memory'] > 0
+        assert metadata[10]['ttl'] == -1, 'Persistent keys have no ttl'
+        assert metadata[11] == {'type': 'none', 'ttl': -2, 'encoding': None, 'memory': None}
+
+        cached = await km.service_redis.hgetall(km.mk_metadata_key(search['id']))
+        assert len(cached) == 12, 'Ensure metadata is cached'
+        assert await km.service_redis.ttl(km.mk_metadata_key(search['id'])) > 0
+
+        await km.redis.delete('metadata-test:persistent')
+        assert (await loader.load(['metadata-test:persistent'], ['type']))[0]['type'] == 'string', \
+            'Metadata must be served from the cache'
+
+    def test__parse_metadata_fields(self):
+        assert parse_metadata_fields(None) == []
+        assert parse_metadata_fields('all') == list(METADATA_FIELDS)
+        assert parse_metadata_fields('type, ttl') == ['type', 'ttl']
+        with pytest.raises(WrongMetadataFieldError):
+            parse_metadata_fields('type,size')
+
     async def test__refresh_ttl(self, key_manager):
         km: KeyManager = await key_manager
         search = await km.search(KEYS_LOOKUP_PATTERN, sort_keys=True, ttl_seconds=1)
@@ -211,7 +318,7 @@ class KeyManagerTest:
     @pytest.mark.skip
     async def test__get_all_keys_set(self, key_manager):
         km = await key_manager
-        sorted_keys = await km._get_sorted_keys('*')
+        sorted_keys = await km.get_sorted_keys('*')
         assert len(sorted_keys)
 
     @pytest.mark.skip
@@ -231,3 +338,382 @@ class KeyManagerTest:
                 await redis1.type(k), await redis1.ttl(k),
                 await redis1.delete(k)
             )
+
+
+# noinspection PyMethodMayBeStatic
+class KeyPatternTest:
+    pytestmark = [pytest.mark.key_manager, pytest.mark.patterns]
+
+    def test__glob(self):
+        assert KeyPattern('user:*').match(b'user:1')
+        assert not KeyPattern('user:*').match(b'xuser:1'), 'Globs must match the whole key'
+        assert KeyPattern('h?llo').match(b'hallo')
+        assert KeyPattern('h[^e]llo').match(b'hallo')
+        assert not KeyPattern('h[^e]llo').match(b'hello')
+        assert KeyPattern('h[a-b]llo').match(b'hbllo')
+        assert KeyPattern(r'h\*llo').match(b'h*llo')
+        assert not KeyPattern(r'h\*llo').match(b'heello')
+        assert KeyPattern('a[bc').match(b'a[bc'), 'Unclosed class is a literal'
+
+    def test__regex(self):
+        assert KeyPattern(r'\d+$', regex=True).match(b'user:42')
+        assert not KeyPattern(r'^\d+$', regex=True).match(b'user:42')
+
+    def test__prefix(self):
+        assert KeyPattern(r'user\*:*').prefix == 'user*:'
+        assert regex_literal_prefix(r'^user:\d+') == 'user:'
+        assert regex_literal_prefix(r'^users?:') == 'user'
+        assert regex_literal_prefix(r'^ab+c') == 'ab'
+        assert regex_literal_prefix(r'^a\.b') == 'a.b'
+        assert regex_literal_prefix(r'^a|^b') == ''
+        assert regex_literal_prefix(r'user') == ''
+
+    def test__get_scan_match(self):
+        assert get_scan_match([KeyPattern('user:1*'), KeyPattern('user:2*')]) == 'user:*'
+        assert get_scan_match([KeyPattern('user:*'), KeyPattern('session', regex=True)]) == '*'
+        assert get_scan_match([KeyPattern('us?r:*')]) == 'us*'
+        assert get_scan_match([KeyPattern(r'a\[*')]) == r'a\[*'
+
+
+@pytest.fixture
+async def value_keys(get_redis):
+    redis: aioredis.Redis = await get_redis('redis_0')
+    pipe = redis.pipeline()
+    pipe.delete(*['values-test:%s' % name for name in ['string', 'big', 'hash', 'set', 'zset', 'list', 'stream']])
+    pipe.set('values-test:string', 'value')
+    pipe.set('values-test:big', 'x' * 100)
+    pipe.hmset_dict('values-test:hash', {'f%s' % i: i for i in range(3)})
+    pipe.sadd('values-test:set', *range(300))
+    pipe.zadd('values-test:zset', *chain(*[(i, 'm%s' % i) for i in range(5)]))
+    pipe.rpush('values-test:list', *range(5))
+    pipe.xadd('values-test:stream', {'field': 'value'})
+    await pipe.execute()
+    return redis
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class KeyValuesLoaderTest:
+    pytestmark = [pytest.mark.key_manager, pytest.mark.values]
+
+    async def test__load(self, value_keys):
+        redis = await value_keys
+        loader = KeyValuesLoader(redis, max_elements=3, max_bytes=10)
+
+        keys = ['values-test:%s' % name for name in ['string', 'big', 'hash', 'set', 'zset', 'list', 'stream']]
+        assert await loader.load([]) == []
+        string, big, hash_, set_, zset, list_, stream, missing = await loader.load(
+            keys + ['values-test:does_not_exist'])
+
+        assert string == {
+            'key': 'values-test:string', 'type': 'string', 'length': 5,
+            'truncated': False, 'cursor': None, 'value': 'value'
+        }
+        assert big['value'] == 'x' * 10
+        assert big['truncated'] and big['cursor'] == 10 and big['length'] == 100
+
+        assert hash_['value'] == {'f0': '0', 'f1': '1', 'f2': '2'}
+        assert not hash_['truncated']
+
+        assert set_['truncated'] and set_['cursor'], 'Big sets must be scanned'
+        assert set_['length'] == 300
+        assert len(set_['value']) == 3
+
+        assert zset['value'] == [['m0', 0], ['m1', 1], ['m2', 2]]
+        assert zset['truncated'] and zset['cursor'] == 3
+
+        assert list_['value'] == ['0', '1', '2']
+        assert list_['cursor'] == 3
+
+        assert stream['value'][0][1] == {'field': 'value'}
+        assert not stream['truncated']
+
+        assert missing['type'] == 'none'
+        assert missing['value'] is None
+
+
+async def browse_all(redis: aioredis.Redis, key: str, **kwargs):
+    cursor, calls, elements = None, 0, []
+    while True:
+        browser = CollectionBrowser(redis, **kwargs)
+        bundle, batches = await browser.browse(key, cursor)
+        async for batch in batches:
+            elements += batch
+        calls += 1
+        cursor = browser.next_cursor
+        if cursor is None:
+            return bundle, elements, calls
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class CollectionBrowserTest:
+    pytestmark = [pytest.mark.key_manager, pytest.mark.browser]
+
+    async def test__browse_set(self, value_keys):
+        redis = await value_keys
+        await redis.sadd('values-test:set', *['m%s' % i for i in range(1000)])  # convert intset to hashtable
+
+        bundle, elements, calls = await browse_all(redis, 'values-test:set', max_elements=70, scan_count=30)
+        assert bundle['type'] == 'set'
+        assert len(elements) == len(set(elements)) == 1300, 'Ensure every member is returned exactly once'
+        assert calls >= 1300 // 70
+
+    async def test__browse_small_hash(self, value_keys):
+        redis = await value_keys
+        bundle, elements, calls = await browse_all(redis, 'values-test:hash', max_elements=2)
+        assert sorted(elements) == [['f0', '0'], ['f1', '1'], ['f2', '2']]
+        assert calls == 2, 'Small encodings return everything at once but the budget must be respected'
+
+    async def test__browse_windows(self, value_keys):
+        redis = await value_keys
+        __, elements, calls = await browse_all(redis, 'values-test:list', max_elements=2)
+        assert elements == ['0', '1', '2', '3', '4']
+        assert calls == 3
+
+        __, elements, __ = await browse_all(redis, 'values-test:zset', max_elements=4)
+        assert elements == [['m%s' % i, i] for i in range(5)]
+
+        __, elements, calls = await browse_all(redis, 'values-test:big', max_bytes=30)
+        assert ''.join(elements) == 'x' * 100
+        assert calls == 4
+
+        await redis.xadd('values-test:stream', {'field': 'value2'})
+        __, elements, calls = await browse_all(redis, 'values-test:stream', max_elements=1)
+        assert [fields for __, fields in elements] == [{'field': 'value'}, {'field': 'value2'}]
+
+    async def test__browse_byte_budget(self, value_keys):
+        redis = await value_keys
+        browser = CollectionBrowser(redis, max_bytes=2)
+        __, batches = await browser.browse('values-test:list')
+        assert [element async for batch in batches for element in batch] == ['0', '1']
+        assert browser.next_cursor == 2
+
+    async def test__browse_wrong_cursor(self, value_keys):
+        redis = await value_keys
+        for key, cursor in [
+            ('list', 'abc'), ('list', '-1'), ('zset', '1.5'), ('string', '-10'),
+            ('set', '-1'), ('set', '1:-2'), ('hash', 'qwe:1'), ('stream', 'qwe'), ('stream', '1-a'),
+        ]:
+            with pytest.raises(WrongCursorError):
+                await CollectionBrowser(redis).browse(f'values-test:{key}', cursor)
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class KeyspaceSamplerTest:
+    pytestmark = [pytest.mark.key_manager, pytest.mark.stats]
+
+    def test__wilson_interval(self):
+        low, high = wilson_interval(50, 100)
+        assert round(low, 3) == 0.404
+        assert round(high, 3) == 0.596
+        assert wilson_interval(0, 0) == (0.0, 1.0)
+        assert wilson_interval(0, 10)[0] == 0.0
+
+    def test__histograms(self):
+        sampler = KeyspaceSampler(None, None, 'redis_0')
+        pttls = [-1, -1, 500, 3000, 3000, 90 * 1000, 10 ** 12]
+        histogram = sampler._ttl_histogram(pttls, 700)
+        assert [(bucket['gt'], bucket['le'], bucket['count']) for bucket in histogram] == [
+            (0, 1, 1), (1, 4, 2), (64, 256, 1), (4 ** 12, None, 1)
+        ]
+        assert histogram[1]['estimated_keys'] == 200
+
+        timeline = {bucket['horizon']: bucket['count'] for bucket in sampler._expiry_timeline(pttls, 700)}
+        assert timeline['1m'] == 3
+        assert timeline['10m'] == 4
+        assert timeline['30d'] == 4
+
+    async def test__get_stats(self, key_manager):
+        km = await key_manager
+        for method in KeyspaceSampler.METHODS:
+            sampler = KeyspaceSampler(km.redis, km.service_redis, 'redis_0', sample_size=50, batch_size=20,
+                                      method=method, refresh_interval=5)
+            stats = await sampler.get_stats(refresh=True)
+            assert stats['cached'] is False
+            assert 0 < stats['sample_size'] <= 50
+            assert stats['total'] >= stats['sample_size']
+            assert round(sum(bundle['share'] for bundle in stats['types'].values()), 3) == 1
+            for bundle in stats['types'].values():
+                assert bundle['low'] <= bundle['share'] <= bundle['high']
+
+            cached = await sampler.get_stats()
+            assert cached['cached'] is True
+            assert cached['timestamp'] == stats['timestamp']
+
+        with pytest.raises(WrongSamplingMethodError):
+            KeyspaceSampler(km.redis, km.service_redis, 'redis_0', method='keys')
+
+
+async def wait_for(predicate, timeout: float = 3):
+    for __ in range(int(timeout / 0.02)):
+        if predicate():
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError('Timed out')
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames,PyProtectedMember
+class LiveKeyIndexTest:
+    pytestmark = [pytest.mark.key_manager, pytest.mark.live_index]
+
+    async def test__index(self, app, get_redis):
+        redis: aioredis.Redis = await get_redis('redis_0')
+        service_redis: aioredis.Redis = await get_redis('redis_1')
+        keys = ['live-index-test:%s' % i for i in range(3)]
+        await redis.delete(*keys)
+
+        key_index = LiveKeyIndex(
+            redis, partial(app._pools_wrapper.create_redis, 'redis_0'), verify_interval=0.1, retry_interval=0.01,
+            configure_notifications=True,
+        ).start()
+        try:
+            await wait_for(lambda: key_index.ready)
+            await redis.set(keys[0], 1)
+            await redis.rpush(keys[1], 1, 2)
+            pattern = KeyPattern('live-index-test:*')
+            await wait_for(lambda: key_index.get_keys(pattern) == [key.encode() for key in keys[:2]])
+
+            key_manager = KeyManager(redis, service_redis, key_index=key_index)
+            hits = key_index.counters['hits']
+            info = await key_manager.search('live-index-test:*', redis_name='redis_0')
+            assert info['count'] == 2
+            info = await key_manager.search_many(['live-index-test:1'], ['^live-index-test:[02]$'], redis_name='redis_0')
+            assert [search['count'] for search in info['searches']] == [1, 1]
+            assert key_index.counters['hits'] == hits + 2
+
+            await redis.rename(keys[0], keys[2])
+            await redis.lpop(keys[1])
+            await redis.lpop(keys[1])
+            await wait_for(lambda: key_index.get_keys(pattern) == [keys[2].encode()])
+            await redis.pexpire(keys[2], 1)
+            await asyncio.sleep(0.01)
+            assert not await redis.exists(keys[2]), 'An access expires the key right away'
+            await wait_for(lambda: key_index.get_keys(pattern) == [])
+
+            # lost notifications are fixed with a resync
+            syncs = key_index.counters['syncs']
+            key_index._keys.update(b'live-index-test:ghost:%d' % i for i in range(100))
+            await wait_for(lambda: key_index.counters['syncs'] > syncs and key_index.ready)
+            assert key_index.get_keys(pattern) == []
+            assert key_index.get_stats()['keys'] == await redis.dbsize()
+        finally:
+            await key_index.stop()
+        assert key_index.get_stats()['state'] == LiveKeyIndex.STATE_STOPPED
+
+    async def test__overflow(self, app, get_redis):
+        redis: aioredis.Redis = await get_redis('redis_0')
+        service_redis: aioredis.Redis = await get_redis('redis_1')
+        await redis.set('live-index-test:0', 1)
+
+        key_index = LiveKeyIndex(
+            redis, partial(app._pools_wrapper.create_redis, 'redis_0'), max_memory=1, configure_notifications=True,
+        ).start()
+        try:
+            await wait_for(lambda: key_index.state == LiveKeyIndex.STATE_OVERFLOW)
+            assert key_index.get_keys(KeyPattern('*')) is None
+            assert key_index.get_stats()['overflows'] == 1
+
+            # searches fall back to SCAN
+            info = await KeyManager(redis, service_redis, key_index=key_index).search(
+                'live-index-test:*', redis_name='redis_0')
+            assert info['count'] == 1
+        finally:
+            await key_index.stop()
+            await redis.delete('live-index-test:0')
+
+    async def test__notifications_disabled(self, app, get_redis):
+        redis: aioredis.Redis = await get_redis('redis_0')
+        service_redis: aioredis.Redis = await get_redis('redis_1')
+        await redis.set('live-index-test:0', 1)
+        config = await redis.config_get('notify-keyspace-events')
+        await redis.config_set('notify-keyspace-events', '')
+
+        key_index = LiveKeyIndex(redis, partial(app._pools_wrapper.create_redis, 'redis_0')).start()
+        try:
+            await wait_for(lambda: key_index.state == LiveKeyIndex.STATE_DISABLED)
+            assert key_index.get_keys(KeyPattern('*')) is None and key_index.last_error
+            assert (await redis.config_get('notify-keyspace-events'))['notify-keyspace-events'] == '', \
+                'The server config is not changed unless asked to'
+
+            info = await KeyManager(redis, service_redis, key_index=key_index).search(
+                'live-index-test:*', redis_name='redis_0')
+            assert info['count'] == 1
+        finally:
+            await key_index.stop()
+            await redis.config_set('notify-keyspace-events', config.get('notify-keyspace-events', ''))
+            await redis.delete('live-index-test:0')
+
+
+@pytest.fixture(params=['redis', 'chunked', 'file'])
+async def result_store(request, get_redis, tmpdir):
+    service_redis: aioredis.Redis = await get_redis('redis_1')
+    if request.param == 'chunked':
+        return ChunkedResultStore(service_redis, chunk_size=3)
+    if request.param == 'file':
+        return FileResultStore(service_redis, str(tmpdir.join('results')))
+    return RedisListResultStore(service_redis, scan_count=2)
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class ResultStoreTest:
+    pytestmark = [pytest.mark.key_manager]
+
+    async def test__store(self, result_store):
+        store: ResultStore = await result_store
+        results_key = store.mk_results_key('sanic-redis-rpc-test', 'result-store')
+        await store.service_redis.delete(results_key)
+        keys = [b'key:%d' % i for i in range(5)] + [b'', b'\xff\x00binary']
+
+        transaction = store.service_redis.multi_exec()
+        store.save(transaction, results_key, keys[:4], 10)
+        await store.execute(transaction)
+        assert await store.get_length(results_key) == 4
+
+        for batch, length in [(keys[4:5], 4), (keys[5:], 5)]:
+            transaction = store.service_redis.multi_exec()
+            await store.append(transaction, results_key, batch, length, 10)
+            await store.execute(transaction)
+
+        assert await store.get_length(results_key) == len(keys)
+        assert await store.get_range(results_key, 0, 100) == keys
+        assert await store.get_range(results_key, 2, 5) == keys[2:6]
+        assert await store.get_range(results_key, 6, 6) == keys[6:]
+        assert await store.get_range(results_key, 7, 10) == []
+
+        pipe = store.service_redis.pipeline()
+        expired = store.expire(pipe, results_key, 20)
+        assert (await pipe.execute() if expired is None else [expired]) == [True]
+
+        assert get_result_store(store.service_redis, dict(store.as_dict(), results_key=results_key)).as_dict() == \
+            store.as_dict()
+
+        aborted_key = store.mk_results_key('sanic-redis-rpc-test', 'result-store-aborted')
+        store.save(store.service_redis.multi_exec(), aborted_key, keys, 10)
+        assert await store.get_length(aborted_key) == 0, 'Nothing is written until a transaction is executed'
+
+    async def test__key_manager(self, result_store, key_manager):
+        store: ResultStore = await result_store
+        km: KeyManager = await key_manager
+        km = KeyManager(km.redis, km.service_redis, result_store=store)
+
+        search = await km.search(KEYS_LOOKUP_PATTERN, sort_keys=True, ttl_seconds=10)
+        assert (await km.get_search_info(search['id']))['store'] == store.NAME
+        assert await km.get_page(search['id'], 2, 10) == ALL_KEYS[10:20]
+
+        # pages are read from the store a search was written to
+        assert await KeyManager(km.redis, km.service_redis).get_page(search['id'], 1, 5) == ALL_KEYS[:5]
+        assert await km.refresh_ttl(search['id'], 20) == [True, True]
+
+        search = await km.search(KEYS_LOOKUP_PATTERN, sort_keys=False, ttl_seconds=10, redis_name='redis_0')
+        first, second = await km.get_page(search['id'], 1, 7), await km.get_page(search['id'], 2, 7)
+        assert len(set(first + second)) == 14
+        assert await km.get_page(search['id'], 1, 7) == first, 'Loaded keys must be stored'
+
+    def test__file_store_cleanup(self, tmpdir):
+        store = FileResultStore(None, str(tmpdir))
+        for search_id, ttl_seconds in [('expired', -1), ('alive', 10)]:
+            store._write(store.mk_results_key('', search_id), [b'key'], 0, ttl_seconds)
+        assert store.cleanup(force=True) == 1
+        assert sorted(os.listdir(str(tmpdir))) == ['alive.keys', 'alive.offsets']
+
+        with pytest.raises(ValueError):
+            mk_result_store(None, 'nothing')
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from sanic import Sanic
+
+from sanic_redis_rpc.redis_rpc import RedisRpc
+from sanic_redis_rpc.rpc import exceptions
+from sanic_redis_rpc.rpc.lanes import LANE_BLOCKING, LANE_INTERACTIVE, LANE_SLOW, LaneScheduler, classify_command
+from tests.utils import mk_pools_wrapper, mk_rpc_bundle
+
+
+def test__classify_command():
+    assert classify_command('get', ['qwe']) == LANE_INTERACTIVE
+    assert classify_command('BLPOP', ['qwe']) == LANE_BLOCKING
+    assert classify_command('xread', [['qwe']]) == LANE_BLOCKING, '`BLOCK 0` is sent by default'
+    assert classify_command('xread', {'streams': ['qwe'], 'timeout': None}) == LANE_INTERACTIVE
+    assert classify_command('xread_group', ['group', 'consumer', ['qwe'], None]) == LANE_INTERACTIVE
+    assert classify_command('hgetall', ['qwe']) == LANE_INTERACTIVE, 'Only blocking commands are told by default'
+    assert classify_command('lrange', ['qwe', 0, -1]) == LANE_INTERACTIVE
+
+    assert classify_command('hgetall', ['qwe'], slow=True) == LANE_SLOW
+    assert classify_command('lrange', ['qwe', 0, 10], slow=True) == LANE_INTERACTIVE
+    assert classify_command('lrange', ['qwe', 0, -1], slow=True) == LANE_SLOW, 'An unbounded range is slow'
+    assert classify_command('lrange', {'key': 'qwe', 'start': 0, 'stop': 5000}, slow=True) == LANE_SLOW
+    assert classify_command('zrange', ['qwe'], slow=True) == LANE_SLOW, 'A default range is unbounded'
+    assert classify_command('zrange', ['qwe', 'a', 'b'], slow=True) == LANE_INTERACTIVE
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class LaneSchedulerTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.wrapper]
+
+    async def test__connection(self, app: Sanic, loop):
+        pools_wrapper = mk_pools_wrapper(app, loop)
+        scheduler = LaneScheduler('redis_1', lambda: pools_wrapper._create_pool('redis_1', minsize=0, maxsize=2),
+                                  size=2, max_queued=1)
+        assert scheduler.lanes[LANE_BLOCKING].max_in_use == 1, 'Blocking commands are limited to their share'
+
+        async def blpop(key):
+            async with scheduler.connection(LANE_BLOCKING) as redis:
+                return await redis.blpop(key, timeout=1)
+
+        first = asyncio.ensure_future(blpop('lane:first'))
+        second = asyncio.ensure_future(blpop('lane:second'))
+        await asyncio.sleep(0.05)
+        assert scheduler.as_dict()['lanes'][LANE_BLOCKING]['queued'] == 1
+        with pytest.raises(exceptions.LaneOverloadedError):
+            async with scheduler.connection(LANE_BLOCKING):
+                pass
+        assert scheduler.lanes[LANE_BLOCKING].counters['rejected'] == 1
+
+        async with scheduler.connection(LANE_SLOW) as redis:
+            assert await redis.echo('qwe') == b'qwe', 'A slow command is not blocked by queued blocking ones'
+
+        redis = await pools_wrapper.get_redis('redis_1')
+        await redis.rpush('lane:first', 1)
+        await redis.rpush('lane:second', 2)
+        assert await asyncio.gather(first, second) == [[b'lane:first', b'1'], [b'lane:second', b'2']]
+        stats = scheduler.as_dict()
+        assert stats['in_use'] == 0 and stats['lanes'][LANE_BLOCKING]['executed'] == 2
+
+        await scheduler.close()
+        await pools_wrapper.close()
+
+    async def test__handle_single(self, app: Sanic, loop):
+        pools_wrapper = mk_pools_wrapper(app, loop, minsize=1, maxsize=1, lane_connections=2, lane_slow=True)
+        rpc = RedisRpc(pools_wrapper)
+        blocked = asyncio.ensure_future(rpc.handle_single(mk_rpc_bundle('redis_1.blpop', ['lane:empty'])))
+        await asyncio.sleep(0.05)
+
+        res = await asyncio.wait_for(rpc.handle_single(mk_rpc_bundle('redis_1.echo', ['qwe'])), 1)
+        assert res['result'] == 'qwe', 'Interactive commands are not blocked by a blocking one'
+        res = await asyncio.wait_for(rpc.handle_batch([
+            mk_rpc_bundle('redis_1.echo', ['qwe']),
+            mk_rpc_bundle('redis_1.hgetall', ['lane:hash']),
+        ]), 1)
+        assert [item['result'] for item in res] == ['qwe', {}]
+
+        status, = [bundle for bundle in await pools_wrapper.get_status() if bundle['name'] == 'redis_1']
+        assert status['lanes']['lanes'][LANE_BLOCKING]['in_use'] == 1
+        assert status['lanes']['lanes'][LANE_SLOW]['executed'] == 1
+
+        blocked.cancel()
+        await asyncio.wait([blocked])
+        await pools_wrapper.close()
+
+        assert mk_pools_wrapper(app, loop).get_lane_scheduler('redis_1') is None, 'Lanes are off by default'
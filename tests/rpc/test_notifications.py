@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from sanic import Sanic
+
+from sanic_redis_rpc.rpc.deadlines import Deadline
+from sanic_redis_rpc.rpc.notifications import NotificationQueue, OVERFLOW_DROP_OLDEST, OVERFLOW_WAIT
+from tests.utils import mk_rpc_bundle
+
+
+def mk_notification(method: str, params):
+    bundle = mk_rpc_bundle(method, params)
+    del bundle['id']
+    return bundle
+
+
+async def wait_for(condition, timeout: float = 2):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    assert condition()
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class NotificationQueueTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.wrapper]
+
+    async def test__flush(self, get_redis):
+        redis = await get_redis('redis_1')
+        await redis.delete('notifications:counter')
+        queue = NotificationQueue('redis_1', lambda: get_redis('redis_1'), batch_size=2)
+        for _ in range(5):
+            assert await queue.put(lambda pipeline: pipeline.incr('notifications:counter'))
+        await queue.put(lambda pipeline: pipeline.incr('notifications:counter', 'qwe'))
+
+        await wait_for(lambda: queue.counters['sent'] + queue.counters['failed'] == 6)
+        assert await redis.get('notifications:counter') == b'5'
+        assert queue.counters['failed'] == 1 and queue.last_error
+        assert queue.counters['flushes'] >= 3, 'Commands are sent in batches of `batch_size`'
+        await queue.close()
+
+    async def test__overflow(self, get_redis):
+        available = False
+        sent = []
+
+        def mk_queue(overflow):
+            return NotificationQueue(
+                'redis_1', lambda: get_redis('redis_1'), max_queued=2, overflow=overflow,
+                is_available=lambda: available, retry_interval=0.01,
+            )
+
+        def command(name):
+            return lambda pipeline: sent.append(name) or pipeline.echo(name)
+
+        queue = mk_queue('drop_new')
+        assert [await queue.put(command(name)) for name in 'abc'] == [True, True, False]
+        assert queue.counters['dropped'] == 1 and len(queue) == 2
+
+        oldest_queue = mk_queue(OVERFLOW_DROP_OLDEST)
+        assert all([await oldest_queue.put(command(name)) for name in 'def'])
+        assert oldest_queue.counters['dropped'] == 1
+
+        waiting_queue = mk_queue(OVERFLOW_WAIT)
+        assert all([await waiting_queue.put(command(name)) for name in 'gh'])
+        assert not await waiting_queue.put(command('i'), Deadline(0.01)), 'A command is dropped at its deadline'
+        put = asyncio.ensure_future(waiting_queue.put(command('j'), Deadline(1)))
+        await asyncio.sleep(0.02)
+        assert not put.done() and not sent, 'Nothing is sent while a pool is unavailable'
+
+        available = True
+        assert await put
+        for item in [queue, oldest_queue, waiting_queue]:
+            await item.close()
+        assert sorted(sent) == list('abefghj')
+
+        with pytest.raises(ValueError):
+            mk_queue('qwe')
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class NotificationViewsTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.views]
+
+    async def test__notify(self, app: Sanic, test_cli, get_redis):
+        redis = await get_redis('redis_1')
+        await redis.delete('notifications:views')
+
+        resp = await test_cli.post('/', json=mk_notification('redis_1.incr', ['notifications:views']))
+        assert resp.status == 204
+        resp = await test_cli.post('/', json=[
+            mk_notification('redis_1.incr', ['notifications:views']),
+            mk_rpc_bundle('redis_1.echo', ['qwe']),
+            mk_notification('redis_0.incrby', ['notifications:views', 10]),
+            mk_notification('redis_0.echo', []),
+            {'jsonrpc': '2.0', 'method': 1},
+        ])
+        res = await resp.json()
+        assert [item.get('result', None) for item in res] == ['qwe', None], 'Only valid notifications are omitted'
+        resp = await test_cli.post('/', json=[mk_notification('redis_1.incr', ['notifications:views'])])
+        assert resp.status == 204
+
+        resp = await test_cli.post('/', json=mk_notification('redis_9.incr', ['notifications:views']))
+        assert (await resp.json())['error']['code'] == -32601
+
+        pools_wrapper = app._pools_wrapper
+        await wait_for(lambda: pools_wrapper.get_notification_queue('redis_1').counters['sent'] == 3)
+        assert await redis.get('notifications:views') == b'3'
+        await wait_for(lambda: pools_wrapper.get_notification_queue('redis_0').counters['invalid'] == 1)
+
+        resp = await test_cli.get('/status')
+        status, = [item for item in await resp.json() if item['name'] == 'redis_0']
+        assert (status['notifications']['queued'], status['notifications']['sent']) == (2, 1)
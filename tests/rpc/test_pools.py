@@ -0,0 +1,205 @@
+import asyncio
+from collections import OrderedDict
+
+import aioredis
+import pytest
+from sanic import Sanic
+from ujson import dumps as json_dumps, loads as json_loads
+
+from sanic_redis_rpc.conf import ENV_POOLS_FILE
+from sanic_redis_rpc.pools import PoolRegistry
+from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper
+from tests.utils import mk_pools_wrapper, mk_rpc_bundle
+
+
+async def clear_registry(get_redis):
+    service_redis: aioredis.Redis = await get_redis('redis_0')
+    await service_redis.delete(PoolRegistry.CONFIG_KEY)
+
+
+async def wait_for(condition, timeout: float = 2):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    assert condition()
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class PoolRegistryTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.pools]
+
+    async def test__publish(self, app: Sanic, get_redis, loop):
+        await clear_registry(get_redis)
+        workers = [mk_pools_wrapper(app, loop) for _ in range(2)]
+        changes = []
+
+        async def on_change(worker_changes):
+            changes.append(worker_changes)
+
+        registries = [PoolRegistry(worker, on_change=on_change, secret='secret').start() for worker in workers]
+        await asyncio.sleep(0.05)
+
+        pools = OrderedDict((name, dict(options)) for name, options in app.config.redis_connections_options.items())
+        pools['redis_2'] = dict(pools['redis_1'], name='redis_2', db=2, id=2)
+        result = await registries[0].publish(pools)
+        assert result['added'] == ['redis_2'] and result['version'] > 0
+
+        await wait_for(lambda: registries[1].version == result['version'])
+        assert workers[1].pool_names == ['redis_0', 'redis_1', 'redis_2'], 'A change must reach other workers'
+        assert registries[0].get_stats()['applied'] == registries[1].get_stats()['applied'] == 1, \
+            'A worker must not apply its own change twice'
+        assert [item['added'] for item in changes] == [['redis_2'], ['redis_2']]
+
+        late_worker = mk_pools_wrapper(app, loop)
+        late_registry = PoolRegistry(late_worker, secret='secret').start()
+        stale_registry = PoolRegistry(mk_pools_wrapper(app, loop), configured_at=10 ** 10, secret='secret').start()
+        await wait_for(lambda: late_registry.version == stale_registry.version == result['version'])
+        assert 'redis_2' in late_worker.pool_names, 'A late worker must apply saved pools'
+        assert 'redis_2' not in stale_registry.pools_wrapper.pool_names, \
+            'Pools saved before the app was configured must be ignored'
+
+        for registry in registries + [late_registry, stale_registry]:
+            await registry.stop()
+            await registry.pools_wrapper.close()
+        await clear_registry(get_redis)
+
+    async def test__secrets(self, app: Sanic, get_redis, loop):
+        await clear_registry(get_redis)
+        pools = OrderedDict((name, dict(options)) for name, options in app.config.redis_connections_options.items())
+        pools['redis_3'] = dict(pools['redis_1'], name='redis_3', id=3, lazy=True, password='secret-password')
+        workers = [
+            RedisPoolsShareWrapper(OrderedDict((name, dict(options)) for name, options in pools.items()), loop=loop)
+            for _ in range(2)
+        ]
+        file_pools = OrderedDict((name, dict(options)) for name, options in pools.items())
+        registries = [
+            PoolRegistry(workers[0], secret='secret').start(),
+            PoolRegistry(workers[1], secret='secret', read_secrets=lambda: file_pools).start(),
+        ]
+        await asyncio.sleep(0.05)
+
+        pools['redis_3']['db'] = 3
+        result = await registries[0].publish(pools)
+        saved = await (await get_redis('redis_0')).get(PoolRegistry.CONFIG_KEY)
+        assert b'secret-password' not in saved, 'Passwords must not be published'
+        assert 'password' not in json_loads(json_loads(saved)['message'])['pools']['redis_3']
+
+        await wait_for(lambda: registries[1].version == result['version'])
+        for worker in workers:
+            options = worker._redis_connections_options['redis_3']
+            assert (options['db'], options['password']) == (3, 'secret-password'), \
+                'A password is taken from the local config'
+
+        pools['redis_3'].update({'db': 4, 'password': 'new-password'})
+        result = await registries[0].publish(pools)
+        await wait_for(lambda: registries[1].version == result['version'])
+        assert registries[1].counters['errors'] == 1, 'Pools with different secrets are not applied'
+        assert workers[1]._redis_connections_options['redis_3']['db'] == 3
+
+        file_pools['redis_3']['password'] = 'new-password'
+        pools['redis_3']['db'] = 5
+        result = await registries[0].publish(pools)
+        await wait_for(lambda: registries[1].version == result['version'])
+        options = workers[1]._redis_connections_options['redis_3']
+        assert (options['db'], options['password']) == (5, 'new-password'), 'Secrets are read by every worker'
+
+        for registry in registries:
+            await registry.stop()
+            await registry.pools_wrapper.close()
+        await clear_registry(get_redis)
+
+    async def test__rejected(self, app: Sanic, get_redis, loop):
+        await clear_registry(get_redis)
+        service_redis: aioredis.Redis = await get_redis('redis_0')
+        worker = mk_pools_wrapper(app, loop)
+        registry = PoolRegistry(worker, secret='secret').start()
+        await asyncio.sleep(0.05)
+
+        forged = json_dumps({'version': 10 ** 9, 'published_at': 0, 'pools': {}, 'secrets': {}})
+        for message in [
+            'qwe', '[]', json_dumps({'version': 10 ** 9}),
+            json_dumps({'message': forged, 'signature': 'qwe'}),
+            json_dumps({'message': '{}', 'signature': registry._sign('{}')}),
+        ]:
+            await service_redis.publish(PoolRegistry.CHANNEL, message)
+        await wait_for(lambda: registry.counters['rejected'] == 5)
+        assert registry.version == 0, 'Unsigned and malformed messages are ignored'
+
+        pools = OrderedDict((name, dict(options)) for name, options in app.config.redis_connections_options.items())
+        pools['redis_2'] = dict(pools['redis_1'], name='redis_2', db=2, id=2)
+        publisher = PoolRegistry(mk_pools_wrapper(app, loop), secret='secret')
+        result = await publisher.publish(pools)
+        await wait_for(lambda: registry.version == result['version'])
+        assert 'redis_2' in worker.pool_names, 'The registry keeps listening'
+
+        unsynced = PoolRegistry(worker).start()
+        assert unsynced._task is None and (await unsynced.publish(pools))['version'] == 0, \
+            'Pools are not synced without a secret'
+
+        await registry.stop()
+        await worker.close()
+        await publisher.pools_wrapper.close()
+        await clear_registry(get_redis)
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class PoolsViewsTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.pools, pytest.mark.views]
+
+    async def test__admin(self, app: Sanic, test_client, get_redis, tmpdir):
+        await clear_registry(get_redis)
+        pools_file = tmpdir.join('pools.env')
+        pools_file.write('# pools\nREDIS_0=redis://localhost:6379?db=0\nREDIS_1=redis://localhost:6379?db=3\n')
+        app.config.pools_file = str(pools_file)
+        app.config.admin_token = 'secret'
+        cli = await test_client(app)
+        headers = {'X-Admin-Token': 'secret'}
+        put_url = app.url_for('sanic-redis-rpc.put_pool', name='redis_2')
+
+        resp = await cli.post(put_url, json={'dsn': 'redis://localhost:6379?db=2'})
+        assert resp.status == 403
+        resp = await cli.post(put_url, json={'dsn': 'redis://localhost:6379?db=2'},
+                              headers={'X-Admin-Token': 'wrong'})
+        assert resp.status == 403
+
+        resp = await cli.post(put_url, json={'dsn': 'redis://localhost:6379?db=2'}, headers=headers)
+        assert resp.status == 200
+        assert (await resp.json())['added'] == ['redis_2']
+        resp = await cli.post('/', json=mk_rpc_bundle('redis_2.echo', ['qwe']))
+        assert (await resp.json())['result'] == 'qwe'
+
+        resp = await cli.get('/status')
+        status, = [item for item in await resp.json() if item['name'] == 'redis_2']
+        assert (status['db'], status['display_name'], status['id']) == (2, 'Redis instance redis_2', 2)
+
+        resp = await cli.post(put_url, json={'dsn': 'redis://:qwe@localhost:6379?db=2'}, headers=headers)
+        assert resp.status == 400, 'Passwords are set in the pools file only'
+
+        for dsn in [None, 'http://localhost']:
+            resp = await cli.post(
+                app.url_for('sanic-redis-rpc.put_pool', name='redis_3'), json={'dsn': dsn}, headers=headers)
+            assert resp.status == 400
+
+        resp = await cli.delete(put_url, headers=headers)
+        assert (await resp.json())['removed'] == ['redis_2']
+        resp = await cli.post('/', json=mk_rpc_bundle('redis_2.echo', ['qwe']))
+        assert (await resp.json())['error']['code'] == -32601
+        resp = await cli.delete(put_url, headers=headers)
+        assert resp.status == 404
+        resp = await cli.delete(app.url_for('sanic-redis-rpc.put_pool', name='redis_0'), headers=headers)
+        assert resp.status == 400, 'The service pool can not be removed'
+
+        resp = await cli.post(app.url_for('sanic-redis-rpc.reload_pools_config'), headers=headers)
+        assert (await resp.json())['reconfigured'] == ['redis_1']
+        assert app.config.redis_connections_options['redis_1']['db'] == 3
+
+        resp = await cli.get(app.url_for('sanic-redis-rpc.get_pools_registry'), headers=headers)
+        stats = await resp.json()
+        assert stats['pools'] == ['redis_0', 'redis_1']
+        assert stats['published'] == 3
+
+        app.config.pools_file = None
+        resp = await cli.post(app.url_for('sanic-redis-rpc.reload_pools_config'), headers=headers)
+        assert resp.status == 400, f'Reload requires {ENV_POOLS_FILE}'
+        await clear_registry(get_redis)
@@ -0,0 +1,113 @@
+import asyncio
+
+import aioredis
+import pytest
+from sanic import Sanic
+
+from sanic_redis_rpc.redis_rpc import RedisRpc
+from sanic_redis_rpc.rpc import exceptions
+from sanic_redis_rpc.rpc.deadlines import Deadline
+from sanic_redis_rpc.rpc.retries import RetryPolicy, is_idempotent
+from tests.utils import mk_pools_wrapper, mk_rpc_bundle
+
+
+def fail_once(monkeypatch, obj, name: str):
+    original = getattr(obj, name)
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise aioredis.ConnectionClosedError('Reader at end of file')
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(obj, name, wrapper)
+    return calls
+
+
+def test__is_idempotent():
+    assert is_idempotent('get') and is_idempotent('HGETALL') and is_idempotent('set', ['qwe', 1])
+    assert not is_idempotent('set', {'key': 'qwe', 'value': 1, 'exist': 'SET_IF_NOT_EXIST'})
+    assert not is_idempotent('incr') and not is_idempotent('lpush') and not is_idempotent('blpop')
+    assert not is_idempotent('multi_exec')
+
+
+# noinspection PyMethodMayBeStatic
+class RetryPolicyTest:
+    async def test__run(self):
+        policy = RetryPolicy(retries=2, backoff=0.001)
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionResetError()
+            return 'qwe'
+
+        retried = []
+        assert await policy.run(call, on_retry=retried.append) == 'qwe'
+        assert len(retried) == 2 and policy.counters == {'retries': 2, 'recovered': 1, 'exhausted': 0}
+
+        attempts.clear()
+        with pytest.raises(ConnectionResetError):
+            await RetryPolicy(retries=1, backoff=0.001).run(call)
+        attempts.clear()
+        deadline = Deadline(0.001)
+        await asyncio.sleep(0.002)
+        with pytest.raises(ConnectionResetError):
+            await policy.run(call, deadline, on_retry=retried.append)
+        assert len(attempts) == 1, 'A call is not repeated past its deadline'
+        attempts.clear()
+        with pytest.raises(ConnectionResetError):
+            await policy.run(call, can_retry=lambda: False)
+        assert len(attempts) == 1
+
+        async def fail():
+            attempts.append(1)
+            raise ValueError()
+
+        attempts.clear()
+        with pytest.raises(ValueError):
+            await policy.run(fail)
+        assert len(attempts) == 1, 'Only connection errors are retried'
+
+        async def pipeline():
+            return ['qwe', ConnectionResetError()]
+
+        res = await policy.run(pipeline, get_error=lambda items: items[1])
+        assert res[0] == 'qwe', 'A result of the last attempt is returned'
+        assert policy.counters['exhausted'] == 1
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class RetryRpcTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.handler]
+
+    async def test__handle(self, app: Sanic, loop, monkeypatch):
+        pools_wrapper = mk_pools_wrapper(app, loop, retry_backoff=0.001)
+        rpc = RedisRpc(pools_wrapper)
+        pool = await pools_wrapper._get_pool('redis_1')
+
+        fail_once(monkeypatch, pool, 'execute')
+        res = await rpc.handle_single(mk_rpc_bundle('redis_1.echo', ['qwe']))
+        assert res['result'] == 'qwe', 'An idempotent call is retried'
+        fail_once(monkeypatch, pool, 'execute')
+        with pytest.raises(aioredis.ConnectionClosedError):
+            await rpc.handle_single(mk_rpc_bundle('redis_1.incr', ['retries:counter']))
+
+        fail_once(monkeypatch, pool, 'acquire')
+        res = await rpc.handle_batch([mk_rpc_bundle('redis_1.echo', ['qwe']), mk_rpc_bundle('redis_1.get', ['qwe'])])
+        assert res[0]['result'] == 'qwe'
+        fail_once(monkeypatch, pool, 'acquire')
+        with pytest.raises(aioredis.ConnectionClosedError):
+            await rpc.handle_batch([mk_rpc_bundle('redis_1.multi_exec', []), mk_rpc_bundle('redis_1.get', ['qwe'])])
+
+        status, = [bundle for bundle in await pools_wrapper.get_status() if bundle['name'] == 'redis_1']
+        assert (status['retries']['retries'], status['retries']['recovered']) == (2, 2)
+        assert status['circuit']['failures'] == 4, 'Every failed attempt is reported'
+
+        with pytest.raises(exceptions.RpcError):
+            await rpc.handle_single(mk_rpc_bundle('redis_1.echo', []))
+        assert pools_wrapper.get_retry_policy('redis_1').counters['retries'] == 2, 'Invalid calls are not retried'
+        await asyncio.sleep(0)
+        await pools_wrapper.close()
@@ -0,0 +1,227 @@
+import os
+import shutil
+
+import aioredis
+import pytest
+from sanic import Sanic
+
+from sanic_redis_rpc.jobs import Job
+from sanic_redis_rpc.jobs.exceptions import WrongJobOptionError
+from sanic_redis_rpc.key_manager.exceptions import PageNotFoundError
+from sanic_redis_rpc.key_manager.patterns import KeyPattern
+from sanic_redis_rpc.snapshots import RdbParser, SnapshotIndex, SnapshotIndexBuilder, SnapshotIndexJob, \
+    SnapshotRegistry, RdbParseError, SnapshotNotFoundError
+from sanic_redis_rpc.snapshots.rdb import lzf_decompress
+
+SNAPSHOT_KEYS = ['snapshot-test:%s' % name for name in [
+    'string', 'int', 'compressed', 'expiring', 'list', 'big:list', 'set', 'big:set', 'zset', 'hash', 'stream'
+]] + ['snapshot-test:user:%s' % i for i in range(20)]
+
+
+@pytest.fixture
+async def rdb_file(get_redis, tmpdir):
+    """
+    Saves the test redis into ``snapshot.rdb`` inside ``tmpdir``, only ``snapshot-test:*`` keys of db 0 matter.
+    """
+    redis: aioredis.Redis = await get_redis('redis_0')
+    await redis.delete(*SNAPSHOT_KEYS)
+    pipe = redis.pipeline()
+    pipe.set('snapshot-test:string', 'value')
+    pipe.set('snapshot-test:int', 12345)
+    pipe.set('snapshot-test:compressed', 'a' * 1000)
+    pipe.set('snapshot-test:expiring', 1, expire=1000)
+    pipe.rpush('snapshot-test:list', *range(5))
+    pipe.rpush('snapshot-test:big:list', *['x' * 100] * 300)
+    pipe.sadd('snapshot-test:set', *range(10))
+    pipe.sadd('snapshot-test:big:set', *['member:%s' % i for i in range(600)])
+    pipe.zadd('snapshot-test:zset', 1.5, 'a', 2, 'b')
+    pipe.hmset_dict('snapshot-test:hash', {'a': 1, 'b': 2})
+    pipe.xadd('snapshot-test:stream', {'a': 1})
+    for i in range(20):
+        pipe.set('snapshot-test:user:%s' % i, 'x' * i)
+    await pipe.execute()
+
+    directory, file_name = await redis.config_get('dir'), await redis.config_get('dbfilename')
+    await redis.config_set('dir', str(tmpdir))
+    await redis.config_set('dbfilename', 'snapshot.rdb')
+    try:
+        await redis.save()
+    finally:
+        await redis.config_set('dir', directory['dir'])
+        await redis.config_set('dbfilename', file_name['dbfilename'])
+    return str(tmpdir.join('snapshot.rdb'))
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class RdbParserTest:
+    pytestmark = [pytest.mark.snapshots]
+
+    async def test__iter_entries(self, rdb_file):
+        path = await rdb_file
+        entries = {
+            entry.key: entry for entry in RdbParser(path, db=0).iter_entries()
+            if entry.key.startswith(b'snapshot-test:')
+        }
+        assert len(entries) == 31
+        assert all(entry.db == 0 for entry in entries.values())
+
+        expected = {
+            'string': ('string', 5), 'int': ('string', 5), 'compressed': ('string', 1000),
+            'list': ('list', 5), 'big:list': ('list', 300), 'set': ('set', 10), 'big:set': ('set', 600),
+            'zset': ('zset', 2), 'hash': ('hash', 2), 'stream': ('stream', 1),
+        }
+        for name, (key_type, elements) in expected.items():
+            entry = entries[b'snapshot-test:' + name.encode()]
+            assert (entry.type, entry.elements) == (key_type, elements), name
+            assert entry.size > 0
+
+        assert entries[b'snapshot-test:expiring'].expire_at > 0
+        assert entries[b'snapshot-test:string'].expire_at == 0
+        assert entries[b'snapshot-test:big:list'].size > entries[b'snapshot-test:list'].size
+
+    def test__errors(self, tmpdir):
+        assert lzf_decompress(b'\x01ab\xe0\x00\x01', 11) == b'ab' + b'ab' * 4 + b'a'
+        with pytest.raises(RdbParseError):
+            lzf_decompress(b'\x01ab', 3)
+
+        for content in [b'NOTREDIS0', b'REDIS0099', b'REDIS0009\x00\x05']:
+            path = str(tmpdir.join('broken.rdb'))
+            with open(path, 'wb') as f:
+                f.write(content)
+            with pytest.raises(RdbParseError):
+                list(RdbParser(path).iter_entries())
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class SnapshotIndexTest:
+    pytestmark = [pytest.mark.snapshots]
+
+    async def test__build_and_query(self, rdb_file, tmpdir):
+        rdb_path = await rdb_file
+        path = str(tmpdir.join('test.snapshot'))
+        info = SnapshotIndexBuilder(rdb_path, path, db=0, run_size=3, sparse_every=2).build()
+        assert not [name for name in os.listdir(str(tmpdir)) if '.run' in name or name.endswith('.part')]
+        assert info['source'] == 'snapshot.rdb'
+
+        index = SnapshotIndex(path)
+        assert index.count == info['keys'] >= 31
+        keys = [record.key for record in index.iter_records()]
+        assert keys == sorted(keys)
+
+        records = index.search([KeyPattern('snapshot-test:user:1*')])
+        assert [record.key for record in records] == [b'snapshot-test:user:1'] + [
+            b'snapshot-test:user:%d' % i for i in range(10, 20)
+        ]
+        records = index.search([KeyPattern('snapshot-test:big:*'), KeyPattern('^snapshot-test:z', regex=True)])
+        assert [record.key for record in records] == [
+            b'snapshot-test:big:list', b'snapshot-test:big:set', b'snapshot-test:zset'
+        ]
+
+        record = index.get(b'snapshot-test:hash')
+        assert record.as_dict()['type'] == 'hash'
+        assert index.get(b'snapshot-test:nothing') is None
+
+        node = index.get_namespace_node('snapshot-test:', limit=2)
+        assert node['count'] == 31
+        assert node['num_children'] == 11
+        assert [child['path'] for child in node['children']] == ['snapshot-test:user:', 'snapshot-test:big:']
+        assert node['children'][1]['types'] == {'list': 1, 'set': 1}
+        with pytest.raises(PageNotFoundError):
+            index.get_namespace_node('snapshot-test:nothing:')
+
+        bigkeys = index.get_bigkeys(top=2)
+        assert bigkeys['top_by_type']['list'][0]['key'] == 'snapshot-test:big:list'
+        assert index.get_bigkeys(top=2) is bigkeys
+        index.close()
+
+        registry = SnapshotRegistry()
+        assert registry.list(str(tmpdir)) == ['test']
+        assert registry.get(str(tmpdir), 'test') is registry.get(str(tmpdir), 'test')
+        for name in ['nothing', '../test', '']:
+            with pytest.raises(SnapshotNotFoundError):
+                registry.get(str(tmpdir), name)
+        registry.close()
+
+    async def test__job(self, rdb_file, get_redis, tmpdir):
+        await rdb_file
+        service_redis: aioredis.Redis = await get_redis('redis_1')
+        job = SnapshotIndexJob(service_redis, str(tmpdir), {'file_name': 'snapshot.rdb', 'run_size': 10})
+        await job.create()
+        await job.execute()
+
+        job_info = await Job.get_info(service_redis, job.id)
+        assert job_info['status'] == Job.STATUS_DONE, job_info.get('error')
+        assert job_info['options']['name'] == 'snapshot'
+        assert job_info['result']['keys'] == job_info['processed'] >= 31
+        assert os.path.isfile(str(tmpdir.join('snapshot.snapshot')))
+
+        for options in [{'file_name': 'nothing.rdb'}, {'file_name': 'snapshot.rdb', 'name': '../qwe'}]:
+            with pytest.raises(WrongJobOptionError):
+                SnapshotIndexJob(service_redis, str(tmpdir), options)
+
+
+# noinspection PyMethodMayBeStatic,PyShadowingNames
+class SnapshotViewsTest:
+    pytestmark = [pytest.mark.snapshots, pytest.mark.views]
+
+    async def test__snapshot(self, app: Sanic, test_cli, rdb_file, tmpdir):
+        rdb_path = await rdb_file
+        app.config.export_dir = str(tmpdir.mkdir('export'))
+        shutil.copy(rdb_path, app.config.export_dir)
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_snapshot_job'), json={'file_name': 'snapshot.rdb', 'name': 'snap'}
+        )
+        assert resp.status == 200
+        await app._job_runner.wait((await resp.json())['id'])
+
+        resp = await test_cli.get('/status')
+        statuses = await resp.json()
+        assert statuses[-1]['name'] == 'snap'
+        assert statuses[-1]['read_only'] is True
+
+        resp = await test_cli.get(statuses[-1]['info_url'])
+        info = await resp.json()
+        assert info['keys'] >= 31
+
+        resp = await test_cli.post(statuses[-1]['search_url'], json={'pattern': 'snapshot-test:big:*'})
+        assert resp.status == 200
+        search = await resp.json()
+        assert search['count'] == 2
+
+        resp = await test_cli.get(search['endpoints']['get_page'] + '?enrich=type,ttl,memory')
+        results = (await resp.json())['results']
+        assert [(item['key'], item['type'], item['ttl']) for item in results] == [
+            ('snapshot-test:big:list', 'list', -1), ('snapshot-test:big:set', 'set', -1)
+        ]
+        assert results[0]['memory'] > 0
+
+        resp = await test_cli.get(app.url_for('sanic-redis-rpc.get_page_values', search_id=search['id'], page_number=1))
+        assert resp.status == 400
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_bulk_job', search_id=search['id']), json={'action': 'unlink'}
+        )
+        assert resp.status == 400, 'Keys of a snapshot search can not be changed'
+
+        app.config.admin_token = 'secret'
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.put_pool', name='snap'), json={'dsn': 'redis://localhost:6379?db=2'},
+            headers={'X-Admin-Token': 'secret'}
+        )
+        assert resp.status == 400, 'A pool can not take a name of a snapshot'
+
+        resp = await test_cli.get(info['endpoints']['get_snapshot_namespaces'] + '?path=snapshot-test:&limit=1')
+        node = await resp.json()
+        assert node['children'][0]['path'] == 'snapshot-test:user:'
+        resp = await test_cli.get(node['endpoints']['children'][0])
+        assert (await resp.json())['count'] == 20
+
+        resp = await test_cli.get(info['endpoints']['get_snapshot_bigkeys'] + '?top=1')
+        assert len((await resp.json())['top']) == 1
+
+        resp = await test_cli.get(app.url_for('sanic-redis-rpc.get_snapshot_info', name='nothing'))
+        assert resp.status == 404
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.start_snapshot_job'), json={'file_name': 'snapshot.rdb', 'name': 'redis_0'}
+        )
+        assert resp.status == 400
@@ -1,6 +1,12 @@
+import asyncio
+from collections import OrderedDict
+
+import aioredis
 import pytest
 from sanic import Sanic
 
+from sanic_redis_rpc.rpc.exceptions import PoolUnavailableError, PoolConfigError
+from sanic_redis_rpc.rpc.health import CircuitBreaker
 from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper
 
 pytestmark = pytest.mark.utils
@@ -54,3 +60,249 @@ class RedisPoolsShareWrapperTest:
         redis_0 = await pools_wrapper.get_redis('redis_0')
 
         assert service_redis is redis_0, 'Ensure default service redis is the first one'
+
+    async def test__get_scan_semaphore(self, pools_wrapper: RedisPoolsShareWrapper):
+        semaphore = pools_wrapper.get_scan_semaphore('redis_0')
+        assert semaphore is pools_wrapper.get_scan_semaphore('redis_0'), 'Ensure semaphores are shared'
+        assert pools_wrapper.pool_names == ['redis_0', 'redis_1']
+
+    async def test__apply_config(self, app: Sanic, loop):
+        options = app.config.redis_connections_options
+        options['redis_1']['drain_timeout'] = 5
+        wrapper = RedisPoolsShareWrapper(options, loop=loop)
+        await wrapper._initialize_pools()
+        old_redis_1 = await wrapper.get_redis('redis_1')
+        blocked = asyncio.ensure_future(old_redis_1.blpop('apply-config-test:nothing', timeout=1))
+        await asyncio.sleep(0.01)
+
+        new_options = OrderedDict((name, dict(pool_options)) for name, pool_options in options.items())
+        new_options['redis_1']['maxsize'] = 5
+        new_options['redis_2'] = dict(options['redis_1'], name='redis_2', db=2, id=2)
+        redis_0_options = options['redis_0']
+        changes = await wrapper.apply_config(new_options)
+        assert (changes['added'], changes['removed'], changes['reconfigured']) == (['redis_2'], [], ['redis_1'])
+        assert set(changes['init']) == {'redis_1', 'redis_2'}
+        assert options['redis_0'] is redis_0_options, 'Options of unchanged pools are kept'
+        assert options['redis_2']['db'] == 2, 'App config is updated'
+
+        assert (await wrapper._get_pool('redis_1')).maxsize == 5
+        assert await wrapper.get_redis('redis_1') is not old_redis_1
+        assert await blocked is None, 'A request in flight must be served by the replaced pool'
+        await asyncio.sleep(0.1)
+        assert old_redis_1.closed, 'The replaced pool must be closed once drained'
+
+        assert (await wrapper.apply_config(new_options))['reconfigured'] == [], 'Applying twice changes nothing'
+        del new_options['redis_2']
+        assert (await wrapper.apply_config(new_options))['removed'] == ['redis_2']
+        with pytest.raises(KeyError):
+            await wrapper.get_redis('redis_2')
+        with pytest.raises(PoolConfigError):
+            await wrapper.apply_config(OrderedDict([('redis_1', new_options['redis_1'])]))
+        await wrapper.close()
+
+    async def test__initialize_pools__concurrently(self, app: Sanic, loop):
+        options = app.config.redis_connections_options
+        options['redis_1'].update({'address': 'redis://localhost:1', 'init_timeout': 0.2})
+        options['redis_2'] = dict(options['redis_0'], name='redis_2', lazy=True, service=False)
+        wrapper = RedisPoolsShareWrapper(options, loop=loop)
+
+        results = await wrapper._initialize_pools()
+        assert results['redis_0']['init_seconds'] < 1
+        assert results['redis_1']['init_error'], 'An unreachable pool must not fail the startup'
+        assert 'redis_2' not in results and 'redis_2' not in wrapper._pool_map, 'Lazy pools are created on first use'
+
+        statuses = {status['name']: status for status in await wrapper.get_status()}
+        assert statuses['redis_0']['initialized'] and statuses['redis_0']['freesize'] >= 1
+        assert not statuses['redis_1']['initialized'] and statuses['redis_1']['init_error']
+        assert statuses['redis_2']['lazy'] is True
+
+        pools = await asyncio.gather(wrapper._get_pool('redis_2'), wrapper._get_pool('redis_2'))
+        assert pools[0] is pools[1], 'Concurrent callers must share a single pool'
+
+        options['redis_0']['address'] = options['redis_1']['address']
+        with pytest.raises(OSError, message='A failure of the service pool must be raised'):
+            await RedisPoolsShareWrapper(options, loop=loop)._initialize_pools()
+        await wrapper.close()
+
+
+# noinspection PyMethodMayBeStatic
+class CircuitBreakerTest:
+    pytestmark = [pytest.mark.wrapper]
+
+    async def test__transitions(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2, error_rate=0.5, window=4, min_calls=4, open_seconds=0.05)
+        circuit_breaker.record(False, ConnectionRefusedError())
+        assert circuit_breaker.allow() and circuit_breaker.state == CircuitBreaker.STATE_CLOSED
+        circuit_breaker.record(False)
+        assert circuit_breaker.state == CircuitBreaker.STATE_OPEN, 'Consecutive failures must open the circuit'
+        assert not circuit_breaker.allow() and 0 < circuit_breaker.retry_after <= 0.05
+
+        await asyncio.sleep(0.06)
+        assert circuit_breaker.allow(), 'A trial call must be let through after a while'
+        assert circuit_breaker.state == CircuitBreaker.STATE_HALF_OPEN
+        assert not circuit_breaker.allow(), 'Only a single trial call is allowed'
+        circuit_breaker.record(False)
+        assert circuit_breaker.state == CircuitBreaker.STATE_OPEN
+
+        await asyncio.sleep(0.06)
+        assert circuit_breaker.allow()
+        circuit_breaker.record(True)
+        assert circuit_breaker.state == CircuitBreaker.STATE_CLOSED
+
+        for success in [True, False, True, False]:
+            circuit_breaker.record(success)
+        assert circuit_breaker.state == CircuitBreaker.STATE_OPEN, 'An error rate must open the circuit'
+        assert circuit_breaker.as_dict()['opened'] == 3
+        assert circuit_breaker.as_dict()['last_error'] == 'ConnectionRefusedError()'
+
+    async def test__wrapper(self, app: Sanic, loop):
+        options = app.config.redis_connections_options
+        options['redis_1'].update({'address': 'redis://localhost:1', 'circuit_failures': 1, 'circuit_open_seconds': 60})
+        wrapper = RedisPoolsShareWrapper(options, loop=loop)
+
+        assert await wrapper.ping('redis_0')
+        with pytest.raises(OSError):
+            await wrapper.get_redis('redis_1')
+        with pytest.raises(PoolUnavailableError):
+            await wrapper.get_redis('redis_1')
+        assert not await wrapper.ping('redis_1'), 'Nothing is sent while the circuit is open'
+
+        wrapper.report('redis_0', ValueError())
+        wrapper.report('redis_0', aioredis.ConnectionClosedError())
+        assert wrapper.get_circuit_breaker('redis_0').as_dict()['failures'] == 1, \
+            'Only connection errors are failures'
+
+        circuit_breaker = wrapper.get_circuit_breaker('redis_0')
+        circuit_breaker.open_seconds = 0.01
+        circuit_breaker._open()
+        with pytest.raises(PoolUnavailableError):
+            await wrapper.get_redis('redis_0')
+        await asyncio.sleep(0.02)
+        assert await wrapper.get_redis('redis_0') and circuit_breaker.state == CircuitBreaker.STATE_OPEN, \
+            'A trial call is not taken by callers other than RPC'
+        assert await wrapper.get_rpc_redis('redis_0') and circuit_breaker.state == CircuitBreaker.STATE_HALF_OPEN
+        with pytest.raises(PoolUnavailableError):
+            await wrapper.get_rpc_redis('redis_0')
+        await wrapper.close()
+
+
+async def ping_in_transaction(redis: aioredis.Redis):
+    transaction = redis.multi_exec()
+    transaction.ping()
+    return await transaction.execute()
+
+
+# noinspection PyMethodMayBeStatic
+class PoolAutoscalerTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.wrapper]
+
+    async def test__step(self, app: Sanic, loop):
+        options = app.config.redis_connections_options
+        options['redis_0'].update({'minsize': 1, 'maxsize': 8, 'autoscale': True, 'autoscale_interval': 60})
+        wrapper = RedisPoolsShareWrapper(options, loop=loop)
+        pool = await wrapper._get_pool('redis_0')
+        autoscaler = wrapper._autoscalers['redis_0']
+        autoscaler.cooldown, autoscaler.shrink_after, autoscaler.grow_wait_ms = 1, 2, 0
+        assert pool.maxsize == 1, 'An autoscaled pool starts with `minsize` connections at most'
+
+        redis = await wrapper.get_redis('redis_0')
+        await asyncio.gather(*[ping_in_transaction(redis) for _ in range(5)] + [redis.ping()])
+        sample = pool.collect()
+        assert sample['acquires'] == 5 and sample['commands'] == 6
+        assert sample['peak_in_use'] == 1 and sample['peak_waiting'] > 1
+
+        decision = autoscaler.step(sample)
+        assert (decision['from'], decision['to'], decision['reason']) == (1, 2, 'queued')
+        assert autoscaler.step(sample) is None, 'No changes are made during a cooldown'
+
+        assert autoscaler.step(dict(sample, peak_waiting=0, peak_in_use=2))['to'] == 3
+        autoscaler.step(sample)
+        saturated = dict(sample, latency_ms=sample['latency_ms'] * 3 + 1)
+        assert autoscaler.step(saturated)['reason'] == 'saturated'
+        assert pool.maxsize == 3
+
+        idle = dict(sample, peak_waiting=0, peak_in_use=0)
+        assert autoscaler.step(idle) is None
+        assert autoscaler.step(idle)['reason'] == 'idle'
+        assert pool.maxsize == 2
+
+        status, = [bundle for bundle in await wrapper.get_status() if bundle['name'] == 'redis_0']
+        assert status['maxsize'] == 2
+        assert status['autoscaler']['grows'] == 2 and status['autoscaler']['shrinks'] == 1
+        assert [decision['to'] for decision in status['autoscaler']['decisions']] == [2, 3, 3, 2]
+        await wrapper.close()
+
+    async def test__run(self, app: Sanic, loop):
+        options = app.config.redis_connections_options
+        options['redis_0'].update({'minsize': 1, 'maxsize': 4, 'autoscale': True, 'autoscale_interval': 0.01})
+        wrapper = RedisPoolsShareWrapper(options, loop=loop)
+        redis = await wrapper.get_redis('redis_0')
+        pool = await wrapper._get_pool('redis_0')
+
+        for _ in range(100):
+            await asyncio.gather(*[ping_in_transaction(redis) for _ in range(8)])
+            await asyncio.sleep(0.01)
+            if pool.maxsize == 4:
+                break
+        assert pool.maxsize == 4, 'Queued callers must grow the pool'
+        await wrapper.close()
+
+    async def test__shrink(self, app: Sanic, loop):
+        options = app.config.redis_connections_options
+        options['redis_0'].update({'minsize': 3, 'maxsize': 6, 'autoscale': True, 'autoscale_interval': 60})
+        wrapper = RedisPoolsShareWrapper(options, loop=loop)
+        pool = await wrapper._get_pool('redis_0')
+        assert pool.freesize == 3
+
+        # free connections are shared, commands sent over them are pending until replies are read
+        pending = [pool.execute('echo', 'qwe'), pool.execute('echo', 'asd')]
+        connections = list(pool._pool)
+        pool.set_cap(1)
+        assert pool.maxsize == pool.freesize == 1 and pool._is_busy(pool._pool[0])
+        assert len(pool._draining) == 1 and sum(conn.closed for conn in connections) == 1, \
+            'Only an idle connection is closed right away'
+
+        assert await asyncio.gather(*pending) == [b'qwe', b'asd'], 'Pending commands are not cut off'
+        await asyncio.sleep(0)
+        assert not pool._draining and sum(conn.closed for conn in connections) == 2
+        assert wrapper.get_circuit_breaker('redis_0').counters['failures'] == 0
+        await wrapper.close()
+
+
+# noinspection PyMethodMayBeStatic
+class ConnectionBudgetTest:
+    pytestmark = [pytest.mark.redis, pytest.mark.wrapper]
+
+    async def test__lease(self, app: Sanic, loop):
+        options = app.config.redis_connections_options
+        options['redis_1'].update({'budget': 6, 'budget_interval': 60})
+        service_redis = await RedisPoolsShareWrapper(options, loop=loop).get_redis('redis_0')
+        await service_redis.delete('sanic-redis-rpc:budget:redis_1')
+
+        workers = [RedisPoolsShareWrapper(options, loop=loop) for _ in range(3)]
+        first, second, third = [await worker._get_pool('redis_1') and worker._budgets['redis_1'] for worker in workers]
+        await asyncio.sleep(0.05)
+        assert first.granted == 6, 'The first lease asks for the whole pool'
+        assert (second.granted, third.granted) == (1, 1), 'Workers are granted a connection at least'
+        assert (await workers[0]._get_pool('redis_1')).maxsize == 6
+
+        await third.lease(1)
+        assert await second.lease(4) == 1
+        assert await first.lease(10) == 2, 'A starved worker makes others return to a fair share'
+        assert first.counters['returned'] == 1
+        assert await second.lease(4) == 2, 'Busy workers get fair shares'
+        assert (await workers[1]._get_pool('redis_1')).maxsize == 2
+
+        await first.lease(1)
+        assert await second.lease(4) == 4, 'Capacity given back by idle workers is borrowed'
+        assert second.counters['borrowed'] == 1
+
+        await service_redis.hset('sanic-redis-rpc:budget:redis_1', 'dead', '5 5 0')
+        await workers[0].close()
+        assert await third.lease(3) == 2
+        assert third.workers == 2, 'Leases of dead and stopped workers are freed'
+
+        status, = [bundle for bundle in await workers[1].get_status() if bundle['name'] == 'redis_1']
+        assert status['budget']['granted'] == status['maxsize'] == 4
+        for worker in workers[1:]:
+            await worker.close()
@@ -1,6 +1,8 @@
 import pytest
 from sanic import Sanic
 
+from tests.utils import mk_rpc_bundle
+
 pytestmark = pytest.mark.views
 
 
@@ -75,6 +77,55 @@ class BlueprintTest:
         assert 'refresh_ttl' in resp_json['endpoints']
         assert 'get_search_info' in resp_json['endpoints']
 
+    async def test__search_many(self, app: Sanic, test_cli, rpc):
+        await rpc('/', 'redis_0.set', 'something_long:1', 1)
+        await rpc('/', 'redis_0.set', 'something_else:1', 1)
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.search', redis_name='redis_0'),
+            json={'patterns': ['something_long*'], 'regexes': ['^something_else:\\d$']}
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['pattern'] == 'something_*'
+        assert len(resp_json['searches']) == 2
+        assert 'get_page' in resp_json['searches'][0]['endpoints']
+
+        resp = await test_cli.get(resp_json['searches'][1]['endpoints']['get_page'])
+        assert resp.status == 200
+        assert (await resp.json())['results'] == ['something_else:1']
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.search', redis_name='redis_0'),
+            json={'regexes': ['(unbalanced']}
+        )
+        assert resp.status == 400
+
+    async def test__federated_search(self, app: Sanic, test_cli, rpc):
+        await rpc('/', 'redis_0.set', 'something_long:1', 1)
+        await rpc('/', 'redis_1.set', 'something_long:1', 1)
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.federated_search'),
+            json={'pattern': 'something_long:1'}
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['pools'] == ['redis_0', 'redis_1']
+
+        resp = await test_cli.get(resp_json['endpoints']['get_page'])
+        assert resp.status == 200
+        assert (await resp.json())['results'] == [
+            {'redis_name': 'redis_0', 'key': 'something_long:1'},
+            {'redis_name': 'redis_1', 'key': 'something_long:1'},
+        ]
+
+        resp = await test_cli.post(
+            app.url_for('sanic-redis-rpc.federated_search'),
+            json={'pattern': 'something_long:1', 'pools': ['does_not_exist']}
+        )
+        assert resp.status == 404
+
     async def test__refresh_ttl(self, search_id, app: Sanic, test_cli):
         search_id = await search_id
 
@@ -96,6 +147,62 @@ class BlueprintTest:
         resp_json = await resp.json()
         assert len(resp_json['results']) == 1
 
+    async def test__get_page__enrich(self, app: Sanic, test_cli, search_id):
+        sid = await search_id
+
+        resp = await test_cli.get(
+            app.url_for('sanic-redis-rpc.get_page', search_id=sid, page_number=1, per_page=1, enrich='type,ttl')
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['results'] == [{'key': 'something_long:1', 'type': 'string', 'ttl': -1}]
+
+        resp = await test_cli.get(
+            app.url_for('sanic-redis-rpc.get_page', search_id=sid, page_number=1, enrich='size')
+        )
+        assert resp.status == 400
+
+    async def test__get_page_values(self, app: Sanic, test_cli, search_id):
+        sid = await search_id
+
+        resp = await test_cli.get(
+            app.url_for('sanic-redis-rpc.get_page_values', search_id=sid, page_number=1, enrich='ttl')
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['page_number'] == 1
+        assert resp_json['results'][0] == {
+            'key': 'something_long:1', 'type': 'string', 'length': 1,
+            'truncated': False, 'cursor': None, 'value': '1', 'ttl': -1
+        }
+        assert len(resp_json['results']) == 2
+
+    async def test__browse_key(self, app: Sanic, test_cli, rpc):
+        await rpc('/', 'redis_0.delete', 'browse-test:list')
+        await rpc('/', 'redis_0.rpush', 'browse-test:list', 'a', 'b', 'c')
+
+        resp = await test_cli.get(
+            app.url_for('sanic-redis-rpc.browse_key', redis_name='redis_0', key='browse-test:list', max_elements=2)
+        )
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['type'] == 'list'
+        assert resp_json['elements'] == ['a', 'b']
+        assert resp_json['next_cursor'] == 2
+
+        resp = await test_cli.get(resp_json['next'])
+        resp_json = await resp.json()
+        assert resp_json['elements'] == ['c']
+        assert resp_json['next_cursor'] is None
+        assert resp_json['next'] is None
+
+        resp = await test_cli.get(app.url_for('sanic-redis-rpc.browse_key', redis_name='redis_0'))
+        assert resp.status == 400
+        resp = await test_cli.get(
+            app.url_for('sanic-redis-rpc.browse_key', redis_name='redis_0', key='browse-test:list', cursor=-1)
+        )
+        assert resp.status == 400
+
     async def test__get_search_info(self, app: Sanic, test_cli, search_id):
         sid = await search_id
         resp = await test_cli.get(
@@ -142,3 +249,64 @@ class BugsTest:
         assert resp.status == 200
         resp_json = await resp.json()
         assert resp_json
+
+    async def test__get_stats(self, app: Sanic, test_cli, rpc):
+        await rpc('/', 'redis_0.set', 'something_long:1', 1)
+
+        resp = await test_cli.get('/status')
+        stats_url = (await resp.json())[0]['stats_url']
+
+        resp = await test_cli.get(stats_url + '?sample_size=10&refresh=1')
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['redis_name'] == 'redis_0'
+        assert resp_json['cached'] is False
+        assert 'no_expiry' in resp_json
+        assert len(resp_json['expiry_timeline']) == 7
+
+        resp = await test_cli.get(stats_url + '?sample_size=10')
+        assert (await resp.json())['cached'] is True
+
+        resp = await test_cli.get(stats_url + '?method=keys')
+        assert resp.status == 400
+        resp = await test_cli.get(app.url_for('sanic-redis-rpc.get_stats', redis_name='does-not-exist'))
+        assert resp.status == 404
+
+    async def test__get_key_index_stats(self, app: Sanic, test_client):
+        app.config.redis_connections_options['redis_0']['key_index'] = True
+        cli = await test_client(app)
+
+        resp = await cli.get(app.url_for('sanic-redis-rpc.get_key_index_stats', redis_name='redis_0'))
+        assert resp.status == 200
+        resp_json = await resp.json()
+        assert resp_json['enabled'] is True
+        assert resp_json['state'] in ['bootstrapping', 'ready', 'stale']
+
+        resp = await cli.get(app.url_for('sanic-redis-rpc.get_key_index_stats', redis_name='redis_1'))
+        assert (await resp.json())['enabled'] is False
+        resp = await cli.get(app.url_for('sanic-redis-rpc.get_key_index_stats', redis_name='does-not-exist'))
+        assert resp.status == 404
+
+    async def test__circuit_breaker(self, app: Sanic, test_client):
+        options = app.config.redis_connections_options
+        options['redis_down'] = dict(
+            options['redis_1'], name='redis_down', address='redis://localhost:1', service=False,
+            circuit_failures=1, circuit_open_seconds=60, health_check_interval=0,
+        )
+        cli = await test_client(app)
+
+        resp = await cli.post('/', json=mk_rpc_bundle('redis_down.get', ['qwe']))
+        resp_json = await resp.json()
+        assert resp_json['error']['code'] == -32001, 'A startup failure must open the circuit'
+        assert resp_json['error']['data']['state'] == 'open'
+        assert resp_json['error']['data']['retry_after'] > 0
+
+        resp = await cli.post('/', json=[mk_rpc_bundle('redis_down.get', ['qwe']), mk_rpc_bundle('redis_0.ping', [])])
+        assert [item.get('error', {}).get('code') for item in await resp.json()] == [-32001, None], \
+            'Healthy pools of a batch must not be affected'
+
+        resp = await cli.get('/status')
+        circuits = {item['name']: item['circuit'] for item in await resp.json() if 'circuit' in item}
+        assert circuits['redis_down']['state'] == 'open'
+        assert circuits['redis_down']['rejected'] == 2
+        assert circuits['redis_0']['state'] == 'closed'
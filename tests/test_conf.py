@@ -1,7 +1,9 @@
 import pytest
 from sanic import Sanic
 
-from sanic_redis_rpc.conf import ENV_REDIS_PREFIX, read_redis_config_from_env, configure
+from sanic_redis_rpc.conf import ENV_REDIS_PREFIX, ENV_EXPORT_DIR, DEFAULT_EXPORT_DIR, read_redis_config_from_env, configure, \
+    ENV_RESULT_STORE, ENV_RESULTS_DIR, ENV_POOLS_FILE, ENV_ADMIN_TOKEN, ENV_CLIENT_HEADER, ENV_CLIENT_WEIGHTS, \
+    DEFAULT_CLIENT_HEADER, ENV_TIMEOUTS, ENV_TRUST_CLIENT_HEADER
 
 pytestmark = pytest.mark.conf
 
@@ -36,3 +38,53 @@ class ConfTest:
         app = configure(Sanic('test'), env)
         assert hasattr(app.config, 'redis_connections_options'), 'Ensure redis config has been read'
         assert app.config.redis_connections_options['redis_0'], 'Ensure default has been set'
+        assert app.config.export_dir == DEFAULT_EXPORT_DIR
+
+        app = configure(Sanic('test'), {ENV_EXPORT_DIR: '/tmp/exports'})
+        assert app.config.export_dir == '/tmp/exports'
+        assert list(app.config.redis_connections_options) == ['redis_0'], 'Ensure settings are not pools'
+
+        app = configure(Sanic('test'), {ENV_RESULT_STORE: 'file', ENV_RESULTS_DIR: '/tmp/results'})
+        assert (app.config.result_store, app.config.results_dir) == ('file', '/tmp/results')
+        with pytest.raises(ValueError):
+            configure(Sanic('test'), {ENV_RESULT_STORE: 'nothing'})
+
+    def test__configure__pools_file(self, tmpdir):
+        pools_file = tmpdir.join('pools.env')
+        pools_file.write('# comment\n\nREDIS_1 = redis://localhost:6379?db=1&name=qwe\n')
+
+        app = configure(Sanic('test'), {
+            ENV_POOLS_FILE: str(pools_file),
+            '%s5' % ENV_REDIS_PREFIX: 'redis://localhost:6379?db=5',
+            ENV_ADMIN_TOKEN: 'secret',
+        })
+        assert list(app.config.redis_connections_options) == ['redis_0', 'qwe'], 'Env pools are replaced by the file'
+        assert app.config.pools_file == str(pools_file)
+        assert app.config.admin_token == 'secret'
+        assert app.config.configured_at > 0
+
+        pools_file.write('REDIS_1\n')
+        with pytest.raises(ValueError):
+            configure(Sanic('test'), {ENV_POOLS_FILE: str(pools_file)})
+
+    def test__configure__clients(self):
+        app = configure(Sanic('test'), {})
+        assert (app.config.client_header, app.config.client_weights) == (DEFAULT_CLIENT_HEADER, {})
+        assert not app.config.trust_client_header, 'A client header is not trusted by default'
+        assert configure(Sanic('test'), {ENV_TRUST_CLIENT_HEADER: '1'}).config.trust_client_header
+        with pytest.raises(ValueError):
+            configure(Sanic('test'), {ENV_TRUST_CLIENT_HEADER: 'qwe'})
+
+        app = configure(Sanic('test'), {ENV_CLIENT_HEADER: 'X-App', ENV_CLIENT_WEIGHTS: 'billing=3, 10.0.0.1=0.5,'})
+        assert app.config.client_header == 'X-App'
+        assert app.config.client_weights == {'billing': 3, '10.0.0.1': 0.5}
+        for weights in ['billing', 'billing=0', '=1']:
+            with pytest.raises(ValueError):
+                configure(Sanic('test'), {ENV_CLIENT_WEIGHTS: weights})
+
+    def test__configure__timeouts(self):
+        app = configure(Sanic('test'), {ENV_TIMEOUTS: 'slow=10, blocking=0'})
+        assert app.config.timeouts == {'interactive': 5, 'slow': 10, 'blocking': 0}
+        for timeouts in ['slow', 'fast=1', 'slow=-1']:
+            with pytest.raises(ValueError):
+                configure(Sanic('test'), {ENV_TIMEOUTS: timeouts})
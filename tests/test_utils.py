@@ -21,4 +21,29 @@ class UtilsTest:
                    'name': 'vasya',
                    'display_name': '',
                    'service': False,
+                   'max_scans': 2,
+                   'drain_timeout': 30.0,
+                   'autoscale': False,
+                   'autoscale_interval': 1.0,
+                   'lane_connections': 0,
+                   'lane_queue': 100,
+                   'lane_slow': False,
+                   'max_in_flight': 1000,
+                   'admission_queue': 10000,
+                   'retries': 2,
+                   'retry_backoff': 0.05,
+                   'notify_queue': 10000,
+                   'notify_batch': 500,
+                   'notify_overflow': 'drop_new',
+                   'budget': 0,
+                   'budget_interval': 1.0,
+                   'lazy': False,
+                   'init_timeout': 10.0,
+                   'health_check_interval': 5.0,
+                   'health_check_timeout': 1.0,
+                   'circuit_failures': 5,
+                   'circuit_open_seconds': 5.0,
+                   'key_index': False,
+                   'key_index_max_memory': 64 * 1024 * 1024,
+                   'key_index_configure': False,
                }
@@ -1,7 +1,12 @@
 import json
 import typing as t
+from collections import OrderedDict
 from uuid import uuid4
 
+from sanic import Sanic
+
+from sanic_redis_rpc.rpc.utils import RedisPoolsShareWrapper
+
 
 class AttrObject:
     def __init__(self, **kwargs):
@@ -21,6 +26,17 @@ def mk_rpc_bundle(method: str, params, dump=False):
     return json.dumps(bundle)
 
 
+def mk_pools_wrapper(app: Sanic, loop, **options) -> RedisPoolsShareWrapper:
+    """
+    :param options: pool options of ``redis_1`` overriding ones of the app config
+    """
+    redis_connections_options = OrderedDict(
+        (name, dict(pool_options)) for name, pool_options in app.config.redis_connections_options.items()
+    )
+    redis_connections_options['redis_1'].update(options)
+    return RedisPoolsShareWrapper(redis_connections_options, loop=loop)
+
+
 class NestedSample:
     def __init__(self):
         self.base = 100